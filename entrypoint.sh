@@ -4,5 +4,12 @@ set -eu
 PORT="${PORT:-7860}"
 
 cd /app
+
+# Multi-worker Prometheus metrics: workers share this dir; stale samples from a previous run must go
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+  find "$PROMETHEUS_MULTIPROC_DIR" -name '*.db' -delete
+fi
+
 echo "Starting Uvicorn on 0.0.0.0:${PORT}"
 exec uvicorn app.main:app --host 0.0.0.0 --port "$PORT"
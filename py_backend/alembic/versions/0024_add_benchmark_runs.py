@@ -0,0 +1,44 @@
+"""add_benchmark_runs
+
+Revision ID: 0024
+Revises: 0023
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0024'
+down_revision = '0023'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per model benchmark run; per-model summaries live in results
+    op.create_table(
+        'benchmark_runs',
+        sa.Column('run_id', postgresql.UUID(as_uuid=True),
+                  server_default=sa.text('gen_random_uuid()'),
+                  primary_key=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('models', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('image_type', sa.String(), sa.ForeignKey('image_types.image_type'), nullable=False),
+        sa.Column('prompt', sa.String(), nullable=True),
+        sa.Column('image_count', sa.Integer(), nullable=False),
+        sa.Column('rounds', sa.SmallInteger(), nullable=False, server_default=sa.text('1')),
+        sa.Column('concurrency', sa.SmallInteger(), nullable=False, server_default=sa.text('1')),
+        sa.Column('results', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('NOW()'), nullable=False),
+        sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_index('ix_benchmark_runs_created_at', 'benchmark_runs', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_benchmark_runs_created_at', table_name='benchmark_runs', if_exists=True)
+    op.drop_table('benchmark_runs')
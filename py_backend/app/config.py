@@ -11,11 +11,82 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: str = ""
     GOOGLE_API_KEY: str = ""
     HF_API_KEY: str = ""
+    # OpenAI-compatible endpoints; point both at vlm_simulator.py for offline load tests
+    HF_PROVIDERS_URL: str = "https://router.huggingface.co/v1/chat/completions"
+    OPENAI_BASE_URL: str = ""
     SPACE_ID: str = ""
     ENVIRONMENT: str = "production"
     STORAGE_PROVIDER: str = "local"
     STORAGE_DIR: str = "/data/uploads"
     HF_HOME: str = "/data/.cache/huggingface"
+    MAX_UPLOAD_BYTES: int = 100 * 1024 * 1024
+    # Whole multipart body; /multi accepts up to 5 files
+    MAX_UPLOAD_REQUEST_BYTES: int = 5 * 100 * 1024 * 1024 + 1024 * 1024
+    DIRECT_UPLOAD_URL_EXPIRES_S: int = 900
+    # Finalize claims, so one direct-upload key is processed once across workers
+    DIRECT_UPLOAD_CLAIM_DIR: str = "/data/direct_claims"
+    # Files of a multi-image upload preprocessed/stored in parallel
+    UPLOAD_CONCURRENCY: int = 4
+    RESUMABLE_UPLOAD_DIR: str = "/data/resumable"
+    RESUMABLE_UPLOAD_TTL_S: int = 24 * 3600
+    # VLM provider limits; per-model overrides live in Models.config['limits']
+    VLM_MAX_CONCURRENCY: int = 8
+    VLM_QUEUE_TIMEOUT_S: float = 30.0
+    VLM_RATE_LIMIT_DIR: str = ""   # shared dir (e.g. /data/ratelimits) to coordinate uvicorn workers
+    # Circuit breaker: trip on error rate or slow calls, retry after the open period
+    VLM_BREAKER_ERROR_RATE: float = 0.5
+    VLM_BREAKER_SLOW_CALL_S: float = 30.0
+    VLM_BREAKER_OPEN_S: float = 30.0
+    VLM_REPROBE_INTERVAL_S: float = 15.0
+    # Provider probes: run concurrently with a per-probe timeout, repeated every interval (0 = startup only)
+    VLM_PROBE_INTERVAL_S: float = 300.0
+    VLM_PROBE_TIMEOUT_S: float = 5.0
+    # Hedged requests: race the fallback model when the primary is slower than its p-th latency
+    VLM_HEDGE_ENABLED: bool = False
+    VLM_HEDGE_PERCENTILE: float = 0.95
+    VLM_HEDGE_MIN_DELAY_S: float = 2.0
+    VLM_HEDGE_MAX_DELAY_S: float = 30.0
+    VLM_HEDGE_MAX_PER_MINUTE: float = 6.0   # per target model; Models.config['hedge']['max_per_minute'] overrides
+    # Multi-image captions: race this many capable models at once and keep the first good answer (0 = try in turn)
+    VLM_MULTI_IMAGE_RACE_N: int = 0
+    # Total budget for an upload/caption request across preprocessing, storage and VLM fallbacks (0 = none)
+    REQUEST_DEADLINE_S: float = 120.0
+    # Client gone mid-caption: "cancel" the provider call and skip the caption write, or "complete" it anyway
+    ABANDONED_UPLOAD_POLICY: str = "cancel"
+    # Batch re-caption jobs: checkpoint directory and default images in flight per job
+    BATCH_CAPTION_DIR: str = "/data/batch_captions"
+    BATCH_CAPTION_CONCURRENCY: int = 4
+    # Model benchmarks: the fixed image set runs use unless image ids are given
+    BENCHMARK_IMAGE_DIR: str = "/data/benchmark_images"
+    BENCHMARK_MAX_IMAGES: int = 50   # cap on image_ids per run; their bytes are held for the whole run
+    # Per-run lock files held by the worker executing a run, so a restart only fails orphaned runs
+    BENCHMARK_RUN_DIR: str = "/data/benchmark_runs"
+    # Schema-by-image-type lookups are cached; PUT /api/schemas/{id} invalidates this worker,
+    # the TTL bounds how long other workers keep a stale schema
+    SCHEMA_CACHE_TTL_S: float = 300.0
+    # OpenTelemetry tracing (opt-in): "otlp" (endpoint from OTEL_EXPORTER_OTLP_* env vars) or "file"
+    # (JSON lines at TRACING_FILE); "" = off. Trace ids are added to log lines while on.
+    TRACING_EXPORTER: str = ""
+    TRACING_FILE: str = "/data/traces/spans.jsonl"
+    TRACING_SAMPLE_RATIO: float = 1.0
+    TRACING_SERVICE_NAME: str = "promptaid-vision"
+    # Per-request budgets: requests going over any of them are logged as slow (0 = no limit).
+    # SQL count/time and stage timings are also sent as a Server-Timing header unless turned off.
+    REQUEST_QUERY_BUDGET: int = 25
+    REQUEST_DB_TIME_BUDGET_MS: float = 500.0
+    REQUEST_TIME_BUDGET_MS: float = 30000.0
+    SERVER_TIMING_HEADER: bool = True
+    # Event-loop watchdog: sample lag every interval and log the loop thread's stack when it stalls
+    # past the threshold (interval 0 = off). Debug mode reports known-blocking calls made on the loop.
+    LOOP_WATCHDOG_INTERVAL_MS: float = 100.0
+    LOOP_STALL_THRESHOLD_MS: float = 250.0
+    LOOP_BLOCKING_CALL_DEBUG: bool = False
+    # Read replicas (comma-separated URLs, "" = none) for read-only endpoints. A replica leaves rotation when
+    # unreachable or lagging over the limit; clients stay on the primary for a while after they write.
+    DATABASE_REPLICA_URLS: str = ""
+    DB_REPLICA_MAX_LAG_S: float = 10.0
+    DB_REPLICA_HEALTH_INTERVAL_S: float = 10.0
+    DB_READ_YOUR_WRITES_S: int = 10
     
     class Config:
         env_file = ".env"
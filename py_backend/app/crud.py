@@ -1,4 +1,4 @@
-import io, hashlib
+import io, hashlib, datetime
 import logging
 from typing import Optional, List
 from sqlalchemy.orm import Session, joinedload, selectinload
@@ -91,6 +91,10 @@ def get_image(db: Session, image_id: str):
         .first()
     )
 
+def get_image_by_file_key(db: Session, file_key: str):
+    """Get the image stored under a given object key, if any"""
+    return db.query(models.Images).filter(models.Images.file_key == file_key).first()
+
 def get_images_paginated(
     db: Session,
     search: Optional[str] = None,
@@ -414,6 +418,7 @@ def get_all_captions_with_images(db: Session):
         db.query(models.Captions)
         .options(
             joinedload(models.Captions.images).joinedload(models.Images.countries),
+            joinedload(models.Captions.images).selectinload(models.Images.captions),
         )
         .all()
     )
@@ -515,7 +520,9 @@ def get_captions_with_images_filtered(
         db.query(models.Captions)
         .filter(models.Captions.caption_id.in_(caption_ids))
         .options(
-            selectinload(models.Captions.images).selectinload(models.Images.countries)
+            selectinload(models.Captions.images).selectinload(models.Images.countries),
+            # convert_image_to_dict reads img.captions for every image
+            selectinload(models.Captions.images).selectinload(models.Images.captions),
         )
         .order_by(models.Captions.created_at.desc())
         .all()
@@ -535,6 +542,47 @@ def count_captions_with_images_filtered(
     starred_only: bool = False,
 ):
     """Count captions matching filters using SQL queries"""
+    query = _filtered_caption_ids_query(
+        db, search, source, event_type, region, country, image_type, upload_type, starred_only
+    )
+    count = query.count()
+    return count
+
+def get_image_ids_filtered(
+    db: Session,
+    search: Optional[str] = None,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    region: Optional[str] = None,
+    country: Optional[str] = None,
+    image_type: Optional[str] = None,
+    upload_type: Optional[str] = None,
+    starred_only: bool = False,
+) -> List[str]:
+    """Get ids of all images linked to captions matching the /grouped filters"""
+    caption_ids = _filtered_caption_ids_query(
+        db, search, source, event_type, region, country, image_type, upload_type, starred_only
+    ).subquery()
+    rows = (
+        db.query(models.images_captions.c.image_id)
+        .filter(models.images_captions.c.caption_id.in_(db.query(caption_ids.c.caption_id)))
+        .distinct()
+        .all()
+    )
+    return [str(row[0]) for row in rows]
+
+def _filtered_caption_ids_query(
+    db: Session,
+    search: Optional[str],
+    source: Optional[str],
+    event_type: Optional[str],
+    region: Optional[str],
+    country: Optional[str],
+    image_type: Optional[str],
+    upload_type: Optional[str],
+    starred_only: bool,
+):
+    """Distinct caption ids matching the /grouped filters"""
     needs_grouping = upload_type is not None
     needs_image_join = source is not None or event_type is not None or image_type is not None or region is not None or country is not None or upload_type is not None
     
@@ -588,8 +636,7 @@ def count_captions_with_images_filtered(
         elif upload_type == 'multiple':
             query = query.having(effective_count > 1)
     
-    count = query.count()
-    return count
+    return query
 
 def get_prompts(db: Session):
     """Get all available prompts"""
@@ -846,4 +893,66 @@ def set_fallback_model(db: Session, model_code: str):
         db.commit()
         db.refresh(model)
         return model
-    return None
\ No newline at end of file
+    return None
+
+# Model benchmark runs
+def create_benchmark_run(db: Session, model_codes: list[str], image_type: str, image_count: int,
+                         rounds: int = 1, concurrency: int = 1, prompt: Optional[str] = None):
+    """Record a new, running benchmark run"""
+    # Validate that the image_type exists
+    image_type_obj = db.query(models.ImageTypes).filter(models.ImageTypes.image_type == image_type).first()
+    if not image_type_obj:
+        raise ValueError(f"Invalid image_type: {image_type}")
+    
+    run = models.BenchmarkRuns(
+        status="running",
+        models=model_codes,
+        image_type=image_type,
+        prompt=prompt,
+        image_count=image_count,
+        rounds=rounds,
+        concurrency=concurrency,
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+def get_benchmark_run(db: Session, run_id: str):
+    """Get a benchmark run by id"""
+    return db.get(models.BenchmarkRuns, run_id)
+
+def get_benchmark_runs(db: Session, limit: int = 50, run_ids: Optional[list[str]] = None):
+    """Benchmark runs newest first, optionally restricted to run_ids"""
+    query = db.query(models.BenchmarkRuns)
+    if run_ids is not None:
+        query = query.filter(models.BenchmarkRuns.run_id.in_(run_ids))
+    return query.order_by(models.BenchmarkRuns.created_at.desc()).limit(limit).all()
+
+def finish_benchmark_run(db: Session, run, status: str, results: Optional[dict] = None, error: Optional[str] = None):
+    """Store a benchmark run's outcome"""
+    run.status = status
+    run.results = results
+    run.error = error
+    run.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.commit()
+    db.refresh(run)
+    return run
+
+def get_running_benchmark_run_ids(db: Session) -> list[str]:
+    """Ids of runs still recorded as running"""
+    rows = db.query(models.BenchmarkRuns.run_id).filter(models.BenchmarkRuns.status == "running").all()
+    return [str(row.run_id) for row in rows]
+
+def fail_running_benchmark_runs(db: Session, error: str, run_ids: Optional[list[str]] = None) -> int:
+    """Mark runs still recorded as running (all, or those in run_ids) as failed; returns how many"""
+    query = db.query(models.BenchmarkRuns).filter(models.BenchmarkRuns.status == "running")
+    if run_ids is not None:
+        query = query.filter(models.BenchmarkRuns.run_id.in_(run_ids))
+    count = query.update({
+        "status": "failed",
+        "error": error,
+        "finished_at": datetime.datetime.now(datetime.timezone.utc),
+    }, synchronize_session=False)
+    db.commit()
+    return count
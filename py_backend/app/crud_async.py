@@ -0,0 +1,89 @@
+"""
+Async CRUD
+AsyncSession versions of the crud functions behind the busiest read
+endpoints, so their handlers can await the database instead of blocking
+the event loop or a threadpool slot.
+
+Simple lookups are select() statements. The filtered listings reuse the
+query builders in crud.py through AsyncSession.run_sync, so the filter
+logic stays in one place while endpoints move over one by one.
+
+Everything a handler reads must be loaded eagerly here: a lazy load on an
+AsyncSession raises instead of running a query.
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+
+from . import crud, models
+
+# Captions.images is a backref of Images.captions and only exists once the
+# mappers are configured; db.query() does that on first use, select() does not
+configure_mappers()
+
+
+async def get_image(db: AsyncSession, image_id: str):
+    """Get a single image by ID with its countries and captions (and their images)"""
+    result = await db.execute(
+        select(models.Images)
+        .options(
+            joinedload(models.Images.countries),
+            joinedload(models.Images.captions).joinedload(models.Captions.images),
+        )
+        .where(models.Images.image_id == image_id)
+    )
+    return result.unique().scalar_one_or_none()
+
+
+async def get_all_captions_with_images(db: AsyncSession):
+    """Get all captions with their images, the images' countries and captions"""
+    result = await db.execute(
+        select(models.Captions)
+        .options(
+            joinedload(models.Captions.images).joinedload(models.Images.countries),
+            joinedload(models.Captions.images).selectinload(models.Images.captions),
+        )
+    )
+    return result.unique().scalars().all()
+
+
+async def get_captions_with_images_filtered(
+    db: AsyncSession,
+    search: Optional[str] = None,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    region: Optional[str] = None,
+    country: Optional[str] = None,
+    image_type: Optional[str] = None,
+    upload_type: Optional[str] = None,
+    starred_only: bool = False,
+    page: int = 1,
+    limit: int = 10,
+):
+    """Async crud.get_captions_with_images_filtered: (captions, total_count)"""
+    return await db.run_sync(
+        crud.get_captions_with_images_filtered,
+        search=search, source=source, event_type=event_type, region=region, country=country,
+        image_type=image_type, upload_type=upload_type, starred_only=starred_only, page=page, limit=limit,
+    )
+
+
+async def count_captions_with_images_filtered(
+    db: AsyncSession,
+    search: Optional[str] = None,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    region: Optional[str] = None,
+    country: Optional[str] = None,
+    image_type: Optional[str] = None,
+    upload_type: Optional[str] = None,
+    starred_only: bool = False,
+):
+    """Async crud.count_captions_with_images_filtered"""
+    return await db.run_sync(
+        crud.count_captions_with_images_filtered,
+        search=search, source=source, event_type=event_type, region=region, country=country,
+        image_type=image_type, upload_type=upload_type, starred_only=starred_only,
+    )
@@ -1,24 +1,49 @@
 import os
 import logging
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 
 from .config import settings
+from .services.metrics import instrument_pool
+from .services.tracing import instrument_engine
+from .services import server_timing
+from .services.replica_routing import Replica, ReplicaSet, RoutingSession
 
 logger = logging.getLogger(__name__)
 
-raw_db_url = settings.DATABASE_URL
+def normalize_db_url(url: str) -> str:
+    if url.startswith("psql '") and url.endswith("'"):
+        url = url[6:-1]
 
-if raw_db_url.startswith("psql '") and raw_db_url.endswith("'"):
-    raw_db_url = raw_db_url[6:-1]
+    # Convert postgresql:// to postgresql+psycopg:// for psycopg v3
+    if url.startswith("postgresql://") and not url.startswith("postgresql+psycopg://"):
+        url = url.replace("postgresql://", "postgresql+psycopg://")
 
-# Convert postgresql:// to postgresql+psycopg:// for psycopg v3
-if raw_db_url.startswith("postgresql://") and not raw_db_url.startswith("postgresql+psycopg://"):
-    raw_db_url = raw_db_url.replace("postgresql://", "postgresql+psycopg://")
+    if "sslmode=" not in url and "localhost" not in url and "127.0.0.1" not in url:
+        url = f"{url}{'&' if '?' in url else '?'}sslmode=require"
+    return url
 
-if "sslmode=" not in raw_db_url and "localhost" not in raw_db_url and "127.0.0.1" not in raw_db_url:
-    raw_db_url = f"{raw_db_url}{'&' if '?' in raw_db_url else '?'}sslmode=require"
+
+def async_db_url(url: str) -> str:
+    # psycopg 3 serves both; sqlite (local experiments only) needs aiosqlite
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def instrument(engine) -> None:
+    # Pool checkout waits feed the db_pool_checkout_wait_seconds histogram on /metrics
+    instrument_pool(engine.pool)
+    # SQL statements become db.* spans while tracing is on
+    instrument_engine(engine)
+    # ...and are counted against the request's query budget / Server-Timing header
+    server_timing.instrument_engine(engine)
+
+
+raw_db_url = normalize_db_url(settings.DATABASE_URL)
 
 logger.debug(f"database url: {raw_db_url}")  
 
@@ -35,6 +60,7 @@ engine = create_engine(
     pool_size=10,
     max_overflow=10,
 )
+instrument(engine)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -42,4 +68,65 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+# Async engine for handlers migrated to AsyncSession (see crud_async.py).
+# Its pool is separate from the sync one, so count both against Postgres'
+# max_connections while endpoints are being moved over.
+async_engine = create_async_engine(
+    async_db_url(raw_db_url),
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=10,
+    max_overflow=10,
+)
+instrument(async_engine.sync_engine)
+
+# expire_on_commit=False: attributes can't be lazily reloaded after a commit
+# without an await, so committed objects keep their loaded state
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# Read replicas (DATABASE_REPLICA_URLS): read-only endpoints use the Read*
+# session factories below, which send their queries to a healthy replica
+# and fall back to the primary. Writes always go to the primary.
+def _replica(i: int, url: str) -> Replica:
+    url = normalize_db_url(url)
+    name = make_url(url).host or f"replica{i}"
+    engine = create_engine(url, pool_pre_ping=True, pool_recycle=300, pool_size=5, max_overflow=5)
+    async_replica_engine = create_async_engine(
+        async_db_url(url), pool_pre_ping=True, pool_recycle=300, pool_size=5, max_overflow=5,
+    )
+    instrument(engine)
+    instrument(async_replica_engine.sync_engine)
+    return Replica(name, engine, async_replica_engine)
+
+
+replicas = ReplicaSet(
+    [_replica(i, url.strip()) for i, url in enumerate(settings.DATABASE_REPLICA_URLS.split(",")) if url.strip()],
+    max_lag_s=settings.DB_REPLICA_MAX_LAG_S,
+)
+if replicas.enabled:
+    logger.info(f"Read replicas: {', '.join(r.name for r in replicas.replicas)}")
+
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=engine,
+    class_=RoutingSession,
+    replicas=replicas,
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+    replicas=replicas,
+    use_async_engines=True,
+)
+
 Base = declarative_base()
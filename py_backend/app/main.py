@@ -1,13 +1,14 @@
 import os
 import subprocess
 import logging
+import time
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
 from dotenv import load_dotenv
@@ -25,6 +26,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tracing is configured before the routers (and the database engine) are imported
+from app.services import tracing
+if tracing.configure(
+    settings.TRACING_EXPORTER,
+    service_name=settings.TRACING_SERVICE_NAME,
+    file_path=settings.TRACING_FILE,
+    sample_ratio=settings.TRACING_SAMPLE_RATIO,
+):
+    tracing.install_log_correlation(logging.getLogger().handlers)
+
 from app.routers import upload, caption, metadata, models
 from app.routers.images import router as images_router
 from app.routers.prompts import router as prompts_router
@@ -35,6 +46,14 @@ from app.routers.images_listing import router as images_listing_router
 from app.routers.images_metadata import router as images_metadata_router
 from app.routers.images_files import router as images_files_router
 from app.routers.images_upload import router as images_upload_router
+from app.routers.images_direct import router as images_direct_router
+from app.routers.images_resumable import router as images_resumable_router
+from app.utils.upload_stream import UploadSizeLimitMiddleware
+from app.services.deadline import DeadlineExceeded
+from app.services import metrics
+from app.services.server_timing import ServerTimingMiddleware
+from app.services.replica_routing import use_primary
+from app.database import replicas
 
 app = FastAPI(
     title="PromptAid Vision",
@@ -46,6 +65,19 @@ app = FastAPI(
 # --------------------------------------------------------------------
 app.add_middleware(GZipMiddleware, minimum_size=500)
 
+# --------------------------------------------------------------------
+# Upload size limit (multipart bodies are cut off as they stream in)
+# --------------------------------------------------------------------
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=settings.MAX_UPLOAD_REQUEST_BYTES)
+
+# --------------------------------------------------------------------
+# Request deadline exceeded -> structured 504
+# --------------------------------------------------------------------
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    logger.warning(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(status_code=504, content={"detail": str(exc), **exc.to_dict()})
+
 # --------------------------------------------------------------------
 # Logging middleware (simple)
 # --------------------------------------------------------------------
@@ -56,6 +88,60 @@ async def log_requests(request: Request, call_next):
     logger.debug(f"{request.method} {request.url.path} -> {response.status_code}")
     return response
 
+# --------------------------------------------------------------------
+# Request latency per route template (served at /metrics)
+# --------------------------------------------------------------------
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.observe_request(request.method, metrics.route_template(request.scope), status, time.perf_counter() - start)
+
+# --------------------------------------------------------------------
+# Tracing: one server span per request, continuing the caller's trace
+# --------------------------------------------------------------------
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not tracing.enabled():
+        return await call_next(request)
+    with tracing.request_span(request.method, request.url.path, request.headers) as span:
+        response = await call_next(request)
+        span.update_name(f"{request.method} {metrics.route_template(request.scope)}")
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["X-Trace-Id"] = tracing.current_trace_id() or ""
+        return response
+
+# --------------------------------------------------------------------
+# Read replicas: a client that just wrote keeps reading from the primary
+# --------------------------------------------------------------------
+PRIMARY_COOKIE = "db_primary"
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    if not replicas.enabled:
+        return await call_next(request)
+    with use_primary(PRIMARY_COOKIE in request.cookies):
+        response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(PRIMARY_COOKIE, "1", max_age=settings.DB_READ_YOUR_WRITES_S, httponly=True, samesite="lax")
+    return response
+
+# --------------------------------------------------------------------
+# Server-Timing (SQL count/time, pipeline stages) and slow-request budgets
+# --------------------------------------------------------------------
+app.add_middleware(
+    ServerTimingMiddleware,
+    max_queries=settings.REQUEST_QUERY_BUDGET,
+    max_db_ms=settings.REQUEST_DB_TIME_BUDGET_MS,
+    max_duration_ms=settings.REQUEST_TIME_BUDGET_MS,
+    send_header=settings.SERVER_TIMING_HEADER,
+)
+
 # --------------------------------------------------------------------
 # Cache headers (assets long-cache, HTML no-cache, API no-store)
 # --------------------------------------------------------------------
@@ -110,6 +196,8 @@ app.include_router(images_listing_router,       prefix="/api/images",     tags=[
 app.include_router(images_metadata_router,      prefix="/api/images",     tags=["images-metadata"])
 app.include_router(images_files_router,         prefix="/api/images",     tags=["images-files"])
 app.include_router(images_upload_router,       prefix="/api/images",     tags=["images-upload"])
+app.include_router(images_direct_router,       prefix="/api/images",     tags=["images-direct"])
+app.include_router(images_resumable_router,    prefix="/api/images",     tags=["images-resumable"])
 app.include_router(images_router,              prefix="/api/contribute", tags=["contribute"])
 app.include_router(prompts_router,             prefix="/api/prompts",    tags=["prompts"])
 app.include_router(admin_router,               prefix="/api/admin",     tags=["admin"])
@@ -167,6 +255,13 @@ async def performance():
         "cache_headers": True,
     }
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    if not metrics.PROMETHEUS_AVAILABLE:
+        return JSONResponse(status_code=503, content={"detail": "prometheus_client is not installed"})
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 # --------------------------------------------------------------------
 # Static dir resolution (ALWAYS a Path)
 # --------------------------------------------------------------------
@@ -375,6 +470,11 @@ def ensure_storage_ready():
 # VLM service registration on startup
 # --------------------------------------------------------------------
 from app.services.vlm_service import vlm_manager
+from app.services.circuit_breaker import CircuitBreakerConfig
+from app.services.hedging import HedgePolicy
+from app.services.batch_caption import batch_caption_runner
+from app.services.model_benchmark import benchmark_run_locks
+from app.services.loop_watchdog import loop_watchdog, install_blocking_call_detector
 
 # Providers
 from app.services.stub_vlm_service import StubVLMService
@@ -403,6 +503,24 @@ async def startup_tasks() -> None:
     
     # Register VLM services
     logger.info("Registering VLM services...")
+    vlm_manager.configure_limits(
+        default_max_concurrency=settings.VLM_MAX_CONCURRENCY,
+        queue_timeout_s=settings.VLM_QUEUE_TIMEOUT_S,
+        coordinator_dir=settings.VLM_RATE_LIMIT_DIR or None,
+    )
+    vlm_manager.configure_breakers(CircuitBreakerConfig(
+        error_rate_threshold=settings.VLM_BREAKER_ERROR_RATE,
+        slow_call_s=settings.VLM_BREAKER_SLOW_CALL_S,
+        open_duration_s=settings.VLM_BREAKER_OPEN_S,
+    ))
+    vlm_manager.configure_hedging(HedgePolicy(
+        enabled=settings.VLM_HEDGE_ENABLED,
+        percentile=settings.VLM_HEDGE_PERCENTILE,
+        min_delay_s=settings.VLM_HEDGE_MIN_DELAY_S,
+        max_delay_s=settings.VLM_HEDGE_MAX_DELAY_S,
+        max_hedges_per_minute=settings.VLM_HEDGE_MAX_PER_MINUTE,
+    ))
+    vlm_manager.configure_multi_image(settings.VLM_MULTI_IMAGE_RACE_N)
 
     # Always have a stub as a safe fallback
     try:
@@ -421,7 +539,7 @@ async def startup_tasks() -> None:
     # OpenAI GPT-4V (if configured)
     if settings.OPENAI_API_KEY:
         try:
-            vlm_manager.register_service(GPT4VService(settings.OPENAI_API_KEY))
+            vlm_manager.register_service(GPT4VService(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL))
             logger.info("✓ GPT-4 Vision service registered")
         except Exception as e:
             logger.error(f"✗ GPT-4 Vision service failed to register: {e}")
@@ -457,6 +575,7 @@ async def startup_tasks() -> None:
                             api_key=settings.HF_API_KEY,
                             model_id=m.model_id,
                             public_name=m.m_code,  # stable name your UI/DB uses
+                            providers_url=settings.HF_PROVIDERS_URL,
                         )
                         vlm_manager.register_service(svc)
                         logger.info(f"✓ HF registered: {m.m_code} -> {m.model_id}")
@@ -477,16 +596,68 @@ async def startup_tasks() -> None:
     else:
         logger.info("○ Hugging Face not configured (HF_API_KEY missing)")
 
+    # Per-model settings (e.g. provider image rendition) from Models.config
+    db = SessionLocal()
+    try:
+        vlm_manager.apply_model_configs(crud.get_models(db))
+    except Exception as e:
+        logger.warning(f"Could not apply model configs: {e}")
+    finally:
+        db.close()
+
     # Kick off lightweight probes in the background (don't block startup)
     try:
-        asyncio.create_task(vlm_manager.probe_all())
+        vlm_manager.start_probe_loop(settings.VLM_PROBE_INTERVAL_S, settings.VLM_PROBE_TIMEOUT_S)
+        vlm_manager.start_reprobe_loop(settings.VLM_REPROBE_INTERVAL_S)
     except Exception as e:
         logger.error(f"Probe scheduling failed: {e}")
 
+    # A run still marked running whose worker no longer holds its lock was cut off by a restart;
+    # runs other live workers are executing keep their locks and are left alone
+    benchmark_run_locks.configure(settings.BENCHMARK_RUN_DIR)
+    db = SessionLocal()
+    try:
+        orphaned = [
+            run_id for run_id in crud.get_running_benchmark_run_ids(db)
+            if not benchmark_run_locks.is_held(run_id)
+        ]
+        stale = crud.fail_running_benchmark_runs(db, "Interrupted by a server restart", run_ids=orphaned) if orphaned else 0
+        if stale:
+            logger.info(f"Marked {stale} interrupted benchmark run(s) as failed")
+    except Exception as e:
+        logger.warning(f"Could not clean up interrupted benchmark runs: {e}")
+    finally:
+        db.close()
+
+    # Pick up batch re-caption jobs interrupted by a restart
+    try:
+        batch_caption_runner.configure(settings.BATCH_CAPTION_DIR, settings.BATCH_CAPTION_CONCURRENCY)
+        batch_caption_runner.resume_pending()
+    except Exception as e:
+        logger.error(f"Could not resume batch caption jobs: {e}")
+
+    # Keep unreachable or lagging read replicas out of rotation
+    replicas.start_health_checks(settings.DB_REPLICA_HEALTH_INTERVAL_S)
+
+    # Watch the event loop for stalls once the (blocking) startup work is done
+    if settings.LOOP_WATCHDOG_INTERVAL_MS > 0:
+        loop_watchdog.configure(settings.LOOP_WATCHDOG_INTERVAL_MS / 1000, settings.LOOP_STALL_THRESHOLD_MS / 1000)
+        loop_watchdog.start()
+    if settings.LOOP_BLOCKING_CALL_DEBUG:
+        install_blocking_call_detector()
+
     logger.info(f"✓ Available models now: {', '.join(vlm_manager.get_available_models())}")
     logger.info(f"✓ Total services: {len(vlm_manager.services)}")
 
 
+@app.on_event("shutdown")
+async def shutdown_tasks() -> None:
+    loop_watchdog.stop()
+    replicas.stop_health_checks()
+    metrics.mark_process_dead()
+    tracing.shutdown()
+
+
 logger.info("PromptAid Vision API server ready")
 logger.info("Endpoints: /api/images, /api/captions, /api/metadata, /api/models")
 logger.info(f"Environment: {settings.ENVIRONMENT}")
@@ -189,3 +189,22 @@ class Captions(Base):
     schema = relationship("JSONSchema")
     model_r = relationship("Models", foreign_keys=[model])
     prompt_r = relationship("Prompts", foreign_keys=[prompt])
+
+class BenchmarkRuns(Base):
+    __tablename__ = "benchmark_runs"
+    __table_args__ = (
+        Index('ix_benchmark_runs_created_at', 'created_at'),
+    )
+
+    run_id      = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status      = Column(String, nullable=False)
+    models      = Column(JSONB, nullable=False)   # model codes benchmarked
+    image_type  = Column(String, ForeignKey("image_types.image_type"), nullable=False)
+    prompt      = Column(String, nullable=True)   # prompt code used, if any
+    image_count = Column(Integer, nullable=False)
+    rounds      = Column(SmallInteger, nullable=False, default=1)
+    concurrency = Column(SmallInteger, nullable=False, default=1)
+    results     = Column(JSONB, nullable=True)    # per-model summary
+    error       = Column(Text, nullable=True)
+    created_at  = Column(TIMESTAMP(timezone=True), default=datetime.datetime.utcnow)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
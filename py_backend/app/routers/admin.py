@@ -1,8 +1,10 @@
 import os
 import jwt
 import hashlib
+import asyncio
+import uuid
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
@@ -10,6 +12,12 @@ from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from ..config import settings
 from .. import crud
+from ..services.vlm_service import vlm_manager
+from ..services.batch_caption import batch_caption_runner, BatchJobError, job_summary
+from ..services.model_benchmark import (
+    load_image_set, run_stored_benchmark, run_summary, compare_runs, benchmark_run_locks
+)
+from .. import storage
 
 router = APIRouter()
 security = HTTPBearer()
@@ -148,6 +156,12 @@ class ModelUpdateRequest(BaseModel):
     model_id: str | None = None
     is_available: bool | None = None
     is_fallback: bool | None = None
+    # Provider image rendition, e.g. {"max_dimension": 1536, "format": "JPEG", "quality": 85}
+    image_input: dict | None = None
+    # Provider limits, e.g. {"max_concurrency": 4, "rpm": 60, "tpm": 90000, "queue_timeout_s": 20}
+    limits: dict | None = None
+    # Hedge spend guard when this model is the hedge target, e.g. {"max_per_minute": 3}
+    hedge: dict | None = None
 
 @router.post("/models", response_model=dict)
 async def create_model(
@@ -249,6 +263,12 @@ async def update_model(
                 config_updates["provider"] = request.provider
             if request.model_id is not None:
                 config_updates["model_id"] = request.model_id
+            if request.image_input is not None:
+                config_updates["image_input"] = request.image_input
+            if request.limits is not None:
+                config_updates["limits"] = request.limits
+            if request.hedge is not None:
+                config_updates["hedge"] = request.hedge
             
             if config_updates:
                 # Get current config or create empty dict
@@ -258,6 +278,7 @@ async def update_model(
                 update_data["config"] = updated_config
             
             updated_model = crud.update_model(db, model_code, update_data)
+            vlm_manager.apply_model_configs([updated_model])
         
         return {
             "message": "Model updated successfully",
@@ -352,3 +373,253 @@ async def delete_model(
             status_code=500,
             detail=f"Failed to delete model: {str(e)}"
         )
+
+# Batch re-caption Endpoints
+class BatchCaptionFilters(BaseModel):
+    """Same filters as GET /api/images/grouped"""
+    search: str | None = None
+    source: str | None = None
+    event_type: str | None = None
+    region: str | None = None
+    country: str | None = None
+    image_type: str | None = None
+    upload_type: str | None = None
+    starred_only: bool = False
+
+class BatchCaptionRequest(BaseModel):
+    image_ids: list[str] | None = None
+    filters: BatchCaptionFilters | None = None
+    model_name: str | None = None
+    prompt: str | None = None          # prompt code or label; defaults to the active prompt per image type
+    title: str | None = None           # defaults to each image's existing caption title
+    concurrency: int | None = None
+    allow_fallback: bool = False       # store captions from the fallback model if model_name fails
+
+def _require_admin(credentials: HTTPAuthorizationCredentials):
+    if not verify_admin_token(credentials.credentials):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token"
+        )
+
+def _batch_error(e: BatchJobError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.post("/captions/batch", response_model=dict, status_code=202)
+async def create_batch_caption_job(
+    request: BatchCaptionRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Re-caption existing images selected by id list or /grouped filters (admin only)"""
+    _require_admin(credentials)
+    
+    if (request.image_ids is None) == (request.filters is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide exactly one of image_ids or filters"
+        )
+    if request.model_name and request.model_name not in vlm_manager.services:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model '{request.model_name}' is not registered"
+        )
+    
+    if request.filters is not None:
+        image_ids = crud.get_image_ids_filtered(db, **request.filters.model_dump())
+    else:
+        image_ids = request.image_ids
+    
+    try:
+        job = batch_caption_runner.create_job(
+            image_ids,
+            model_name=request.model_name,
+            prompt=request.prompt,
+            title=request.title,
+            concurrency=request.concurrency,
+            allow_fallback=request.allow_fallback,
+            filters=request.filters.model_dump() if request.filters else None,
+        )
+        job = batch_caption_runner.start(job["job_id"])
+    except BatchJobError as e:
+        raise _batch_error(e)
+    
+    return {"job": job_summary(job)}
+
+@router.get("/captions/batch", response_model=dict)
+async def list_batch_caption_jobs(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """List batch re-caption jobs, newest first (admin only)"""
+    _require_admin(credentials)
+    try:
+        return {"jobs": [job_summary(job) for job in batch_caption_runner.list_jobs()]}
+    except BatchJobError as e:
+        raise _batch_error(e)
+
+@router.get("/captions/batch/{job_id}", response_model=dict)
+async def get_batch_caption_job(
+    job_id: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Progress of a batch re-caption job, including per-image errors (admin only)"""
+    _require_admin(credentials)
+    try:
+        job = batch_caption_runner.get_job(job_id)
+    except BatchJobError as e:
+        raise _batch_error(e)
+    return {"job": job_summary(job), "errors": job["failed"], "active": batch_caption_runner.is_running(job_id)}
+
+@router.post("/captions/batch/{job_id}/cancel", response_model=dict)
+async def cancel_batch_caption_job(
+    job_id: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Stop a batch re-caption job; finished captions are kept (admin only)"""
+    _require_admin(credentials)
+    try:
+        return {"job": job_summary(batch_caption_runner.cancel(job_id))}
+    except BatchJobError as e:
+        raise _batch_error(e)
+
+@router.post("/captions/batch/{job_id}/resume", response_model=dict)
+async def resume_batch_caption_job(
+    job_id: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Continue a cancelled/failed job, retrying images that are not done (admin only)"""
+    _require_admin(credentials)
+    try:
+        return {"job": job_summary(batch_caption_runner.start(job_id))}
+    except BatchJobError as e:
+        raise _batch_error(e)
+
+class BenchmarkRequest(BaseModel):
+    models: list[str] | None = None       # model codes; defaults to every registered model
+    image_type: str = "crisis_map"        # schema the replies are validated against
+    image_ids: list[str] | None = None    # defaults to the fixed set in BENCHMARK_IMAGE_DIR; at most BENCHMARK_MAX_IMAGES
+    prompt: str | None = None             # prompt code or label; defaults to the active prompt for image_type
+    rounds: int = 1
+    concurrency: int = 1
+
+# Running benchmark tasks, kept referenced until they finish
+_benchmark_tasks: set = set()
+
+def _benchmark_run_id(run_id: str) -> str:
+    try:
+        return str(uuid.UUID(run_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=404, detail=f"Benchmark run {run_id} not found")
+
+@router.post("/benchmarks", response_model=dict, status_code=202)
+async def create_benchmark_run(
+    request: BenchmarkRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Benchmark registered models on a fixed image set; poll the run for results (admin only)"""
+    _require_admin(credentials)
+    
+    model_codes = request.models or [name for name in vlm_manager.services if name != "manual"]
+    missing = [m for m in model_codes if m not in vlm_manager.services]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Models not registered: {', '.join(missing)}"
+        )
+    if not 1 <= request.rounds <= 20 or not 1 <= request.concurrency <= 16:
+        raise HTTPException(
+            status_code=400,
+            detail="rounds must be 1-20 and concurrency 1-16"
+        )
+    if request.image_ids and len(request.image_ids) > settings.BENCHMARK_MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BENCHMARK_MAX_IMAGES} image_ids per run"
+        )
+    if request.image_type not in {t.image_type for t in crud.get_image_types(db)}:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid image_type: {request.image_type}"
+        )
+    
+    if request.prompt:
+        prompt_obj = crud.get_prompt(db, request.prompt) or crud.get_prompt_by_label(db, request.prompt)
+    else:
+        prompt_obj = crud.get_active_prompt_by_image_type(db, request.image_type)
+    if not prompt_obj:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No prompt found (requested: '{request.prompt}' or active for type '{request.image_type}')"
+        )
+    
+    try:
+        if request.image_ids:
+            images = []
+            for image_id in request.image_ids:
+                img = crud.get_image(db, image_id)
+                if not img:
+                    raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+                images.append((image_id, await asyncio.to_thread(storage.get_object_bytes, img.file_key)))
+        else:
+            images = await asyncio.to_thread(load_image_set, settings.BENCHMARK_IMAGE_DIR)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    run = crud.create_benchmark_run(
+        db,
+        model_codes,
+        image_type=request.image_type,
+        image_count=len(images),
+        rounds=request.rounds,
+        concurrency=request.concurrency,
+        prompt=prompt_obj.p_code,
+    )
+    # Held by this worker until the run ends; other workers' restarts leave the run alone
+    lock = benchmark_run_locks.hold(str(run.run_id))
+    task = asyncio.create_task(run_stored_benchmark(
+        str(run.run_id), images, prompt_obj.label, prompt_obj.metadata_instructions or "", lock=lock
+    ))
+    _benchmark_tasks.add(task)
+    task.add_done_callback(_benchmark_tasks.discard)
+    
+    return {"run": run_summary(run)}
+
+@router.get("/benchmarks", response_model=dict)
+async def list_benchmark_runs(
+    limit: int = Query(50, ge=1, le=500),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """List benchmark runs, newest first (admin only)"""
+    _require_admin(credentials)
+    return {"runs": [run_summary(run) for run in crud.get_benchmark_runs(db, limit=limit)]}
+
+@router.get("/benchmarks/compare", response_model=dict)
+async def compare_benchmark_runs(
+    run_ids: list[str] = Query(..., description="Runs to compare; repeat the parameter"),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Per-model latency, schema pass rate and token numbers across runs (admin only)"""
+    _require_admin(credentials)
+    run_ids = list(dict.fromkeys(_benchmark_run_id(r) for r in run_ids))
+    runs = crud.get_benchmark_runs(db, limit=len(run_ids), run_ids=run_ids)
+    found = {str(run.run_id) for run in runs}
+    missing = [r for r in run_ids if r not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Benchmark runs not found: {', '.join(missing)}")
+    return compare_runs([run_summary(run) for run in reversed(runs)])
+
+@router.get("/benchmarks/{run_id}", response_model=dict)
+async def get_benchmark_run(
+    run_id: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """A benchmark run with its per-model results (admin only)"""
+    _require_admin(credentials)
+    run = crud.get_benchmark_run(db, _benchmark_run_id(run_id))
+    if not run:
+        raise HTTPException(status_code=404, detail="Benchmark run not found")
+    return {"run": run_summary(run)}
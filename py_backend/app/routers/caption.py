@@ -1,13 +1,20 @@
 # py_backend/app/routers/caption.py
 from fastapi import APIRouter, HTTPException, Depends, Form, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Set
+import asyncio
+import json
 import logging
 
-from .. import crud, database, schemas, storage
+from .. import crud, crud_async, database, schemas, storage
 from ..services.vlm_service import vlm_manager
 from ..services.schema_validator import schema_validator
 from ..config import settings
+from ..utils.disconnect import cancel_on_disconnect, ClientDisconnected, CANCEL, abandoned_requests
+from ..services.deadline import Deadline, DeadlineExceeded
+from ..services import tracing
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -19,11 +26,113 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    async with database.AsyncReadSessionLocal() as db:
+        yield db
+
+def _resolve_prompt(db: Session, img, prompt: str | None):
+    """Prompt by code/label, or the active one for the image's type"""
+    if prompt:
+        logger.debug(f"Looking for prompt: '{prompt}' (type: {type(prompt)})")
+        prompt_obj = crud.get_prompt(db, prompt) or crud.get_prompt_by_label(db, prompt)
+    else:
+        logger.debug(f"Looking for active prompt for image type: {img.image_type}")
+        prompt_obj = crud.get_active_prompt_by_image_type(db, img.image_type)
+
+    logger.debug(f"Prompt lookup result: {prompt_obj}")
+    if not prompt_obj:
+        raise HTTPException(400, f"No prompt found (requested: '{prompt}' or active for type '{img.image_type}')")
+    return prompt_obj
+
+async def _load_image_bytes(file_key: str, deadline: Deadline) -> bytes:
+    """Load image bytes (S3 or local) within the request deadline"""
+    def load_image_bytes() -> bytes:
+        try:
+            if hasattr(storage, 's3') and settings.STORAGE_PROVIDER != "local":
+                response = storage.s3.get_object(
+                    Bucket=settings.S3_BUCKET,
+                    Key=file_key,
+                )
+                return response["Body"].read()
+            import os
+            file_path = os.path.join(settings.STORAGE_DIR, file_key)
+            with open(file_path, 'rb') as f:
+                return f.read()
+        except Exception as e:
+            logger.error(f"Error reading image file: {e}")
+            # fallback: try presigned/public URL
+            try:
+                url = storage.get_object_url(file_key)
+                if url.startswith('/') and settings.STORAGE_PROVIDER == "local":
+                    url = f"http://localhost:8000{url}"
+                import requests
+                resp = requests.get(url, timeout=deadline.timeout(30))
+                resp.raise_for_status()
+                return resp.content
+            except Exception as fallback_error:
+                logger.error(f"Fallback also failed: {fallback_error}")
+                raise HTTPException(500, f"Could not read image file: {e}")
+
+    return await deadline.run_sync("load image", load_image_bytes)
+
+def _validated_caption(result: dict, image_type: str, model_name: str | None):
+    """Schema-validate a VLM result; returns (text, used_model, raw, metadata)"""
+    logger.debug(f"VLM service result: {result}")
+    logger.debug(f"Result model field: {result.get('model', 'NOT_FOUND')}")
+    
+    raw = result.get("raw_response", {})
+    
+    # Validate and clean the data using schema validation
+    logger.debug(f"Validating data for image type: {image_type}")
+    logger.debug(f"Raw data structure: {list(raw.keys()) if isinstance(raw, dict) else 'Not a dict'}")
+    
+    cleaned_data, is_valid, validation_error = schema_validator.clean_and_validate_data(raw, image_type)
+    
+    if is_valid:
+        logger.debug(f"✓ Schema validation passed for {image_type}")
+        text = cleaned_data.get("analysis", "")
+        metadata = cleaned_data.get("metadata", {})
+    else:
+        logger.debug(f"⚠ Schema validation failed for {image_type}: {validation_error}")
+        text = result.get("caption", "This is a fallback caption due to schema validation error.")
+        metadata = result.get("metadata", {})
+        raw["validation_error"] = validation_error
+        raw["validation_failed"] = True
+    
+    used_model = result.get("model", model_name) or "STUB_MODEL"
+    if used_model == "random":
+        logger.warning(f"VLM service returned 'random' as model name, using STUB_MODEL fallback")
+        used_model = "STUB_MODEL"
+    
+    # Fallback info (if any)
+    if result.get("fallback_used"):
+        raw["fallback_info"] = {
+            "original_model": result.get("original_model"),
+            "fallback_model": used_model,
+            "reason": result.get("fallback_reason"),
+        }
+    return text, used_model, raw, metadata
+
+def _error_caption(e: Exception):
+    logger.warning(f"VLM error, using fallback: {e}")
+    text = "This is a fallback caption due to VLM service error."
+    return text, "STUB_MODEL", {"error": str(e), "fallback": True}, {}
+
 @router.post(
     "/images/{image_id}/caption",
     response_model=schemas.CaptionOut,
 )
 async def create_caption(
+    request: Request,
     image_id: str,
     title: str = Form(...),
     prompt: str = Form(None),  # optional; will use active prompts if not provided
@@ -31,142 +140,181 @@ async def create_caption(
     db: Session = Depends(get_db),
 ):
     logger.debug(f"Received request - image_id: {image_id}, title: {title}, prompt: {prompt}, model_name: {model_name}")
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
+    tracing.annotate(**{"caption.image_id": image_id, "caption.requested_model": model_name})
     
     img = crud.get_image(db, image_id)
     if not img:
         raise HTTPException(404, "image not found")
 
     # Get the prompt (explicit by code/label, or active for image type)
-    if prompt:
-        logger.debug(f"Looking for prompt: '{prompt}' (type: {type(prompt)})")
-        prompt_obj = crud.get_prompt(db, prompt) or crud.get_prompt_by_label(db, prompt)
-    else:
-        logger.debug(f"Looking for active prompt for image type: {img.image_type}")
-        prompt_obj = crud.get_active_prompt_by_image_type(db, img.image_type)
-
-    logger.debug(f"Prompt lookup result: {prompt_obj}")
-    if not prompt_obj:
-        raise HTTPException(400, f"No prompt found (requested: '{prompt}' or active for type '{img.image_type}')")
-
+    prompt_obj = _resolve_prompt(db, img, prompt)
     prompt_text = prompt_obj.label
     metadata_instructions = prompt_obj.metadata_instructions or ""
     logger.debug(f"Using prompt text: '{prompt_text}'")
     logger.debug(f"Using metadata instructions: '{metadata_instructions[:100]}...'")
 
-    # Load image bytes (S3 or local)
+    with tracing.span("caption.load_image"):
+        img_bytes = await _load_image_bytes(img.file_key, deadline)
+    logger.debug(f"About to call VLM service with model_name: {model_name}")
+
     try:
-        logger.debug(f"About to call VLM service with model_name: {model_name}")
-        if hasattr(storage, 's3') and settings.STORAGE_PROVIDER != "local":
-            response = storage.s3.get_object(
-                Bucket=settings.S3_BUCKET,
-                Key=img.file_key,
-            )
-            img_bytes = response["Body"].read()
-        else:
-            import os
-            file_path = os.path.join(settings.STORAGE_DIR, img.file_key)
-            with open(file_path, 'rb') as f:
-                img_bytes = f.read()
+        with tracing.span("caption.vlm"):
+            result = await cancel_on_disconnect(request, vlm_manager.generate_caption(
+                image_bytes=img_bytes,
+                prompt=prompt_text,
+                metadata_instructions=metadata_instructions,
+                model_name=model_name,
+                db_session=db,
+                deadline=deadline,
+            ), label="caption")
+        with tracing.span("caption.validate"):
+            text, used_model, raw, metadata = _validated_caption(result, img.image_type, model_name)
+    except (ClientDisconnected, DeadlineExceeded):
+        raise
     except Exception as e:
-        logger.error(f"Error reading image file: {e}")
-        # fallback: try presigned/public URL
-        try:
-            url = storage.get_object_url(img.file_key)
-            if url.startswith('/') and settings.STORAGE_PROVIDER == "local":
-                url = f"http://localhost:8000{url}"
-            import requests
-            resp = requests.get(url)
-            resp.raise_for_status()
-            img_bytes = resp.content
-        except Exception as fallback_error:
-            logger.error(f"Fallback also failed: {fallback_error}")
-            raise HTTPException(500, f"Could not read image file: {e}")
-
-    metadata = {}
-    try:
-        result = await vlm_manager.generate_caption(
-            image_bytes=img_bytes,
-            prompt=prompt_text,
-            metadata_instructions=metadata_instructions,
-            model_name=model_name,
-            db_session=db,
+        text, used_model, raw, metadata = _error_caption(e)
+
+    with tracing.span("caption.db_commit", **{"caption.model": used_model}):
+        caption = crud.create_caption(
+            db,
+            image_id=image_id,
+            title=title,
+            prompt=prompt_obj.p_code,
+            model_code=used_model,
+            raw_json=raw,
+            text=text,
+            metadata=metadata,
         )
-        
-        logger.debug(f"VLM service result: {result}")
-        logger.debug(f"Result model field: {result.get('model', 'NOT_FOUND')}")
-        
-        raw = result.get("raw_response", {})
-        
-        # Validate and clean the data using schema validation
-        image_type = img.image_type
-        logger.debug(f"Validating data for image type: {image_type}")
-        logger.debug(f"Raw data structure: {list(raw.keys()) if isinstance(raw, dict) else 'Not a dict'}")
-        
-        cleaned_data, is_valid, validation_error = schema_validator.clean_and_validate_data(raw, image_type)
-        
-        if is_valid:
-            logger.debug(f"✓ Schema validation passed for {image_type}")
-            text = cleaned_data.get("analysis", "")
-            metadata = cleaned_data.get("metadata", {})
-        else:
-            logger.debug(f"⚠ Schema validation failed for {image_type}: {validation_error}")
-            text = result.get("caption", "This is a fallback caption due to schema validation error.")
-            metadata = result.get("metadata", {})
-            raw["validation_error"] = validation_error
-            raw["validation_failed"] = True
-        
-        used_model = result.get("model", model_name) or "STUB_MODEL"
-        if used_model == "random":
-            logger.warning(f"VLM service returned 'random' as model name, using STUB_MODEL fallback")
-            used_model = "STUB_MODEL"
-        
-        # Fallback info (if any)
-        if result.get("fallback_used"):
-            raw["fallback_info"] = {
-                "original_model": result.get("original_model"),
-                "fallback_model": used_model,
-                "reason": result.get("fallback_reason"),
-            }
-        
-    except Exception as e:
-        logger.warning(f"VLM error, using fallback: {e}")
-        text = "This is a fallback caption due to VLM service error."
-        used_model = "STUB_MODEL"
-        raw = {"error": str(e), "fallback": True}
-        metadata = {}
-
-    caption = crud.create_caption(
-        db,
-        image_id=image_id,
-        title=title,
-        prompt=prompt_obj.p_code,
-        model_code=used_model,
-        raw_json=raw,
-        text=text,
-        metadata=metadata,
-    )
     
     db.refresh(caption)
     logger.debug(f"Caption created, caption object: {caption}")
     logger.debug(f"caption_id: {caption.caption_id}")
     return schemas.CaptionOut.from_orm(caption)
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Streams whose client left under the "complete" policy, kept alive until stored
+_detached_streams: Set[asyncio.Task] = set()
+
+@router.post("/images/{image_id}/caption/stream")
+async def create_caption_stream(
+    request: Request,
+    image_id: str,
+    title: str = Form(...),
+    prompt: str = Form(None),
+    model_name: str | None = Form(None),
+    db: Session = Depends(get_db),
+):
+    """Generate a caption as Server-Sent Events
+
+    Emits "delta" events with partial text while the model writes, then one
+    "result" event with the validated, stored caption (CaptionOut), or an
+    "error" event. The result is authoritative: if the provider fails
+    mid-stream, a fallback model's caption replaces the partial text.
+    """
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
+
+    img = crud.get_image(db, image_id)
+    if not img:
+        raise HTTPException(404, "image not found")
+    prompt_obj = _resolve_prompt(db, img, prompt)
+    prompt_code = prompt_obj.p_code
+    prompt_text = prompt_obj.label
+    metadata_instructions = prompt_obj.metadata_instructions or ""
+    image_type = img.image_type
+    img_bytes = await _load_image_bytes(img.file_key, deadline)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        # Own session: the request's is closed once the response starts streaming
+        session = database.SessionLocal()
+        try:
+            try:
+                result = await vlm_manager.generate_caption_stream(
+                    image_bytes=img_bytes,
+                    prompt=prompt_text,
+                    metadata_instructions=metadata_instructions,
+                    model_name=model_name,
+                    db_session=session,
+                    deadline=deadline,
+                    on_delta=lambda text: queue.put_nowait(("delta", {"text": text})),
+                )
+                text, used_model, raw, metadata = _validated_caption(result, image_type, model_name)
+            except DeadlineExceeded as e:
+                queue.put_nowait(("error", {"detail": str(e), **e.to_dict()}))
+                return
+            except Exception as e:
+                text, used_model, raw, metadata = _error_caption(e)
+
+            caption = crud.create_caption(
+                session,
+                image_id=image_id,
+                title=title,
+                prompt=prompt_code,
+                model_code=used_model,
+                raw_json=raw,
+                text=text,
+                metadata=metadata,
+            )
+            session.refresh(caption)
+            queue.put_nowait(("result", schemas.CaptionOut.from_orm(caption).model_dump(mode="json")))
+        except Exception as e:
+            logger.error(f"Streaming caption failed: {e}")
+            queue.put_nowait(("error", {"detail": str(e)}))
+        finally:
+            session.close()
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(produce())
+
+    async def events():
+        finished = False
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    finished = True
+                    return
+                yield _sse(*item)
+        finally:
+            # Starlette stops the generator when the client disconnects
+            if not finished and not task.done():
+                abandoned_requests["caption_stream"] = abandoned_requests.get("caption_stream", 0) + 1
+                if settings.ABANDONED_UPLOAD_POLICY == CANCEL:
+                    logger.info("Client disconnected; cancelled in-flight caption stream")
+                    task.cancel()
+                else:
+                    _detached_streams.add(task)
+                    task.add_done_callback(_detached_streams.discard)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get(
     "/captions/legacy",
     response_model=List[schemas.ImageOut],
 )
-def get_all_captions_legacy_format(
+async def get_all_captions_legacy_format(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """Get all images with captions in the old format for backward compatibility"""
     logger.debug(f"Fetching all captions in legacy format...")
-    captions = crud.get_all_captions_with_images(db)
+    captions = await crud_async.get_all_captions_with_images(db)
     logger.debug(f"Found {len(captions)} captions")
     
     result = []
     for caption in captions:
-        db.refresh(caption)
         if caption.images:
             for image in caption.images:
                 from .upload import convert_image_to_dict
@@ -199,18 +347,17 @@ def get_all_captions_legacy_format(
     "/captions",
     response_model=List[schemas.CaptionOut],
 )
-def get_all_captions_with_images(
-    db: Session = Depends(get_db),
+async def get_all_captions_with_images(
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """Get all captions"""
     logger.debug(f"Fetching all captions...")
-    captions = crud.get_all_captions_with_images(db)
+    captions = await crud_async.get_all_captions_with_images(db)
     logger.debug(f"Found {len(captions)} captions")
     
     result = []
     for caption in captions:
         logger.debug(f"Processing caption {caption.caption_id}, title: {caption.title}, generated: {caption.generated}, model: {caption.model}")
-        db.refresh(caption)
         result.append(schemas.CaptionOut.from_orm(caption))
     logger.debug(f"Returning {len(result)} formatted results")
     return result
@@ -221,7 +368,7 @@ def get_all_captions_with_images(
 )
 def get_captions_by_image(
     image_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Get all captions for a specific image"""
     captions = crud.get_captions_by_image(db, image_id)
@@ -237,7 +384,7 @@ def get_captions_by_image(
 )
 def get_caption(
     caption_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     caption = crud.get_caption(db, caption_id)
     if not caption:
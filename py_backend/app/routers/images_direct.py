@@ -0,0 +1,260 @@
+"""
+Direct Upload Router
+Two-phase uploads: the browser PUTs/POSTs bytes straight to storage using a
+target issued here, then calls finalize so the server runs the usual pipeline
+(hashing, preprocessing, thumbnails, captioning) from storage.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import jwt
+import logging
+import os
+import re
+import tempfile
+
+try:
+    import fcntl  # POSIX only; finalize claims are skipped without it
+except ImportError:
+    fcntl = None
+
+from .. import crud, schemas, database, storage
+from ..config import settings
+from ..services.upload_service import UploadService
+from ..services.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Keys issued by /direct/init always look like maps/<uuid4>_<filename>
+_DIRECT_KEY_RE = re.compile(r'^maps/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_[^/]+$')
+_TOKEN_AUDIENCE = "direct-upload"
+# Objects fetched for finalize stay in memory up to this size, then spill to disk
+_SPOOL_MAX_MEMORY = 1024 * 1024
+
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class DirectUploadInitRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+
+class DirectUploadInitResponse(BaseModel):
+    key: str
+    token: str
+    upload: dict
+    expires_in: int
+    max_bytes: int
+
+class DirectUploadFinalizeRequest(schemas.UploadMetadataIn):
+    key: str
+    token: str
+
+def _check_direct_key(key: str) -> None:
+    if not _DIRECT_KEY_RE.match(key or ""):
+        raise HTTPException(400, "Invalid upload key")
+
+def _token_secret() -> str:
+    return os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
+
+def create_upload_token(key: str) -> str:
+    """Sign key so only the client that called /direct/init can upload and finalize it"""
+    payload = {
+        'key': key,
+        'aud': _TOKEN_AUDIENCE,
+        'exp': datetime.utcnow() + timedelta(seconds=settings.DIRECT_UPLOAD_URL_EXPIRES_S),
+    }
+    return jwt.encode(payload, _token_secret(), algorithm='HS256')
+
+def verify_upload_token(token: Optional[str], key: str, leeway: float = 0) -> None:
+    """Reject keys that were not issued by /direct/init (or whose token expired)"""
+    _check_direct_key(key)
+    try:
+        payload = jwt.decode(
+            token or "", _token_secret(), algorithms=['HS256'],
+            audience=_TOKEN_AUDIENCE, leeway=leeway,
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(403, "Upload token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(403, "Invalid upload token")
+    if payload.get('key') != key:
+        raise HTTPException(403, "Upload token does not match key")
+
+def _claim_path(key: str) -> str:
+    return os.path.join(settings.DIRECT_UPLOAD_CLAIM_DIR, hashlib.sha256(key.encode()).hexdigest() + ".claim")
+
+def claim_finalize(key: str) -> Optional[int]:
+    """Lock key for finalizing; a concurrent finalize of the same key gets a 409
+
+    The lock is an flock on a per-key file, so the OS drops it if the worker
+    dies. Returns the descriptor to pass to release_finalize.
+    """
+    if fcntl is None:
+        return None
+    os.makedirs(settings.DIRECT_UPLOAD_CLAIM_DIR, exist_ok=True)
+    path = _claim_path(key)
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise HTTPException(409, "Upload is already being finalized")
+        # The previous holder unlinks the file on release; retry if we locked a removed one
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+def release_finalize(key: str, fd: Optional[int]) -> None:
+    if fd is None:
+        return
+    try:
+        os.remove(_claim_path(key))
+    except FileNotFoundError:
+        pass
+    os.close(fd)
+
+@router.post("/direct/init", response_model=DirectUploadInitResponse)
+def init_direct_upload(request: DirectUploadInitRequest):
+    """Issue a storage key and an upload target for a direct browser upload"""
+    if request.size is not None and request.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"File too large (max {settings.MAX_UPLOAD_BYTES} bytes)")
+
+    key = storage.new_object_key(request.filename)
+    token = create_upload_token(key)
+    try:
+        target = storage.generate_presigned_upload(
+            key,
+            content_type=request.content_type,
+            expires_in=settings.DIRECT_UPLOAD_URL_EXPIRES_S,
+            max_bytes=settings.MAX_UPLOAD_BYTES,
+            token=token,
+        )
+    except Exception as e:
+        logger.error(f"Failed to create upload target: {str(e)}")
+        raise HTTPException(500, f"Failed to create upload target: {str(e)}")
+
+    logger.info(f"Issued direct upload target for key: {key}")
+    return DirectUploadInitResponse(
+        key=key,
+        token=token,
+        upload=target,
+        expires_in=settings.DIRECT_UPLOAD_URL_EXPIRES_S,
+        max_bytes=settings.MAX_UPLOAD_BYTES,
+    )
+
+@router.put("/direct/local/{key:path}")
+async def put_direct_upload_local(key: str, request: Request, token: Optional[str] = None):
+    """Local-storage stand-in for a presigned PUT; streams the body to disk
+
+    Only keys signed by /direct/init are accepted, and an existing object is
+    never replaced: a key can be written once.
+    """
+    if settings.STORAGE_PROVIDER != "local":
+        raise HTTPException(404, "Local storage not enabled")
+    verify_upload_token(token, key)
+
+    try:
+        path = storage.local_path_for_key(key)
+    except ValueError:
+        raise HTTPException(400, "Invalid upload key")
+    if os.path.exists(path):
+        raise HTTPException(409, "Object already exists")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    written = 0
+    tmp_path = f"{path}.part"
+    try:
+        # O_EXCL on the part file: a second PUT of the same key while one is running fails
+        f = open(tmp_path, 'xb')
+    except FileExistsError:
+        raise HTTPException(409, "Upload already in progress")
+    try:
+        with f:
+            async for chunk in request.stream():
+                written += len(chunk)
+                if written > settings.MAX_UPLOAD_BYTES:
+                    raise HTTPException(413, f"File too large (max {settings.MAX_UPLOAD_BYTES} bytes)")
+                f.write(chunk)
+        # link() fails instead of replacing if the object appeared meanwhile
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            raise HTTPException(409, "Object already exists")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {"key": key, "size": written}
+
+@router.post("/direct/finalize", response_model=schemas.ImageOut)
+async def finalize_direct_upload(
+    request: DirectUploadFinalizeRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """Process an object the browser uploaded directly to storage
+
+    The token from /direct/init is checked again; it stays valid for one more
+    URL lifetime so an upload started just before expiry can still finish.
+    The key is claimed for the whole finalize so a concurrent call for it
+    cannot create a second record for (or delete) the same object.
+    """
+    verify_upload_token(request.token, request.key, leeway=settings.DIRECT_UPLOAD_URL_EXPIRES_S)
+    claim = claim_finalize(request.key)
+    try:
+        return await _finalize(request, http_request, db)
+    finally:
+        release_finalize(request.key, claim)
+
+async def _finalize(request: DirectUploadFinalizeRequest, http_request: Request, db: Session) -> schemas.ImageOut:
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
+
+    if crud.get_image_by_file_key(db, request.key):
+        raise HTTPException(409, "Upload already finalized")
+
+    size = await asyncio.to_thread(storage.get_object_size, request.key)
+    if size is None:
+        raise HTTPException(404, "Uploaded object not found")
+    if size > settings.MAX_UPLOAD_BYTES:
+        await deadline.run_sync("delete object", storage.delete_object, request.key)
+        raise HTTPException(413, f"File too large (max {settings.MAX_UPLOAD_BYTES} bytes)")
+
+    filename = request.filename or request.key.split("/", 1)[1].split("_", 1)[1]
+    logger.info(f"Finalizing direct upload: {request.key} ({size} bytes)")
+
+    # Stream the object to a spooled temp file rather than holding it in memory
+    content = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
+    try:
+        await deadline.run_sync("load object", storage.download_fileobj, request.key, content)
+        content.seek(0)
+        result = await UploadService.process_content(
+            content,
+            filename,
+            db=db,
+            stored_key=request.key,
+            request=http_request,
+            deadline=deadline,
+            **request.dict(exclude={"key", "token", "filename"})
+        )
+        return result['image']
+    except (HTTPException, DeadlineExceeded):
+        raise
+    except Exception as e:
+        logger.error(f"Direct upload finalize failed: {str(e)}")
+        raise HTTPException(500, f"Finalize failed: {str(e)}")
+    finally:
+        content.close()
@@ -15,6 +15,7 @@ import mimetypes
 from .. import crud, schemas, database, storage
 from ..config import settings
 from ..services.image_preprocessor import ImagePreprocessor
+from ..utils.upload_stream import spool_upload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -170,11 +171,11 @@ async def preprocess_image(
     logger.info(f"Preprocessing image: {file.filename}")
     
     try:
-        content = await file.read()
+        upload = await spool_upload(file, settings.MAX_UPLOAD_BYTES)
         
         # Preprocess the image
-        processed_content, processed_filename, mime_type = ImagePreprocessor.preprocess_image(
-            content, 
+        processed_file, processed_filename, mime_type, _ = ImagePreprocessor.preprocess_fileobj(
+            upload.file, 
             file.filename,
             target_format='PNG',
             quality=95
@@ -182,15 +183,18 @@ async def preprocess_image(
         
         logger.info(f"Image preprocessed: {file.filename} -> {processed_filename}")
         
+        processed_size = upload.size if processed_file is upload.file else len(processed_file.getbuffer())
         return {
             "original_filename": file.filename,
             "processed_filename": processed_filename,
-            "original_size": len(content),
-            "processed_size": len(processed_content),
+            "original_size": upload.size,
+            "processed_size": processed_size,
             "mime_type": mime_type,
             "preprocessing_applied": processed_filename != file.filename
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Image preprocessing failed: {str(e)}")
         raise HTTPException(500, f"Image preprocessing failed: {str(e)}")
@@ -0,0 +1,169 @@
+"""
+Resumable Upload Router
+Chunked uploads with offsets (tus-style) for large drone imagery sent over
+unreliable links. Completed uploads are checksum-verified and handed to the
+regular upload pipeline.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.requests import ClientDisconnect
+from sqlalchemy.orm import Session
+from typing import Optional
+import asyncio
+import logging
+
+from .. import schemas, database
+from ..config import settings
+from ..services.resumable_upload import ResumableUploadStore, ResumableUploadError
+from ..services.upload_service import UploadService
+from ..services.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+store = ResumableUploadStore(settings.RESUMABLE_UPLOAD_DIR, max_bytes=settings.MAX_UPLOAD_BYTES)
+
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+def _status(state: dict) -> dict:
+    return {
+        "upload_id": state["upload_id"],
+        "filename": state["filename"],
+        "offset": state["offset"],
+        "size": state["total_size"],
+        "complete": state["offset"] == state["total_size"],
+    }
+
+def _error_response(e: ResumableUploadError) -> JSONResponse:
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return JSONResponse(status_code=e.status_code, content={"detail": str(e), "offset": e.offset}, headers=headers)
+
+@router.post("/resumable", status_code=201)
+async def create_resumable_upload(request: ResumableUploadCreate):
+    """Start a resumable upload"""
+    try:
+        await asyncio.to_thread(store.cleanup_expired, settings.RESUMABLE_UPLOAD_TTL_S)
+        state = await asyncio.to_thread(store.create, request.filename, request.size, request.sha256)
+    except ResumableUploadError as e:
+        return _error_response(e)
+    logger.info(f"Resumable upload started: {state['upload_id']} ({request.size} bytes)")
+    return _status(state)
+
+@router.head("/resumable/{upload_id}")
+async def head_resumable_upload(upload_id: str):
+    """Report the current offset so the client knows where to resume"""
+    try:
+        state = await asyncio.to_thread(store.get, upload_id)
+    except ResumableUploadError as e:
+        return Response(status_code=e.status_code)
+    return Response(
+        status_code=200,
+        headers={"Upload-Offset": str(state["offset"]), "Upload-Length": str(state["total_size"])},
+    )
+
+@router.get("/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """Get upload status"""
+    try:
+        state = await asyncio.to_thread(store.get, upload_id)
+    except ResumableUploadError as e:
+        return _error_response(e)
+    return _status(state)
+
+@router.patch("/resumable/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+):
+    """Append the request body at Upload-Offset
+
+    The body is written piece by piece as it arrives and refused with 413 as
+    soon as it runs past the declared upload size. If the client disconnects
+    mid-body, the bytes that did arrive are kept and the offset advanced, so
+    the client resumes from there. A PATCH while another request still holds
+    the upload gets a 423 with the current offset.
+    """
+    content_length = request.headers.get("content-length")
+    length = int(content_length) if content_length and content_length.isdigit() else None
+    try:
+        writer = await asyncio.to_thread(store.start_append, upload_id, upload_offset, length)
+    except ResumableUploadError as e:
+        return _error_response(e)
+    try:
+        async for piece in request.stream():
+            if piece:
+                await asyncio.to_thread(writer.write, piece)
+        state = await asyncio.to_thread(writer.commit)
+    except ClientDisconnect:
+        state = await asyncio.to_thread(writer.commit)
+        logger.info(f"Resumable upload {upload_id}: client disconnected, kept offset {state['offset']}")
+        return Response(status_code=204, headers={"Upload-Offset": str(state["offset"])})
+    except ResumableUploadError as e:
+        return _error_response(e)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return Response(status_code=204, headers={"Upload-Offset": str(state["offset"])})
+
+@router.post("/resumable/{upload_id}/complete", response_model=schemas.ImageOut)
+async def complete_resumable_upload(
+    request: Request,
+    upload_id: str,
+    metadata: schemas.UploadMetadataIn,
+    db: Session = Depends(get_db)
+):
+    """Verify the assembled file and run the upload pipeline on it
+
+    The upload is claimed first, so a concurrent or retried complete gets a
+    409 instead of creating a second image. A failed complete releases the
+    claim and can be retried.
+    """
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
+    try:
+        await asyncio.to_thread(store.claim_completion, upload_id, settings.REQUEST_DEADLINE_S or None)
+    except ResumableUploadError as e:
+        return _error_response(e)
+
+    completed = False
+    try:
+        try:
+            state = await asyncio.to_thread(store.verify, upload_id)
+        except ResumableUploadError as e:
+            return _error_response(e)
+
+        logger.info(f"Resumable upload verified: {upload_id} sha256={state['verified_sha256']}")
+
+        try:
+            with open(store.data_path(state["upload_id"]), "rb") as assembled:
+                result = await UploadService.process_content(
+                    assembled,
+                    metadata.filename or state["filename"],
+                    db=db,
+                    sha256=state["verified_sha256"],
+                    request=request,
+                    deadline=deadline,
+                    **metadata.dict(exclude={"filename"})
+                )
+        except (HTTPException, DeadlineExceeded):
+            raise
+        except Exception as e:
+            logger.error(f"Resumable upload processing failed: {str(e)}")
+            raise HTTPException(500, f"Upload failed: {str(e)}")
+        completed = True
+    finally:
+        if completed:
+            await asyncio.to_thread(store.delete, upload_id)
+        else:
+            await asyncio.to_thread(store.release_completion, upload_id)
+    return result['image']
@@ -2,12 +2,14 @@
 Simplified Upload Router
 Handles only the core upload endpoints, delegating to service layer
 """
-from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import logging
 
 from .. import schemas, database
+from ..config import settings
+from ..services.deadline import Deadline, DeadlineExceeded
 from ..services.upload_service import UploadService
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,7 @@ def get_db():
 
 @router.post("/", response_model=schemas.ImageOut)
 async def upload_image(
+    request: Request,
     source: Optional[str] = Form(default=None),
     event_type: str = Form(default="OTHER"),
     countries: str = Form(default=""),
@@ -68,17 +71,22 @@ async def upload_image(
             rtk_fix=rtk_fix,
             std_h_m=std_h_m,
             std_v_m=std_v_m,
-            db=db
+            db=db,
+            request=request,
+            deadline=Deadline(settings.REQUEST_DEADLINE_S)
         )
         
         return result['image']
         
+    except (HTTPException, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"Single upload failed: {str(e)}")
         raise HTTPException(500, f"Upload failed: {str(e)}")
 
 @router.post("/multi", response_model=dict)
 async def upload_multiple_images(
+    request: Request,
     files: List[UploadFile] = Form(...),
     source: Optional[str] = Form(default=None),
     event_type: str = Form(default="OTHER"),
@@ -125,11 +133,15 @@ async def upload_multiple_images(
             rtk_fix=rtk_fix,
             std_h_m=std_h_m,
             std_v_m=std_v_m,
-            db=db
+            db=db,
+            request=request,
+            deadline=Deadline(settings.REQUEST_DEADLINE_S)
         )
         
         return result
         
+    except (HTTPException, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"Multi upload failed: {str(e)}")
         raise HTTPException(500, f"Multi upload failed: {str(e)}")
@@ -12,6 +12,14 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 @router.put("/captions/{caption_id}/metadata", response_model=schemas.CaptionOut)
 def update_metadata(
     caption_id: str,
@@ -24,31 +32,31 @@ def update_metadata(
     return schemas.CaptionOut.from_orm(caption)
 
 @router.get("/sources", response_model=List[schemas.SourceOut])
-def get_sources(db: Session = Depends(get_db)):
+def get_sources(db: Session = Depends(get_read_db)):
     """Get all sources for lookup"""
     return crud.get_sources(db)
 
 @router.get("/regions", response_model=List[schemas.RegionOut])
-def get_regions(db: Session = Depends(get_db)):
+def get_regions(db: Session = Depends(get_read_db)):
     """Get all regions for lookup"""
     return crud.get_regions(db)
 
 @router.get("/types", response_model=List[schemas.TypeOut])
-def get_types(db: Session = Depends(get_db)):
+def get_types(db: Session = Depends(get_read_db)):
     """Get all types for lookup"""
     return crud.get_types(db)
 
 @router.get("/spatial-references", response_model=List[schemas.SpatialReferenceOut])
-def get_spatial_references(db: Session = Depends(get_db)):
+def get_spatial_references(db: Session = Depends(get_read_db)):
     """Get all spatial references for lookup"""
     return crud.get_spatial_references(db)
 
 @router.get("/image-types", response_model=List[schemas.ImageTypeOut])
-def get_image_types(db: Session = Depends(get_db)):
+def get_image_types(db: Session = Depends(get_read_db)):
     """Get all image types for lookup"""
     return crud.get_image_types(db)
 
 @router.get("/countries", response_model=List[schemas.CountryOut])
-def get_countries(db: Session = Depends(get_db)):
+def get_countries(db: Session = Depends(get_read_db)):
     """Get all countries for lookup"""
     return crud.get_countries(db)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from .. import crud, database, schemas
 from ..services.vlm_service import vlm_manager
 from typing import Dict, Any
+import asyncio
 
 router = APIRouter()
 
@@ -14,10 +15,14 @@ def get_db():
         db.close()
 
 @router.get("/models")
-def get_available_models(db: Session = Depends(get_db)):
-    """Get all available VLM models"""
+async def get_available_models(db: Session = Depends(get_db)):
+    """Get all available VLM models
+
+    Runs on the event loop, which owns the manager's limiters and breakers;
+    only the database query goes to a thread.
+    """
     try:
-        db_models = crud.get_models(db)
+        db_models = await asyncio.to_thread(crud.get_models, db)
         
         models_info = []
         for model in db_models:
@@ -39,12 +44,28 @@ def get_available_models(db: Session = Depends(get_db)):
             "debug": {
                 "registered_services": registered_services,
                 "total_services": len(registered_services),
+                "rate_limits": {name: limiter.stats() for name, limiter in vlm_manager.limiters.items()},
+                "circuits": {name: breaker.stats() for name, breaker in vlm_manager.breakers.items()},
+                "hedging": {
+                    "enabled": vlm_manager.hedge_policy.enabled,
+                    "hedges": vlm_manager.hedge_guard.hedges,
+                    "denied": vlm_manager.hedge_guard.denied,
+                },
+                "coalescing": vlm_manager.single_flight.stats(),
                 "available_db_models": [m.m_code for m in db_models if m.is_available]
             }
         }
     except Exception as e:
         raise HTTPException(500, f"Failed to get models: {str(e)}")
 
+@router.get("/models/health")
+async def get_models_health():
+    """Probe latency, status and circuit state of every registered VLM service
+
+    No I/O; async so breakers are created and moved on the event loop.
+    """
+    return {"services": vlm_manager.get_health()}
+
 @router.get("/models/{model_code}")
 def get_model_info(model_code: str, db: Session = Depends(get_db)):
     """Get specific model information"""
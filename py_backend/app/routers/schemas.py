@@ -16,6 +16,14 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def verify_admin_access(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify admin token for schema endpoints"""
     token = credentials.credentials
@@ -131,7 +139,7 @@ async def test_schema_validation(
 
 @router.get("/schemas/validation-stats")
 async def get_validation_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     token: str = Depends(verify_admin_access)
 ):
     """Get validation statistics (admin only)"""
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException, Response
+from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
+import asyncio
 import io
 import logging
 from sqlalchemy.orm import Session
-from .. import crud, schemas, storage, database
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import crud, crud_async, schemas, storage, database
 from ..config import settings
 from ..services.image_preprocessor import ImagePreprocessor
 from ..services.thumbnail_service import ImageProcessingService
+from ..utils.upload_stream import spool_upload, hash_fileobj
+from ..utils.disconnect import cancel_on_disconnect, ClientDisconnected
+from ..services.deadline import Deadline, DeadlineExceeded
 from typing import List, Optional
 import boto3
 import time
@@ -43,6 +48,19 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    """Session for read-only endpoints: queries go to a read replica when one is healthy"""
+    async with database.AsyncReadSessionLocal() as db:
+        yield db
+
 
 def convert_image_to_dict(img, image_url, url_cache: Optional[dict[str, str]] = None):
     """Helper function to convert SQLAlchemy image model to dict for Pydantic
@@ -181,7 +199,7 @@ def convert_image_to_dict(img, image_url, url_cache: Optional[dict[str, str]] =
 
 
 @router.get("/", response_model=List[schemas.ImageOut])
-def list_images(db: Session = Depends(get_db)):
+def list_images(db: Session = Depends(get_read_db)):
     """Get all images with their caption data"""
     images = crud.get_images(db)
     url_cache: dict[str, str] = {}
@@ -193,7 +211,7 @@ def list_images(db: Session = Depends(get_db)):
     return result
 
 @router.get("/grouped")
-def list_images_grouped(
+async def list_images_grouped(
     page: int = 1, 
     limit: int = 10, 
     search: str = None,
@@ -205,7 +223,7 @@ def list_images_grouped(
     upload_type: str = None,
     starred_only: bool = False,
     include_count: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get images grouped by shared captions for multi-upload items with pagination and filtering
     
@@ -218,7 +236,7 @@ def list_images_grouped(
     if limit < 1 or limit > 100:
         limit = 10
     
-    captions, total_count = crud.get_captions_with_images_filtered(
+    captions, total_count = await crud_async.get_captions_with_images_filtered(
         db=db,
         search=search,
         source=source,
@@ -315,7 +333,7 @@ def list_images_grouped(
     return result
 
 @router.get("/grouped/count")
-def get_images_grouped_count(
+async def get_images_grouped_count(
     search: str = None,
     source: str = None,
     event_type: str = None,
@@ -324,11 +342,11 @@ def get_images_grouped_count(
     image_type: str = None,
     upload_type: str = None,
     starred_only: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get total count of images for pagination"""
     
-    count = crud.count_captions_with_images_filtered(
+    count = await crud_async.count_captions_with_images_filtered(
         db=db,
         search=search,
         source=source,
@@ -343,7 +361,7 @@ def get_images_grouped_count(
     return {"total_count": count}
 
 @router.get("/{image_id}", response_model=schemas.ImageOut)
-def get_image(image_id: str, db: Session = Depends(get_db)):
+async def get_image(image_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """Get a single image by ID"""
     # Validate image_id before querying database
     if not image_id or image_id in ['undefined', 'null', '']:
@@ -355,7 +373,7 @@ def get_image(image_id: str, db: Session = Depends(get_db)):
     if not uuid_pattern.match(image_id):
         raise HTTPException(400, "Invalid image ID format")
     
-    img = crud.get_image(db, image_id) # This loads captions
+    img = await crud_async.get_image(db, image_id) # This loads captions and their images
     if not img:
         raise HTTPException(404, "Image not found")
     
@@ -367,9 +385,6 @@ def get_image(image_id: str, db: Session = Depends(get_db)):
         # We take the first caption and check its linked images
         main_caption = img.captions[0] 
         
-        # Refresh the caption to ensure its images relationship is loaded if not already
-        db.refresh(main_caption) 
-        
         if main_caption.images:
             all_linked_image_ids = [str(linked_img.image_id) for linked_img in main_caption.images]
             effective_image_count = main_caption.image_count if main_caption.image_count is not None and main_caption.image_count > 0 else len(main_caption.images)
@@ -395,6 +410,7 @@ def get_image(image_id: str, db: Session = Depends(get_db)):
 
 @router.post("/", response_model=schemas.ImageOut)
 async def upload_image(
+    request: Request,
     source: Optional[str] = Form(default=None),
     event_type: str    = Form(default="OTHER"),
     countries: str     = Form(default=""),
@@ -417,6 +433,7 @@ async def upload_image(
     std_v_m: Optional[float]     = Form(default=None),
     db: Session        = Depends(get_db)
 ):
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
     countries_list = [c.strip() for c in countries.split(',') if c.strip()] if countries else []
     
     if image_type == "drone_image":
@@ -448,12 +465,15 @@ async def upload_image(
         std_h_m = None
         std_v_m = None
     
-    content = await file.read()
+    # Hash and size-check the spooled upload; the pipeline works from the handle
+    upload = await deadline.run(spool_upload(file, settings.MAX_UPLOAD_BYTES), "receive")
     
     # Preprocess image if needed
     try:
-        processed_content, processed_filename, mime_type = ImagePreprocessor.preprocess_image(
-            content, 
+        processed_file, processed_filename, mime_type, original_mime_type = await deadline.run_sync(
+            "preprocess",
+            ImagePreprocessor.preprocess_fileobj,
+            upload.file, 
             file.filename,
             target_format='PNG',  # Default to PNG for better quality
             quality=95
@@ -466,7 +486,7 @@ async def upload_image(
             preprocessing_info = {
                 "original_filename": file.filename,
                 "processed_filename": processed_filename,
-                "original_mime_type": ImagePreprocessor.detect_mime_type(content, file.filename),
+                "original_mime_type": original_mime_type,
                 "processed_mime_type": mime_type,
                 "was_preprocessed": True
             }
@@ -479,10 +499,12 @@ async def upload_image(
                 "was_preprocessed": False
             }
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Image preprocessing failed: {str(e)}")
         # Fall back to original content if preprocessing fails
-        processed_content = content
+        processed_file = upload.file
         processed_filename = file.filename
         mime_type = 'image/png'  # Default fallback
         preprocessing_info = {
@@ -494,9 +516,9 @@ async def upload_image(
             "error": str(e)
         }
     
-    sha = crud.hash_bytes(processed_content)
+    sha = upload.sha256 if processed_file is upload.file else await deadline.run_sync("hash", hash_fileobj, processed_file)
 
-    key = storage.upload_fileobj(io.BytesIO(processed_content), processed_filename)
+    key = await deadline.run_sync("storage", storage.upload_fileobj, processed_file, processed_filename)
 
     # Generate and upload all image resolutions
     thumbnail_key = None
@@ -506,8 +528,10 @@ async def upload_image(
     
     try:
         # Process both thumbnail and detail versions
-        thumbnail_result, detail_result = ImageProcessingService.process_all_resolutions(
-            processed_content, 
+        thumbnail_result, detail_result = await deadline.run_sync(
+            "thumbnails",
+            ImageProcessingService.process_all_resolutions,
+            processed_file, 
             processed_filename
         )
         
@@ -519,6 +543,8 @@ async def upload_image(
             detail_key, detail_sha256 = detail_result
             logger.info(f"Detail version generated and uploaded: key={detail_key}, sha256={detail_sha256}")
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Image resolution processing failed: {str(e)}")
         # Continue without processed versions if generation fails
@@ -550,13 +576,15 @@ async def upload_image(
     
     try:
         from ..services.vlm_service import vlm_manager
-        result = await vlm_manager.generate_caption(
-            image_bytes=processed_content,
+        processed_file.seek(0)
+        result = await cancel_on_disconnect(request, vlm_manager.generate_caption(
+            image_bytes=processed_file.read(),
             prompt=prompt_text,
             metadata_instructions=metadata_instructions,
             model_name=model_name,
             db_session=db,
-        )
+            deadline=deadline,
+        ), label="upload")
         
         raw = result.get("raw_response", {})
         text = result.get("caption", "")
@@ -586,6 +614,8 @@ async def upload_image(
             image_count=1
         )
         
+    except (ClientDisconnected, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"VLM caption generation failed: {str(e)}")
         # Continue without caption if VLM fails
@@ -596,8 +626,17 @@ async def upload_image(
     result = schemas.ImageOut(**img_dict)
     return result
 
+async def _discard_objects(keys: List[str]) -> None:
+    """Best-effort delete of stored objects; runs outside the request deadline"""
+    for key in keys:
+        try:
+            await asyncio.to_thread(storage.delete_object, key)
+        except Exception as e:
+            logger.warning(f"Failed to delete orphaned object {key}: {e}")
+
 @router.post("/multi", response_model=schemas.ImageOut)
 async def upload_multiple_images(
+    request: Request,
     files: List[UploadFile] = Form(...),
     source: Optional[str] = Form(default=None),
     event_type: str = Form(default="OTHER"),
@@ -628,6 +667,7 @@ async def upload_multiple_images(
     if len(files) < 1:
         raise HTTPException(400, "At least one image required")
     
+    deadline = Deadline(settings.REQUEST_DEADLINE_S)
     countries_list = [c.strip() for c in countries.split(',') if c.strip()] if countries else []
     
     if image_type == "drone_image":
@@ -662,27 +702,47 @@ async def upload_multiple_images(
     uploaded_images = []
     image_bytes_list = []
     
-    # Process each file
-    for file in files:
-        content = await file.read()
-        
+    # Runs in a worker thread: preprocessing, hashing and storage all block
+    def store_file(upload) -> tuple:
         # Preprocess image if needed
         try:
-            processed_content, processed_filename, mime_type = ImagePreprocessor.preprocess_image(
-                content, 
-                file.filename,
+            processed_file, processed_filename, mime_type, _ = ImagePreprocessor.preprocess_fileobj(
+                upload.file, 
+                upload.filename,
                 target_format='PNG',
                 quality=95
             )
         except Exception as e:
             logger.debug(f"Image preprocessing failed: {str(e)}")
-            processed_content = content
-            processed_filename = file.filename
+            processed_file = upload.file
+            processed_filename = upload.filename
             mime_type = 'image/png'
         
-        sha = crud.hash_bytes(processed_content)
-        key = storage.upload_fileobj(io.BytesIO(processed_content), processed_filename)
-        
+        sha = upload.sha256 if processed_file is upload.file else hash_fileobj(processed_file)
+        key = storage.upload_fileobj(processed_file, processed_filename)
+        try:
+            processed_file.seek(0)
+            return key, sha, processed_file.read()
+        except Exception:
+            storage.delete_object(key)
+            raise
+    
+    # Preprocess and store files concurrently (bounded); records are created in upload order
+    semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_CONCURRENCY))
+    
+    async def prepare(file: UploadFile) -> tuple:
+        async with semaphore:
+            upload = await deadline.run(spool_upload(file, settings.MAX_UPLOAD_BYTES), "receive")
+            return await deadline.run_sync("storage", store_file, upload)
+    
+    stored_files = await asyncio.gather(*(prepare(f) for f in files), return_exceptions=True)
+    failures = [stored for stored in stored_files if isinstance(stored, BaseException)]
+    if failures:
+        # Files that did store must not be left behind without a record
+        await _discard_objects([stored[0] for stored in stored_files if not isinstance(stored, BaseException)])
+        raise failures[0]
+    
+    for key, sha, image_bytes in stored_files:
         # Create image record
         img = crud.create_image(
             db, source, event_type, key, sha, countries_list, epsg, image_type,
@@ -691,7 +751,7 @@ async def upload_multiple_images(
         )
         
         uploaded_images.append(img)
-        image_bytes_list.append(processed_content)
+        image_bytes_list.append(image_bytes)
     
     # Get the first image for URL generation (they all share the same metadata)
     first_img = uploaded_images[0]
@@ -717,13 +777,14 @@ async def upload_multiple_images(
     
     try:
         from ..services.vlm_service import vlm_manager
-        result = await vlm_manager.generate_multi_image_caption(
+        result = await cancel_on_disconnect(request, vlm_manager.generate_multi_image_caption(
             image_bytes_list=image_bytes_list,
             prompt=prompt_text,
             metadata_instructions=metadata_instructions,
             model_name=model_name,
             db_session=db,
-        )
+            deadline=deadline,
+        ), label="upload")
         
         raw = result.get("raw_response", {})
         text = result.get("caption", "")
@@ -785,6 +846,9 @@ async def upload_multiple_images(
         
         db.commit()
         
+    except (ClientDisconnected, DeadlineExceeded):
+        db.rollback()
+        raise
     except Exception as e:
         logger.debug(f"VLM error: {e}")
         # Rollback any pending changes before creating fallback caption
@@ -874,11 +938,11 @@ async def copy_image_for_contribution(
         raise HTTPException(500, f"Failed to copy image: {str(e)}")
 
 @router.get("/{image_id}/file")
-async def get_image_file(image_id: str, db: Session = Depends(get_db)):
+async def get_image_file(image_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """Serve the actual image file"""
     logger.debug(f"Serving image file for image_id: {image_id}")
     
-    img = crud.get_image(db, image_id)
+    img = await crud_async.get_image(db, image_id)
     if not img:
         logger.warning(f"Image not found: {image_id}")
         raise HTTPException(404, "Image not found")
@@ -1053,12 +1117,11 @@ async def preprocess_image_only(
 ):
     """Preprocess image without storing it - returns processed file data"""
     try:
-        # Read file content
-        file_content = await file.read()
+        upload = await spool_upload(file, settings.MAX_UPLOAD_BYTES)
         
         # Preprocess the image
-        processed_content, processed_filename, processed_mime_type = ImagePreprocessor.preprocess_image(
-            file_content, 
+        processed_file, processed_filename, processed_mime_type, _ = ImagePreprocessor.preprocess_fileobj(
+            upload.file, 
             file.filename or "unknown",
             target_format='PNG',
             quality=95
@@ -1071,7 +1134,8 @@ async def preprocess_image_only(
         )
         
         # Encode processed content as base64 for JSON response
-        processed_content_b64 = base64.b64encode(processed_content).decode('utf-8')
+        processed_file.seek(0)
+        processed_content_b64 = base64.b64encode(processed_file.read()).decode('ascii')
         
         # Create preprocessing info
         preprocessing_info = {
@@ -1091,6 +1155,8 @@ async def preprocess_image_only(
             "was_preprocessed": was_preprocessed
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=400,
@@ -44,6 +44,30 @@ class ImageMetadataUpdate(BaseModel):
     std_h_m: Optional[float] = None
     std_v_m: Optional[float] = None
 
+class UploadMetadataIn(BaseModel):
+    """Upload form fields, for uploads whose bytes arrive out of band"""
+    filename: Optional[str] = None
+    source: Optional[str] = None
+    event_type: str = "OTHER"
+    countries: str = ""
+    epsg: str = ""
+    image_type: str = "crisis_map"
+    title: str = ""
+    model_name: Optional[str] = None
+    
+    # Drone-specific fields (optional)
+    center_lon: Optional[float] = None
+    center_lat: Optional[float] = None
+    amsl_m: Optional[float] = None
+    agl_m: Optional[float] = None
+    heading_deg: Optional[float] = None
+    yaw_deg: Optional[float] = None
+    pitch_deg: Optional[float] = None
+    roll_deg: Optional[float] = None
+    rtk_fix: Optional[bool] = None
+    std_h_m: Optional[float] = None
+    std_v_m: Optional[float] = None
+
 class CaptionOut(BaseModel):
     caption_id: UUID
     title: Optional[str] = None
@@ -0,0 +1,393 @@
+"""
+Batch Caption Service
+Re-captions many existing images with one model/prompt. Jobs run with
+bounded concurrency and checkpoint progress to a JSON file, so a job that
+was interrupted by a restart resumes with the images it had not finished.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only; stops two workers resuming the same job
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Job statuses; queued/running jobs are picked up again after a restart
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+RESUMABLE_STATUSES = (QUEUED, RUNNING)
+
+DEFAULT_TITLE = "Batch re-caption"
+
+
+class BatchJobError(Exception):
+    """Raised for unknown jobs or invalid job requests"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BatchJobStore:
+    """Job state kept as <job_id>.json in base_dir"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def _path(self, job_id: str) -> str:
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except (ValueError, TypeError):
+            raise BatchJobError("Unknown batch job", 404)
+        return os.path.join(self.base_dir, f"{job_id}.json")
+
+    def save(self, job: Dict[str, Any]) -> None:
+        os.makedirs(self.base_dir, exist_ok=True)
+        job["updated_at"] = time.time()
+        path = self._path(job["job_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise BatchJobError("Unknown batch job", 404)
+
+    @contextmanager
+    def claim(self, job_id: str) -> Iterator[bool]:
+        """Hold an exclusive, non-blocking lock on a job; yields False if another process has it"""
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(self._path(job_id)[:-len(".json")] + ".lock", "a") as lock_file:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                yield True
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.base_dir):
+            return []
+        jobs = []
+        for name in os.listdir(self.base_dir):
+            if name.endswith(".json"):
+                try:
+                    jobs.append(self.load(name[:-len(".json")]))
+                except (BatchJobError, ValueError) as e:
+                    logger.warning("Skipping unreadable batch job %s: %s", name, e)
+        return sorted(jobs, key=lambda j: j.get("created_at", 0), reverse=True)
+
+
+def job_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job state without the (potentially huge) per-image maps"""
+    summary = {k: v for k, v in job.items() if k not in ("image_ids", "done", "failed")}
+    summary.update({
+        "total": len(job["image_ids"]),
+        "completed": len(job["done"]),
+        "failed": len(job["failed"]),
+        "remaining": len(job["image_ids"]) - len(job["done"]),
+    })
+    return summary
+
+
+CaptionFn = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+class BatchCaptionRunner:
+    """Creates, runs, cancels and resumes batch caption jobs"""
+
+    def __init__(
+        self,
+        store: Optional[BatchJobStore] = None,
+        caption_one: Optional[CaptionFn] = None,
+        default_concurrency: int = 4,
+        checkpoint_interval_s: float = 2.0,
+    ):
+        self.store = store
+        self.caption_one = caption_one or caption_image
+        self.default_concurrency = default_concurrency
+        self.checkpoint_interval_s = checkpoint_interval_s
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def configure(self, base_dir: str, default_concurrency: Optional[int] = None) -> None:
+        self.store = BatchJobStore(base_dir)
+        if default_concurrency is not None:
+            self.default_concurrency = default_concurrency
+
+    def _require_store(self) -> BatchJobStore:
+        if self.store is None:
+            raise BatchJobError("Batch captioning is not configured", 503)
+        return self.store
+
+    def create_job(
+        self,
+        image_ids: List[str],
+        model_name: Optional[str] = None,
+        prompt: Optional[str] = None,
+        title: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        allow_fallback: bool = False,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Persist a new queued job; duplicate image ids are dropped"""
+        image_ids = list(dict.fromkeys(str(i) for i in image_ids))
+        if not image_ids:
+            raise BatchJobError("No images match the batch request")
+        now = time.time()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "status": QUEUED,
+            "created_at": now,
+            "updated_at": now,
+            "model_name": model_name,
+            "prompt": prompt,
+            "title": title,
+            "concurrency": max(1, concurrency or self.default_concurrency),
+            "allow_fallback": allow_fallback,
+            "filters": filters,
+            "cancel_requested": False,
+            "error": None,
+            "image_ids": image_ids,
+            "done": {},
+            "failed": {},
+        }
+        self._require_store().save(job)
+        logger.info("Created batch caption job %s for %d images", job["job_id"], len(image_ids))
+        return job
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        return self._require_store().load(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return self._require_store().list()
+
+    def is_running(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def start(self, job_id: str) -> Dict[str, Any]:
+        """Run a job in the background; a no-op if it is already running"""
+        job = self.get_job(job_id)
+        if self.is_running(job_id):
+            return job
+        if job["cancel_requested"] or job["status"] not in RESUMABLE_STATUSES:
+            job.update({"status": QUEUED, "cancel_requested": False, "error": None})
+            self.store.save(job)
+        task = asyncio.create_task(self.run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        job = self.get_job(job_id)
+        job.update({"status": CANCELLED, "cancel_requested": True})
+        self.store.save(job)
+        task = self._tasks.get(job_id)
+        if task and not task.done():
+            task.cancel()
+        return job
+
+    def resume_pending(self) -> List[str]:
+        """Restart jobs that were queued or running when the process stopped"""
+        if self.store is None:
+            return []
+        resumed = []
+        for job in self.store.list():
+            if job["status"] in RESUMABLE_STATUSES and not self.is_running(job["job_id"]):
+                self.start(job["job_id"])
+                resumed.append(job["job_id"])
+        if resumed:
+            logger.info("Resumed %d batch caption job(s)", len(resumed))
+        return resumed
+
+    async def run(self, job_id: str) -> Dict[str, Any]:
+        """Caption every image of the job not yet done, checkpointing as it goes"""
+        store = self._require_store()
+        with store.claim(job_id) as claimed:
+            if not claimed:
+                logger.info("Batch caption job %s is running in another process", job_id)
+                return store.load(job_id)
+            return await self._run_claimed(store, job_id)
+
+    async def _run_claimed(self, store: BatchJobStore, job_id: str) -> Dict[str, Any]:
+        job = store.load(job_id)
+        if job.get("cancel_requested"):
+            return job
+        job["status"] = RUNNING
+        store.save(job)
+
+        remaining = iter([i for i in job["image_ids"] if i not in job["done"]])
+        last_saved = time.monotonic()
+
+        def checkpoint(force: bool = False) -> None:
+            """Merge progress into the stored job and pick up a cancel made by any worker"""
+            nonlocal last_saved
+            if not force and time.monotonic() - last_saved < self.checkpoint_interval_s:
+                return
+            latest = store.load(job_id)
+            if latest.get("cancel_requested"):
+                job.update({"status": CANCELLED, "cancel_requested": True})
+            latest["done"] = {**latest["done"], **job["done"]}
+            latest["failed"] = {k: v for k, v in job["failed"].items() if k not in latest["done"]}
+            latest.update({k: job[k] for k in ("status", "cancel_requested", "error")})
+            store.save(latest)
+            last_saved = time.monotonic()
+
+        async def worker() -> None:
+            # Workers share one iterator, so at most `concurrency` images are in flight
+            for image_id in remaining:
+                if job["cancel_requested"]:
+                    return
+                try:
+                    caption_id = await self.caption_one(image_id, job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Batch %s: image %s failed: %s", job_id, image_id, e)
+                    job["failed"][image_id] = str(e) or type(e).__name__
+                else:
+                    job["done"][image_id] = caption_id
+                    job["failed"].pop(image_id, None)
+                checkpoint()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(job["concurrency"])))
+        except asyncio.CancelledError:
+            # Shutdown leaves the job running so the next start resumes it
+            checkpoint(force=True)
+            raise
+        except Exception as e:
+            logger.error("Batch caption job %s failed: %s", job_id, e)
+            job.update({"status": FAILED, "error": str(e)})
+            checkpoint(force=True)
+            return job
+
+        if not job["cancel_requested"]:
+            job["status"] = COMPLETED
+        checkpoint(force=True)
+        if job["cancel_requested"]:
+            logger.info("Batch caption job %s cancelled with %d images done", job_id, len(job["done"]))
+            return job
+        logger.info(
+            "Batch caption job %s finished: %d captioned, %d failed",
+            job_id, len(job["done"]), len(job["failed"]),
+        )
+        return job
+
+
+def _caption_fields(result: Dict[str, Any], image_type: str) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """Validated (text, metadata, raw_json) from a VLM result, as the caption endpoint stores them"""
+    from .schema_validator import schema_validator
+
+    raw = result.get("raw_response", {})
+    cleaned_data, is_valid, validation_error = schema_validator.clean_and_validate_data(raw, image_type)
+    if is_valid:
+        return cleaned_data.get("analysis", ""), cleaned_data.get("metadata", {}), raw
+    raw["validation_error"] = validation_error
+    raw["validation_failed"] = True
+    return result.get("caption", ""), result.get("metadata", {}), raw
+
+
+def _load_caption_inputs(db, image_id: str, prompt: Optional[str]) -> Tuple[Any, Any, Optional[str]]:
+    """Image, prompt and the image's existing title for caption_image (sync, run in a thread)"""
+    from .. import crud
+
+    img = crud.get_image(db, image_id)
+    if not img:
+        raise LookupError("image not found")
+    if prompt:
+        prompt_obj = crud.get_prompt(db, prompt) or crud.get_prompt_by_label(db, prompt)
+    else:
+        prompt_obj = crud.get_active_prompt_by_image_type(db, img.image_type)
+    if not prompt_obj:
+        raise LookupError(f"no prompt found (requested: '{prompt}' or active for type '{img.image_type}')")
+    existing_title = next((c.title for c in img.captions if c.title), None)
+    return img, prompt_obj, existing_title
+
+
+def _store_caption(db, result: Dict[str, Any], image_type: str, raw_extra: Dict[str, Any], **fields) -> str:
+    """Validate a VLM result and store it as a caption (sync, run in a thread)
+
+    Validation is done here too: a schema cache miss queries the database.
+    """
+    from .. import crud
+
+    text, metadata, raw = _caption_fields(result, image_type)
+    raw.update(raw_extra)
+    return str(crud.create_caption(db, text=text, metadata=metadata, raw_json=raw, **fields).caption_id)
+
+
+async def caption_image(image_id: str, job: Dict[str, Any]) -> str:
+    """Caption one image for a batch job and store it; returns the new caption id
+
+    Database work runs in worker threads so a large job does not stall the
+    event loop between provider calls.
+    """
+    from .. import database, storage
+    from .vlm_service import vlm_manager
+
+    db = database.SessionLocal()
+    try:
+        img, prompt_obj, existing_title = await asyncio.to_thread(
+            _load_caption_inputs, db, image_id, job.get("prompt")
+        )
+
+        img_bytes = await asyncio.to_thread(storage.get_object_bytes, img.file_key)
+        result = await vlm_manager.generate_caption(
+            image_bytes=img_bytes,
+            prompt=prompt_obj.label,
+            metadata_instructions=prompt_obj.metadata_instructions or "",
+            model_name=job.get("model_name"),
+            db_session=db,
+        )
+
+        used_model = result.get("model") or job.get("model_name") or "STUB_MODEL"
+        if result.get("fallback_used") and not job.get("allow_fallback"):
+            raise RuntimeError(
+                f"{result.get('original_model')} unavailable, fell back to {used_model}: {result.get('fallback_reason')}"
+            )
+
+        raw_extra = {"batch_job_id": job["job_id"]}
+        if result.get("fallback_used"):
+            raw_extra["fallback_info"] = {
+                "original_model": result.get("original_model"),
+                "fallback_model": used_model,
+                "reason": result.get("fallback_reason"),
+            }
+
+        return await asyncio.to_thread(
+            _store_caption,
+            db,
+            result,
+            img.image_type,
+            raw_extra,
+            image_id=image_id,
+            title=job.get("title") or existing_title or DEFAULT_TITLE,
+            prompt=prompt_obj.p_code,
+            model_code=used_model,
+        )
+    finally:
+        await asyncio.to_thread(db.close)
+
+
+batch_caption_runner = BatchCaptionRunner()
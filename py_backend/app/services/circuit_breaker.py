@@ -0,0 +1,136 @@
+"""
+Circuit Breaker
+Tracks recent outcomes of a VLM service so the manager can skip a provider
+that is failing or hanging instead of waiting out its timeout on every
+request.
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"         # normal operation
+    OPEN = "open"             # failing; calls are rejected immediately
+    HALF_OPEN = "half_open"   # cooling-off over; a trial call decides
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+
+@dataclass(frozen=True)
+class CircuitBreakerConfig:
+    window_size: int = 20
+    min_calls: int = 4
+    error_rate_threshold: float = 0.5
+    consecutive_failures: int = 3
+    slow_call_s: float = 30.0
+    slow_rate_threshold: float = 0.8
+    open_duration_s: float = 30.0
+    half_open_max_calls: int = 1
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by error rate and latency"""
+
+    def __init__(self, name: str, config: Optional[CircuitBreakerConfig] = None):
+        self.name = name
+        self.config = config or CircuitBreakerConfig()
+        self._state = CircuitState.CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=self.config.window_size)  # (failed, slow)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.config.open_duration_s:
+            self._to_half_open()
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go through now; half-open admits a limited number of trials"""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._trials < self.config.half_open_max_calls:
+            self._trials += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give back an admitted call that never reached the provider (e.g. rate limited)"""
+        if self._state == CircuitState.HALF_OPEN and self._trials:
+            self._trials -= 1
+
+    def record_success(self, duration_s: float) -> None:
+        if self._state == CircuitState.HALF_OPEN:
+            self._close()
+            return
+        self._consecutive_failures = 0
+        self._record(failed=False, slow=duration_s >= self.config.slow_call_s)
+
+    def record_failure(self, duration_s: float, error: Optional[BaseException] = None) -> None:
+        self.last_error = repr(error) if error is not None else None
+        if self._state == CircuitState.HALF_OPEN:
+            self._open("trial call failed")
+            return
+        self._consecutive_failures += 1
+        self._record(failed=True, slow=duration_s >= self.config.slow_call_s)
+
+    def probe_succeeded(self) -> None:
+        """A background probe reached the provider; let the next real call decide"""
+        if self._state == CircuitState.OPEN:
+            self._to_half_open()
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        self._outcomes.append((failed, slow))
+        if self._state != CircuitState.CLOSED:
+            return
+        if self._consecutive_failures >= self.config.consecutive_failures:
+            self._open(f"{self._consecutive_failures} consecutive failures")
+            return
+        total = len(self._outcomes)
+        if total < self.config.min_calls:
+            return
+        error_rate = sum(1 for f, _ in self._outcomes if f) / total
+        slow_rate = sum(1 for _, s in self._outcomes if s) / total
+        if error_rate >= self.config.error_rate_threshold:
+            self._open(f"error rate {error_rate:.0%}")
+        elif slow_rate >= self.config.slow_rate_threshold:
+            self._open(f"slow call rate {slow_rate:.0%}")
+
+    def _open(self, reason: str) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._trials = 0
+        logger.warning("Circuit OPEN for %s: %s", self.name, reason)
+
+    def _to_half_open(self) -> None:
+        self._state = CircuitState.HALF_OPEN
+        self._trials = 0
+        logger.info("Circuit HALF-OPEN for %s", self.name)
+
+    def _close(self) -> None:
+        self._state = CircuitState.CLOSED
+        self._outcomes.clear()
+        self._consecutive_failures = 0
+        self._trials = 0
+        logger.info("Circuit CLOSED for %s", self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        total = len(self._outcomes)
+        return {
+            "state": self.state.value,
+            "calls_in_window": total,
+            "error_rate": (sum(1 for f, _ in self._outcomes if f) / total) if total else 0.0,
+            "consecutive_failures": self._consecutive_failures,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,99 @@
+"""
+Request Deadlines
+A deadline is created once per request at the router and handed to every
+stage (preprocessing, storage, VLM calls and their fallbacks). Each stage
+waits only for what is left of the request's budget, so a slow stage fails
+fast with DeadlineExceeded instead of stacking its own worst-case timeout on
+top of the others.
+"""
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time; carries the stage that was cut off"""
+
+    def __init__(self, stage: str, budget_s: float, elapsed_s: float):
+        super().__init__(f"Request deadline of {budget_s:.0f}s exceeded during {stage} (after {elapsed_s:.1f}s)")
+        self.stage = stage
+        self.budget_s = budget_s
+        self.elapsed_s = elapsed_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "deadline_exceeded",
+            "stage": self.stage,
+            "budget_s": self.budget_s,
+            "elapsed_s": round(self.elapsed_s, 3),
+        }
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish (None/0 budget = no limit)"""
+
+    def __init__(self, budget_s: Optional[float] = None):
+        self.budget_s = budget_s if budget_s and budget_s > 0 else math.inf
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget_s
+
+    @property
+    def bounded(self) -> bool:
+        return self.budget_s != math.inf
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Seconds a stage may wait: the remaining budget, optionally capped (None = no limit)"""
+        remaining = self.remaining if self.bounded else None
+        if cap is None:
+            return remaining
+        return cap if remaining is None else min(cap, remaining)
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        return DeadlineExceeded(stage, self.budget_s, self.elapsed)
+
+    def check(self, stage: str) -> None:
+        """Fail fast before starting a stage the budget no longer covers"""
+        if self.expired:
+            raise self.exceeded(stage)
+
+    async def run(self, awaitable: Awaitable[T], stage: str, cap: Optional[float] = None) -> T:
+        """Await within the remaining budget, raising DeadlineExceeded when it runs out"""
+        if self.expired:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise self.exceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout(cap))
+        except asyncio.TimeoutError:
+            # A stage's own timeout (e.g. an HTTP client's) is not ours to relabel
+            if self.expired:
+                raise self.exceeded(stage) from None
+            raise
+
+    async def run_sync(self, stage: str, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run blocking work in a thread within the budget
+
+        The thread cannot be interrupted; on timeout the request moves on and
+        the thread's result is discarded.
+        """
+        return await self.run(asyncio.to_thread(fn, *args, **kwargs), stage)
+
+
+def ensure_deadline(deadline: Optional[Deadline]) -> Deadline:
+    """The given deadline, or an unbounded one for callers that have none"""
+    return deadline if deadline is not None else Deadline()
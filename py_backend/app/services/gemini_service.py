@@ -1,13 +1,24 @@
 from .vlm_service import VLMService, ModelType
-from typing import Dict, Any, List
+from .structured_output import parse_structured_output
+from typing import Dict, Any, List, Optional
 import asyncio
 import time
-import re
-import json
 
 import google.generativeai as genai
 
 
+def _usage(response) -> Optional[Dict[str, Any]]:
+    """Gemini's usage metadata in the OpenAI usage shape the other providers report"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "completion_tokens": getattr(usage, "candidates_token_count", None),
+        "total_tokens": getattr(usage, "total_token_count", None),
+    }
+
+
 class GeminiService(VLMService):
     """Google Gemini Vision service implementation"""
 
@@ -22,9 +33,10 @@ class GeminiService(VLMService):
         """Generate caption using Google Gemini Vision"""
         instruction = prompt + "\n\n" + metadata_instructions
 
+        image = await self.prepare_image(image_bytes)
         image_part = {
-            "mime_type": "image/jpeg",
-            "data": image_bytes,
+            "mime_type": image.mime_type,
+            "data": image.data,
         }
 
         start = time.time()
@@ -33,17 +45,12 @@ class GeminiService(VLMService):
 
         content = getattr(response, "text", None) or ""
 
-        cleaned_content = content
-        if cleaned_content.startswith("```json"):
-            cleaned_content = re.sub(r"^```json\s*", "", cleaned_content)
-            cleaned_content = re.sub(r"\s*```$", "", cleaned_content)
-
-        try:
-            parsed = json.loads(cleaned_content)
-            description = parsed.get("description", "")
-            analysis = parsed.get("analysis", "")
-            recommended_actions = parsed.get("recommended_actions", "")
-            metadata = parsed.get("metadata", {})
+        parsed = parse_structured_output(content)
+        if parsed.ok:
+            description = parsed.description
+            analysis = parsed.analysis
+            recommended_actions = parsed.recommended_actions
+            metadata = parsed.metadata
             
             # Combine all three parts for backward compatibility
             caption_text = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
@@ -53,14 +60,20 @@ class GeminiService(VLMService):
                 allowed_epsg = ["4326", "3857", "32617", "32633", "32634", "OTHER"]
                 if epsg_value not in allowed_epsg:
                     metadata["epsg"] = "OTHER"
-        except json.JSONDecodeError:
+        else:
             description = ""
             analysis = content
             recommended_actions = ""
             caption_text = content
             metadata = {}
 
-        raw_response: Dict[str, Any] = {"model": self.model_id}
+        raw_response: Dict[str, Any] = {
+            "model": self.model_id,
+            "content": content,
+            "parse_status": parsed.status,
+            "image_payload": image.describe(),
+            "usage": _usage(response)
+        }
 
         return {
             "caption": caption_text,
@@ -79,10 +92,11 @@ class GeminiService(VLMService):
 
         # Create content list with instruction and multiple images
         content = [instruction]
-        for image_bytes in image_bytes_list:
+        images = await self.prepare_images(image_bytes_list)
+        for image in images:
             image_part = {
-                "mime_type": "image/jpeg",
-                "data": image_bytes,
+                "mime_type": image.mime_type,
+                "data": image.data,
             }
             content.append(image_part)
 
@@ -92,17 +106,12 @@ class GeminiService(VLMService):
 
         content = getattr(response, "text", None) or ""
 
-        cleaned_content = content
-        if cleaned_content.startswith("```json"):
-            cleaned_content = re.sub(r"^```json\s*", "", cleaned_content)
-            cleaned_content = re.sub(r"\s*```$", "", cleaned_content)
-
-        try:
-            parsed = json.loads(cleaned_content)
-            description = parsed.get("description", "")
-            analysis = parsed.get("analysis", "")
-            recommended_actions = parsed.get("recommended_actions", "")
-            metadata = parsed.get("metadata", {})
+        parsed = parse_structured_output(content)
+        if parsed.ok:
+            description = parsed.description
+            analysis = parsed.analysis
+            recommended_actions = parsed.recommended_actions
+            metadata = parsed.metadata
             
             # Combine all three parts for backward compatibility
             caption_text = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
@@ -112,7 +121,7 @@ class GeminiService(VLMService):
                 allowed_epsg = ["4326", "3857", "32617", "32633", "32634", "OTHER"]
                 if epsg_value not in allowed_epsg:
                     metadata["epsg"] = "OTHER"
-        except json.JSONDecodeError:
+        else:
             description = ""
             analysis = content
             recommended_actions = ""
@@ -121,7 +130,11 @@ class GeminiService(VLMService):
 
         raw_response: Dict[str, Any] = {
             "model": self.model_id,
-            "image_count": len(image_bytes_list)
+            "content": content,
+            "parse_status": parsed.status,
+            "image_count": len(image_bytes_list),
+            "image_payload": [image.describe() for image in images],
+            "usage": _usage(response)
         }
 
         return {
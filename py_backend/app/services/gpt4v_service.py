@@ -1,20 +1,26 @@
 from .vlm_service import VLMService, ModelType
-from typing import Dict, Any, List
+from .structured_output import parse_structured_output
+from typing import Dict, Any, List, Optional, Callable
 import openai
-import base64
 import asyncio
-import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+def _usage(response) -> Optional[Dict[str, Any]]:
+    """Token counts reported with a completion, if any"""
+    usage = getattr(response, "usage", None)
+    return usage.model_dump() if usage is not None else None
+
 class GPT4VService(VLMService):
     """GPT-4 Vision service implementation"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         super().__init__("GPT4V", ModelType.GPT4V)
         logger.debug(f"Initializing with API key: {api_key[:10]}...{api_key[-4:] if api_key else 'None'}")
-        self.client = openai.OpenAI(api_key=api_key)
+        # base_url: any OpenAI-compatible endpoint (e.g. the local VLM simulator)
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url or None)
         self.model_name = "GPT-4O"
         logger.info("Initialized successfully")
     
@@ -27,7 +33,7 @@ class GPT4VService(VLMService):
             logger.debug(f"Image size: {len(image_bytes)} bytes")
             logger.debug(f"Prompt length: {len(prompt)} chars")
             
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            image = await self.prepare_image(image_bytes)
             
             logger.debug(f"Making API call to OpenAI...")
             response = await asyncio.to_thread(
@@ -41,7 +47,7 @@ class GPT4VService(VLMService):
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                    "url": image.data_url
                                 }
                             }
                         ]
@@ -52,56 +58,7 @@ class GPT4VService(VLMService):
             logger.info("API call successful!")
             
             content = response.choices[0].message.content
-            
-            cleaned_content = content.strip()
-            if cleaned_content.startswith("```json"):
-                cleaned_content = cleaned_content[7:]
-            if cleaned_content.endswith("```"):
-                cleaned_content = cleaned_content[:-3]
-            cleaned_content = cleaned_content.strip()
-            
-            metadata = {}
-            try:
-                metadata = json.loads(cleaned_content)
-            except json.JSONDecodeError:
-                if "```json" in content:
-                    json_start = content.find("```json") + 7
-                    json_end = content.find("```", json_start)
-                    if json_end > json_start:
-                        json_str = content[json_start:json_end].strip()
-                        try:
-                            metadata = json.loads(json_str)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON parse error: {e}")
-                else:
-                    import re
-                    json_match = re.search(r'\{[^{}]*"metadata"[^{}]*\{[^{}]*\}', content)
-                    if json_match:
-                        try:
-                            metadata = json.loads(json_match.group())
-                        except json.JSONDecodeError:
-                            pass
-            
-            # Extract the three parts from the parsed JSON
-            description = metadata.get("description", "")
-            analysis = metadata.get("analysis", "")
-            recommended_actions = metadata.get("recommended_actions", "")
-            
-            # Combine all three parts for backward compatibility
-            combined_content = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
-            
-            return {
-                "caption": combined_content,
-                "raw_response": {
-                    "content": content, 
-                    "metadata": metadata,
-                    "extracted_metadata": metadata
-                },
-                "metadata": metadata,
-                "description": description,
-                "analysis": analysis,
-                "recommended_actions": recommended_actions
-            }
+            return self._build_result(content, image_payload=image.describe(), usage=_usage(response))
             
         except Exception as e:
             logger.error(f"API call failed: {str(e)}")
@@ -111,6 +68,56 @@ class GPT4VService(VLMService):
                 logger.error(f"Response body: {getattr(e.response, 'text', 'Unknown')}")
             raise Exception(f"GPT-4 Vision API error: {str(e)}")
     
+    async def stream_caption(self, image_bytes: bytes, prompt: str, metadata_instructions: str = "",
+                             on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate caption using GPT-4 Vision, passing each streamed text delta to on_delta"""
+        try:
+            image = await self.prepare_image(image_bytes)
+            loop = asyncio.get_running_loop()
+            stop = threading.Event()
+
+            def consume() -> str:
+                # The sync client's stream is read in a worker thread; deltas hop back to the loop
+                parts = []
+                stream = self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": prompt + "\n\n" + metadata_instructions},
+                                {"type": "image_url", "image_url": {"url": image.data_url}}
+                            ]
+                        }
+                    ],
+                    max_tokens=800,
+                    stream=True
+                )
+                try:
+                    for chunk in stream:
+                        if stop.is_set():
+                            break
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        if text:
+                            parts.append(text)
+                            if on_delta:
+                                loop.call_soon_threadsafe(on_delta, text)
+                finally:
+                    stream.close()
+                return "".join(parts)
+
+            try:
+                content = await asyncio.to_thread(consume)
+            except asyncio.CancelledError:
+                stop.set()
+                raise
+            return self._build_result(content, image_payload=image.describe(), streamed=True)
+
+        except Exception as e:
+            logger.error(f"API call failed: {str(e)}")
+            logger.error(f"Error type: {type(e).__name__}")
+            raise Exception(f"GPT-4 Vision API error: {str(e)}")
+
     async def generate_multi_image_caption(self, image_bytes_list: List[bytes], prompt: str, metadata_instructions: str = "") -> Dict[str, Any]:
         """Generate caption for multiple images using GPT-4 Vision"""
         try:
@@ -118,12 +125,12 @@ class GPT4VService(VLMService):
             content = [{"type": "text", "text": prompt + "\n\n" + metadata_instructions}]
             
             # Add each image to the content
-            for i, image_bytes in enumerate(image_bytes_list):
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            images = await self.prepare_images(image_bytes_list)
+            for image in images:
                 content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}"
+                        "url": image.data_url
                     }
                 })
             
@@ -140,57 +147,12 @@ class GPT4VService(VLMService):
             )
             
             content = response.choices[0].message.content
-            
-            cleaned_content = content.strip()
-            if cleaned_content.startswith("```json"):
-                cleaned_content = cleaned_content[7:]
-            if cleaned_content.endswith("```"):
-                cleaned_content = cleaned_content[:-3]
-            cleaned_content = cleaned_content.strip()
-            
-            metadata = {}
-            try:
-                metadata = json.loads(cleaned_content)
-            except json.JSONDecodeError:
-                if "```json" in content:
-                    json_start = content.find("```json") + 7
-                    json_end = content.find("```", json_start)
-                    if json_end > json_start:
-                        json_str = content[json_start:json_end].strip()
-                        try:
-                            metadata = json.loads(json_str)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON parse error: {e}")
-                else:
-                    import re
-                    json_match = re.search(r'\{[^{}]*"metadata"[^{}]*\{[^{}]*\}', content)
-                    if json_match:
-                        try:
-                            metadata = json.loads(json_match.group())
-                        except json.JSONDecodeError:
-                            pass
-            
-            # Extract the three parts from the parsed JSON
-            description = metadata.get("description", "")
-            analysis = metadata.get("analysis", "")
-            recommended_actions = metadata.get("recommended_actions", "")
-            
-            # Combine all three parts for backward compatibility
-            combined_content = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
-            
-            return {
-                "caption": combined_content,
-                "raw_response": {
-                    "content": content, 
-                    "metadata": metadata,
-                    "extracted_metadata": metadata,
-                    "image_count": len(image_bytes_list)
-                },
-                "metadata": metadata,
-                "description": description,
-                "analysis": analysis,
-                "recommended_actions": recommended_actions
-            }
+            return self._build_result(
+                content,
+                image_count=len(image_bytes_list),
+                image_payload=[image.describe() for image in images],
+                usage=_usage(response),
+            )
             
         except Exception as e:
             logger.error(f"API call failed: {str(e)}")
@@ -198,4 +160,34 @@ class GPT4VService(VLMService):
             if hasattr(e, 'response'):
                 logger.error(f"Response status: {getattr(e.response, 'status_code', 'Unknown')}")
                 logger.error(f"Response body: {getattr(e.response, 'text', 'Unknown')}")
-            raise Exception(f"GPT-4 Vision API error: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"GPT-4 Vision API error: {str(e)}")
+
+    def _build_result(self, content: str, **raw_extra) -> Dict[str, Any]:
+        """Parse the model's JSON reply into the caption result shape"""
+        parsed = parse_structured_output(content)
+        if not parsed.ok:
+            logger.error(f"JSON parse error: {parsed.error}")
+        metadata = parsed.data or {}
+        
+        # Extract the three parts from the parsed JSON
+        description = metadata.get("description", "")
+        analysis = metadata.get("analysis", "")
+        recommended_actions = metadata.get("recommended_actions", "")
+        
+        # Combine all three parts for backward compatibility
+        combined_content = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
+        
+        return {
+            "caption": combined_content,
+            "raw_response": {
+                "content": content, 
+                "metadata": metadata,
+                "extracted_metadata": metadata,
+                "parse_status": parsed.status,
+                **raw_extra
+            },
+            "metadata": metadata,
+            "description": description,
+            "analysis": analysis,
+            "recommended_actions": recommended_actions
+        }
@@ -0,0 +1,85 @@
+"""
+Hedged Requests
+If the primary VLM has not answered within a latency-percentile delay, the
+same request is also sent to the fallback model and whichever finishes
+first wins. A per-model spend guard bounds how many extra calls hedging may
+add.
+"""
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    enabled: bool = False
+    percentile: float = 0.95
+    min_samples: int = 20
+    default_delay_s: float = 15.0     # used until enough latency samples exist
+    min_delay_s: float = 2.0
+    max_delay_s: float = 30.0
+    max_hedges_per_minute: float = 6.0
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per service"""
+
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window_size)
+            samples.append(seconds)
+
+    def percentile(self, name: str, p: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(name) or ())
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(p * (len(samples) - 1))))
+        return samples[index]
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return len(self._samples.get(name) or ())
+
+
+class HedgeSpendGuard:
+    """Per-model budget of hedge calls per minute"""
+
+    def __init__(self, max_per_minute: float):
+        self.max_per_minute = max_per_minute
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.hedges: Dict[str, int] = {}
+        self.denied: Dict[str, int] = {}
+
+    def try_spend(self, name: str, max_per_minute: Optional[float] = None) -> bool:
+        rate = max_per_minute if max_per_minute is not None else self.max_per_minute
+        if rate <= 0:
+            return False
+        bucket = self._buckets.get(name)
+        if bucket is None or bucket.rate_per_minute != rate:
+            bucket = self._buckets[name] = TokenBucket(rate)
+        if bucket.try_acquire(1) == 0.0:
+            self.hedges[name] = self.hedges.get(name, 0) + 1
+            return True
+        self.denied[name] = self.denied.get(name, 0) + 1
+        return False
+
+
+def hedge_delay(policy: HedgePolicy, tracker: LatencyTracker, name: str) -> float:
+    """Delay before hedging a call to name: its latency percentile, clamped"""
+    observed = tracker.percentile(name, policy.percentile, policy.min_samples)
+    delay = observed if observed is not None else policy.default_delay_s
+    return max(policy.min_delay_s, min(policy.max_delay_s, delay))
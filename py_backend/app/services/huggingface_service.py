@@ -3,14 +3,12 @@ from __future__ import annotations
 
 
 from .vlm_service import VLMService, ModelType, ServiceStatus
+from .structured_output import content_text, parse_structured_output
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 import aiohttp
-import base64
 import time
-import re
 import json
-import imghdr
 import os
 
 
@@ -22,9 +20,12 @@ def _env_token() -> Optional[str]:
     )
 
 
+HF_ROUTER_URL = "https://router.huggingface.co/v1/chat/completions"
+
+
 def _providers_url_default() -> str:
     # OpenAI-compatible gateway on HF Inference Providers
-    return os.getenv("HF_PROVIDERS_URL", "https://router.huggingface.co/v1/chat/completions")
+    return os.getenv("HF_PROVIDERS_URL", HF_ROUTER_URL)
 
 
 class HuggingFaceService(VLMService):
@@ -51,20 +52,6 @@ class HuggingFaceService(VLMService):
             self.is_available = False
             self.status = ServiceStatus.DEGRADED
 
-    # ---------- helpers ----------
-
-    def _guess_mime(self, image_bytes: bytes) -> str:
-        kind = imghdr.what(None, h=image_bytes)
-        if kind == "jpeg":
-            return "image/jpeg"
-        if kind == "png":
-            return "image/png"
-        if kind == "gif":
-            return "image/gif"
-        if kind == "webp":
-            return "image/webp"
-        return "image/jpeg"
-
     # ---------- lifecycle ----------
 
     async def probe(self) -> bool:
@@ -81,6 +68,13 @@ class HuggingFaceService(VLMService):
             timeout = aiohttp.ClientTimeout(total=5)
             headers_auth = {"Authorization": f"Bearer {self.api_key}"}
 
+            if self.providers_url != HF_ROUTER_URL:
+                # Self-hosted/simulated OpenAI-compatible endpoint: its model list is enough
+                models_url = self.providers_url.rsplit("/chat/completions", 1)[0] + "/models"
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    async with session.get(models_url, headers=headers_auth) as resp:
+                        return resp.status == 200
+
             async with aiohttp.ClientSession(timeout=timeout) as session:
                 # Token check
                 r1 = await session.get("https://huggingface.co/api/whoami-v2", headers=headers_auth)
@@ -121,8 +115,7 @@ class HuggingFaceService(VLMService):
         if metadata_instructions:
             instruction += "\n\n" + metadata_instructions.strip()
 
-        mime = self._guess_mime(image_bytes)
-        data_url = f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+        image = await self.prepare_image(image_bytes)
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -136,7 +129,7 @@ class HuggingFaceService(VLMService):
                     "role": "user",
                     "content": [
                         {"type": "text", "text": instruction},
-                        {"type": "image_url", "image_url": {"url": data_url}},
+                        {"type": "image_url", "image_url": {"url": image.data_url}},
                     ],
                 }
             ],
@@ -170,73 +163,89 @@ class HuggingFaceService(VLMService):
         if not content and message.get("reasoning_content"):
             content = message.get("reasoning_content", "")
 
-        if isinstance(content, list):
-            parts = []
-            for block in content:
-                if isinstance(block, dict):
-                    parts.append(block.get("text") or block.get("content") or "")
-                else:
-                    parts.append(str(block))
-            content = "\n".join([p for p in parts if p])
-
-        caption = (content or "").strip()
-
-        # Strip accidental fenced JSON and special tokens
-        if caption.startswith("```json"):
-            caption = re.sub(r"^```json\s*", "", caption)
-            caption = re.sub(r"\s*```$", "", caption)
-        
-        # Strip GLM special tokens
-        if caption.startswith("<|begin_of_box|>"):
-            caption = caption[16:]  # Remove <|begin_of_box|>
-        if caption.endswith("<|end_of_box|>"):
-            caption = caption[:-15]  # Remove <|end_of_box|>
+        return self._build_result(content, start_time, image_payload=image.describe(), usage=result.get("usage"))
 
-        metadata = {}
-        description = ""
-        analysis = caption
-        recommended_actions = ""
+    async def stream_caption(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        metadata_instructions: str = "",
+        on_delta: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate caption with a streamed chat completion (SSE), passing each
+        content delta to on_delta as it arrives.
+        """
+        if not self.api_key or not self.model_id:
+            raise Exception("MODEL_UNAVAILABLE: HuggingFace credentials or model_id missing.")
 
-        try:
-            parsed = json.loads(caption)
-            description = parsed.get("description", "")
-            analysis = parsed.get("analysis", caption)
-            recommended_actions = parsed.get("recommended_actions", "")
-            metadata = parsed.get("metadata", {})
-            caption_text = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
-        except json.JSONDecodeError:
-            # If JSON parsing fails, treat the response as plain text analysis
-            parsed = None
-            description = ""
-            analysis = caption
-            recommended_actions = ""
-            metadata = {}
-            caption_text = caption
-        
-        # Fallback: if all structured fields are empty, put everything in analysis
-        if not description and not recommended_actions and not metadata:
-            analysis = caption
-            caption_text = f"Description: \n\nAnalysis: {caption}\n\nRecommended Actions: "
+        start_time = time.time()
 
-        elapsed = time.time() - start_time
+        instruction = (prompt or "").strip()
+        if metadata_instructions:
+            instruction += "\n\n" + metadata_instructions.strip()
 
-        return {
-            "caption": caption_text,
-            "metadata": metadata,
-            "confidence": None,
-            "processing_time": elapsed,
-            "raw_response": {
-                "model": self.model_id,
-                "content": content,
-                "metadata": metadata,
-                "extracted_metadata": metadata,
-                "parsed": parsed,
-            },
-            "description": description,
-            "analysis": analysis,
-            "recommended_actions": recommended_actions,
+        image = await self.prepare_image(image_bytes)
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+        payload = {
+            "model": self.model_id,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": instruction},
+                        {"type": "image_url", "image_url": {"url": image.data_url}},
+                    ],
+                }
+            ],
+            "max_tokens": 4096,
+            "temperature": 0.2,
+            "stream": True,
         }
 
+        content_parts: List[str] = []
+        reasoning_parts: List[str] = []
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+                async with session.post(
+                    self.providers_url,
+                    headers=headers,
+                    json=payload,
+                ) as resp:
+                    if resp.status != 200:
+                        raise Exception(f"MODEL_UNAVAILABLE: {self.model_name} unavailable (HTTP {resp.status}).")
+                    async for line in resp.content:
+                        line = line.strip()
+                        if not line.startswith(b"data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == b"[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+                        delta = ((chunk.get("choices") or [{}])[0].get("delta") or {})
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                            if on_delta:
+                                on_delta(delta["content"])
+                        elif delta.get("reasoning_content"):
+                            reasoning_parts.append(delta["reasoning_content"])
+        except Exception as e:
+            if "MODEL_UNAVAILABLE" not in str(e):
+                raise Exception(f"MODEL_UNAVAILABLE: {self.model_name} is unavailable due to a network/error.")
+            raise
+
+        # GLM models sometimes put content in reasoning_content
+        content = "".join(content_parts) or "".join(reasoning_parts)
+        return self._build_result(content, start_time, image_payload=image.describe(), streamed=True)
+
     async def generate_multi_image_caption(
         self,
         image_bytes_list: List[bytes],
@@ -261,10 +270,9 @@ class HuggingFaceService(VLMService):
         }
 
         content = [{"type": "text", "text": instruction}]
-        for image_bytes in image_bytes_list:
-            mime = self._guess_mime(image_bytes)
-            data_url = f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-            content.append({"type": "image_url", "image_url": {"url": data_url}})
+        images = await self.prepare_images(image_bytes_list)
+        for image in images:
+            content.append({"type": "image_url", "image_url": {"url": image.data_url}})
 
         payload = {
             "model": self.model_id,
@@ -295,42 +303,30 @@ class HuggingFaceService(VLMService):
         if not content_out and message.get("reasoning_content"):
             content_out = message.get("reasoning_content", "")
 
-        if isinstance(content_out, list):
-            parts = []
-            for block in content_out:
-                if isinstance(block, dict):
-                    parts.append(block.get("text") or block.get("content") or "")
-                else:
-                    parts.append(str(block))
-            content_out = "\n".join([p for p in parts if p])
-
-        caption = (content_out or "").strip()
+        return self._build_result(
+            content_out,
+            start_time,
+            image_count=len(image_bytes_list),
+            image_payload=[image.describe() for image in images],
+            usage=result.get("usage"),
+        )
 
-        if caption.startswith("```json"):
-            caption = re.sub(r"^```json\s*", "", caption)
-            caption = re.sub(r"\s*```$", "", caption)
-        
-        # Strip GLM special tokens
-        if caption.startswith("<|begin_of_box|>"):
-            caption = caption[16:]  # Remove <|begin_of_box|>
-        if caption.endswith("<|end_of_box|>"):
-            caption = caption[:-15]  # Remove <|end_of_box|>
+    # ---------- response parsing ----------
 
-        metadata = {}
-        description = ""
-        analysis = caption
-        recommended_actions = ""
+    def _build_result(self, content: Any, start_time: float, **raw_extra) -> Dict[str, Any]:
+        """Turn the model's message content into the caption result shape"""
+        content = content_text(content)
+        parsed = parse_structured_output(content)
+        caption = parsed.text
 
-        try:
-            parsed = json.loads(caption)
-            description = parsed.get("description", "")
+        if parsed.ok:
+            description = parsed.description
             analysis = parsed.get("analysis", caption)
-            recommended_actions = parsed.get("recommended_actions", "")
-            metadata = parsed.get("metadata", {})
+            recommended_actions = parsed.recommended_actions
+            metadata = parsed.metadata
             caption_text = f"Description: {description}\n\nAnalysis: {analysis}\n\nRecommended Actions: {recommended_actions}"
-        except json.JSONDecodeError:
+        else:
             # If JSON parsing fails, treat the response as plain text analysis
-            parsed = None
             description = ""
             analysis = caption
             recommended_actions = ""
@@ -351,11 +347,12 @@ class HuggingFaceService(VLMService):
             "processing_time": elapsed,
             "raw_response": {
                 "model": self.model_id,
-                "content": content_out,
+                "content": content,
                 "metadata": metadata,
                 "extracted_metadata": metadata,
-                "parsed": parsed,
-                "image_count": len(image_bytes_list),
+                "parsed": parsed.data,
+                "parse_status": parsed.status,
+                **raw_extra,
             },
             "description": description,
             "analysis": analysis,
@@ -370,12 +367,12 @@ class ProvidersGenericVLMService(HuggingFaceService):
     Example:
       ProvidersGenericVLMService(None, "Qwen/Qwen2.5-VL-32B-Instruct", "QWEN2_5_VL_32B")
     """
-    def __init__(self, api_key: str, model_id: str, public_name: str | None = None):
-        providers_url = "https://router.huggingface.co/v1/chat/completions"
+    def __init__(self, api_key: str, model_id: str, public_name: str | None = None,
+                 providers_url: str | None = None):
         super().__init__(
             api_key=api_key,
             model_id=model_id,
-            providers_url=providers_url,
+            providers_url=providers_url or _providers_url_default(),
             public_name=public_name or model_id.replace("/", "_").upper(),
         )
         if not self.api_key or not self.model_id:
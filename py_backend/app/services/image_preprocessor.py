@@ -124,7 +124,36 @@ class ImagePreprocessor:
                 
         except Exception as e:
             raise ValueError(f"Failed to preprocess {mime_type} file: {str(e)}")
-    
+
+    @staticmethod
+    def preprocess_fileobj(
+        fileobj: BinaryIO,
+        filename: str,
+        target_format: str = 'PNG',
+        quality: int = 95
+    ) -> Tuple[BinaryIO, str, str, str]:
+        """
+        Preprocess a file-like object, only reading it fully when conversion is needed
+
+        PNG/JPEG uploads are passed through as the same (rewound) handle.
+
+        Returns:
+            Tuple of (processed_fileobj, new_filename, mime_type, original_mime_type)
+        """
+        fileobj.seek(0)
+        head = fileobj.read(64)
+        fileobj.seek(0)
+        original_mime_type = ImagePreprocessor.detect_mime_type(head, filename)
+
+        if not ImagePreprocessor.needs_preprocessing(original_mime_type):
+            return fileobj, filename, original_mime_type, original_mime_type
+
+        processed_content, processed_filename, mime_type = ImagePreprocessor.preprocess_image(
+            fileobj.read(), filename, target_format, quality
+        )
+        fileobj.seek(0)
+        return io.BytesIO(processed_content), processed_filename, mime_type, original_mime_type
+
     @staticmethod
     def configure_pdf_processing(zoom_factor: float = 1.5, compress_level: int = 6, quality_mode: str = 'balanced'):
         """
@@ -0,0 +1,219 @@
+"""
+Event-Loop Watchdog
+Measures how late the event loop runs a timer (its lag) and exports it as
+event_loop_lag_seconds. A helper thread watches the loop's heartbeat: when
+the loop has not come back for longer than the stall threshold, the thread
+logs the loop thread's current stack, i.e. the callback that is blocking it.
+
+Debug mode additionally wraps known-blocking calls (boto3, PIL, sync HTTP
+clients, SQLAlchemy sessions, time.sleep) and reports each call site that
+makes one on the loop thread instead of in a worker thread.
+"""
+import asyncio
+import functools
+import importlib
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional, Set, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# (module, attribute path) of calls that block the calling thread
+BLOCKING_CALLS = (
+    ("time", "sleep"),
+    ("botocore.client", "BaseClient._make_api_call"),
+    ("PIL.Image", "Image.load"),
+    ("PIL.Image", "Image.save"),
+    ("httpx", "Client.send"),
+    ("requests", "Session.send"),
+    ("sqlalchemy.orm", "Session.execute"),
+    ("sqlalchemy.orm", "Session.commit"),
+)
+
+# Frames of the stalled loop thread included in the log
+STACK_LIMIT = 30
+
+
+class LoopWatchdog:
+    """Lag sampler on the loop plus a thread that reports stalls"""
+
+    def __init__(self, interval_s: float = 0.1, stall_threshold_s: float = 0.25):
+        self.interval_s = interval_s
+        self.stall_threshold_s = stall_threshold_s
+        self.max_lag_s = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        self._ticks = 0
+
+    def configure(self, interval_s: float, stall_threshold_s: float) -> None:
+        self.interval_s = interval_s
+        self.stall_threshold_s = stall_threshold_s
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start watching the running loop; call from a coroutine on it"""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample_lag())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Event-loop watchdog started (every %.0f ms, stall threshold %.0f ms)",
+            self.interval_s * 1000, self.stall_threshold_s * 1000,
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    async def _sample_lag(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            self._ticks += 1
+            self.max_lag_s = max(self.max_lag_s, lag)
+            metrics.observe_loop_lag(lag)
+            if lag > self.stall_threshold_s:
+                logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        reported_tick = -1
+        while not self._stop.wait(self.interval_s / 2):
+            overdue = time.perf_counter() - self._last_tick - self.interval_s
+            if overdue <= self.stall_threshold_s or reported_tick == self._ticks:
+                continue
+            # One report per stall: the loop has not ticked since
+            reported_tick = self._ticks
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "(no frame)\n"
+            logger.warning(
+                "Event loop stalled for over %.0f ms; loop thread is at:\n%s",
+                overdue * 1000, stack.rstrip(),
+            )
+
+
+def on_loop_thread() -> bool:
+    """Whether the caller runs on a thread with a running event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def in_async_bridge() -> bool:
+    """Whether the caller runs in SQLAlchemy's greenlet for an AsyncSession
+
+    AsyncSession runs the sync Session on the loop thread inside a greenlet
+    that hands every database round trip back to the loop, so Session calls
+    made there do not block it.
+    """
+    try:
+        from sqlalchemy.util.concurrency import in_greenlet
+    except ImportError:
+        return False
+    return in_greenlet()
+
+
+_patched: list = []
+_reported_sites: Set[Tuple[str, str, int]] = set()
+_local = threading.local()
+
+
+def _caller_site() -> Tuple[str, int]:
+    """First frame outside this module and the wrapped library"""
+    for frame in reversed(traceback.extract_stack(limit=STACK_LIMIT)[:-3]):
+        if "site-packages" not in frame.filename and "/lib/python" not in frame.filename:
+            return frame.filename, frame.lineno
+    return "?", 0
+
+
+def _report_blocking(call: str) -> None:
+    metrics.record_blocking_call(call)
+    filename, lineno = _caller_site()
+    key = (call, filename, lineno)
+    if key in _reported_sites:
+        return
+    _reported_sites.add(key)
+    logger.warning(
+        "Blocking call %s on the event loop thread at %s:%d\n%s",
+        call, filename, lineno, "".join(traceback.format_stack(limit=STACK_LIMIT)[:-2]).rstrip(),
+    )
+
+
+def _wrap(call: str, fn):
+    async_bridged = call.startswith("sqlalchemy.")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Only the outermost blocking call is reported (commit -> execute -> ...)
+        if getattr(_local, "inside", False) or not on_loop_thread() or (async_bridged and in_async_bridge()):
+            return fn(*args, **kwargs)
+        _local.inside = True
+        try:
+            _report_blocking(call)
+            return fn(*args, **kwargs)
+        finally:
+            _local.inside = False
+    return wrapper
+
+
+def install_blocking_call_detector(calls=BLOCKING_CALLS) -> int:
+    """Wrap known-blocking calls to report use on the loop thread; returns how many were wrapped
+
+    Debug aid: it adds a check to every wrapped call. Libraries that are not
+    installed are skipped.
+    """
+    count = 0
+    for module_name, path in calls:
+        try:
+            owner = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        *parents, attr = path.split(".")
+        for parent in parents:
+            owner = getattr(owner, parent, None)
+        fn = getattr(owner, attr, None) if owner is not None else None
+        if fn is None or getattr(fn, "_blocking_call_wrapped", False):
+            continue
+        wrapper = _wrap(f"{module_name}.{path}", fn)
+        wrapper._blocking_call_wrapped = True
+        setattr(owner, attr, wrapper)
+        _patched.append((owner, attr, fn))
+        count += 1
+    logger.info("Blocking-call detector wrapped %d calls", count)
+    return count
+
+
+def uninstall_blocking_call_detector() -> None:
+    while _patched:
+        owner, attr, fn = _patched.pop()
+        setattr(owner, attr, fn)
+    _reported_sites.clear()
+
+
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,206 @@
+"""
+Prometheus Metrics
+Request latency per route, upload pipeline stage timings, VLM call outcomes
+and fallbacks, database pool checkout waits, cache hit/miss counts and
+event-loop lag, served at /metrics.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers (wiped before they start); each worker
+writes its samples there and /metrics aggregates all of them. Without
+prometheus_client installed every recording call is a no-op.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from . import server_timing
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, GCCollector, Histogram, PlatformCollector,
+        ProcessCollector, generate_latest, multiprocess,
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upload pipeline stages, in order
+UPLOAD_STAGES = ("receive", "preprocess", "hash", "storage", "thumbnail", "detail", "vlm", "db_commit")
+
+# Seconds; request and VLM latencies range from milliseconds to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30)
+
+
+def multiprocess_dir() -> Optional[str]:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+if PROMETHEUS_AVAILABLE:
+    # Our own registry rather than the global one, so importing this module
+    # under a second name (app.services.metrics / services.metrics) is harmless
+    registry = CollectorRegistry()
+    ProcessCollector(registry=registry)
+    PlatformCollector(registry=registry)
+    GCCollector(registry=registry)
+
+    HTTP_REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "Time to response start, by route template",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS, registry=registry,
+    )
+    UPLOAD_STAGE_DURATION = Histogram(
+        "upload_stage_duration_seconds", "Time spent in each upload pipeline stage",
+        ["stage"], buckets=LATENCY_BUCKETS, registry=registry,
+    )
+    VLM_CALLS = Counter(
+        "vlm_calls_total", "Provider calls by model and outcome", ["model", "outcome"], registry=registry,
+    )
+    VLM_CALL_DURATION = Histogram(
+        "vlm_call_duration_seconds", "Provider call latency (excluding queueing), by model",
+        ["model", "outcome"], buckets=LATENCY_BUCKETS, registry=registry,
+    )
+    VLM_FALLBACKS = Counter(
+        "vlm_fallbacks_total", "Captions answered by a model other than the one picked",
+        ["from_model", "to_model", "kind"], registry=registry,
+    )
+    DB_POOL_CHECKOUT_WAIT = Histogram(
+        "db_pool_checkout_wait_seconds", "Time waiting for a database connection from the pool",
+        buckets=POOL_WAIT_BUCKETS, registry=registry,
+    )
+    DB_POOL_CHECKOUT_ERRORS = Counter(
+        "db_pool_checkout_errors_total", "Pool checkouts that failed (e.g. pool timeout)", registry=registry,
+    )
+    CACHE_LOOKUPS = Counter(
+        "cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ["cache", "result"], registry=registry,
+    )
+    DB_SESSION_ROUTES = Counter(
+        "db_session_routes_total", "Read-session routing: replica, primary_pinned, primary_write or primary_fallback",
+        ["route"], registry=registry,
+    )
+    EVENT_LOOP_LAG = Histogram(
+        "event_loop_lag_seconds", "How late the event loop ran a periodic timer",
+        buckets=LOOP_LAG_BUCKETS, registry=registry,
+    )
+    EVENT_LOOP_BLOCKING_CALLS = Counter(
+        "event_loop_blocking_calls_total", "Known-blocking calls made on the event loop thread (debug mode)",
+        ["call"], registry=registry,
+    )
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. /api/images/{image_id}
+
+    Newer FastAPI versions keep an included router's routes relative to its
+    prefix, so the prefix is recovered from the part of the path the route's
+    own pattern did not match. Unmatched requests share one label.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    pattern = getattr(route, "path_regex", None)
+    if pattern is None or pattern.match(path):
+        return template
+    for i, char in enumerate(path):
+        if char == "/" and pattern.match(path[i:]):
+            return path[:i] + template
+    return template
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    if PROMETHEUS_AVAILABLE:
+        HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    server_timing.add_stage(stage, seconds)
+    if PROMETHEUS_AVAILABLE:
+        UPLOAD_STAGE_DURATION.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time an upload stage; recorded whether it succeeds or raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def record_vlm_call(model: str, outcome: str, seconds: Optional[float] = None) -> None:
+    """outcome: success, error, deadline, rate_limited or circuit_open; seconds only for calls that ran"""
+    if seconds is not None:
+        server_timing.add_stage("vlm_call", seconds)
+    if not PROMETHEUS_AVAILABLE:
+        return
+    VLM_CALLS.labels(model, outcome).inc()
+    if seconds is not None:
+        VLM_CALL_DURATION.labels(model, outcome).observe(seconds)
+
+
+def record_vlm_fallback(from_model: str, to_model: str, kind: str) -> None:
+    """kind: fallback (configured model), stub, hedge or multi_image"""
+    if PROMETHEUS_AVAILABLE:
+        VLM_FALLBACKS.labels(from_model, to_model, kind).inc()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    if PROMETHEUS_AVAILABLE:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_db_route(route: str) -> None:
+    if PROMETHEUS_AVAILABLE:
+        DB_SESSION_ROUTES.labels(route).inc()
+
+
+def observe_loop_lag(seconds: float) -> None:
+    if PROMETHEUS_AVAILABLE:
+        EVENT_LOOP_LAG.observe(seconds)
+
+
+def record_blocking_call(call: str) -> None:
+    if PROMETHEUS_AVAILABLE:
+        EVENT_LOOP_BLOCKING_CALLS.labels(call).inc()
+
+
+def instrument_pool(pool) -> None:
+    """Time every checkout from a SQLAlchemy pool"""
+    if not PROMETHEUS_AVAILABLE or getattr(pool, "_checkout_timed", False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        except Exception:
+            DB_POOL_CHECKOUT_ERRORS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool._checkout_timed = True
+
+
+def render() -> Tuple[bytes, str]:
+    """(body, content type) for /metrics; aggregates every worker in multiprocess mode"""
+    if not PROMETHEUS_AVAILABLE:
+        raise RuntimeError("prometheus_client is not installed")
+    if multiprocess_dir():
+        workers = CollectorRegistry()
+        multiprocess.MultiProcessCollector(workers)
+        return generate_latest(workers), CONTENT_TYPE_LATEST
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """Drop a stopped worker's live samples from the shared directory"""
+    if PROMETHEUS_AVAILABLE and multiprocess_dir():
+        multiprocess.mark_process_dead(pid or os.getpid())
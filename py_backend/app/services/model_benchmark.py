@@ -0,0 +1,383 @@
+"""
+Model Benchmark
+Runs a fixed image set through registered VLM services and summarises,
+per model, call latency percentiles, image payload sizes, schema-validation
+pass rate and output tokens, so models can be compared on numbers. Runs are
+stored in benchmark_runs and compared through the admin API; the
+benchmark_models.py CLI also runs them in-process against StubVLMService or
+the local VLM simulator.
+"""
+import asyncio
+import io
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .deadline import Deadline
+
+try:
+    import fcntl  # POSIX only; without it every running run counts as orphaned at startup
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Run statuses
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff")
+
+# Rough characters per token, for providers that do not report usage
+CHARS_PER_TOKEN = 4
+
+DEFAULT_PROMPT = (
+    "Describe this crisis image. Reply with a JSON object with the keys "
+    "description, analysis, recommended_actions and metadata."
+)
+
+# (raw_response, image_type) -> (is_valid, error); is_valid None means not checked
+ValidateFn = Callable[[Dict[str, Any], str], Tuple[Optional[bool], Optional[str]]]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of values (p in 0-100), None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def load_image_set(directory: str) -> List[Tuple[str, bytes]]:
+    """(name, bytes) for every image in directory, in a stable order"""
+    if not directory or not os.path.isdir(directory):
+        raise FileNotFoundError(f"Benchmark image directory not found: {directory!r}")
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as f:
+                images.append((name, f.read()))
+    if not images:
+        raise FileNotFoundError(f"No images in {directory}")
+    return images
+
+
+def synthetic_image_set(count: int = 4, size: int = 1024) -> List[Tuple[str, bytes]]:
+    """Generated JPEGs of decreasing size, for runs without a real image set"""
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        side = max(64, size >> i)
+        image = Image.linear_gradient("L").resize((side, side)).convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=85)
+        images.append((f"synthetic_{side}px.jpg", output.getvalue()))
+    return images
+
+
+def output_tokens(raw: Dict[str, Any]) -> Tuple[Optional[int], bool]:
+    """(tokens, estimated): the provider's completion tokens, else estimated from the reply text"""
+    usage = raw.get("usage") or {}
+    tokens = usage.get("completion_tokens") if isinstance(usage, dict) else None
+    if tokens is not None:
+        return int(tokens), False
+    content = raw.get("content") or raw.get("analysis")
+    if isinstance(content, str) and content:
+        return max(1, len(content) // CHARS_PER_TOKEN), True
+    return None, True
+
+
+def payload_bytes(raw: Dict[str, Any]) -> Optional[int]:
+    """Bytes of image data sent to the provider, from the result's image_payload"""
+    payload = raw.get("image_payload")
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not payload:
+        return None
+    return sum(p.get("payload_bytes") or 0 for p in payload)
+
+
+def schema_validate(raw: Dict[str, Any], image_type: str) -> Tuple[bool, Optional[str]]:
+    """Validate a result's raw response against the image type's schema, as captions are stored"""
+    from .schema_validator import schema_validator
+
+    _, is_valid, error = schema_validator.clean_and_validate_data(raw, image_type)
+    return is_valid, error
+
+
+def _stats(values: List[float], digits: int = 1) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    stats = {f"p{p}": round(percentile(values, p), digits) for p in (50, 90, 95, 99)}
+    stats["mean"] = round(sum(values) / len(values), digits)
+    stats["max"] = round(max(values), digits)
+    return stats
+
+
+def summarise(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-model summary of benchmark samples"""
+    ok = [s for s in samples if s["ok"]]
+    validated = [s for s in ok if s["schema_valid"] is not None]
+    tokens = [s["output_tokens"] for s in ok if s["output_tokens"] is not None]
+    payloads = [s["payload_bytes"] for s in ok if s["payload_bytes"] is not None]
+    return {
+        "calls": len(samples),
+        "succeeded": len(ok),
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else None,
+        "latency_ms": _stats([s["latency_ms"] for s in ok]),
+        "payload_bytes": _stats(payloads, 0),
+        "schema_pass_rate": round(sum(1 for s in validated if s["schema_valid"]) / len(validated), 4) if validated else None,
+        "output_tokens": {
+            **(_stats(tokens, 0) or {}),
+            "total": sum(tokens),
+            "estimated": any(s["tokens_estimated"] for s in ok),
+        } if tokens else None,
+        "parse_status": dict(Counter(s["parse_status"] for s in ok if s["parse_status"])),
+        "errors": dict(Counter(s["error"] for s in samples if s["error"]).most_common(5)),
+    }
+
+
+class ModelBenchmark:
+    """Runs an image set through VLM services via the manager's call path
+
+    Calls go through VLMServiceManager._call_service, so they respect each
+    provider's rate limits and circuit breaker, but never fall back: a failed
+    call is recorded against the model that was asked.
+    """
+
+    def __init__(self, manager, validate: Optional[ValidateFn] = None, call_timeout_s: float = 120.0):
+        self.manager = manager
+        self.validate = validate or schema_validate
+        self.call_timeout_s = call_timeout_s
+
+    def _services(self, model_names: Optional[List[str]]):
+        if not model_names:
+            return [s for s in self.manager.services.values() if s.model_name != "manual"]
+        missing = [m for m in model_names if m not in self.manager.services]
+        if missing:
+            raise ValueError(f"Models not registered: {', '.join(missing)}")
+        return [self.manager.services[m] for m in model_names]
+
+    async def _measure(self, service, image: Tuple[str, bytes], prompt: str,
+                       metadata_instructions: str, image_type: str) -> Dict[str, Any]:
+        name, image_bytes = image
+        sample = {
+            "image": name,
+            "ok": False,
+            "latency_ms": None,
+            "payload_bytes": None,
+            "schema_valid": None,
+            "output_tokens": None,
+            "tokens_estimated": False,
+            "parse_status": None,
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            result = await self.manager._call_service(
+                service, image_bytes, prompt, metadata_instructions, deadline=Deadline(self.call_timeout_s)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            sample["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            sample["error"] = (str(e) or type(e).__name__)[:200]
+            return sample
+        sample["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        sample["ok"] = True
+
+        raw = result.get("raw_response") or {}
+        sample["payload_bytes"] = payload_bytes(raw)
+        sample["output_tokens"], sample["tokens_estimated"] = output_tokens(raw)
+        sample["parse_status"] = raw.get("parse_status")
+        try:
+            sample["schema_valid"], _ = await asyncio.to_thread(self.validate, raw, image_type)
+        except Exception as e:
+            logger.warning("Benchmark validation failed for %s: %s", service.model_name, e)
+        return sample
+
+    async def run(
+        self,
+        images: List[Tuple[str, bytes]],
+        model_names: Optional[List[str]] = None,
+        prompt: str = DEFAULT_PROMPT,
+        metadata_instructions: str = "",
+        image_type: str = "crisis_map",
+        rounds: int = 1,
+        concurrency: int = 1,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Summary per model; models run one after another, each with `concurrency` calls in flight"""
+        if not images:
+            raise ValueError("No benchmark images")
+        services = self._services(model_names)
+        results = {}
+        for service in services:
+            work = iter([image for _ in range(max(1, rounds)) for image in images])
+            samples: List[Dict[str, Any]] = []
+
+            async def worker() -> None:
+                for image in work:
+                    samples.append(await self._measure(service, image, prompt, metadata_instructions, image_type))
+
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+            results[service.model_name] = summarise(samples)
+            logger.info(
+                "Benchmarked %s: %d/%d calls succeeded",
+                service.model_name, results[service.model_name]["succeeded"], len(samples),
+            )
+        return results
+
+
+def compare_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Side-by-side view of runs: for each model, its headline numbers in every run"""
+    models: Dict[str, List[Dict[str, Any]]] = {}
+    for run in runs:
+        for model, summary in (run.get("results") or {}).items():
+            latency = summary.get("latency_ms") or {}
+            tokens = summary.get("output_tokens") or {}
+            payload = summary.get("payload_bytes") or {}
+            models.setdefault(model, []).append({
+                "run_id": run["run_id"],
+                "created_at": run.get("created_at"),
+                "calls": summary.get("calls"),
+                "error_rate": summary.get("error_rate"),
+                "p50_ms": latency.get("p50"),
+                "p95_ms": latency.get("p95"),
+                "schema_pass_rate": summary.get("schema_pass_rate"),
+                "mean_output_tokens": tokens.get("mean"),
+                "mean_payload_bytes": payload.get("mean"),
+            })
+    return {"runs": [run["run_id"] for run in runs], "models": models}
+
+
+def run_summary(run) -> Dict[str, Any]:
+    """API view of a BenchmarkRuns row"""
+    return {
+        "run_id": str(run.run_id),
+        "status": run.status,
+        "models": run.models,
+        "image_type": run.image_type,
+        "prompt": run.prompt,
+        "image_count": run.image_count,
+        "rounds": run.rounds,
+        "concurrency": run.concurrency,
+        "results": run.results,
+        "error": run.error,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+class BenchmarkRunLocks:
+    """Lock file per running benchmark, flock'd by the worker executing it
+
+    The OS drops the lock when that worker exits, so at startup a run still
+    marked running whose lock is free has lost its worker, while runs other
+    live workers are executing are left alone.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir
+
+    def configure(self, base_dir: str) -> None:
+        self.base_dir = base_dir
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.base_dir, f"{run_id}.lock")
+
+    def hold(self, run_id: str) -> Optional[int]:
+        """Take the run's lock; pass the returned descriptor to release() when the run ends"""
+        if fcntl is None or not self.base_dir:
+            return None
+        os.makedirs(self.base_dir, exist_ok=True)
+        fd = os.open(self._path(run_id), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+
+    def release(self, run_id: str, fd: Optional[int]) -> None:
+        if fd is None:
+            return
+        try:
+            os.remove(self._path(run_id))
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+    def is_held(self, run_id: str) -> bool:
+        """Whether a live worker is executing run_id"""
+        if fcntl is None or not self.base_dir:
+            return False
+        try:
+            fd = os.open(self._path(run_id), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+benchmark_run_locks = BenchmarkRunLocks()
+
+
+def _load_run_params(run_id: str) -> Dict[str, Any]:
+    from .. import crud, database
+
+    db = database.SessionLocal()
+    try:
+        run = crud.get_benchmark_run(db, run_id)
+        return {
+            "model_names": run.models,
+            "image_type": run.image_type,
+            "rounds": run.rounds,
+            "concurrency": run.concurrency,
+        }
+    finally:
+        db.close()
+
+
+def _store_outcome(run_id: str, status: str, results: Optional[Dict[str, Any]] = None,
+                   error: Optional[str] = None) -> None:
+    from .. import crud, database
+
+    db = database.SessionLocal()
+    try:
+        crud.finish_benchmark_run(db, crud.get_benchmark_run(db, run_id), status, results=results, error=error)
+    finally:
+        db.close()
+
+
+async def run_stored_benchmark(run_id: str, images: List[Tuple[str, bytes]], prompt: str,
+                               metadata_instructions: str = "", lock: Optional[int] = None) -> None:
+    """Run the benchmark recorded as run_id and store its results on the row
+
+    No session is held while the models run (that can take minutes): the
+    row is read before and written after, each with a short-lived session.
+    lock (from benchmark_run_locks.hold) is released once the outcome is stored.
+    """
+    from .vlm_service import vlm_manager
+
+    try:
+        params = await asyncio.to_thread(_load_run_params, run_id)
+        try:
+            results = await ModelBenchmark(vlm_manager).run(
+                images,
+                prompt=prompt,
+                metadata_instructions=metadata_instructions,
+                **params,
+            )
+        except Exception as e:
+            logger.error("Benchmark run %s failed: %s", run_id, e)
+            await asyncio.to_thread(_store_outcome, run_id, FAILED, error=str(e))
+            return
+        await asyncio.to_thread(_store_outcome, run_id, COMPLETED, results=results)
+    finally:
+        benchmark_run_locks.release(run_id, lock)
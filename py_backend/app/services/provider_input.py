@@ -0,0 +1,202 @@
+"""
+Provider Input
+Derives the rendition of an image actually sent to a VLM provider (bounded
+dimensions, provider-friendly format) instead of the full preprocessed
+original, and caches renditions by content hash and spec.
+"""
+import base64
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+_FORMAT_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass(frozen=True)
+class ImageInputSpec:
+    """How images are rendered for one model; read from Models.config['image_input']"""
+    max_dimension: int = 2048
+    format: str = "JPEG"
+    quality: int = 85
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], default: Optional["ImageInputSpec"] = None) -> "ImageInputSpec":
+        base = default or cls()
+        image_input = (config or {}).get("image_input") or {}
+        fmt = str(image_input.get("format", base.format)).upper()
+        if fmt == "JPG":
+            fmt = "JPEG"
+        if fmt not in _FORMAT_MIME_TYPES:
+            logger.warning(f"Unsupported image_input format '{fmt}', using {base.format}")
+            fmt = base.format
+        return cls(
+            max_dimension=int(image_input.get("max_dimension", base.max_dimension)),
+            format=fmt,
+            quality=int(image_input.get("quality", base.quality)),
+        )
+
+    @property
+    def mime_type(self) -> str:
+        return _FORMAT_MIME_TYPES[self.format]
+
+
+@dataclass
+class ProviderImage:
+    """Rendition ready to send to a provider"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    source_sha256: str
+    source_bytes: int
+    _base64: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    def describe(self) -> Dict[str, Any]:
+        """Payload stats reported with caption results"""
+        return {
+            "payload_bytes": len(self.data),
+            "source_bytes": self.source_bytes,
+            "mime_type": self.mime_type,
+            "width": self.width,
+            "height": self.height,
+        }
+
+
+def render_image(image_bytes: bytes, spec: ImageInputSpec, source_sha256: Optional[str] = None) -> ProviderImage:
+    """Downscale and re-encode image_bytes according to spec
+
+    The original bytes are reused when they already fit the spec's format and
+    dimensions, so small JPEGs are not recompressed.
+    """
+    source_sha256 = source_sha256 or hashlib.sha256(image_bytes).hexdigest()
+    image = Image.open(io.BytesIO(image_bytes))
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+
+    fits = max(image.size) <= spec.max_dimension
+    if fits and source_format == spec.format:
+        return ProviderImage(image_bytes, spec.mime_type, image.width, image.height, source_sha256, len(image_bytes))
+
+    if not fits:
+        image.thumbnail((spec.max_dimension, spec.max_dimension), Image.Resampling.LANCZOS)
+
+    if spec.format == "JPEG" and image.mode != "RGB":
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    output = io.BytesIO()
+    if spec.format == "JPEG":
+        image.save(output, format="JPEG", quality=spec.quality, optimize=True)
+    elif spec.format == "WEBP":
+        image.save(output, format="WEBP", quality=spec.quality, method=4)
+    else:
+        image.save(output, format="PNG", optimize=True)
+
+    return ProviderImage(output.getvalue(), spec.mime_type, image.width, image.height, source_sha256, len(image_bytes))
+
+
+class ProviderInputCache:
+    """Thread-safe LRU of renditions keyed by (source sha256, spec), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, ImageInputSpec], ProviderImage]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, image_bytes: bytes, spec: ImageInputSpec, sha256: Optional[str] = None) -> ProviderImage:
+        sha = sha256 or hashlib.sha256(image_bytes).hexdigest()
+        key = (sha, spec)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("provider_input", True)
+                return cached
+            self.misses += 1
+        record_cache("provider_input", False)
+
+        rendered = render_image(image_bytes, spec, source_sha256=sha)
+
+        with self._lock:
+            if key not in self._entries and len(rendered.data) <= self.max_bytes:
+                self._entries[key] = rendered
+                self._size += len(rendered.data)
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted.data)
+        return rendered
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+provider_input_cache = ProviderInputCache()
+
+
+class PreparedImages(list):
+    """Source bytes of one multi-image request, rendered once per spec
+
+    Behaves as the list of image bytes. Each image is hashed once and the
+    renditions for a spec (base64 included) are kept, so fallbacks and
+    raced providers with the same spec send the same payload instead of
+    re-rendering and re-encoding every image per attempt.
+    """
+
+    def __init__(self, images=()):
+        super().__init__(images)
+        self._sha256s: Optional[List[str]] = None
+        self._renditions: Dict[ImageInputSpec, List[ProviderImage]] = {}
+        self._lock = threading.Lock()
+
+    def renditions(self, spec: ImageInputSpec, cache: Optional[ProviderInputCache] = None) -> List[ProviderImage]:
+        """Renditions of every image for spec; blocking, so call it from a worker thread"""
+        with self._lock:
+            rendered = self._renditions.get(spec)
+            if rendered is None:
+                if self._sha256s is None:
+                    self._sha256s = [hashlib.sha256(data).hexdigest() for data in self]
+                cache = cache or provider_input_cache
+                rendered = [cache.get_or_render(data, spec, sha256=sha) for data, sha in zip(self, self._sha256s)]
+                for image in rendered:
+                    image.base64  # encode now, off the event loop
+                self._renditions[spec] = rendered
+            return rendered
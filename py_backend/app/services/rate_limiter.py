@@ -0,0 +1,295 @@
+"""
+VLM Rate Limiting
+Per-service concurrency caps and token-bucket limits (requests and tokens per
+minute) so bursts queue locally instead of tripping provider 429s. Limits can
+be shared by all uvicorn workers on a host through a file-backed coordinator.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+
+try:
+    import fcntl  # POSIX only; the file coordinator is disabled without it
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Rough token cost of one image in a vision request, used for TPM estimates
+IMAGE_TOKEN_ESTIMATE = 1000
+POLL_INTERVAL_S = 0.05
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request could not get capacity before its queue deadline"""
+
+
+@dataclass(frozen=True)
+class RateLimitSpec:
+    """Limits for one model; read from Models.config['limits']"""
+    max_concurrency: Optional[int] = None
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    queue_timeout_s: Optional[float] = None
+    max_output_tokens: int = 800
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], default: Optional["RateLimitSpec"] = None) -> "RateLimitSpec":
+        base = default or cls()
+        limits = (config or {}).get("limits") or {}
+
+        def _num(key, cast):
+            value = limits.get(key, getattr(base, key))
+            return cast(value) if value is not None else None
+
+        return cls(
+            max_concurrency=_num("max_concurrency", int),
+            rpm=_num("rpm", float),
+            tpm=_num("tpm", float),
+            queue_timeout_s=_num("queue_timeout_s", float),
+            max_output_tokens=_num("max_output_tokens", int) or base.max_output_tokens,
+        )
+
+    def estimate_tokens(self, text: str, image_count: int = 1) -> int:
+        """Upper-bound token estimate for a request (prompt + images + completion)"""
+        return len(text or "") // 4 + image_count * IMAGE_TOKEN_ESTIMATE + self.max_output_tokens
+
+
+def _take_from_bucket(state: Dict[str, float], amount: float, rate_per_minute: float, now: float) -> float:
+    """Refill state and take amount; returns 0 on success or seconds to wait"""
+    capacity = rate_per_minute
+    rate = rate_per_minute / 60.0
+    tokens = min(capacity, state.get("tokens", capacity) + (now - state.get("updated", now)) * rate)
+    state["updated"] = now
+    # A single request larger than the bucket would never fit; cap it at a full bucket
+    amount = min(amount, capacity)
+    if tokens >= amount:
+        state["tokens"] = tokens - amount
+        return 0.0
+    state["tokens"] = tokens
+    return (amount - tokens) / rate
+
+
+def _refund_to_bucket(state: Dict[str, float], amount: float, rate_per_minute: float, now: float) -> None:
+    """Give back tokens taken for a request that was never sent"""
+    capacity = rate_per_minute
+    tokens = min(capacity, state.get("tokens", capacity) + (now - state.get("updated", now)) * rate_per_minute / 60.0)
+    state["tokens"] = min(capacity, tokens + min(amount, capacity))
+    state["updated"] = now
+
+
+class TokenBucket:
+    """In-process token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self._state: Dict[str, float] = {}
+
+    def try_acquire(self, amount: float = 1, now: Optional[float] = None) -> float:
+        return _take_from_bucket(self._state, amount, self.rate_per_minute, now if now is not None else time.time())
+
+    def refund(self, amount: float = 1, now: Optional[float] = None) -> None:
+        _refund_to_bucket(self._state, amount, self.rate_per_minute, now if now is not None else time.time())
+
+
+class FileRateLimitCoordinator:
+    """Shares buckets and concurrency slots between worker processes via flock'd files"""
+
+    def __init__(self, base_dir: str):
+        if fcntl is None:
+            raise RuntimeError("File rate-limit coordinator requires fcntl (POSIX)")
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.base_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + suffix)
+
+    def _update_bucket(self, key: str, update) -> Optional[Any]:
+        """Apply update(state) to the shared bucket; None if another worker holds its lock
+
+        Never blocks: callers run on the event loop and retry after a sleep.
+        """
+        path = self._path(key, ".bucket.json")
+        with open(path, "a+") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {}
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, key: str, amount: float, rate_per_minute: float) -> float:
+        """Take from the shared bucket; returns 0 on success or seconds to wait
+
+        A bucket another worker has locked counts as a short wait.
+        """
+        wait = self._update_bucket(key, lambda state: _take_from_bucket(state, amount, rate_per_minute, time.time()))
+        return POLL_INTERVAL_S if wait is None else wait
+
+    def refund(self, key: str, amount: float, rate_per_minute: float) -> bool:
+        """Give tokens back to the shared bucket; False if it is locked"""
+        def update(state):
+            _refund_to_bucket(state, amount, rate_per_minute, time.time())
+            return True
+        return self._update_bucket(key, update) is not None
+
+    def try_acquire_slot(self, key: str, limit: int):
+        """Grab one of limit slot locks without blocking; the OS frees it if the worker dies"""
+        for i in range(limit):
+            handle = open(self._path(key, f".slot{i}"), "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except OSError:
+                handle.close()
+        return None
+
+    @staticmethod
+    def release_slot(handle) -> None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        finally:
+            handle.close()
+
+
+class ServiceRateLimiter:
+    """Concurrency + RPM/TPM limiter for one VLM service"""
+
+    def __init__(self, name: str, spec: RateLimitSpec, coordinator: Optional[FileRateLimitCoordinator] = None,
+                 default_queue_timeout_s: float = 30.0):
+        self.name = name
+        self.spec = spec
+        self.coordinator = coordinator
+        self.queue_timeout_s = spec.queue_timeout_s if spec.queue_timeout_s is not None else default_queue_timeout_s
+        self._semaphore = asyncio.Semaphore(spec.max_concurrency) if spec.max_concurrency and not coordinator else None
+        self._buckets = {
+            "rpm": TokenBucket(spec.rpm) if spec.rpm else None,
+            "tpm": TokenBucket(spec.tpm) if spec.tpm else None,
+        }
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.spec.max_concurrency or self.spec.rpm or self.spec.tpm)
+
+    def _try_bucket(self, kind: str, amount: float) -> float:
+        rate = self.spec.rpm if kind == "rpm" else self.spec.tpm
+        if not rate:
+            return 0.0
+        if self.coordinator:
+            return self.coordinator.try_acquire(f"{self.name}.{kind}", amount, rate)
+        return self._buckets[kind].try_acquire(amount)
+
+    async def _refund_bucket(self, kind: str, amount: float) -> None:
+        rate = self.spec.rpm if kind == "rpm" else self.spec.tpm
+        if not rate:
+            return
+        if not self.coordinator:
+            self._buckets[kind].refund(amount)
+            return
+        for _ in range(20):
+            if self.coordinator.refund(f"{self.name}.{kind}", amount, rate):
+                return
+            await asyncio.sleep(POLL_INTERVAL_S)
+        logger.warning(f"{self.name}: could not refund {kind} budget, bucket stayed locked")
+
+    async def _wait_bucket(self, kind: str, amount: float, deadline: float) -> None:
+        while True:
+            wait = self._try_bucket(kind, amount)
+            if wait <= 0:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(f"{self.name}: {kind} limit, no capacity within queue deadline")
+            await asyncio.sleep(wait)
+
+    async def _acquire_slot(self, deadline: float):
+        if self._semaphore:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise RateLimitExceeded(f"{self.name}: concurrency limit, no slot within queue deadline")
+            return None
+        if self.coordinator and self.spec.max_concurrency:
+            while True:
+                handle = self.coordinator.try_acquire_slot(self.name, self.spec.max_concurrency)
+                if handle:
+                    return handle
+                if time.monotonic() >= deadline:
+                    raise RateLimitExceeded(f"{self.name}: concurrency limit, no slot within queue deadline")
+                await asyncio.sleep(POLL_INTERVAL_S)
+        return None
+
+    def _release_slot(self, handle) -> None:
+        if self._semaphore:
+            self._semaphore.release()
+        elif handle is not None:
+            self.coordinator.release_slot(handle)
+
+    @asynccontextmanager
+    async def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Wait (up to the queue deadline) for concurrency and rate capacity
+
+        The slot is taken first: RPM/TPM budget is only spent by a call that
+        is certain to run, not by one that then times out waiting for a slot.
+        Likewise the RPM token is refunded if the TPM wait then fails.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        deadline = time.monotonic() + (timeout if timeout is not None else self.queue_timeout_s)
+        self.queued += 1
+        try:
+            handle = await self._acquire_slot(deadline)
+            try:
+                await self._wait_bucket("rpm", 1, deadline)
+                if tokens:
+                    try:
+                        await self._wait_bucket("tpm", tokens, deadline)
+                    except BaseException:
+                        await self._refund_bucket("rpm", 1)
+                        raise
+            except BaseException:
+                self._release_slot(handle)
+                raise
+        except RateLimitExceeded:
+            self.rejected += 1
+            raise
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._release_slot(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.spec.max_concurrency,
+            "rpm": self.spec.rpm,
+            "tpm": self.spec.tpm,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,190 @@
+"""
+Read-Replica Routing
+Sends the reads of read-only endpoints to a healthy replica and everything
+else to the primary:
+
+- RoutingSession (sync, and as the sync half of an AsyncSession) binds a
+  session to one replica for its reads. Flushes and INSERT/UPDATE/DELETE
+  statements go to the primary, and a session that has written keeps
+  reading from the primary so it sees its own writes.
+- use_primary() pins a request to the primary, e.g. for a client that
+  wrote moments ago (read-your-writes across requests).
+- ReplicaSet health-checks the replicas (reachable, replay lag under the
+  limit) and takes one out of rotation as soon as a connection to it
+  drops. With no healthy replica, reads fall back to the primary.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+# (an idle primary must not make a caught-up replica look stale)
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_pinned: contextvars.ContextVar[bool] = contextvars.ContextVar("db_primary_pinned", default=False)
+
+
+@contextmanager
+def use_primary(pinned: bool = True) -> Iterator[None]:
+    """Route every session in the block (and work it starts) to the primary"""
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class Replica:
+    def __init__(self, name: str, engine, async_engine=None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+        self.lag_s: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def mark_down(self, reason: str) -> None:
+        if self.healthy:
+            logger.warning("Read replica %s out of rotation: %s", self.name, reason)
+        self.healthy = False
+        self.last_error = reason
+
+    def to_dict(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "lag_s": self.lag_s,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at,
+        }
+
+
+class ReplicaSet:
+    """The configured replicas, their health and round-robin selection"""
+
+    def __init__(self, replicas: List[Replica], max_lag_s: float = 10.0):
+        self.replicas = replicas
+        self.max_lag_s = max_lag_s
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        for replica in replicas:
+            self._watch_disconnects(replica, replica.engine)
+            if replica.async_engine is not None:
+                self._watch_disconnects(replica, replica.async_engine.sync_engine)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    @staticmethod
+    def _watch_disconnects(replica: Replica, engine) -> None:
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                replica.mark_down(str(context.original_exception)[:200])
+
+    def pick(self) -> Optional[Replica]:
+        """Next healthy replica, or None to read from the primary"""
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def check(self) -> None:
+        """Probe every replica (blocking); run it off the event loop"""
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    if replica.engine.dialect.name == "postgresql":
+                        replica.lag_s = float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0.0)
+                    else:
+                        conn.execute(text("SELECT 1"))
+                        replica.lag_s = 0.0
+            except Exception as e:
+                replica.lag_s = None
+                replica.mark_down(str(e)[:200])
+            else:
+                if replica.lag_s > self.max_lag_s:
+                    replica.mark_down(f"replication lag {replica.lag_s:.1f}s > {self.max_lag_s:.1f}s")
+                else:
+                    if not replica.healthy:
+                        logger.info("Read replica %s back in rotation (lag %.1fs)", replica.name, replica.lag_s)
+                    replica.healthy = True
+                    replica.last_error = None
+            replica.checked_at = time.time()
+
+    def start_health_checks(self, interval_s: float) -> None:
+        if not self.enabled or interval_s <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._health_loop(interval_s))
+
+    async def _health_loop(self, interval_s: float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logger.error(f"Replica health check failed: {e}")
+            await asyncio.sleep(interval_s)
+
+    def stop_health_checks(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self) -> dict:
+        return {r.name: r.to_dict() for r in self.replicas}
+
+
+class RoutingSession(Session):
+    """Session whose reads go to a replica and writes to the primary (its bind)
+
+    Pass replicas= (and use_async_engines=True when it backs an
+    AsyncSession) through the sessionmaker.
+    """
+
+    def __init__(self, *args, replicas: Optional[ReplicaSet] = None, use_async_engines: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.use_async_engines = use_async_engines
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        route = self.info.get("db_route")
+        if route is None:
+            if self.replicas is None or not self.replicas.enabled:
+                return primary
+            if _pinned.get():
+                route = "primary_pinned"
+        if self._flushing or isinstance(clause, UpdateBase):
+            route = "primary_write"
+        if route is None:
+            replica = self.replicas.pick()
+            if replica is None:
+                route = "primary_fallback"
+            else:
+                route = "replica"
+                self.info["db_replica"] = replica
+        if route != self.info.get("db_route"):
+            self.info["db_route"] = route
+            metrics.record_db_route(route)
+        if route != "replica":
+            return primary
+        replica = self.info["db_replica"]
+        return replica.async_engine.sync_engine if self.use_async_engines else replica.engine
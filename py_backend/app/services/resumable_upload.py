@@ -0,0 +1,282 @@
+"""
+Resumable Upload Store
+Persists partial uploads on disk so clients on bad links can resume from the
+last acknowledged offset instead of resending the whole file.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+try:
+    import fcntl  # POSIX only; used to serialise appends across workers
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ResumableUploadError(Exception):
+    """Raised for protocol errors; carries the HTTP status to surface"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ChunkWriter:
+    """Writes one chunk at the upload's offset while holding its lock
+
+    Returned by ResumableUploadStore.start_append. Pieces are written as they
+    arrive; the stored offset only moves on commit(), so bytes that are not
+    committed are discarded by the next append. commit() may be called after
+    a partial chunk (client disconnected) to keep what did arrive. close()
+    must always be called.
+    """
+
+    def __init__(self, store: "ResumableUploadStore", state: Dict[str, Any], lock_file, data_file: BinaryIO):
+        self.store = store
+        self.state = state
+        self.offset = state["offset"]
+        self.remaining = state["total_size"] - state["offset"]
+        self.written = 0
+        self._lock_file = lock_file
+        self._data_file = data_file
+
+    def write(self, piece: bytes) -> None:
+        if self.written + len(piece) > self.remaining:
+            raise ResumableUploadError("Chunk exceeds declared upload size", 413, self.offset)
+        self._data_file.write(piece)
+        self.written += len(piece)
+
+    def commit(self) -> Dict[str, Any]:
+        """Flush the chunk to disk and advance the stored offset past it"""
+        self._data_file.flush()
+        os.fsync(self._data_file.fileno())
+        self.state["offset"] = self.offset + self.written
+        self.state["updated_at"] = time.time()
+        self.store._write_state(self.state)
+        return self.state
+
+    def close(self) -> None:
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+        if self._lock_file is not None:
+            if fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class ResumableUploadStore:
+    """Chunked upload state kept as <id>.part (data) and <id>.json (metadata)"""
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, base_dir: str, max_bytes: Optional[int] = None):
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+
+    # ---------- paths ----------
+
+    def _check_id(self, upload_id: str) -> str:
+        try:
+            return str(uuid.UUID(upload_id))
+        except (ValueError, TypeError):
+            raise ResumableUploadError("Invalid upload id", 404)
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.base_dir, f"{upload_id}.json")
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self.base_dir, f"{upload_id}.part")
+
+    def _lock(self, upload_id: str, wait: bool = False):
+        """Lock the upload; unless wait, a held lock is a 423 carrying the current offset
+
+        Requests hold the lock while streaming a chunk, so a retry racing a
+        request that has not noticed its client is gone is refused rather
+        than parked on a worker thread.
+        """
+        lock_file = open(os.path.join(self.base_dir, f"{upload_id}.lock"), "a")
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise ResumableUploadError("Upload is busy with another request", 423, self.get(upload_id)["offset"])
+        return lock_file
+
+    @contextmanager
+    def _locked(self, upload_id: str, wait: bool = False) -> Iterator[None]:
+        lock_file = self._lock(upload_id, wait)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _write_state(self, state: Dict[str, Any]) -> None:
+        path = self._state_path(state["upload_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    # ---------- protocol ----------
+
+    def create(self, filename: str, total_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Start a new upload and return its state"""
+        if total_size <= 0:
+            raise ResumableUploadError("Upload size must be positive")
+        if self.max_bytes and total_size > self.max_bytes:
+            raise ResumableUploadError(f"File too large (max {self.max_bytes} bytes)", 413)
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        now = time.time()
+        state = {
+            "upload_id": str(uuid.uuid4()),
+            "filename": os.path.basename(filename or "") or "upload.bin",
+            "total_size": total_size,
+            "sha256": sha256.lower() if sha256 else None,
+            "offset": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        open(self.data_path(state["upload_id"]), "wb").close()
+        self._write_state(state)
+        return state
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        """Return the current state of an upload"""
+        upload_id = self._check_id(upload_id)
+        try:
+            with open(self._state_path(upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ResumableUploadError("Upload not found", 404)
+
+    def start_append(self, upload_id: str, offset: int, length: Optional[int] = None) -> ChunkWriter:
+        """Lock the upload and open it for writing at offset
+
+        offset must match what is already stored. length, when the client
+        declared it (Content-Length), is checked against the declared upload
+        size before any byte is read.
+        """
+        upload_id = self._check_id(upload_id)
+        lock_file = self._lock(upload_id)
+        try:
+            state = self.get(upload_id)
+            if state.get("completing_since"):
+                raise ResumableUploadError("Upload is being completed", 409, state["offset"])
+            if offset != state["offset"]:
+                raise ResumableUploadError(
+                    f"Offset mismatch (expected {state['offset']}, got {offset})", 409, state["offset"]
+                )
+            if length is not None and state["offset"] + length > state["total_size"]:
+                raise ResumableUploadError("Chunk exceeds declared upload size", 413, state["offset"])
+
+            data_file = open(self.data_path(upload_id), "r+b")
+            # Drop any bytes left over from an interrupted write
+            data_file.truncate(offset)
+            data_file.seek(offset)
+        except BaseException:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            raise
+        return ChunkWriter(self, state, lock_file, data_file)
+
+    def append(self, upload_id: str, offset: int, chunk: bytes) -> Dict[str, Any]:
+        """Append a chunk at offset; offsets must match what is already stored"""
+        writer = self.start_append(upload_id, offset, len(chunk))
+        try:
+            writer.write(chunk)
+            return writer.commit()
+        finally:
+            writer.close()
+
+    def verify(self, upload_id: str) -> Dict[str, Any]:
+        """Check the assembled file is complete and matches the declared sha256"""
+        state = self.get(upload_id)
+        if state["offset"] != state["total_size"]:
+            raise ResumableUploadError(
+                f"Upload incomplete ({state['offset']}/{state['total_size']} bytes)", 409, state["offset"]
+            )
+
+        digest = hashlib.sha256()
+        with open(self.data_path(state["upload_id"]), "rb") as f:
+            for block in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                digest.update(block)
+        actual = digest.hexdigest()
+
+        if state["sha256"] and actual != state["sha256"]:
+            raise ResumableUploadError(
+                f"Checksum mismatch (expected {state['sha256']}, got {actual})", 422, state["offset"]
+            )
+        state["verified_sha256"] = actual
+        return state
+
+    def claim_completion(self, upload_id: str, stale_after_s: Optional[float] = None) -> Dict[str, Any]:
+        """Mark the upload as being completed; a concurrent or retried complete gets a 409
+
+        A claim older than stale_after_s (its completer died) can be taken over.
+        """
+        upload_id = self._check_id(upload_id)
+        with self._locked(upload_id):
+            state = self.get(upload_id)
+            claimed = state.get("completing_since")
+            if claimed and not (stale_after_s and time.time() - claimed > stale_after_s):
+                raise ResumableUploadError("Upload is already being completed", 409, state["offset"])
+            state["completing_since"] = time.time()
+            self._write_state(state)
+            return state
+
+    def release_completion(self, upload_id: str) -> None:
+        """Drop a completion claim after a failed complete so the client can retry"""
+        upload_id = self._check_id(upload_id)
+        # Appends only hold the lock briefly while a claim is set, so waiting is bounded
+        with self._locked(upload_id, wait=True):
+            try:
+                state = self.get(upload_id)
+            except ResumableUploadError:
+                return
+            state.pop("completing_since", None)
+            self._write_state(state)
+
+    def delete(self, upload_id: str) -> None:
+        """Remove all files belonging to an upload (best-effort)"""
+        upload_id = self._check_id(upload_id)
+        for suffix in (".part", ".json", ".lock"):
+            try:
+                os.remove(os.path.join(self.base_dir, f"{upload_id}{suffix}"))
+            except OSError:
+                pass
+
+    def cleanup_expired(self, ttl_seconds: float) -> int:
+        """Delete uploads untouched for longer than ttl_seconds; returns count"""
+        if not os.path.isdir(self.base_dir):
+            return 0
+        cutoff = time.time() - ttl_seconds
+        removed = 0
+        for name in os.listdir(self.base_dir):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-5]
+            try:
+                state = self.get(upload_id)
+            except (ResumableUploadError, ValueError):
+                continue
+            if state.get("updated_at", 0) < cutoff:
+                self.delete(upload_id)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} expired resumable uploads")
+        return removed
@@ -1,20 +1,41 @@
-import json
+import time
+from dataclasses import dataclass
 from typing import Dict, Any, Optional, Tuple
 from jsonschema import validate, ValidationError
 from jsonschema.validators import Draft7Validator
 import logging
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
+from app.config import settings
 from app import crud
+from .structured_output import parse_structured_output
+from .metrics import record_cache
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class _CompiledSchema:
+    schema_id: str
+    version: Optional[str]
+    schema: Dict[str, Any]
+    validator: Draft7Validator
+
 class SchemaValidator:
-    """Service for validating JSON data against stored schemas"""
+    """Service for validating JSON data against stored schemas
+    
+    Compiled validators are cached per schema id/version and schema lookups
+    per image type, so validating a caption does not touch the database.
+    clear_schema_cache() drops both when a schema changes.
+    """
     
-    def __init__(self):
-        self.validators = {}
+    def __init__(self, type_cache_ttl_s: Optional[float] = None):
+        self.validators: Dict[str, _CompiledSchema] = {}
         self._schema_cache = {}
+        # image_type -> (schema_id, version, schema, loaded_at); schema_id is
+        # None for image types that have no schema
+        self._type_cache: Dict[str, Tuple[Optional[str], Optional[str], Optional[Dict[str, Any]], float]] = {}
+        self.type_cache_ttl_s = settings.SCHEMA_CACHE_TTL_S if type_cache_ttl_s is None else type_cache_ttl_s
+        self.cache_stats = {"hits": 0, "misses": 0, "compiled": 0}
     
     def _get_schema_from_db(self, schema_id: str) -> Optional[Dict[str, Any]]:
         """Fetch schema from database with caching"""
@@ -37,16 +58,29 @@ class SchemaValidator:
             db.close()
     
     def _get_schema_by_image_type(self, image_type: str) -> Optional[Tuple[str, Dict[str, Any]]]:
-        """Fetch schema by image type from database"""
+        """Fetch schema by image type (cached; from the database on a miss)"""
+        cached = self._type_cache.get(image_type)
+        if cached and time.monotonic() - cached[3] < self.type_cache_ttl_s:
+            self.cache_stats["hits"] += 1
+            record_cache("schema_by_image_type", True)
+            return (cached[0], cached[2]) if cached[0] else None
+        self.cache_stats["misses"] += 1
+        record_cache("schema_by_image_type", False)
+        
         try:
             db = SessionLocal()
             schemas = crud.get_schemas_by_image_type(db, image_type)
             if schemas:
                 # Return the first schema found (could be enhanced to handle multiple schemas)
                 schema_obj = schemas[0]
+                self._type_cache[image_type] = (
+                    schema_obj.schema_id, schema_obj.version, schema_obj.schema, time.monotonic()
+                )
+                self._compiled_validator(schema_obj.schema_id, schema_obj.schema, schema_obj.version)
                 return schema_obj.schema_id, schema_obj.schema
             else:
                 logger.warning(f"No schema found for image type: {image_type}")
+                self._type_cache[image_type] = (None, None, None, time.monotonic())
                 return None
         except Exception as e:
             logger.error(f"Error fetching schema for image type {image_type} from database: {str(e)}")
@@ -55,14 +89,31 @@ class SchemaValidator:
             db.close()
     
     def clear_schema_cache(self, schema_id: Optional[str] = None):
-        """Clear schema cache for a specific schema or all schemas"""
+        """Clear cached schemas and compiled validators for a specific schema or all schemas"""
         if schema_id:
             self._schema_cache.pop(schema_id, None)
+            self.validators.pop(schema_id, None)
+            # A new or re-typed schema may fill a type cached as having none
+            for image_type, cached in list(self._type_cache.items()):
+                if cached[0] == schema_id or cached[0] is None:
+                    del self._type_cache[image_type]
             logger.info(f"Cleared cache for schema {schema_id}")
         else:
             self._schema_cache.clear()
+            self.validators.clear()
+            self._type_cache.clear()
             logger.info("Cleared all schema cache")
     
+    def _compiled_validator(self, schema_id: str, schema: Dict[str, Any], version: Optional[str] = None) -> Draft7Validator:
+        """Draft7Validator for schema, compiled once per schema id/version"""
+        cached = self.validators.get(schema_id)
+        if cached and (version is None or cached.version == version) and (cached.schema is schema or cached.schema == schema):
+            return cached.validator
+        validator = Draft7Validator(schema)
+        self.validators[schema_id] = _CompiledSchema(schema_id, version, schema, validator)
+        self.cache_stats["compiled"] += 1
+        return validator
+    
     def validate_against_schema(self, data: Dict[str, Any], schema: Dict[str, Any], schema_id: str) -> Tuple[bool, Optional[str]]:
         """
         Validate JSON data against a schema
@@ -76,7 +127,7 @@ class SchemaValidator:
             Tuple of (is_valid, error_message)
         """
         try:
-            validator = Draft7Validator(schema)
+            validator = self._compiled_validator(schema_id, schema)
             errors = list(validator.iter_errors(data))
             
             if errors:
@@ -158,10 +209,7 @@ class SchemaValidator:
                 if "response" in ai_data:
                     content = ai_data["response"]
                     if isinstance(content, str):
-                        try:
-                            data = json.loads(content)
-                        except json.JSONDecodeError:
-                            data = {"description": "", "analysis": content, "recommended_actions": "", "metadata": {}}
+                        data = self._parse_content(content)
                     else:
                         data = content
                 elif "description" in ai_data and "analysis" in ai_data and "recommended_actions" in ai_data and "metadata" in ai_data:
@@ -179,11 +227,7 @@ class SchemaValidator:
             elif "content" in raw_data:
                 content = raw_data["content"]
                 if isinstance(content, str):
-                    try:
-                        parsed_content = json.loads(content)
-                        data = parsed_content
-                    except json.JSONDecodeError:
-                        data = {"description": "", "analysis": content, "recommended_actions": "", "metadata": {}}
+                    data = self._parse_content(content)
                 else:
                     data = content
             else:
@@ -202,6 +246,14 @@ class SchemaValidator:
             logger.error(error_msg)
             return raw_data, False, error_msg
     
+    @staticmethod
+    def _parse_content(content: str) -> Dict[str, Any]:
+        """Structured data from a provider's text reply, or the text as plain analysis"""
+        parsed = parse_structured_output(content)
+        if parsed.ok:
+            return parsed.data
+        return {"description": "", "analysis": parsed.text or content, "recommended_actions": "", "metadata": {}}
+    
     def _clean_data(self, data: Dict[str, Any], image_type: str) -> Dict[str, Any]:
         """
         Clean and normalize the data structure
@@ -0,0 +1,152 @@
+"""
+Server-Timing
+Per-request accounting of SQL statements, database time and pipeline
+stages. The totals go back to the client as a Server-Timing header (shown
+in the browser's network panel) and are checked against the request
+budgets: a request that runs too many queries or takes too long is logged
+as slow, so an N+1 regression shows up in the logs before it shows up in
+latency.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """What one request spent, accumulated while it runs"""
+
+    __slots__ = ("started_at", "db_queries", "db_seconds", "stages")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stages: Dict[str, float] = {}
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        parts = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"']
+        parts += [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("request_timing", default=None)
+
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def add_stage(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the current request (no-op outside a request)"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def track() -> Iterator[RequestTiming]:
+    """Collect timings for the block (and work it starts in threads or tasks)"""
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+
+
+def instrument_engine(engine) -> None:
+    """Count SQL statements and their time against the request that ran them"""
+    from sqlalchemy import event
+
+    def finish(conn) -> None:
+        starts = conn.info.get("timing_starts")
+        timing = _current.get()
+        if not starts:
+            return
+        started = starts.pop()
+        if timing is not None:
+            timing.db_queries += 1
+            timing.db_seconds += time.perf_counter() - started
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("timing_starts", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        finish(conn)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None:
+            finish(context.connection)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: Server-Timing header and slow-request log per request
+
+    Budgets of 0 are not checked. The header is sent with the response
+    start, so work done while a streamed body is sent is only in the log.
+    """
+
+    def __init__(self, app, max_queries: int = 0, max_db_ms: float = 0.0, max_duration_ms: float = 0.0,
+                 send_header: bool = True):
+        self.app = app
+        self.max_queries = max_queries
+        self.max_db_ms = max_db_ms
+        self.max_duration_ms = max_duration_ms
+        self.send_header = send_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track() as timing:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start" and self.send_header:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", timing.header().encode("latin-1"))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                self._check_budgets(scope, timing)
+
+    def over_budget(self, timing: RequestTiming) -> list:
+        """Names of the budgets the request went over"""
+        over = []
+        if self.max_queries and timing.db_queries > self.max_queries:
+            over.append(f"{timing.db_queries} queries > {self.max_queries}")
+        if self.max_db_ms and timing.db_seconds * 1000 > self.max_db_ms:
+            over.append(f"{timing.db_seconds * 1000:.0f}ms in DB > {self.max_db_ms:.0f}ms")
+        if self.max_duration_ms and timing.elapsed * 1000 > self.max_duration_ms:
+            over.append(f"{timing.elapsed * 1000:.0f}ms total > {self.max_duration_ms:.0f}ms")
+        return over
+
+    def _check_budgets(self, scope, timing: RequestTiming) -> None:
+        over = self.over_budget(timing)
+        if over:
+            from .metrics import route_template
+            stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in timing.stages.items())
+            logger.warning(
+                "Slow request %s %s (%s): %s%s",
+                scope.get("method"), route_template(scope), scope.get("path"), "; ".join(over),
+                f" [{stages}]" if stages else "",
+            )
@@ -0,0 +1,69 @@
+"""
+Single-Flight Request Coalescing
+Concurrent identical calls (same key) share one in-flight task, so a
+double-click or client retry does not pay for a second provider call. The
+shared task is cancelled only when every caller waiting on it has gone.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], label: Optional[str] = None) -> T:
+        """Await fn() unless a call with the same key is already in flight; then await that one"""
+        label = label or "default"
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed[label] = self.executed.get(label, 0) + 1
+            record_cache("vlm_single_flight", False)
+        else:
+            self.coalesced[label] = self.coalesced.get(label, 0) + 1
+            record_cache("vlm_single_flight", True)
+            logger.debug("Coalesced duplicate %s call", label)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled; nobody needs the result
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "executed": dict(self.executed),
+            "coalesced": dict(self.coalesced),
+            "total_coalesced": sum(self.coalesced.values()),
+        }
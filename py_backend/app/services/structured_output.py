@@ -0,0 +1,192 @@
+"""
+Structured Output Parsing
+One parser for the JSON object every provider is prompted to return
+(description / analysis / recommended_actions / metadata). Models wrap it
+in ```json fences, GLM box tokens or a chatty preamble, and long replies
+get cut off at max_tokens; all of these still parse here instead of
+turning a paid caption into fallback text.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+# How the object was recovered
+OK = "ok"                  # the whole (cleaned) text was the object
+EXTRACTED = "extracted"    # the object was embedded in other text
+REPAIRED = "repaired"      # the object was truncated and closed off
+FAILED = "failed"          # no object could be recovered
+
+_BOX_OPEN = "<|begin_of_box|>"
+_BOX_CLOSE = "<|end_of_box|>"
+
+# Backtracking attempts when closing off a truncated object
+_MAX_REPAIR_ATTEMPTS = 32
+
+
+@dataclass
+class ParsedOutput:
+    """Result of parsing a provider's reply"""
+    text: str                               # reply with fences/special tokens stripped
+    data: Optional[Dict[str, Any]] = None   # the recovered object, None on failure
+    status: str = FAILED
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return (self.data or {}).get(key, default)
+
+    @property
+    def description(self) -> str:
+        return self.get("description", "") or ""
+
+    @property
+    def analysis(self) -> str:
+        return self.get("analysis", "") or ""
+
+    @property
+    def recommended_actions(self) -> str:
+        return self.get("recommended_actions", "") or ""
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        metadata = self.get("metadata", {})
+        return metadata if isinstance(metadata, dict) else {}
+
+
+def content_text(content: Any) -> str:
+    """Flatten a message's content (str, bytes or a list of content blocks) to text"""
+    if content is None:
+        return ""
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content).decode("utf-8", errors="replace")
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, dict):
+                parts.append(block.get("text") or block.get("content") or "")
+            else:
+                parts.append(str(block))
+        return "\n".join([p for p in parts if p])
+    return str(content)
+
+
+def _strip_wrappers(text: str) -> str:
+    text = text.strip()
+    if text.startswith(_BOX_OPEN):
+        text = text[len(_BOX_OPEN):]
+    if text.endswith(_BOX_CLOSE):
+        text = text[:-len(_BOX_CLOSE)]
+    text = text.strip()
+    if text.startswith("```"):
+        newline = text.find("\n")
+        text = text[newline + 1:] if newline != -1 else text[3:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        value = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    if isinstance(value, str) and value.lstrip().startswith("{"):
+        # Double-encoded: the object was sent as a JSON string
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def _scan(text: str, start: int) -> Tuple[Optional[int], List[str], bool, List[Tuple[int, Tuple[str, ...]]]]:
+    """Walk an object starting at text[start] == '{'
+
+    Returns (end, open_stack, in_string, cut_points). end is the index just
+    past the matching brace, or None if the text ends first; then the open
+    containers, whether a string was left open, and positions where the
+    object could be cut and closed (before a comma, after a finished value).
+    """
+    stack: List[str] = []
+    cut_points: List[Tuple[int, Tuple[str, ...]]] = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c == "{" or c == "[":
+            stack.append(c)
+        elif c == "}" or c == "]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, [], False, cut_points
+            cut_points.append((i + 1, tuple(stack)))
+        elif c == ",":
+            cut_points.append((i, tuple(stack)))
+    return None, stack, in_string, cut_points
+
+
+def _closers(stack) -> str:
+    return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+
+def _repair(text: str, start: int, stack: List[str], in_string: bool,
+            cut_points: List[Tuple[int, Tuple[str, ...]]]) -> Optional[Dict[str, Any]]:
+    """Close off a truncated object, backing up to earlier cut points if needed"""
+    body = text[start:].rstrip()
+    candidate = body + ('"' if in_string else "") + _closers(stack)
+    data = _loads_object(candidate)
+    if data is not None:
+        return data
+    for cut, cut_stack in reversed(cut_points[-_MAX_REPAIR_ATTEMPTS:]):
+        data = _loads_object(text[start:cut] + _closers(cut_stack))
+        if data is not None:
+            return data
+    return None
+
+
+def parse_structured_output(content: Any) -> ParsedOutput:
+    """Recover the JSON object from a provider's reply
+
+    Tries, in order: the cleaned text as-is; the first balanced object found
+    inside it; a truncated object closed off at the last point that parses.
+    Never raises; check ParsedOutput.ok.
+    """
+    text = _strip_wrappers(content_text(content))
+    if not text:
+        return ParsedOutput(text=text, error="empty response")
+
+    data = _loads_object(text)
+    if data is not None:
+        return ParsedOutput(text=text, data=data, status=OK)
+
+    start = text.find("{")
+    while start != -1:
+        end, stack, in_string, cut_points = _scan(text, start)
+        if end is None:
+            # Runs off the end of the reply: a truncated object, so repair it
+            # rather than settle for one of the complete objects nested inside
+            data = _repair(text, start, stack, in_string, cut_points)
+            if data is not None:
+                return ParsedOutput(text=text, data=data, status=REPAIRED)
+        else:
+            data = _loads_object(text[start:end])
+            if data is not None:
+                return ParsedOutput(text=text, data=data, status=EXTRACTED)
+        start = text.find("{", start + 1)
+
+    return ParsedOutput(text=text, error="no JSON object found")
@@ -1,15 +1,32 @@
 import io
 import logging
 from PIL import Image, ImageOps
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union, BinaryIO
 import base64
 from ..storage import upload_fileobj, get_object_url
+from .metrics import stage_timer
+from .tracing import span
 
 logger = logging.getLogger(__name__)
 
 class ImageProcessingService:
     """Service for creating and managing multiple image resolutions"""
     
+    @staticmethod
+    def _open_image(image_content: Union[bytes, BinaryIO]) -> Image.Image:
+        """Open an image from raw bytes or a seekable file handle"""
+        if isinstance(image_content, (bytes, bytearray)):
+            return Image.open(io.BytesIO(image_content))
+        image_content.seek(0)
+        return Image.open(image_content)
+    
+    @staticmethod
+    def _as_bytes(image_content: Union[bytes, BinaryIO]) -> bytes:
+        if isinstance(image_content, (bytes, bytearray)):
+            return image_content
+        image_content.seek(0)
+        return image_content.read()
+    
     @staticmethod
     def create_resized_image(
         image_content: bytes,
@@ -36,8 +53,8 @@ class ImageProcessingService:
             Tuple of (resized_bytes, resized_filename)
         """
         try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(image_content))
+            # Open image from bytes or a file handle
+            image = ImageProcessingService._open_image(image_content)
             
             # Honor EXIF orientation
             image = ImageOps.exif_transpose(image)
@@ -81,7 +98,7 @@ class ImageProcessingService:
         except Exception as e:
             logger.error(f"Error creating resized image: {str(e)}")
             # Return original content as fallback
-            return image_content, filename
+            return ImageProcessingService._as_bytes(image_content), filename
     
     @staticmethod
     def create_resized_image_max_width(
@@ -107,8 +124,8 @@ class ImageProcessingService:
             Tuple of (resized_bytes, resized_filename)
         """
         try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(image_content))
+            # Open image from bytes or a file handle
+            image = ImageProcessingService._open_image(image_content)
             
             # Honor EXIF orientation
             image = ImageOps.exif_transpose(image)
@@ -158,7 +175,7 @@ class ImageProcessingService:
         except Exception as e:
             logger.error(f"Error creating resized image: {str(e)}")
             # Return original content as fallback
-            return image_content, filename
+            return ImageProcessingService._as_bytes(image_content), filename
     
     @staticmethod
     def create_thumbnail(
@@ -326,14 +343,14 @@ class ImageProcessingService:
     
     @staticmethod
     def process_all_resolutions(
-        image_content: bytes,
+        image_content: Union[bytes, BinaryIO],
         filename: str
     ) -> Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str]]]:
         """
         Create and upload both thumbnail and detail versions
         
         Args:
-            image_content: Raw image bytes
+            image_content: Raw image bytes or a seekable file handle
             filename: Original filename
             
         Returns:
@@ -344,20 +361,22 @@ class ImageProcessingService:
         
         try:
             # Create thumbnail (WebP format, max width 300px, 80% quality)
-            thumbnail_bytes, thumbnail_filename = ImageProcessingService.create_thumbnail(image_content, filename)
-            if thumbnail_bytes and thumbnail_filename:
-                # Upload the pre-created thumbnail bytes without re-processing
-                thumbnail_result = ImageProcessingService.upload_image_bytes(
-                    thumbnail_bytes, thumbnail_filename, "WEBP"
-                )
+            with stage_timer("thumbnail"), span("upload.thumbnail"):
+                thumbnail_bytes, thumbnail_filename = ImageProcessingService.create_thumbnail(image_content, filename)
+                if thumbnail_bytes and thumbnail_filename:
+                    # Upload the pre-created thumbnail bytes without re-processing
+                    thumbnail_result = ImageProcessingService.upload_image_bytes(
+                        thumbnail_bytes, thumbnail_filename, "WEBP"
+                    )
             
             # Create detail version (WebP format, max width 800px, 85% quality)
-            detail_bytes, detail_filename = ImageProcessingService.create_detail_image(image_content, filename)
-            if detail_bytes and detail_filename:
-                # Upload the pre-created detail bytes without re-processing
-                detail_result = ImageProcessingService.upload_image_bytes(
-                    detail_bytes, detail_filename, "WEBP"
-                )
+            with stage_timer("detail"), span("upload.detail"):
+                detail_bytes, detail_filename = ImageProcessingService.create_detail_image(image_content, filename)
+                if detail_bytes and detail_filename:
+                    # Upload the pre-created detail bytes without re-processing
+                    detail_result = ImageProcessingService.upload_image_bytes(
+                        detail_bytes, detail_filename, "WEBP"
+                    )
                 
         except Exception as e:
             logger.error(f"Error processing image resolutions: {str(e)}")
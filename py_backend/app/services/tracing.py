@@ -0,0 +1,243 @@
+"""
+Tracing
+Opt-in OpenTelemetry spans around the upload, caption, VLM, storage and
+database paths, so a slow request shows whether its time went to
+preprocessing, storage, thumbnails, the provider or Postgres.
+
+TRACING_EXPORTER turns it on: "otlp" sends spans to a collector configured
+by the standard OTEL_EXPORTER_OTLP_* variables, "file" appends them as JSON
+lines to TRACING_FILE for offline analysis. While tracing is off (or the
+OpenTelemetry packages are missing) span() and traced() cost a flag check.
+"""
+import functools
+import inspect
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.propagate import extract
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+EXPORTERS = ("otlp", "file")
+
+# Log format with the active trace/span ids (see TraceContextFilter)
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [trace_id=%(trace_id)s span_id=%(span_id)s] - %(message)s"
+
+# SQL statements are cut to this many characters on db.query spans
+MAX_STATEMENT_CHARS = 2000
+
+_enabled = False
+_tracer = None
+_provider = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def configure(exporter: str, service_name: str = "promptaid-vision", file_path: Optional[str] = None,
+              sample_ratio: float = 1.0, span_exporter=None) -> bool:
+    """Start exporting spans; returns whether tracing is on
+
+    span_exporter, when given, is used as is (synchronously) instead of the
+    named exporter.
+    """
+    global _enabled, _tracer, _provider
+    if not exporter and span_exporter is None:
+        return False
+    if not OTEL_AVAILABLE:
+        logger.warning("Tracing requested but opentelemetry is not installed")
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("Tracing requested but opentelemetry-sdk is not installed")
+        return False
+
+    if span_exporter is not None:
+        processor = SimpleSpanProcessor(span_exporter)
+    elif exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http")
+            return False
+        processor = BatchSpanProcessor(OTLPSpanExporter())
+    elif exporter == "file":
+        if not file_path:
+            logger.warning("TRACING_EXPORTER=file needs TRACING_FILE")
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        out = open(file_path, "a", encoding="utf-8")
+        processor = BatchSpanProcessor(ConsoleSpanExporter(
+            out=out, formatter=lambda span: span.to_json(indent=None) + "\n",
+        ))
+    else:
+        logger.warning("Unknown TRACING_EXPORTER %r; expected one of %s", exporter, ", ".join(EXPORTERS))
+        return False
+
+    shutdown()
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    _provider.add_span_processor(processor)
+    # Deliberately not the global provider: libraries that trace through it
+    # (newer FastAPI versions do) would add a second server span per request
+    _tracer = _provider.get_tracer("promptaid-vision")
+    _enabled = True
+    logger.info("Tracing enabled (%s, sample ratio %.2f)", exporter or type(span_exporter).__name__, sample_ratio)
+    return True
+
+
+def shutdown() -> None:
+    """Flush pending spans and stop tracing"""
+    global _enabled, _tracer, _provider
+    _enabled = False
+    _tracer = None
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def _attributes(attributes: dict) -> dict:
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Any]]:
+    """Run the block in a child span of the current one; yields the span (None while tracing is off)
+
+    Exceptions raised in the block are recorded on the span and mark it as
+    an error. Dotted attribute names go through a dict, e.g.
+    span("vlm.fallback", **{"vlm.model": name}).
+    """
+    if not _enabled:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run a function (sync or async) in a span called name"""
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await fn(*args, **kwargs)
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span"""
+    if _enabled:
+        trace.get_current_span().set_attributes(_attributes(attributes))
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """Record a point-in-time event (e.g. a hedge firing) on the current span"""
+    if _enabled:
+        trace.get_current_span().add_event(name, _attributes(attributes))
+
+
+@contextmanager
+def request_span(method: str, path: str, headers) -> Iterator[Optional[Any]]:
+    """Server span for an incoming request, continuing the caller's trace from its traceparent header"""
+    if not _enabled:
+        yield None
+        return
+    with _tracer.start_as_current_span(
+        f"{method} {path}", context=extract(headers), kind=SpanKind.SERVER,
+        attributes={"http.method": method, "http.target": path},
+    ) as current:
+        yield current
+
+
+def current_trace_id() -> Optional[str]:
+    if not _enabled:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+class TraceContextFilter(logging.Filter):
+    """Adds trace_id and span_id ("-" outside a span) to log records for LOG_FORMAT"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = record.span_id = "-"
+        if _enabled:
+            context = trace.get_current_span().get_span_context()
+            if context.is_valid:
+                record.trace_id = format(context.trace_id, "032x")
+                record.span_id = format(context.span_id, "016x")
+        return True
+
+
+def install_log_correlation(handlers) -> None:
+    """Put trace ids on every line written by these logging handlers"""
+    for handler in handlers:
+        handler.addFilter(TraceContextFilter())
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def instrument_engine(engine) -> None:
+    """Span every SQL statement run on a SQLAlchemy engine (while tracing is on)"""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not _enabled:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        current = _tracer.start_span(f"db.{operation}", kind=SpanKind.CLIENT, attributes={
+            "db.system": system,
+            "db.operation": operation,
+            "db.statement": statement[:MAX_STATEMENT_CHARS],
+            "db.executemany": executemany,
+        })
+        conn.info.setdefault("trace_spans", []).append(current)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            current = spans.pop()
+            if cursor is not None and cursor.rowcount is not None and cursor.rowcount >= 0:
+                current.set_attribute("db.rowcount", cursor.rowcount)
+            current.end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        conn = context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            current = spans.pop()
+            current.record_exception(context.original_exception)
+            current.set_status(Status(StatusCode.ERROR, str(context.original_exception)[:200]))
+            current.end()
@@ -2,10 +2,12 @@
 Upload Service
 Handles the core business logic for image uploads and processing
 """
+import asyncio
 import logging
 import io
-from typing import Optional, Dict, Any, Tuple
-from fastapi import UploadFile
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, Tuple, Union, BinaryIO
+from fastapi import Request, UploadFile
 from sqlalchemy.orm import Session
 
 from .. import crud, schemas, storage
@@ -13,9 +15,21 @@ from ..services.image_preprocessor import ImagePreprocessor
 from ..services.thumbnail_service import ImageProcessingService
 from ..services.vlm_service import vlm_manager
 from ..utils.image_utils import convert_image_to_dict
+from ..utils.upload_stream import spool_upload, hash_fileobj
+from ..utils.disconnect import cancel_on_disconnect, ClientDisconnected
+from ..services.deadline import Deadline, DeadlineExceeded, ensure_deadline
+from ..services.metrics import stage_timer
+from ..services import tracing
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+@contextmanager
+def _stage(name: str) -> Iterator[None]:
+    """Time an upload stage for /metrics and trace it as an upload.<name> span"""
+    with stage_timer(name), tracing.span(f"upload.{name}"):
+        yield
+
 class UploadService:
     """Service for handling image upload operations"""
     
@@ -41,11 +55,73 @@ class UploadService:
         rtk_fix: Optional[bool] = None,
         std_h_m: Optional[float] = None,
         std_v_m: Optional[float] = None,
-        db: Session = None
+        db: Session = None,
+        request: Optional[Request] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """Process a single image upload"""
         logger.info(f"Processing single upload: {file.filename}")
+        deadline = ensure_deadline(deadline)
+        
+        # Hash and size-check the spooled upload without loading it into memory
+        with _stage("receive"):
+            upload = await deadline.run(spool_upload(file, settings.MAX_UPLOAD_BYTES), "receive")
         
+        return await UploadService.process_content(
+            upload.file, upload.filename, source, event_type, countries, epsg, image_type,
+            title, model_name, center_lon, center_lat, amsl_m, agl_m,
+            heading_deg, yaw_deg, pitch_deg, roll_deg,
+            rtk_fix, std_h_m, std_v_m, db=db, sha256=upload.sha256, request=request,
+            deadline=deadline
+        )
+    
+    @staticmethod
+    async def process_content(
+        content: Union[bytes, BinaryIO],
+        filename: str,
+        source: Optional[str],
+        event_type: str,
+        countries: str,
+        epsg: str,
+        image_type: str,
+        title: str,
+        model_name: Optional[str],
+        # Drone-specific fields
+        center_lon: Optional[float] = None,
+        center_lat: Optional[float] = None,
+        amsl_m: Optional[float] = None,
+        agl_m: Optional[float] = None,
+        heading_deg: Optional[float] = None,
+        yaw_deg: Optional[float] = None,
+        pitch_deg: Optional[float] = None,
+        roll_deg: Optional[float] = None,
+        rtk_fix: Optional[bool] = None,
+        std_h_m: Optional[float] = None,
+        std_v_m: Optional[float] = None,
+        db: Session = None,
+        stored_key: Optional[str] = None,
+        sha256: Optional[str] = None,
+        prepared: Optional[Dict[str, Any]] = None,
+        request: Optional[Request] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """Run the upload pipeline on content that has already been received
+        
+        content may be bytes or a seekable file handle; handles are streamed
+        to storage and only read into memory where a consumer needs bytes.
+        sha256, when known (hashed while receiving), is reused if the file is
+        stored unmodified.
+        
+        If stored_key is given, the original bytes already live in storage
+        (direct browser upload) and are only re-uploaded when preprocessing
+        changed them. If prepared is given (see _prepare_file), the storage
+        stages already ran and only the database record and caption remain.
+        
+        With request, the caption call is cancelled if the client goes away
+        (see ABANDONED_UPLOAD_POLICY). Every stage runs within deadline's
+        remaining budget and raises DeadlineExceeded once it is spent.
+        """
+        deadline = ensure_deadline(deadline)
         # Parse and validate input
         countries_list = [c.strip() for c in countries.split(',') if c.strip()] if countries else []
         
@@ -71,44 +147,38 @@ class UploadService:
         if not image_type or image_type.strip() == "":
             image_type = "crisis_map"
         
-        # Read file content
-        content = await file.read()
-        
-        # Preprocess image
-        preprocessing_info = await UploadService._preprocess_image(content, file.filename)
-        
-        # Upload to storage
-        key, sha = await UploadService._upload_to_storage(
-            preprocessing_info['processed_content'],
-            preprocessing_info['processed_filename'],
-            preprocessing_info['mime_type']
-        )
-        
-        # Generate thumbnails and detail versions
-        thumbnail_result, detail_result = await UploadService._generate_image_versions(
-            preprocessing_info['processed_content'],
-            preprocessing_info['processed_filename']
-        )
+        if prepared is None:
+            prepared = await UploadService._prepare_file(content, filename, stored_key, sha256, deadline)
+        preprocessing_info = prepared['preprocessing_info']
+        processed_file = preprocessing_info['processed_file']
+        key, sha = prepared['key'], prepared['sha256']
+        thumbnail_result, detail_result = prepared['thumbnail_result'], prepared['detail_result']
         
         # Create database record
-        img = crud.create_image(
-            db, source, event_type, key, sha, countries_list, epsg, image_type,
-            center_lon, center_lat, amsl_m, agl_m,
-            heading_deg, yaw_deg, pitch_deg, roll_deg,
-            rtk_fix, std_h_m, std_v_m,
-            thumbnail_key=thumbnail_result[0] if thumbnail_result else None,
-            detail_key=detail_result[0] if detail_result else None
-        )
+        deadline.check("database")
+        with _stage("db_commit"):
+            img = crud.create_image(
+                db, source, event_type, key, sha, countries_list, epsg, image_type,
+                center_lon, center_lat, amsl_m, agl_m,
+                heading_deg, yaw_deg, pitch_deg, roll_deg,
+                rtk_fix, std_h_m, std_v_m,
+                thumbnail_key=thumbnail_result[0] if thumbnail_result else None,
+                thumbnail_sha256=thumbnail_result[1] if thumbnail_result else None,
+                detail_key=detail_result[0] if detail_result else None,
+                detail_sha256=detail_result[1] if detail_result else None
+            )
         
         # Generate caption if requested
         if title or model_name:
+            processed_file.seek(0)
             await UploadService._generate_caption(
-                img, preprocessing_info['processed_content'], title, model_name, db
+                img, processed_file.read(), title, model_name, db, request, deadline
             )
         
         # Generate response
         url = storage.get_object_url(key)
         img_dict = convert_image_to_dict(img, url)
+        preprocessing_info = {k: v for k, v in preprocessing_info.items() if k != 'processed_file'}
         img_dict['preprocessing_info'] = preprocessing_info
         
         logger.info(f"Successfully processed upload: {img.image_id}")
@@ -117,6 +187,57 @@ class UploadService:
             'preprocessing_info': preprocessing_info
         }
     
+    @staticmethod
+    async def _prepare_file(
+        content: Union[bytes, BinaryIO],
+        filename: str,
+        stored_key: Optional[str] = None,
+        sha256: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """Run the storage stages (preprocess, upload, thumbnails) for one file
+        
+        Touches no database session, so several files can be prepared
+        concurrently.
+        """
+        deadline = ensure_deadline(deadline)
+        source_file = io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+        
+        # Preprocess image
+        preprocessing_info = await UploadService._preprocess_image(source_file, filename, deadline)
+        processed_file = preprocessing_info['processed_file']
+        known_sha = sha256 if not preprocessing_info['was_preprocessed'] else None
+        
+        # Upload to storage (or reuse the object the browser uploaded)
+        if stored_key and not preprocessing_info['was_preprocessed']:
+            key = stored_key
+            sha = known_sha or await UploadService._hash(processed_file, deadline)
+        else:
+            key, sha = await UploadService._upload_to_storage(
+                processed_file,
+                preprocessing_info['processed_filename'],
+                preprocessing_info['processed_mime_type'],
+                sha256=known_sha,
+                deadline=deadline
+            )
+            if stored_key:
+                await deadline.run_sync("storage", storage.delete_object, stored_key)
+        
+        # Generate thumbnails and detail versions
+        thumbnail_result, detail_result = await UploadService._generate_image_versions(
+            processed_file,
+            preprocessing_info['processed_filename'],
+            deadline
+        )
+        
+        return {
+            'preprocessing_info': preprocessing_info,
+            'key': key,
+            'sha256': sha,
+            'thumbnail_result': thumbnail_result,
+            'detail_result': detail_result
+        }
+    
     @staticmethod
     async def process_multi_upload(
         files: list[UploadFile],
@@ -139,23 +260,55 @@ class UploadService:
         rtk_fix: Optional[bool] = None,
         std_h_m: Optional[float] = None,
         std_v_m: Optional[float] = None,
-        db: Session = None
+        db: Session = None,
+        request: Optional[Request] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """Process multiple image uploads"""
         logger.info(f"Processing multi upload: {len(files)} files")
+        deadline = ensure_deadline(deadline)
+        
+        # Storage stages run concurrently (bounded); database writes and
+        # captions stay sequential on the shared session, in upload order
+        semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_CONCURRENCY))
+        
+        async def prepare(file: UploadFile):
+            async with semaphore:
+                with tracing.span("upload.file", filename=file.filename):
+                    with _stage("receive"):
+                        upload = await deadline.run(spool_upload(file, settings.MAX_UPLOAD_BYTES), "receive")
+                    prepared = await UploadService._prepare_file(
+                        upload.file, upload.filename, sha256=upload.sha256, deadline=deadline
+                    )
+                    return upload, prepared
+        
+        prepared_files = await asyncio.gather(*(prepare(f) for f in files), return_exceptions=True)
         
         results = []
-        for file in files:
+        for index, (file, prepared) in enumerate(zip(files, prepared_files)):
             try:
-                result = await UploadService.process_single_upload(
-                    file, source, event_type, countries, epsg, image_type,
+                if isinstance(prepared, BaseException):
+                    raise prepared
+                upload, prepared = prepared
+                result = await UploadService.process_content(
+                    upload.file, upload.filename, source, event_type, countries, epsg, image_type,
                     title, model_name, center_lon, center_lat, amsl_m, agl_m,
                     heading_deg, yaw_deg, pitch_deg, roll_deg,
-                    rtk_fix, std_h_m, std_v_m, db
+                    rtk_fix, std_h_m, std_v_m, db=db, prepared=prepared, request=request,
+                    deadline=deadline
                 )
                 results.append(result)
+            except (ClientDisconnected, DeadlineExceeded):
+                # Files stored but not yet recorded would be orphaned
+                await UploadService._discard_prepared(prepared_files[index + 1:])
+                raise
             except Exception as e:
                 logger.error(f"Failed to process file {file.filename}: {str(e)}")
+                # Later files share the session; a failed flush must not poison them
+                db.rollback()
+                stored = prepared_files[index]
+                if not isinstance(stored, BaseException) and not crud.get_image_by_file_key(db, stored[1]['key']):
+                    await UploadService._discard_prepared([stored])
                 results.append({
                     'error': str(e),
                     'filename': file.filename
@@ -169,24 +322,41 @@ class UploadService:
         }
     
     @staticmethod
-    async def _preprocess_image(content: bytes, filename: str) -> Dict[str, Any]:
+    async def _discard_prepared(prepared_files: list) -> None:
+        """Best-effort delete of stored objects that never got a database record"""
+        for prepared in prepared_files:
+            if isinstance(prepared, BaseException):
+                continue
+            _, prepared = prepared
+            keys = [prepared['key']] + [r[0] for r in (prepared['thumbnail_result'], prepared['detail_result']) if r]
+            for key in keys:
+                try:
+                    await asyncio.to_thread(storage.delete_object, key)
+                except Exception as e:
+                    logger.warning(f"Failed to delete orphaned object {key}: {e}")
+    
+    @staticmethod
+    async def _preprocess_image(fileobj: BinaryIO, filename: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Preprocess an image file"""
         logger.debug(f"Preprocessing image: {filename}")
         
         try:
-            processed_content, processed_filename, mime_type = ImagePreprocessor.preprocess_image(
-                content, 
-                filename,
-                target_format='PNG',
-                quality=95
-            )
+            with _stage("preprocess"):
+                processed_file, processed_filename, mime_type, original_mime_type = await ensure_deadline(deadline).run_sync(
+                    "preprocess",
+                    ImagePreprocessor.preprocess_fileobj,
+                    fileobj, 
+                    filename,
+                    target_format='PNG',
+                    quality=95
+                )
             
             preprocessing_info = {
                 "original_filename": filename,
                 "processed_filename": processed_filename,
-                "original_mime_type": ImagePreprocessor.detect_mime_type(content, filename),
+                "original_mime_type": original_mime_type,
                 "processed_mime_type": mime_type,
-                "processed_content": processed_content,
+                "processed_file": processed_file,
                 "was_preprocessed": processed_filename != filename
             }
             
@@ -195,6 +365,8 @@ class UploadService:
             
             return preprocessing_info
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Image preprocessing failed: {str(e)}")
             # Fall back to original content
@@ -203,39 +375,52 @@ class UploadService:
                 "processed_filename": filename,
                 "original_mime_type": "unknown",
                 "processed_mime_type": "image/png",
-                "processed_content": content,
+                "processed_file": fileobj,
                 "was_preprocessed": False,
                 "error": str(e)
             }
     
     @staticmethod
-    async def _upload_to_storage(content: bytes, filename: str, mime_type: str) -> Tuple[str, str]:
-        """Upload content to storage and return key and SHA256"""
+    async def _upload_to_storage(
+        fileobj: BinaryIO,
+        filename: str,
+        mime_type: str,
+        sha256: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, str]:
+        """Stream a file handle to storage and return key and SHA256"""
         logger.debug(f"Uploading to storage: {filename}")
+        deadline = ensure_deadline(deadline)
         
-        key = storage.upload_fileobj(
-            io.BytesIO(content), 
-            filename, 
-            content_type=mime_type
-        )
+        with _stage("storage"):
+            key = await deadline.run_sync(
+                "storage",
+                storage.upload_fileobj,
+                fileobj, 
+                filename, 
+                content_type=mime_type
+            )
         
-        sha = crud.hash_bytes(content)
+        sha = sha256 or await UploadService._hash(fileobj, deadline)
         logger.debug(f"Uploaded to key: {key}, SHA: {sha}")
         
         return key, sha
     
     @staticmethod
-    async def _generate_image_versions(content: bytes, filename: str) -> Tuple[Optional[Tuple], Optional[Tuple]]:
+    async def _hash(fileobj: BinaryIO, deadline: Deadline) -> str:
+        """SHA256 of a file handle, read in a worker thread"""
+        with _stage("hash"):
+            return await deadline.run_sync("hash", hash_fileobj, fileobj)
+    
+    @staticmethod
+    async def _generate_image_versions(fileobj: BinaryIO, filename: str,
+                                       deadline: Optional[Deadline] = None) -> Tuple[Optional[Tuple], Optional[Tuple]]:
         """Generate thumbnail and detail versions of the image"""
         logger.debug(f"Generating image versions: {filename}")
         
         try:
-            thumbnail_result = ImageProcessingService.create_and_upload_thumbnail(
-                content, filename
-            )
-            
-            detail_result = ImageProcessingService.create_and_upload_detail(
-                content, filename
+            thumbnail_result, detail_result = await ensure_deadline(deadline).run_sync(
+                "thumbnails", ImageProcessingService.process_all_resolutions, fileobj, filename
             )
             
             if thumbnail_result:
@@ -245,12 +430,15 @@ class UploadService:
             
             return thumbnail_result, detail_result
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Image version generation failed: {str(e)}")
             return None, None
     
     @staticmethod
-    async def _generate_caption(img, image_content: bytes, title: str, model_name: Optional[str], db: Session):
+    async def _generate_caption(img, image_content: bytes, title: str, model_name: Optional[str], db: Session,
+                                request: Optional[Request] = None, deadline: Optional[Deadline] = None):
         """Generate caption for the uploaded image"""
         if not title and not model_name:
             return
@@ -265,29 +453,34 @@ class UploadService:
                 return
             
             # Generate caption using VLM service
-            result = await vlm_manager.generate_caption(
-                image_content=image_content,
-                prompt=prompt_obj.label,
-                metadata_instructions=prompt_obj.metadata_instructions or "",
-                model_name=model_name,
-                db_session=db
-            )
+            with _stage("vlm"):
+                result = await cancel_on_disconnect(request, vlm_manager.generate_caption(
+                    image_bytes=image_content,
+                    prompt=prompt_obj.label,
+                    metadata_instructions=prompt_obj.metadata_instructions or "",
+                    model_name=model_name,
+                    db_session=db,
+                    deadline=deadline
+                ), label="upload")
             
             # Create caption record
-            crud.create_caption(
-                db=db,
-                image_id=img.image_id,
-                title=title or result.get("title", ""),
-                prompt=prompt_obj.p_code,
-                model_code=result.get("model", model_name or "STUB_MODEL"),
-                raw_json=result.get("raw_response", {}),
-                text=result.get("text", ""),
-                metadata=result.get("metadata", {}),
-                image_count=1
-            )
+            with _stage("db_commit"):
+                crud.create_caption(
+                    db=db,
+                    image_id=img.image_id,
+                    title=title or result.get("title", ""),
+                    prompt=prompt_obj.p_code,
+                    model_code=result.get("model", model_name or "STUB_MODEL"),
+                    raw_json=result.get("raw_response", {}),
+                    text=result.get("caption", ""),
+                    metadata=result.get("metadata", {}),
+                    image_count=1
+                )
             
             logger.info(f"Caption generated for image {img.image_id}")
             
+        except (ClientDisconnected, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Caption generation failed: {str(e)}")
             # Continue without caption if generation fails
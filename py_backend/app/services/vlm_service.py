@@ -2,12 +2,30 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Awaitable, Optional, List, Callable
+import asyncio
+import contextlib
+import copy
+import hashlib
 import logging
+import random
+import time
 from enum import Enum
 
+from .provider_input import ImageInputSpec, PreparedImages, ProviderImage, provider_input_cache
+from .rate_limiter import FileRateLimitCoordinator, RateLimitExceeded, RateLimitSpec, ServiceRateLimiter
+from .circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitOpenError, CircuitState
+from .hedging import HedgePolicy, HedgeSpendGuard, LatencyTracker, hedge_delay
+from .single_flight import SingleFlight
+from .deadline import Deadline, DeadlineExceeded, ensure_deadline
+from .structured_output import FAILED as PARSE_FAILED
+from . import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
+# Session.info marker for sessions VLMServiceManager opened itself (see _open_session)
+_OWNED_SESSION = "vlm_manager_owned"
+
 
 class ModelType(Enum):
     """Enum for different VLM model types"""
@@ -27,6 +45,9 @@ class ServiceStatus(Enum):
 class VLMService(ABC):
     """Abstract base class for VLM services"""
 
+    # Rendition sent to the provider unless Models.config['image_input'] overrides it
+    DEFAULT_IMAGE_INPUT = ImageInputSpec()
+
     def __init__(self, model_name: str, model_type: ModelType, provider: str = "custom", lazy_init: bool = True):
         self.model_name = model_name
         self.model_type = model_type
@@ -35,6 +56,44 @@ class VLMService(ABC):
         self.is_available = True            # quick flag used by manager for random selection
         self.status = ServiceStatus.DEGRADED
         self._initialized = False
+        self.image_input = self.DEFAULT_IMAGE_INPUT
+        # Health from periodic probes (see VLMServiceManager.probe_all)
+        self.last_probe_at: Optional[float] = None
+        self.last_probe_ok: Optional[bool] = None
+        self.last_probe_latency_s: Optional[float] = None
+        self.consecutive_probe_failures = 0
+        self.rate_limits: Optional[RateLimitSpec] = None   # None -> manager defaults
+        self.hedge_max_per_minute: Optional[float] = None   # None -> manager default
+        self.multi_image: Optional[bool] = None   # Models.config['multi_image']; False opts a model out
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """Apply per-model settings from the models table (Models.config)"""
+        self.image_input = ImageInputSpec.from_config(config, self.DEFAULT_IMAGE_INPUT)
+        self.rate_limits = RateLimitSpec.from_config(config) if (config or {}).get("limits") else None
+        hedge = (config or {}).get("hedge") or {}
+        self.hedge_max_per_minute = float(hedge["max_per_minute"]) if "max_per_minute" in hedge else None
+        multi_image = (config or {}).get("multi_image")
+        self.multi_image = bool(multi_image) if multi_image is not None else None
+
+    async def prepare_image(self, image_bytes: bytes) -> ProviderImage:
+        """Right-size an image for this provider (cached by sha256 and spec)"""
+        image = await asyncio.to_thread(provider_input_cache.get_or_render, image_bytes, self.image_input)
+        logger.debug(
+            "%s image payload: %d bytes (source %d bytes, %dx%d %s)",
+            self.model_name, len(image.data), image.source_bytes, image.width, image.height, image.mime_type,
+        )
+        return image
+
+    async def prepare_images(self, image_bytes_list: List[bytes]) -> List[ProviderImage]:
+        """Renditions for a multi-image call; a PreparedImages list shares them across services"""
+        images = image_bytes_list if isinstance(image_bytes_list, PreparedImages) else PreparedImages(image_bytes_list)
+        return await asyncio.to_thread(images.renditions, self.image_input)
+
+    @property
+    def supports_multi_image(self) -> bool:
+        """Implements generate_multi_image_caption and is not opted out in Models.config"""
+        implemented = type(self).generate_multi_image_caption is not VLMService.generate_multi_image_caption
+        return implemented and self.multi_image is not False
 
     async def probe(self) -> bool:
         """
@@ -57,6 +116,18 @@ class VLMService(ABC):
         """Generate caption for an image"""
         ...
 
+    async def stream_caption(self, image_bytes: bytes, prompt: str, metadata_instructions: str = "",
+                             on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate a caption, passing partial text to on_delta as it arrives
+
+        Providers with a streaming API override this. The default emulates it:
+        the whole caption is delivered as one delta once generation finishes.
+        """
+        result = await self.generate_caption(image_bytes, prompt, metadata_instructions)
+        if on_delta and result.get("caption"):
+            on_delta(result["caption"])
+        return result
+
     # Optional for multi-image models; override in providers that support it.
     async def generate_multi_image_caption(self, image_bytes_list: List[bytes], prompt: str, metadata_instructions: str = "") -> Dict[str, Any]:
         raise NotImplementedError("Multi-image caption not implemented for this service")
@@ -70,6 +141,18 @@ class VLMService(ABC):
             "available": self.is_available,
             "status": self.status.value,
             "lazy_init": self.lazy_init,
+            "multi_image": self.supports_multi_image,
+            "image_input": {
+                "max_dimension": self.image_input.max_dimension,
+                "format": self.image_input.format,
+                "quality": self.image_input.quality,
+            },
+            "health": {
+                "last_probe_at": self.last_probe_at,
+                "last_probe_ok": self.last_probe_ok,
+                "last_probe_latency_s": self.last_probe_latency_s,
+                "consecutive_probe_failures": self.consecutive_probe_failures,
+            },
         }
 
 
@@ -79,6 +162,242 @@ class VLMServiceManager:
     def __init__(self):
         self.services: Dict[str, VLMService] = {}
         self.default_service: Optional[str] = None
+        self.limiters: Dict[str, ServiceRateLimiter] = {}
+        self.default_limits = RateLimitSpec()
+        self.queue_timeout_s = 30.0
+        self.limit_coordinator: Optional[FileRateLimitCoordinator] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.breaker_config = CircuitBreakerConfig()
+        self._reprobe_task: Optional[asyncio.Task] = None
+        self._probe_task: Optional[asyncio.Task] = None
+        self.probe_timeout_s = 5.0
+        self.unhealthy_after = 3   # consecutive failed probes before a service is UNAVAILABLE
+        self.latency = LatencyTracker()
+        self.hedge_policy = HedgePolicy()
+        self.hedge_guard = HedgeSpendGuard(self.hedge_policy.max_hedges_per_minute)
+        self.single_flight = SingleFlight()
+        self.session_factory: Optional[Callable[[], Any]] = None   # sessions for coalesced calls; default SessionLocal
+        self.multi_image_race_n = 0   # >1: race that many multi-image candidates at once
+
+    def configure_limits(self, default_max_concurrency: Optional[int] = None, queue_timeout_s: float = 30.0,
+                         coordinator_dir: Optional[str] = None) -> None:
+        """Set defaults for services without Models.config['limits'] and how limits are shared"""
+        self.default_limits = RateLimitSpec(max_concurrency=default_max_concurrency or None)
+        self.queue_timeout_s = queue_timeout_s
+        self.limit_coordinator = None
+        if coordinator_dir:
+            try:
+                self.limit_coordinator = FileRateLimitCoordinator(coordinator_dir)
+                logger.info("VLM rate limits shared across workers via %s", coordinator_dir)
+            except Exception as e:
+                logger.warning("Rate-limit coordinator unavailable (%r); limits are per worker", e)
+        self.limiters.clear()
+
+    def configure_breakers(self, config: CircuitBreakerConfig) -> None:
+        """Set thresholds for per-service circuit breakers (resets existing state)"""
+        self.breaker_config = config
+        self.breakers.clear()
+
+    def _breaker_for(self, service: VLMService) -> CircuitBreaker:
+        breaker = self.breakers.get(service.model_name)
+        if breaker is None:
+            breaker = CircuitBreaker(service.model_name, self.breaker_config)
+            self.breakers[service.model_name] = breaker
+        return breaker
+
+    def is_circuit_open(self, service: VLMService) -> bool:
+        return self._breaker_for(service).state == CircuitState.OPEN
+
+    async def reprobe_open_circuits(self) -> None:
+        """Probe services whose circuit is open; a successful probe admits a trial call"""
+        open_services = [
+            self.services[name] for name, breaker in list(self.breakers.items())
+            if name in self.services and breaker.state == CircuitState.OPEN
+        ]
+        await asyncio.gather(*(self._probe_one(svc) for svc in open_services))
+
+    async def _reprobe_loop(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self.reprobe_open_circuits()
+            except Exception as e:
+                logger.warning("Circuit re-probe round failed: %r", e)
+
+    def start_reprobe_loop(self, interval_s: float) -> None:
+        """Start the background task that tries to close open circuits"""
+        if interval_s > 0 and (self._reprobe_task is None or self._reprobe_task.done()):
+            self._reprobe_task = asyncio.create_task(self._reprobe_loop(interval_s))
+
+    def configure_hedging(self, policy: HedgePolicy) -> None:
+        """Enable/tune hedged requests to the configured fallback model"""
+        self.hedge_policy = policy
+        self.hedge_guard = HedgeSpendGuard(policy.max_hedges_per_minute)
+
+    def configure_multi_image(self, race_top_n: int = 0) -> None:
+        """Race the top N multi-image candidates concurrently instead of trying them in turn (0/1 = in turn)"""
+        self.multi_image_race_n = max(0, int(race_top_n))
+
+    def _hedge_target(self, service: VLMService, db_session) -> Optional[VLMService]:
+        if not self.hedge_policy.enabled or not db_session:
+            return None
+        try:
+            from .. import crud
+            configured_fallback = crud.get_fallback_model(db_session)
+        except Exception as e:
+            logger.debug("No hedge target (fallback lookup failed): %r", e)
+            return None
+        target = self.services.get(configured_fallback) if configured_fallback else None
+        if not target or target is service or not target.is_available or not self.is_healthy(target):
+            return None
+        return target
+
+    async def _hedged_call(self, service: VLMService, target: VLMService, image_bytes: bytes,
+                           prompt: str, metadata_instructions: str, attempted: set,
+                           deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Call service; if it is slower than its latency percentile, race target too
+
+        Names of services actually called are added to attempted.
+        """
+        delay = hedge_delay(self.hedge_policy, self.latency, service.model_name)
+        primary = asyncio.create_task(self._call_service(service, image_bytes, prompt, metadata_instructions, deadline))
+        tasks = {primary}
+        # Everything after the primary starts is covered: if the caller is cancelled
+        # (client gone, deadline) while waiting, no provider call is left running
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.hedge_guard.try_spend(target.model_name, target.hedge_max_per_minute):
+                result = await primary
+                result["model"] = service.model_name
+                return result
+
+            logger.info("Hedging %s after %.1fs with %s", service.model_name, delay, target.model_name)
+            tracing.add_event("vlm.hedge", **{"vlm.model": service.model_name, "vlm.hedge_model": target.model_name,
+                                              "vlm.hedge_delay_s": delay})
+            if target.lazy_init and not target._initialized:
+                await target.ensure_ready()
+            attempted.add(target.model_name)
+            hedge = asyncio.create_task(self._call_service(target, image_bytes, prompt, metadata_instructions, deadline))
+            tasks.add(hedge)
+            owners = {primary: service, hedge: target}
+            pending = set(owners)
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    winner = owners[task]
+                    result = task.result()
+                    result["model"] = winner.model_name
+                    if winner is not service:
+                        result.update({
+                            "fallback_used": True,
+                            "original_model": service.model_name,
+                            "fallback_reason": f"hedged: no answer from {service.model_name} within {delay:.1f}s",
+                        })
+                        metrics.record_vlm_fallback(service.model_name, winner.model_name, "hedge")
+                    result["hedged"] = True
+                    return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        # Surface the primary's error so the normal fallback chain reports it
+        if primary.exception() is not None:
+            raise primary.exception()
+        raise first_error
+
+    @staticmethod
+    def _fallback_span(service: VLMService, target: VLMService, kind: str, reason=None):
+        """Span around one fallback attempt from service to target"""
+        return tracing.span("vlm.fallback", **{
+            "vlm.original_model": service.model_name,
+            "vlm.model": target.model_name,
+            "vlm.fallback_kind": kind,
+            "vlm.fallback_reason": str(reason)[:200] if reason else None,
+        })
+
+    def _limiter_for(self, service: VLMService) -> ServiceRateLimiter:
+        limiter = self.limiters.get(service.model_name)
+        if limiter is None:
+            limiter = ServiceRateLimiter(
+                service.model_name,
+                service.rate_limits or self.default_limits,
+                coordinator=self.limit_coordinator,
+                default_queue_timeout_s=self.queue_timeout_s,
+            )
+            self.limiters[service.model_name] = limiter
+        return limiter
+
+    @tracing.traced("vlm.call")
+    async def _call_service(self, service: VLMService, images, prompt: str, metadata_instructions: str = "",
+                            deadline: Optional[Deadline] = None,
+                            on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Single path for every provider call
+
+        Rejects immediately if the service's circuit is open, then waits for
+        rate/concurrency capacity, and records the outcome on the breaker.
+        images is one image's bytes or a list for multi-image captions.
+        Queueing and the call itself are bounded by the request deadline; a
+        call cut off by the deadline is not counted against the provider.
+        With on_delta, a single-image call streams partial text to it.
+        """
+        multi = isinstance(images, list)
+        deadline = ensure_deadline(deadline)
+        tracing.annotate(**{
+            "vlm.model": service.model_name,
+            "vlm.provider": service.provider,
+            "vlm.images": len(images) if multi else 1,
+            "vlm.streaming": on_delta is not None,
+        })
+        stage = f"{service.model_name} call"
+        deadline.check(stage)
+        breaker = self._breaker_for(service)
+        if not breaker.allow_request():
+            metrics.record_vlm_call(service.model_name, "circuit_open")
+            raise CircuitOpenError(f"{service.model_name} circuit open; skipping")
+
+        limiter = self._limiter_for(service)
+        tokens = limiter.spec.estimate_tokens(prompt + metadata_instructions, len(images) if multi else 1)
+        recorded = False
+        try:
+            async with limiter.acquire(tokens=tokens, timeout=deadline.timeout(limiter.queue_timeout_s)):
+                start = time.monotonic()
+                try:
+                    if multi:
+                        call = service.generate_multi_image_caption(images, prompt, metadata_instructions)
+                    elif on_delta is not None:
+                        call = service.stream_caption(images, prompt, metadata_instructions, on_delta)
+                    else:
+                        call = service.generate_caption(images, prompt, metadata_instructions)
+                    result = await deadline.run(call, stage)
+                except NotImplementedError:
+                    metrics.record_vlm_call(service.model_name, "unsupported")
+                    raise
+                except DeadlineExceeded:
+                    metrics.record_vlm_call(service.model_name, "deadline", time.monotonic() - start)
+                    raise
+                except Exception as e:
+                    breaker.record_failure(time.monotonic() - start, e)
+                    metrics.record_vlm_call(service.model_name, "error", time.monotonic() - start)
+                    recorded = True
+                    raise
+                elapsed = time.monotonic() - start
+                breaker.record_success(elapsed)
+                self.latency.record(service.model_name, elapsed)
+                metrics.record_vlm_call(service.model_name, "success", elapsed)
+                recorded = True
+                return result
+        except RateLimitExceeded:
+            metrics.record_vlm_call(service.model_name, "rate_limited")
+            if deadline.expired:
+                raise deadline.exceeded(f"{service.model_name} queue") from None
+            raise
+        finally:
+            if not recorded:
+                breaker.release()
 
     def register_service(self, service: VLMService):
         """
@@ -90,22 +409,84 @@ class VLMServiceManager:
             self.default_service = service.model_name
         logger.info("Registered VLM service: %s (%s)", service.model_name, service.provider)
 
+    async def _probe_one(self, svc: VLMService) -> bool:
+        """Probe one service with a timeout and record the outcome as its health"""
+        start = time.monotonic()
+        try:
+            ok = bool(await asyncio.wait_for(svc.probe(), self.probe_timeout_s))
+        except asyncio.TimeoutError:
+            logger.warning("Probe timed out for %s after %.1fs", svc.model_name, self.probe_timeout_s)
+            ok = False
+        except Exception as e:
+            logger.warning("Probe failed for %s: %r", svc.model_name, e)
+            ok = False
+
+        svc.last_probe_at = time.time()
+        svc.last_probe_latency_s = round(time.monotonic() - start, 3)
+        svc.last_probe_ok = ok
+        svc.consecutive_probe_failures = 0 if ok else svc.consecutive_probe_failures + 1
+        if ok:
+            svc.status = ServiceStatus.READY
+        elif svc.consecutive_probe_failures >= self.unhealthy_after:
+            svc.status = ServiceStatus.UNAVAILABLE
+        else:
+            svc.status = ServiceStatus.DEGRADED
+        # If probe fails but lazy_init is allowed, keep is_available True so selection still works.
+        svc.is_available = ok or svc.lazy_init
+
+        breaker = self.breakers.get(svc.model_name)
+        if ok and breaker:
+            breaker.probe_succeeded()
+        logger.info("Probe %s -> %s (%.2fs)", svc.model_name, svc.status.value, svc.last_probe_latency_s)
+        return ok
+
     async def probe_all(self):
         """
-        Run lightweight probes for all registered services.
+        Run lightweight probes for all registered services, concurrently.
         Failures do not remove services; they stay DEGRADED and will lazy-init on first use.
         """
-        for svc in self.services.values():
+        await asyncio.gather(*(self._probe_one(svc) for svc in list(self.services.values())))
+
+    async def _probe_loop(self, interval_s: float) -> None:
+        while True:
             try:
-                ok = await svc.probe()
-                svc.status = ServiceStatus.READY if ok else ServiceStatus.DEGRADED
-                # If probe fails but lazy_init is allowed, keep is_available True so selection still works.
-                svc.is_available = ok or svc.lazy_init
-                logger.info("Probe %s -> %s", svc.model_name, svc.status.value)
+                await self.probe_all()
             except Exception as e:
-                logger.warning("Probe failed for %s: %r", svc.model_name, e)
-                svc.status = ServiceStatus.DEGRADED
-                svc.is_available = bool(svc.lazy_init)
+                logger.warning("Probe round failed: %r", e)
+            await asyncio.sleep(interval_s)
+
+    def start_probe_loop(self, interval_s: float, timeout_s: float = 5.0) -> None:
+        """Probe all services now and then every interval_s (0 = once)"""
+        self.probe_timeout_s = timeout_s
+        if interval_s <= 0:
+            asyncio.create_task(self.probe_all())
+        elif self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe_loop(interval_s))
+
+    def is_healthy(self, service: VLMService) -> bool:
+        """Usable for automatic selection: not known-down by probes or the circuit breaker"""
+        return service.status != ServiceStatus.UNAVAILABLE and not self.is_circuit_open(service)
+
+    def get_health(self) -> Dict[str, Any]:
+        """Probe and circuit health of every registered service"""
+        health = {}
+        for name, svc in self.services.items():
+            health[name] = {
+                "status": svc.status.value,
+                "available": svc.is_available,
+                "healthy": self.is_healthy(svc),
+                "circuit": self._breaker_for(svc).state.value,
+                **svc.get_model_info()["health"],
+            }
+        return health
+
+    def apply_model_configs(self, models) -> None:
+        """Push Models.config of each DB row onto its registered service"""
+        for m in models:
+            svc = self.services.get(m.m_code)
+            if svc:
+                svc.configure(m.config)
+                self.limiters.pop(m.m_code, None)
 
     def get_service(self, model_name: str) -> Optional[VLMService]:
         """Get a specific VLM service"""
@@ -119,6 +500,12 @@ class VLMServiceManager:
         """Get list of available model names"""
         return list(self.services.keys())
 
+    def _healthy_first(self, candidates: List[VLMService]) -> List[VLMService]:
+        """Healthy candidates, preferring ones whose last probe succeeded; [] if none are healthy"""
+        healthy = [s for s in candidates if self.is_healthy(s)]
+        ready = [s for s in healthy if s.status == ServiceStatus.READY]
+        return ready or healthy
+
     async def _pick_service(self, model_name: Optional[str], db_session) -> VLMService:
         # Specific pick
         service = None
@@ -139,7 +526,7 @@ class VLMServiceManager:
                     configured_fallback = crud.get_fallback_model(db_session)
                     if configured_fallback and configured_fallback in allowed:
                         fallback_service = self.services.get(configured_fallback)
-                        if fallback_service and fallback_service.is_available:
+                        if fallback_service and fallback_service.is_available and self.is_healthy(fallback_service):
                             logger.info("Using configured fallback model: %s", configured_fallback)
                             service = fallback_service
                     
@@ -149,11 +536,10 @@ class VLMServiceManager:
                         logger.info("Using STUB_MODEL as final fallback")
                 except Exception as e:
                     logger.warning("DB availability check failed: %r; using first available", e)
-                    avail = [s for s in self.services.values() if s.is_available]
+                    avail = self._healthy_first([s for s in self.services.values() if s.is_available])
                     service = (self.services.get("STUB_MODEL") or (random.choice(avail) if avail else next(iter(self.services.values()))))
             else:
-                import random
-                avail = [s for s in self.services.values() if s.is_available]
+                avail = self._healthy_first([s for s in self.services.values() if s.is_available])
                 service = (random.choice(avail) if avail else (self.services.get("STUB_MODEL") or next(iter(self.services.values()))))
 
         if not service:
@@ -170,90 +556,334 @@ class VLMServiceManager:
 
         return service
 
-    async def generate_caption(self, image_bytes: bytes, prompt: str, metadata_instructions: str = "", model_name: str | None = None, db_session=None) -> dict:
-        """Generate caption using the specified model or fallback to available service."""
+    @staticmethod
+    async def _image_digest(images: List[bytes]) -> str:
+        def digest() -> str:
+            h = hashlib.sha256()
+            for data in images:
+                h.update(hashlib.sha256(data).digest())
+            return h.hexdigest()
+        if sum(len(data) for data in images) < 256 * 1024:
+            return digest()
+        return await asyncio.to_thread(digest)
+
+    def _open_session(self):
+        factory = self.session_factory
+        if factory is None:
+            from ..database import SessionLocal
+            factory = SessionLocal
+        db = factory()
+        db.info[_OWNED_SESSION] = True
+        return db
+
+    @staticmethod
+    def _end_lookup(db_session) -> None:
+        """Hand a session this manager opened back to the pool before a provider call
+
+        Request sessions are left alone; an owned one reconnects on its next lookup.
+        """
+        if db_session is not None and db_session.info.get(_OWNED_SESSION):
+            db_session.close()
+
+    async def _with_own_session(self, call: Callable[[Any], Awaitable[dict]], use_db: bool) -> dict:
+        if not use_db:
+            return await call(None)
+        db = self._open_session()
+        try:
+            return await call(db)
+        finally:
+            db.close()
+
+    async def _coalesced(self, kind: str, images: List[bytes], prompt: str, metadata_instructions: str,
+                         model_name: Optional[str], call: Callable[[Any], Awaitable[dict]], use_db: bool,
+                         deadline: Optional[Deadline]) -> dict:
+        """Share one in-flight call between identical concurrent requests; each caller gets its own copy
+
+        The shared call belongs to no single caller: it opens its own session
+        for model lookups (if the caller had one) and runs without a deadline.
+        Each caller waits for it within its own deadline, and the call is
+        cancelled once every caller has given up.
+        """
+        deadline = ensure_deadline(deadline)
+        key = (kind, await self._image_digest(images), prompt, metadata_instructions, model_name, use_db)
+        result = await deadline.run(
+            self.single_flight.do(key, lambda: self._with_own_session(call, use_db), label=model_name),
+            "VLM caption",
+        )
+        return copy.deepcopy(result)
+
+    async def generate_caption(self, image_bytes: bytes, prompt: str, metadata_instructions: str = "", model_name: str | None = None, db_session=None,
+                               deadline: Optional[Deadline] = None) -> dict:
+        """Generate caption using the specified model or fallback to available service.
+
+        With a deadline, the primary call and every fallback share its
+        remaining budget; DeadlineExceeded is raised once it runs out.
+        db_session only says model lookups may use the database: the call can
+        be shared with other requests, so it opens a session of its own.
+        """
+        return await self._coalesced(
+            "single", [image_bytes], prompt, metadata_instructions, model_name,
+            lambda db: self._generate_caption(image_bytes, prompt, metadata_instructions, model_name, db),
+            db_session is not None, deadline,
+        )
+
+    @tracing.traced("vlm.caption")
+    async def _generate_caption(self, image_bytes: bytes, prompt: str, metadata_instructions: str, model_name: Optional[str], db_session,
+                                deadline: Optional[Deadline] = None) -> dict:
+        deadline = ensure_deadline(deadline)
         service = await self._pick_service(model_name, db_session)
+        tracing.annotate(**{"vlm.requested_model": model_name, "vlm.model": service.model_name})
+        hedge_target = self._hedge_target(service, db_session)
+        self._end_lookup(db_session)
+        attempted = {service.model_name}
         try:
-            result = await service.generate_caption(image_bytes, prompt, metadata_instructions)
+            if hedge_target:
+                return await self._hedged_call(service, hedge_target, image_bytes, prompt, metadata_instructions, attempted, deadline)
+            result = await self._call_service(service, image_bytes, prompt, metadata_instructions, deadline)
             result["model"] = service.model_name
             return result
         except Exception as e:
-            logger.error("Error with %s: %r; trying fallbacks", service.model_name, e)
-            
-            # First, try the configured fallback model if available
-            if db_session:
-                try:
-                    from .. import crud
-                    configured_fallback = crud.get_fallback_model(db_session)
-                    if configured_fallback and configured_fallback != service.model_name:
-                        fallback_service = self.services.get(configured_fallback)
-                        if fallback_service and fallback_service.is_available:
-                            logger.info("Trying configured fallback model: %s", configured_fallback)
-                            try:
+            return await self._fallback_caption(service, e, image_bytes, prompt, metadata_instructions, db_session,
+                                                deadline, attempted)
+
+    async def _fallback_caption(self, service: VLMService, e: Exception, image_bytes: bytes, prompt: str,
+                                metadata_instructions: str, db_session, deadline: Deadline, attempted: set) -> dict:
+        """Try the configured fallback model, then STUB_MODEL, after service failed with e"""
+        # No budget left for fallbacks
+        deadline.check("VLM fallback")
+        logger.error("Error with %s: %r; trying fallbacks", service.model_name, e)
+        
+        # First, try the configured fallback model if available (unless it was already raced)
+        if db_session:
+            try:
+                from .. import crud
+                configured_fallback = crud.get_fallback_model(db_session)
+                self._end_lookup(db_session)
+                if configured_fallback and configured_fallback not in attempted:
+                    fallback_service = self.services.get(configured_fallback)
+                    if fallback_service and fallback_service.is_available and self.is_healthy(fallback_service):
+                        logger.info("Trying configured fallback model: %s", configured_fallback)
+                        try:
+                            with self._fallback_span(service, fallback_service, "fallback", e):
                                 if fallback_service.lazy_init and not fallback_service._initialized:
                                     await fallback_service.ensure_ready()
-                                res = await fallback_service.generate_caption(image_bytes, prompt, metadata_instructions)
-                                res.update({
-                                    "model": fallback_service.model_name,
-                                    "fallback_used": True,
-                                    "original_model": service.model_name,
-                                    "fallback_reason": str(e),
-                                })
-                                logger.info("Configured fallback model %s succeeded", configured_fallback)
-                                return res
-                            except Exception as fe:
-                                logger.warning("Configured fallback service %s also failed: %r", configured_fallback, fe)
-                except Exception as db_error:
-                    logger.warning("Failed to get configured fallback: %r", db_error)
-            
-            # If configured fallback failed or not available, try STUB_MODEL
-            stub_service = self.services.get("STUB_MODEL")
-            if stub_service and stub_service != service.model_name:
-                logger.info("Trying STUB_MODEL as final fallback")
-                try:
+                                res = await self._call_service(fallback_service, image_bytes, prompt, metadata_instructions, deadline)
+                            res.update({
+                                "model": fallback_service.model_name,
+                                "fallback_used": True,
+                                "original_model": service.model_name,
+                                "fallback_reason": str(e),
+                            })
+                            metrics.record_vlm_fallback(service.model_name, fallback_service.model_name, "fallback")
+                            logger.info("Configured fallback model %s succeeded", configured_fallback)
+                            return res
+                        except DeadlineExceeded:
+                            raise
+                        except Exception as fe:
+                            logger.warning("Configured fallback service %s also failed: %r", configured_fallback, fe)
+            except DeadlineExceeded:
+                raise
+            except Exception as db_error:
+                logger.warning("Failed to get configured fallback: %r", db_error)
+        
+        # If configured fallback failed or not available, try STUB_MODEL
+        stub_service = self.services.get("STUB_MODEL")
+        if stub_service and stub_service is not service:
+            logger.info("Trying STUB_MODEL as final fallback")
+            try:
+                with self._fallback_span(service, stub_service, "stub", e):
                     if stub_service.lazy_init and not stub_service._initialized:
                         await stub_service.ensure_ready()
-                    res = await stub_service.generate_caption(image_bytes, prompt, metadata_instructions)
-                    res.update({
-                        "model": stub_service.model_name,
-                        "fallback_used": True,
-                        "original_model": service.model_name,
-                        "fallback_reason": str(e),
-                    })
-                    logger.info("STUB_MODEL succeeded as final fallback")
-                    return res
-                except Exception as fe:
-                    logger.warning("STUB_MODEL also failed: %r", fe)
-            
-            # All services failed
-            raise RuntimeError(f"All VLM services failed. Last error from {service.model_name}: {e}")
-
-    async def generate_multi_image_caption(self, image_bytes_list: List[bytes], prompt: str, metadata_instructions: str = "", model_name: str | None = None, db_session=None) -> dict:
-        """Multi-image version if a provider supports it."""
+                    res = await self._call_service(stub_service, image_bytes, prompt, metadata_instructions, deadline)
+                res.update({
+                    "model": stub_service.model_name,
+                    "fallback_used": True,
+                    "original_model": service.model_name,
+                    "fallback_reason": str(e),
+                })
+                metrics.record_vlm_fallback(service.model_name, stub_service.model_name, "stub")
+                logger.info("STUB_MODEL succeeded as final fallback")
+                return res
+            except DeadlineExceeded:
+                raise
+            except Exception as fe:
+                logger.warning("STUB_MODEL also failed: %r", fe)
+        
+        # All services failed
+        raise RuntimeError(f"All VLM services failed. Last error from {service.model_name}: {e}")
+
+    @tracing.traced("vlm.caption_stream")
+    async def generate_caption_stream(self, image_bytes: bytes, prompt: str, metadata_instructions: str = "",
+                                      model_name: str | None = None, db_session=None,
+                                      deadline: Optional[Deadline] = None,
+                                      on_delta: Optional[Callable[[str], None]] = None) -> dict:
+        """Generate a caption, passing partial text from the chosen provider to on_delta.
+
+        Streams are per client, so they are neither coalesced nor hedged. If
+        the provider fails, the usual fallback chain runs without streaming
+        and its result is returned whole.
+        """
+        deadline = ensure_deadline(deadline)
         service = await self._pick_service(model_name, db_session)
+        tracing.annotate(**{"vlm.requested_model": model_name, "vlm.model": service.model_name})
         try:
-            result = await service.generate_multi_image_caption(image_bytes_list, prompt, metadata_instructions)
+            result = await self._call_service(service, image_bytes, prompt, metadata_instructions, deadline, on_delta)
             result["model"] = service.model_name
             return result
         except Exception as e:
-            logger.error("Error with %s (multi): %r; trying fallbacks", service.model_name, e)
-            for other in self.services.values():
-                if other is service:
-                    continue
-                try:
-                    if other.lazy_init and not other._initialized:
-                        await other.ensure_ready()
-                    res = await other.generate_multi_image_caption(image_bytes_list, prompt, metadata_instructions)
-                    res.update({
-                        "model": other.model_name,
-                        "fallback_used": True,
-                        "original_model": service.model_name,
-                        "fallback_reason": str(e),
-                    })
-                    return res
-                except Exception:
-                    continue
-            raise RuntimeError(f"All VLM services failed (multi). Last error from {service.model_name}: {e}")
+            return await self._fallback_caption(service, e, image_bytes, prompt, metadata_instructions, db_session,
+                                                deadline, {service.model_name})
+
+    async def generate_multi_image_caption(self, image_bytes_list: List[bytes], prompt: str, metadata_instructions: str = "", model_name: str | None = None, db_session=None,
+                                           deadline: Optional[Deadline] = None) -> dict:
+        """Multi-image version if a provider supports it."""
+        image_bytes_list = list(image_bytes_list)
+        return await self._coalesced(
+            "multi", image_bytes_list, prompt, metadata_instructions, model_name,
+            lambda db: self._generate_multi_image_caption(image_bytes_list, prompt, metadata_instructions, model_name, db),
+            db_session is not None, deadline,
+        )
+
+    def _multi_image_candidates(self, service: VLMService, db_session) -> List[VLMService]:
+        """Services to try for a multi-image caption, in order
+
+        The picked service, the configured fallback model, then other healthy
+        services ready first, and STUB_MODEL last. Only services that support
+        multi-image captions are included; fallbacks must also be available,
+        healthy and not have an open circuit.
+        """
+        stub = self.services.get("STUB_MODEL")
+
+        def usable(svc: Optional[VLMService]) -> bool:
+            return (
+                svc is not None and svc.supports_multi_image and svc.model_name != "manual"
+                and svc.is_available and self.is_healthy(svc) and not self.is_circuit_open(svc)
+            )
+
+        candidates = [service] if service.supports_multi_image else []
+        if db_session:
+            try:
+                from .. import crud
+                configured_fallback = self.services.get(crud.get_fallback_model(db_session) or "")
+                if usable(configured_fallback) and configured_fallback is not stub:
+                    candidates.append(configured_fallback)
+            except Exception as e:
+                logger.warning("Failed to get configured fallback: %r", e)
+        others = [s for s in self.services.values() if usable(s) and s is not stub]
+        candidates += sorted(others, key=lambda s: s.status != ServiceStatus.READY)
+        if usable(stub):
+            candidates.append(stub)
+        return list(dict.fromkeys(candidates))
+
+    @staticmethod
+    def _is_usable_result(result: Dict[str, Any]) -> bool:
+        """A caption that parsed; raced results that are not get passed over"""
+        raw = result.get("raw_response") or {}
+        return bool(result.get("caption")) and raw.get("parse_status") != PARSE_FAILED
+
+    async def _race_multi_image(self, racers: List[VLMService], images: PreparedImages, prompt: str,
+                                metadata_instructions: str, deadline: Deadline,
+                                errors: Dict[str, str]) -> Optional[tuple]:
+        """Call racers at once; (service, result) of the first usable answer, losers cancelled
+
+        Without a usable answer, returns the first unusable one, or None if
+        every racer failed; failures are recorded in errors.
+        """
+        async def attempt(svc: VLMService) -> Dict[str, Any]:
+            if svc.lazy_init and not svc._initialized:
+                await svc.ensure_ready()
+            return await self._call_service(svc, images, prompt, metadata_instructions, deadline)
+
+        owners = {asyncio.create_task(attempt(svc)): svc for svc in racers}
+        pending = set(owners)
+        unusable: Optional[tuple] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    svc = owners[task]
+                    error = task.exception()
+                    if isinstance(error, DeadlineExceeded):
+                        raise error
+                    if error is not None:
+                        errors[svc.model_name] = str(error) or type(error).__name__
+                        continue
+                    result = task.result()
+                    if self._is_usable_result(result):
+                        return svc, result
+                    errors[svc.model_name] = "unusable result"
+                    unusable = unusable or (svc, result)
+        finally:
+            for task in pending:
+                task.cancel()
+        return unusable
+
+    @tracing.traced("vlm.multi_image_caption")
+    async def _generate_multi_image_caption(self, image_bytes_list: List[bytes], prompt: str, metadata_instructions: str, model_name: Optional[str], db_session,
+                                            deadline: Optional[Deadline] = None) -> dict:
+        deadline = ensure_deadline(deadline)
+        service = await self._pick_service(model_name, db_session)
+        tracing.annotate(**{"vlm.requested_model": model_name, "vlm.model": service.model_name,
+                            "vlm.images": len(image_bytes_list)})
+        # Rendered and encoded once, whichever services end up being called
+        images = PreparedImages(image_bytes_list)
+        candidates = self._multi_image_candidates(service, db_session)
+        self._end_lookup(db_session)
+        errors: Dict[str, str] = {}
+        if not service.supports_multi_image:
+            errors[service.model_name] = f"{service.model_name} does not support multi-image captions"
+
+        def finish(winner: VLMService, result: Dict[str, Any]) -> dict:
+            result["model"] = winner.model_name
+            if winner is not service:
+                result.update({
+                    "fallback_used": True,
+                    "original_model": service.model_name,
+                    "fallback_reason": errors.get(service.model_name) or f"raced: {winner.model_name} answered first",
+                })
+                metrics.record_vlm_fallback(service.model_name, winner.model_name, "multi_image")
+            return result
+
+        stub = self.services.get("STUB_MODEL")
+        racers = [c for c in candidates if c is not stub][:self.multi_image_race_n]
+        raced = None
+        if len(racers) > 1:
+            logger.info("Racing multi-image caption across %s", ", ".join(r.model_name for r in racers))
+            with tracing.span("vlm.race", **{"vlm.racers": [r.model_name for r in racers]}):
+                raced = await self._race_multi_image(racers, images, prompt, metadata_instructions, deadline, errors)
+            if raced and self._is_usable_result(raced[1]):
+                result = finish(*raced)
+                result["raced"] = [r.model_name for r in racers]
+                return result
+            candidates = [c for c in candidates if c not in racers]
+
+        for candidate in candidates:
+            if candidate is not service:
+                deadline.check("VLM fallback")
+                logger.info("Trying %s for multi-image caption", candidate.model_name)
+            attempt = (self._fallback_span(service, candidate, "multi_image", errors.get(service.model_name))
+                       if candidate is not service else contextlib.nullcontext())
+            try:
+                with attempt:
+                    if candidate.lazy_init and not candidate._initialized:
+                        await candidate.ensure_ready()
+                    result = await self._call_service(candidate, images, prompt, metadata_instructions, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.error("Error with %s (multi): %r; trying fallbacks", candidate.model_name, e)
+                errors[candidate.model_name] = str(e) or type(e).__name__
+                continue
+            return finish(candidate, result)
+        if raced:
+            # Every racer answered badly or failed and nothing else worked; keep the answer we have
+            result = finish(*raced)
+            result["raced"] = [r.model_name for r in racers]
+            return result
+        raise RuntimeError(
+            f"All VLM services failed (multi). Last error from {service.model_name}: "
+            f"{errors.get(service.model_name, 'no multi-image capable service available')}"
+        )
 
 
 # Global manager instance (as in your current code)
@@ -1,10 +1,13 @@
 import io
 import os
+import shutil
 import mimetypes
 from uuid import uuid4
 from typing import BinaryIO, Optional
 
 from .config import settings
+from .services.metrics import record_cache
+from .services.tracing import traced
 
 if settings.STORAGE_PROVIDER != "local":
     import boto3
@@ -27,6 +30,9 @@ else:
         
         def generate_presigned_url(self, **kwargs):
             raise RuntimeError("S3 client not available in local storage mode")
+
+        def generate_presigned_post(self, **kwargs):
+            raise RuntimeError("S3 client not available in local storage mode")
     
     s3 = DummyS3Client()
 
@@ -64,8 +70,10 @@ def get_object_url(key: str, *, expires_in: int = 3600, cache: Optional[dict[str
     cache_dict = cache if cache is not None else _url_cache
     
     if key in cache_dict:
+        record_cache("presigned_url", True)
         return cache_dict[key]
     
+    record_cache("presigned_url", False)
     url = generate_presigned_url(key, expires_in=expires_in)
     cache_dict[key] = url
     return url
@@ -75,6 +83,7 @@ def clear_url_cache():
     _url_cache.clear()
 
 
+@traced("storage.generate_presigned_url")
 def generate_presigned_url(key: str, expires_in: int = 3600) -> str:
     """Generate presigned URL for GETting object."""
     if settings.STORAGE_PROVIDER == "local":
@@ -87,6 +96,102 @@ def generate_presigned_url(key: str, expires_in: int = 3600) -> str:
     )
 
 
+def new_object_key(filename: Optional[str]) -> str:
+    """Allocate a fresh object key using the same layout as uploads."""
+    safe_name = os.path.basename(filename or "") or "upload.bin"
+    return f"maps/{uuid4()}_{safe_name}"
+
+
+@traced("storage.generate_presigned_upload")
+def generate_presigned_upload(
+    key: str,
+    *,
+    content_type: Optional[str] = None,
+    expires_in: int = 3600,
+    max_bytes: Optional[int] = None,
+    token: Optional[str] = None,
+) -> dict:
+    """Return a target the browser can upload ``key`` to directly.
+
+    For S3 this is a presigned PUT (plus a presigned POST policy when
+    ``max_bytes`` is given, so the size limit is enforced by storage).
+    For local storage the target is the app's own local-upload endpoint,
+    authorised by ``token`` in place of a storage signature.
+    """
+    ct = content_type or (mimetypes.guess_type(key)[0] or "application/octet-stream")
+
+    if settings.STORAGE_PROVIDER == "local":
+        return {
+            "method": "PUT",
+            "url": f"/api/images/direct/local/{key}" + (f"?token={token}" if token else ""),
+            "headers": {"Content-Type": ct},
+        }
+
+    target = {
+        "method": "PUT",
+        "url": s3.generate_presigned_url(
+            ClientMethod="put_object",
+            Params={"Bucket": settings.S3_BUCKET, "Key": key, "ContentType": ct},
+            ExpiresIn=expires_in,
+        ),
+        "headers": {"Content-Type": ct},
+    }
+    if max_bytes:
+        target["post"] = s3.generate_presigned_post(
+            Bucket=settings.S3_BUCKET,
+            Key=key,
+            Fields={"Content-Type": ct},
+            Conditions=[{"Content-Type": ct}, ["content-length-range", 1, max_bytes]],
+            ExpiresIn=expires_in,
+        )
+    return target
+
+
+def local_path_for_key(key: str) -> str:
+    """Resolve a key to a path inside STORAGE_DIR, rejecting traversal."""
+    base = os.path.realpath(settings.STORAGE_DIR)
+    path = os.path.realpath(os.path.join(base, key))
+    if not path.startswith(base + os.sep):
+        raise ValueError(f"Invalid object key: {key}")
+    return path
+
+
+@traced("storage.get_object_bytes")
+def get_object_bytes(key: str) -> bytes:
+    """Read an object's full content from the configured storage."""
+    if settings.STORAGE_PROVIDER == "local":
+        with open(local_path_for_key(key), "rb") as f:
+            return f.read()
+    response = s3.get_object(Bucket=settings.S3_BUCKET, Key=key)
+    return response["Body"].read()
+
+
+@traced("storage.download_fileobj")
+def download_fileobj(key: str, fileobj: BinaryIO) -> None:
+    """Stream an object's content into fileobj without holding it in memory."""
+    if settings.STORAGE_PROVIDER == "local":
+        with open(local_path_for_key(key), "rb") as f:
+            shutil.copyfileobj(f, fileobj, 1024 * 1024)
+        return
+    s3.download_fileobj(settings.S3_BUCKET, key, fileobj)
+
+
+@traced("storage.get_object_size")
+def get_object_size(key: str) -> Optional[int]:
+    """Return object size in bytes, or None if it does not exist."""
+    if settings.STORAGE_PROVIDER == "local":
+        try:
+            return os.path.getsize(local_path_for_key(key))
+        except (OSError, ValueError):
+            return None
+    try:
+        head = s3.head_object(Bucket=settings.S3_BUCKET, Key=key)
+        return int(head.get("ContentLength", 0))
+    except botocore.exceptions.ClientError:
+        return None
+
+
+@traced("storage.upload_fileobj")
 def upload_fileobj(
     fileobj: BinaryIO,
     filename: str,
@@ -116,7 +221,7 @@ def _upload_local(
     
     with open(filepath, 'wb') as f:
         fileobj.seek(0)
-        f.write(fileobj.read())
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
     
     return key
 
@@ -149,6 +254,7 @@ def _upload_s3(
     return key
 
 
+@traced("storage.upload_bytes")
 def upload_bytes(
     data: bytes,
     filename: str,
@@ -161,6 +267,7 @@ def upload_bytes(
     return upload_fileobj(buf, filename, content_type=content_type, cache_control=cache_control)
 
 
+@traced("storage.copy_object")
 def copy_object(
     src_key: str,
     *,
@@ -211,6 +318,7 @@ def _copy_s3(src_key: str, new_filename: Optional[str] = None, cache_control: Op
     return dest_key
 
 
+@traced("storage.delete_object")
 def delete_object(key: str) -> None:
     """Delete object (best-effort)."""
     if settings.STORAGE_PROVIDER == "local":
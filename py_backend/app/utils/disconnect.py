@@ -0,0 +1,83 @@
+"""
+Client disconnect handling
+Starlette keeps running an endpoint after the client has gone, so a closed
+upload page still pays for the whole VLM call and the writes after it.
+cancel_on_disconnect races an awaitable against the client connection and,
+under the "cancel" policy, cancels it as soon as the client goes away.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# What happens to work a client has abandoned:
+#   "cancel"   - cancel the provider call and skip the writes that follow
+#   "complete" - finish the call and store its result anyway
+CANCEL = "cancel"
+COMPLETE = "complete"
+
+# Counters of abandoned requests by label (e.g. "upload", "caption")
+abandoned_requests: Dict[str, int] = {}
+
+
+class ClientDisconnected(HTTPException):
+    """The client closed the connection; 499 is logged but never seen by anyone"""
+
+    def __init__(self, label: str = "request"):
+        super().__init__(499, f"Client closed {label} before it completed")
+        self.label = label
+
+
+async def _wait_for_disconnect(request, poll_interval_s: float) -> None:
+    # Request.is_disconnected() cannot see a disconnect through BaseHTTPMiddleware,
+    # so wait on receive() itself; only safe once the body has been read
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+        await asyncio.sleep(poll_interval_s)
+
+
+async def cancel_on_disconnect(
+    request,
+    awaitable: Awaitable[T],
+    label: str = "request",
+    policy: Optional[str] = None,
+    poll_interval_s: float = 0.5,
+) -> T:
+    """Await awaitable unless the client disconnects first
+
+    Call only after the request body has been consumed (form/JSON parsed). Under the cancel policy a disconnect cancels awaitable and raises
+    ClientDisconnected so the caller skips its remaining work. Without a
+    request, or under the complete policy, awaitable simply runs to the end.
+    """
+    if policy is None:
+        from ..config import settings
+        policy = settings.ABANDONED_UPLOAD_POLICY
+    task = asyncio.ensure_future(awaitable)
+    if request is None or policy != CANCEL:
+        return await task
+
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request, poll_interval_s))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        watcher.cancel()
+        raise
+    if task.done():
+        watcher.cancel()
+        return task.result()
+    if watcher.exception() is not None:
+        logger.debug("Disconnect watcher failed (%r); waiting for %s", watcher.exception(), label)
+        return await task
+
+    task.cancel()
+    abandoned_requests[label] = abandoned_requests.get(label, 0) + 1
+    logger.info("Client disconnected; cancelled in-flight %s", label)
+    raise ClientDisconnected(label)
@@ -0,0 +1,132 @@
+"""
+Streaming upload helpers
+Hash and size-check multipart uploads chunk by chunk so the pipeline can work
+from file handles instead of holding several copies of the bytes in memory.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+HEAD_SIZE = 64
+
+
+@dataclass
+class SpooledUpload:
+    """An upload already on disk (or in a small memory spool), ready to stream"""
+    file: BinaryIO
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+    head: bytes
+
+    def read_bytes(self) -> bytes:
+        """Materialise the whole upload; only for consumers that need bytes"""
+        self.file.seek(0)
+        data = self.file.read()
+        self.file.seek(0)
+        return data
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(413, f"File too large (max {max_bytes} bytes)")
+
+
+async def spool_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> SpooledUpload:
+    """Walk an UploadFile in chunks, hashing it and enforcing max_bytes
+
+    Starlette has already spooled the multipart part to a temporary file, so
+    the returned handle is that same file rewound; no extra copy is made.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if not head:
+            head = chunk[:HEAD_SIZE]
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise _too_large(max_bytes)
+        digest.update(chunk)
+    await upload.seek(0)
+
+    return SpooledUpload(
+        file=upload.file,
+        filename=upload.filename or "upload.bin",
+        content_type=upload.content_type,
+        size=size,
+        sha256=digest.hexdigest(),
+        head=head,
+    )
+
+
+def hash_fileobj(fileobj: BinaryIO) -> str:
+    """SHA-256 of a file-like object, read in chunks; leaves it rewound"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized multipart bodies while they are still arriving
+
+    Requests declaring a Content-Length above the limit are refused before the
+    body is read; chunked bodies are counted as they stream in and aborted
+    with 413 as soon as they cross it.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            logger.warning(f"Rejected upload of {int(content_length)} bytes to {scope.get('path')}")
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Request too large (max {self.max_bytes} bytes)"},
+                headers={"Connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(413, f"Request too large (max {self.max_bytes} bytes)")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _is_multipart(scope) -> bool:
+        for name, value in scope.get("headers") or []:
+            if name == b"content-type":
+                return value.startswith(b"multipart/form-data")
+        return False
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Re-caption existing images through the admin batch API.
+
+Jobs run inside the API server (so they use its registered models, rate
+limits and circuit breakers) and checkpoint their progress; this script
+starts a job, resumes/cancels one, and follows its progress.
+
+Examples:
+  python batch_recaption.py --model GPT-4O --filter image_type=crisis_map --filter source=WFP
+  python batch_recaption.py --model GEMINI15 --ids-file ids.txt --concurrency 8
+  python batch_recaption.py --status <job_id>
+  python batch_recaption.py --resume <job_id>
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+FILTER_KEYS = {"search", "source", "event_type", "region", "country", "image_type", "upload_type", "starred_only"}
+
+
+def parse_filters(pairs):
+    filters = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep or key not in FILTER_KEYS:
+            raise SystemExit(f"Invalid filter '{pair}'; expected key=value with key in {sorted(FILTER_KEYS)}")
+        filters[key] = value.lower() in ("1", "true", "yes") if key == "starred_only" else value
+    return filters
+
+
+def read_ids(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def login(base_url, password):
+    resp = requests.post(f"{base_url}/api/admin/login", json={"password": password}, timeout=30)
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def call(method, url, headers, **kwargs):
+    resp = requests.request(method, url, headers=headers, timeout=60, **kwargs)
+    if resp.status_code >= 400:
+        raise SystemExit(f"{method} {url} failed ({resp.status_code}): {resp.text}")
+    return resp.json()
+
+
+def print_job(job):
+    print(
+        f"[{job['status']}] {job['job_id']}: {job['completed']}/{job['total']} captioned, "
+        f"{job['failed']} failed, {job['remaining']} remaining"
+    )
+
+
+def follow(base_url, headers, job_id, interval):
+    while True:
+        data = call("GET", f"{base_url}/api/admin/captions/batch/{job_id}", headers)
+        job = data["job"]
+        print_job(job)
+        if job["status"] not in ("queued", "running"):
+            for image_id, error in list(data["errors"].items())[:20]:
+                print(f"  {image_id}: {error}")
+            return job
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch re-caption existing images")
+    parser.add_argument("--url", default=os.getenv("PROMPTAID_URL", "http://localhost:8000"), help="API base URL")
+    parser.add_argument("--password", default=os.getenv("ADMIN_PASSWORD"), help="admin password (default: $ADMIN_PASSWORD)")
+    parser.add_argument("--model", help="model code to caption with (default: server default)")
+    parser.add_argument("--prompt", help="prompt code or label (default: active prompt per image type)")
+    parser.add_argument("--title", help="caption title (default: each image's existing title)")
+    parser.add_argument("--concurrency", type=int, help="images captioned in parallel")
+    parser.add_argument("--allow-fallback", action="store_true", help="keep captions produced by the fallback model")
+    parser.add_argument("--filter", action="append", default=[], metavar="KEY=VALUE", help="/api/images/grouped filter; repeatable")
+    parser.add_argument("--ids", nargs="+", help="image ids")
+    parser.add_argument("--ids-file", help="file with one image id per line")
+    parser.add_argument("--status", metavar="JOB_ID", help="show a job's progress")
+    parser.add_argument("--resume", metavar="JOB_ID", help="resume a cancelled or failed job")
+    parser.add_argument("--cancel", metavar="JOB_ID", help="cancel a running job")
+    parser.add_argument("--no-wait", action="store_true", help="return after starting the job")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between progress checks")
+    args = parser.parse_args()
+
+    if not args.password:
+        raise SystemExit("Admin password required (--password or ADMIN_PASSWORD)")
+    base_url = args.url.rstrip("/")
+    headers = login(base_url, args.password)
+    jobs_url = f"{base_url}/api/admin/captions/batch"
+
+    if args.cancel:
+        print_job(call("POST", f"{jobs_url}/{args.cancel}/cancel", headers)["job"])
+        return 0
+    if args.status:
+        job_id = args.status
+    elif args.resume:
+        job_id = call("POST", f"{jobs_url}/{args.resume}/resume", headers)["job"]["job_id"]
+    else:
+        image_ids = args.ids or (read_ids(args.ids_file) if args.ids_file else None)
+        if (image_ids is None) == (not args.filter):
+            raise SystemExit("Select images with either --filter or --ids/--ids-file")
+        payload = {
+            "model_name": args.model,
+            "prompt": args.prompt,
+            "title": args.title,
+            "concurrency": args.concurrency,
+            "allow_fallback": args.allow_fallback,
+        }
+        if image_ids is not None:
+            payload["image_ids"] = image_ids
+        else:
+            payload["filters"] = parse_filters(args.filter)
+        job = call("POST", jobs_url, headers, json=payload)["job"]
+        job_id = job["job_id"]
+        print_job(job)
+
+    if args.no_wait:
+        print(f"Job id: {job_id}")
+        return 0
+    try:
+        job = follow(base_url, headers, job_id, args.interval)
+    except KeyboardInterrupt:
+        print(f"\nStopped following; the job keeps running. Resume watching with --status {job_id}")
+        return 0
+    return 0 if job["status"] == "completed" and not job["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Compare the sync and async database layers under concurrent load.
+
+Runs the same read (one per request, each with its own session, as the
+endpoints do) against DATABASE_URL in three ways:
+  sync-thread  sync Session in AnyIO's threadpool (sync `def` handlers)
+  sync-loop    sync Session called on the event loop (`async def` handlers
+               before migration) - blocks every other request
+  async        AsyncSession from crud_async (migrated handlers)
+
+and reports throughput, latency percentiles and the worst event-loop lag
+seen meanwhile, so a migrated endpoint can be checked before and after.
+
+Examples:
+  python benchmark_db_concurrency.py --operation image --concurrency 64 --requests 2000
+  python benchmark_db_concurrency.py --operation grouped --modes sync-thread,async --threads 40
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import anyio
+import anyio.to_thread
+from sqlalchemy import select
+
+from app import crud, crud_async, database, models
+
+MODES = ("sync-thread", "sync-loop", "async")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def operations(image_ids, page_size):
+    """name -> (sync fn(db), async fn(db))"""
+    return {
+        "image": (
+            lambda db: crud.get_image(db, random.choice(image_ids)),
+            lambda db: crud_async.get_image(db, random.choice(image_ids)),
+        ),
+        "grouped": (
+            lambda db: crud.get_captions_with_images_filtered(db, page=1, limit=page_size),
+            lambda db: crud_async.get_captions_with_images_filtered(db, page=1, limit=page_size),
+        ),
+        "captions": (
+            crud.get_all_captions_with_images,
+            crud_async.get_all_captions_with_images,
+        ),
+    }
+
+
+class Benchmark:
+    def __init__(self, args, sync_op, async_op):
+        self.args = args
+        self.sync_op = sync_op
+        self.async_op = async_op
+
+    def run_sync(self):
+        db = database.SessionLocal()
+        try:
+            self.sync_op(db)
+        finally:
+            db.close()
+
+    async def run_async(self):
+        async with database.AsyncSessionLocal() as db:
+            await self.async_op(db)
+
+    async def one(self, mode):
+        if mode == "sync-thread":
+            await anyio.to_thread.run_sync(self.run_sync)
+        elif mode == "sync-loop":
+            self.run_sync()
+        else:
+            await self.run_async()
+
+    async def watch_lag(self, stop, lags):
+        interval = 0.01
+        while not stop.is_set():
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    async def run_mode(self, mode):
+        anyio.to_thread.current_default_thread_limiter().total_tokens = self.args.threads
+        latencies, errors = [], 0
+        counter = iter(range(self.args.requests))
+
+        async def client():
+            nonlocal errors
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    await self.one(mode)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                # Let other clients (and the lag watcher) run between requests
+                await asyncio.sleep(0)
+
+        # Warm both pools before timing
+        await asyncio.gather(*(self.one(mode) for _ in range(min(self.args.concurrency, 10))))
+
+        stop, lags = asyncio.Event(), []
+        watcher = asyncio.create_task(self.watch_lag(stop, lags))
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await watcher
+
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+            "max_loop_lag_ms": round(max(lags, default=0.0) * 1000, 1),
+        }
+
+    async def run(self):
+        results = {}
+        for mode in self.args.modes:
+            results[mode] = await self.run_mode(mode)
+        await database.async_engine.dispose()
+        return results
+
+
+async def load_image_ids(limit=500):
+    async with database.AsyncSessionLocal() as db:
+        result = await db.execute(select(models.Images.image_id).limit(limit))
+        return list(result.scalars().all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async database sessions under concurrency")
+    parser.add_argument("--operation", choices=("image", "grouped", "captions"), default="image")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--requests", type=int, default=1000, help="reads per mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="reads in flight")
+    parser.add_argument("--threads", type=int, default=40, help="AnyIO threadpool size (FastAPI's default is 40)")
+    parser.add_argument("--page-size", type=int, default=20, help="grouped: captions per page")
+    args = parser.parse_args()
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    async def run():
+        image_ids = await load_image_ids()
+        if args.operation == "image" and not image_ids:
+            raise SystemExit("No images in the database")
+        sync_op, async_op = operations(image_ids, args.page_size)[args.operation]
+        return await Benchmark(args, sync_op, async_op).run()
+
+    print(json.dumps({"operation": args.operation, "concurrency": args.concurrency, **asyncio.run(run())}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark VLM models on a fixed image set.
+
+By default the run happens inside the API server through the admin API, so
+it uses the registered models, their rate limits and the database schemas,
+and the results are stored for comparison. With --local the run happens in
+this process against StubVLMService and/or the local VLM simulator, with no
+server, database or provider keys needed.
+
+Examples:
+  python benchmark_models.py --model GPT-4O --model QWEN2_5_VL_7B --rounds 3
+  python benchmark_models.py --list
+  python benchmark_models.py --compare <run_id> <run_id>
+  python benchmark_models.py --local --stub --images ~/benchmark_images
+  python vlm_simulator.py --latency lognormal:2,0.4 &
+  python benchmark_models.py --local --simulator http://localhost:8090 --simulator-model SIM_A --schema schema.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import requests
+
+COLUMNS = [
+    ("calls", "calls"),
+    ("error_rate", "err%"),
+    ("p50_ms", "p50 ms"),
+    ("p95_ms", "p95 ms"),
+    ("schema_pass_rate", "schema%"),
+    ("mean_output_tokens", "out tok"),
+    ("mean_payload_bytes", "payload B"),
+]
+
+
+def login(base_url, password):
+    resp = requests.post(f"{base_url}/api/admin/login", json={"password": password}, timeout=30)
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def call(method, url, headers, **kwargs):
+    resp = requests.request(method, url, headers=headers, timeout=60, **kwargs)
+    if resp.status_code >= 400:
+        raise SystemExit(f"{method} {url} failed ({resp.status_code}): {resp.text}")
+    return resp.json()
+
+
+def _cell(key, value):
+    if value is None:
+        return "-"
+    if key in ("error_rate", "schema_pass_rate"):
+        return f"{value * 100:.1f}"
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def print_comparison(comparison):
+    header = f"{'model':<24} {'run':<10} " + " ".join(f"{label:>9}" for _, label in COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for model, rows in sorted(comparison["models"].items()):
+        for row in rows:
+            cells = " ".join(f"{_cell(key, row.get(key)):>9}" for key, _ in COLUMNS)
+            print(f"{model:<24} {str(row['run_id'])[:8]:<10} {cells}")
+
+
+def print_run(run):
+    from app.services.model_benchmark import compare_runs
+
+    print(f"[{run['status']}] {run['run_id']}: {len(run['models'])} model(s), {run['image_count']} image(s) x {run['rounds']} round(s)")
+    if run.get("error"):
+        print(f"  error: {run['error']}")
+    if run.get("results"):
+        print_comparison(compare_runs([run]))
+        for model, summary in sorted(run["results"].items()):
+            for error, count in summary.get("errors", {}).items():
+                print(f"  {model}: {count}x {error}")
+
+
+def remote(args):
+    if not args.password:
+        raise SystemExit("Admin password required (--password or ADMIN_PASSWORD)")
+    base_url = args.url.rstrip("/")
+    headers = login(base_url, args.password)
+    runs_url = f"{base_url}/api/admin/benchmarks"
+
+    if args.list:
+        for run in call("GET", runs_url, headers)["runs"]:
+            print(f"[{run['status']}] {run['run_id']} {run['created_at']} {', '.join(run['models'])}")
+        return 0
+    if args.compare:
+        print_comparison(call("GET", f"{runs_url}/compare", headers, params={"run_ids": args.compare}))
+        return 0
+    if args.status:
+        run = call("GET", f"{runs_url}/{args.status}", headers)["run"]
+    else:
+        payload = {
+            "models": args.model or None,
+            "image_type": args.image_type,
+            "image_ids": args.ids,
+            "prompt": args.prompt,
+            "rounds": args.rounds,
+            "concurrency": args.concurrency,
+        }
+        run = call("POST", runs_url, headers, json=payload)["run"]
+        print(f"Started benchmark run {run['run_id']}")
+    while run["status"] == "running" and not args.no_wait:
+        time.sleep(args.interval)
+        run = call("GET", f"{runs_url}/{run['run_id']}", headers)["run"]
+    print_run(run)
+    return 0 if run["status"] != "failed" else 1
+
+
+def schema_file_validator(path):
+    """Validate replies against a JSON schema file instead of the database schemas"""
+    from jsonschema.validators import Draft7Validator
+    from app.services.structured_output import parse_structured_output
+
+    with open(path) as f:
+        validator = Draft7Validator(json.load(f))
+
+    def validate(raw, image_type):
+        parsed = parse_structured_output(raw.get("content"))
+        data = parsed.data if parsed.ok else raw
+        errors = [e.message for e in validator.iter_errors(data)]
+        return not errors, "; ".join(errors) or None
+
+    return validate
+
+
+async def run_local(args):
+    from app.services.vlm_service import VLMServiceManager
+    from app.services.stub_vlm_service import StubVLMService
+    from app.services.huggingface_service import ProvidersGenericVLMService
+    from app.services.model_benchmark import ModelBenchmark, load_image_set, synthetic_image_set, DEFAULT_PROMPT
+
+    manager = VLMServiceManager()
+    if args.stub:
+        manager.register_service(StubVLMService())
+    if args.simulator:
+        providers_url = args.simulator.rstrip("/") + "/v1/chat/completions"
+        for name in args.simulator_model or ["SIMULATED"]:
+            manager.register_service(ProvidersGenericVLMService("sim", f"sim/{name}", name, providers_url=providers_url))
+    if not manager.services:
+        raise SystemExit("--local needs --stub and/or --simulator")
+
+    if args.schema:
+        validate = schema_file_validator(args.schema)
+    elif args.db_schema:
+        validate = None   # ModelBenchmark's default: the database schema for --image-type
+    else:
+        validate = lambda raw, image_type: (None, None)
+    benchmark = ModelBenchmark(manager, validate=validate)
+    images = load_image_set(args.images) if args.images else synthetic_image_set()
+    started = time.time()
+    results = await benchmark.run(
+        images,
+        model_names=args.model or None,
+        prompt=args.prompt or DEFAULT_PROMPT,
+        image_type=args.image_type,
+        rounds=args.rounds,
+        concurrency=args.concurrency,
+    )
+    return {
+        "run_id": "local",
+        "status": "completed",
+        "models": list(results),
+        "image_count": len(images),
+        "rounds": args.rounds,
+        "elapsed_s": round(time.time() - started, 2),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VLM models on a fixed image set")
+    parser.add_argument("--url", default=os.getenv("PROMPTAID_URL", "http://localhost:8000"), help="API base URL")
+    parser.add_argument("--password", default=os.getenv("ADMIN_PASSWORD"), help="admin password (default: $ADMIN_PASSWORD)")
+    parser.add_argument("--model", action="append", help="model code to benchmark; repeatable (default: all registered)")
+    parser.add_argument("--image-type", default="crisis_map", help="schema the replies are validated against")
+    parser.add_argument("--prompt", help="prompt code or label (local: prompt text)")
+    parser.add_argument("--ids", nargs="+", help="stored image ids to use instead of the server's fixed image set")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over the image set per model")
+    parser.add_argument("--concurrency", type=int, default=1, help="calls in flight per model")
+    parser.add_argument("--list", action="store_true", help="list stored runs")
+    parser.add_argument("--compare", nargs="+", metavar="RUN_ID", help="compare stored runs")
+    parser.add_argument("--status", metavar="RUN_ID", help="show a stored run")
+    parser.add_argument("--no-wait", action="store_true", help="return after starting the run")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between progress checks")
+    local = parser.add_argument_group("local runs")
+    local.add_argument("--local", action="store_true", help="run in this process instead of on the server")
+    local.add_argument("--stub", action="store_true", help="benchmark StubVLMService")
+    local.add_argument("--simulator", metavar="URL", help="vlm_simulator.py base URL to benchmark")
+    local.add_argument("--simulator-model", action="append", help="model name to register against the simulator; repeatable")
+    local.add_argument("--images", help="directory of benchmark images (default: generated JPEGs)")
+    local.add_argument("--schema", help="JSON schema file to validate replies against")
+    local.add_argument("--db-schema", action="store_true", help="validate against the database schema for --image-type")
+    local.add_argument("--json", action="store_true", help="print the full results as JSON")
+    args = parser.parse_args()
+
+    if not args.local:
+        return remote(args)
+    run = asyncio.run(run_local(args))
+    if args.json:
+        print(json.dumps(run, indent=2))
+    else:
+        print_run(run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Load-test the upload pipeline (POST /api/images/) end to end.
+
+Run the backend against vlm_simulator.py so captions come from recorded
+replies with realistic latency instead of a paid provider, then drive
+uploads either closed-loop (--concurrency clients uploading back to back)
+or open-loop (--rate uploads per second regardless of backlog).
+
+Examples:
+  python vlm_simulator.py --latency lognormal:4,0.5 &
+  python load_test_uploads.py --requests 200 --concurrency 16 --model QWEN2_5_VL_7B
+  python load_test_uploads.py --rate 5 --duration 120 --simulator-url http://localhost:8090
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        with open(args.image, "rb") as f:
+            self.image = f.read()
+        self.filename = os.path.basename(args.image)
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _form(self, i):
+        form = aiohttp.FormData()
+        form.add_field("file", self.image, filename=f"{i}_{self.filename}", content_type="image/jpeg")
+        form.add_field("image_type", self.args.image_type)
+        form.add_field("title", f"load test {i}")
+        if self.args.model:
+            form.add_field("model_name", self.args.model)
+        return form
+
+    async def upload(self, session, i):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            async with session.post(self.args.base_url.rstrip("/") + self.args.endpoint, data=self._form(i)) as resp:
+                body = await resp.read()
+                self.statuses[resp.status] += 1
+                if resp.status >= 400:
+                    self.errors[body[:120].decode("utf-8", errors="replace")] += 1
+        except Exception as e:
+            self.statuses["exception"] += 1
+            self.errors[f"{type(e).__name__}: {e}"[:120]] += 1
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+            self.in_flight -= 1
+
+    async def closed_loop(self, session):
+        counter = iter(range(self.args.requests))
+
+        async def client():
+            for i in counter:
+                await self.upload(session, i)
+
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+
+    async def open_loop(self, session):
+        tasks = []
+        deadline = time.perf_counter() + self.args.duration
+        i = 0
+        while time.perf_counter() < deadline and (not self.args.requests or i < self.args.requests):
+            tasks.append(asyncio.create_task(self.upload(session, i)))
+            i += 1
+            # Poisson arrivals at the target rate
+            await asyncio.sleep(random.expovariate(self.args.rate))
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=self.args.timeout)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            started = time.perf_counter()
+            if self.args.rate:
+                await self.open_loop(session)
+            else:
+                await self.closed_loop(session)
+            elapsed = time.perf_counter() - started
+            simulator = await self.simulator_stats(session)
+        return self.report(elapsed, simulator)
+
+    async def simulator_stats(self, session):
+        if not self.args.simulator_url:
+            return None
+        try:
+            async with session.get(self.args.simulator_url.rstrip("/") + "/stats") as resp:
+                return await resp.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def report(self, elapsed, simulator):
+        total = len(self.latencies)
+        ok = sum(n for status, n in self.statuses.items() if isinstance(status, int) and status < 400)
+        latency = {}
+        if self.latencies:
+            latency = {f"p{p}": round(percentile(self.latencies, p), 3) for p in (50, 90, 95, 99)}
+            latency["max"] = round(max(self.latencies), 3)
+        return {
+            "requests": total,
+            "succeeded": ok,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(total / elapsed, 3) if elapsed else None,
+            "max_in_flight": self.max_in_flight,
+            "latency_s": latency,
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "top_errors": dict(self.errors.most_common(5)),
+            "simulator": simulator,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent uploads through /api/images/")
+    parser.add_argument("--base-url", default=os.getenv("PROMPTAID_URL", "http://localhost:8000"))
+    parser.add_argument("--endpoint", default="/api/images/")
+    parser.add_argument("--image", default=os.path.join(os.path.dirname(__file__), "tests", "test.jpg"))
+    parser.add_argument("--image-type", default="crisis_map")
+    parser.add_argument("--model", help="model_name for captions (default: server's choice)")
+    parser.add_argument("--requests", type=int, default=100, help="uploads to send (open loop: upper bound, 0 = none)")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed loop: uploads in flight")
+    parser.add_argument("--rate", type=float, help="open loop: mean uploads per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="open loop: seconds to keep sending")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-upload timeout in seconds")
+    parser.add_argument("--simulator-url", help="vlm_simulator.py base URL to include its /stats")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(LoadTest(args).run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
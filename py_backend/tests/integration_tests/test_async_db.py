@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Async database layer: crud_async returns what crud does"""
+
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+@pytest.fixture(scope="module")
+def db():
+    from sqlalchemy import text
+    from app.database import SessionLocal, async_engine
+
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await async_engine.dispose()
+
+    try:
+        asyncio.run(ping())
+    except Exception as e:
+        pytest.skip(f"Database not reachable: {e}")
+    session = SessionLocal()
+    yield session
+    session.close()
+
+def run_async(fn, *args, **kwargs):
+    from app.database import AsyncSessionLocal, async_engine
+
+    async def go():
+        try:
+            async with AsyncSessionLocal() as session:
+                return await fn(session, *args, **kwargs)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(go())
+
+def test_get_image_matches(db):
+    """Async get_image loads the same image, countries and captions"""
+    from app import crud, crud_async, models
+
+    image = db.query(models.Images).first()
+    if image is None:
+        pytest.skip("No images in the database")
+    expected = crud.get_image(db, str(image.image_id))
+
+    def describe(img):
+        return (
+            str(img.image_id),
+            sorted(c.c_code for c in img.countries),
+            sorted((str(c.caption_id), len(c.images)) for c in img.captions),
+        )
+
+    actual = run_async(lambda session: crud_async.get_image(session, str(image.image_id)))
+    assert describe(actual) == describe(expected)
+
+def test_filtered_listing_matches(db):
+    """Async filtered listing returns the same page and total"""
+    from app import crud, crud_async
+
+    expected, expected_total = crud.get_captions_with_images_filtered(db, page=1, limit=20)
+    actual, actual_total = run_async(crud_async.get_captions_with_images_filtered, page=1, limit=20)
+    assert actual_total == expected_total
+    assert [str(c.caption_id) for c in actual] == [str(c.caption_id) for c in expected]
+    assert run_async(crud_async.count_captions_with_images_filtered) == crud.count_captions_with_images_filtered(db)
+
+def test_all_captions_match(db):
+    """Async caption listing returns every caption with its images"""
+    from app import crud, crud_async
+
+    expected = {str(c.caption_id): len(c.images) for c in crud.get_all_captions_with_images(db)}
+    actual = {str(c.caption_id): len(c.images) for c in run_async(crud_async.get_all_captions_with_images)}
+    assert actual == expected
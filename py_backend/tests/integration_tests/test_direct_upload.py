@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Direct-to-storage uploads: init → PUT → finalize against local storage
+
+The pipeline behind finalize (preprocessing, database, caption) is replaced by
+a recorder; these tests cover what the router itself must enforce.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app import schemas
+    from app.config import settings
+    from app.routers import images_direct
+
+    monkeypatch.setattr(settings, "STORAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DIRECT_UPLOAD_CLAIM_DIR", str(tmp_path / "claims"))
+    monkeypatch.setattr(images_direct.crud, "get_image_by_file_key", lambda db, key: None)
+
+    processed = []
+
+    async def process_content(content, filename, db=None, stored_key=None, **kwargs):
+        processed.append({"key": stored_key, "filename": filename, "bytes": content.read()})
+        await asyncio.sleep(0.1)
+        image = schemas.ImageOut(
+            image_id=uuid.uuid4(), file_key=stored_key, sha256="0" * 64,
+            event_type="OTHER", image_type="crisis_map", image_url=f"/uploads/{stored_key}",
+        )
+        return {"image": image}
+
+    monkeypatch.setattr(images_direct.UploadService, "process_content", process_content)
+
+    app = FastAPI()
+    app.include_router(images_direct.router, prefix="/api/images")
+    app.dependency_overrides[images_direct.get_db] = lambda: None
+    client = TestClient(app)
+    client.processed = processed
+    client.storage_dir = tmp_path
+    return client
+
+def init(client, filename="map.png"):
+    response = client.post("/api/images/direct/init", json={"filename": filename, "size": len(PNG)})
+    assert response.status_code == 200
+    return response.json()
+
+def test_init_put_finalize(client):
+    """The issued target accepts the upload and finalize processes the stored object"""
+    issued = init(client)
+    assert issued["upload"]["url"].endswith(f"?token={issued['token']}")
+
+    response = client.put(issued["upload"]["url"], content=PNG)
+    assert response.status_code == 200
+    assert response.json() == {"key": issued["key"], "size": len(PNG)}
+
+    response = client.post("/api/images/direct/finalize", json={"key": issued["key"], "token": issued["token"]})
+    assert response.status_code == 200
+    assert response.json()["file_key"] == issued["key"]
+    assert client.processed == [{"key": issued["key"], "filename": "map.png", "bytes": PNG}]
+
+def test_forged_key_rejected(client):
+    """A well-formed key without a token (or with another key's token) cannot be written or finalized"""
+    issued = init(client)
+    forged = f"maps/{uuid.uuid4()}_map.png"
+
+    assert client.put(f"/api/images/direct/local/{forged}", content=PNG).status_code == 403
+    assert client.put(f"/api/images/direct/local/{forged}?token={issued['token']}", content=PNG).status_code == 403
+    assert client.put(f"/api/images/direct/local/{forged}?token=not-a-jwt", content=PNG).status_code == 403
+    assert not (client.storage_dir / forged).exists()
+
+    response = client.post("/api/images/direct/finalize", json={"key": forged, "token": issued["token"]})
+    assert response.status_code == 403
+    assert client.processed == []
+
+def test_existing_object_not_overwritten(client):
+    """A stored object keeps its content: a second PUT of the same key is refused"""
+    issued = init(client)
+    assert client.put(issued["upload"]["url"], content=PNG).status_code == 200
+
+    response = client.put(issued["upload"]["url"], content=b"replaced")
+    assert response.status_code == 409
+    assert (client.storage_dir / issued["key"]).read_bytes() == PNG
+    assert not (client.storage_dir / f"{issued['key']}.part").exists()
+
+def test_expired_token_rejected(client, monkeypatch):
+    """Tokens stop working once the upload window has passed"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "DIRECT_UPLOAD_URL_EXPIRES_S", -60)
+    issued = init(client)
+    response = client.put(issued["upload"]["url"], content=PNG)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Upload token expired"
+
+def test_concurrent_finalize_processed_once(client):
+    """Two finalize calls racing for one key: one processes it, the other gets a 409"""
+    import httpx
+
+    issued = init(client)
+    assert client.put(issued["upload"]["url"], content=PNG).status_code == 200
+    body = {"key": issued["key"], "token": issued["token"]}
+
+    async def race():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(http.post("/api/images/direct/finalize", json=body) for _ in range(2)))
+
+    responses = asyncio.run(race())
+    assert sorted(r.status_code for r in responses) == [200, 409]
+    assert len(client.processed) == 1
+    assert os.listdir(client.storage_dir / "claims") == []
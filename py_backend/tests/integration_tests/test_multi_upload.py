@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Multi-image uploads: files are stored concurrently, and a failing file
+leaves nothing behind in storage for the ones that did get stored
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.config import settings
+    from app.routers import upload
+
+    monkeypatch.setattr(settings, "STORAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(settings, "UPLOAD_CONCURRENCY", 2)
+
+    created = []
+    monkeypatch.setattr(upload.crud, "create_image", lambda *args, **kwargs: created.append(args))
+
+    app = FastAPI()
+    app.include_router(upload.router, prefix="/api/images")
+    app.dependency_overrides[upload.get_db] = lambda: None
+    client = TestClient(app)
+    client.created = created
+    client.storage_dir = tmp_path
+    return client
+
+def stored_files(root):
+    return [p for p in root.rglob("*") if p.is_file()]
+
+def test_later_file_failure_discards_stored_files(client):
+    """A file over the size limit fails the request and the files stored alongside it are deleted"""
+    files = [
+        ("files", ("first.png", PNG, "image/png")),
+        ("files", ("second.png", PNG, "image/png")),
+        ("files", ("too-large.png", PNG + b"\x00" * 2048, "image/png")),
+    ]
+    response = client.post("/api/images/multi", files=files, data={"title": "Maps"})
+
+    assert response.status_code == 413
+    assert client.created == []
+    assert stored_files(client.storage_dir) == []
+
+class FakeSession:
+    """Stands in for the request's session; records rollbacks"""
+
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+def test_failed_record_discards_that_files_objects(tmp_path, monkeypatch):
+    """A database error for the middle file rolls back the session and deletes only that file's objects"""
+    import asyncio
+    import io
+    import uuid
+    from fastapi import UploadFile
+    from PIL import Image
+    from app import models
+    from app.config import settings
+    from app.services import upload_service
+
+    monkeypatch.setattr(settings, "STORAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(upload_service.crud, "get_image_by_file_key", lambda db, key: None)
+
+    recorded = []
+
+    def create_image(db, src, type_code, key, sha, *args, **kwargs):
+        if "green" in key:
+            raise RuntimeError("duplicate key value")
+        recorded.append(key)
+        return models.Images(
+            image_id=uuid.uuid4(), file_key=key, sha256=sha, source=src, event_type=type_code,
+            epsg="OTHER", image_type="crisis_map",
+            thumbnail_key=kwargs.get("thumbnail_key"), detail_key=kwargs.get("detail_key"),
+        )
+
+    monkeypatch.setattr(upload_service.crud, "create_image", create_image)
+
+    def png(color):
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 64), color).save(buf, format="PNG")
+        buf.seek(0)
+        return buf
+
+    files = [UploadFile(png(c), filename=f"{c}.png") for c in ("red", "green", "blue")]
+    db = FakeSession()
+    result = asyncio.run(upload_service.UploadService.process_multi_upload(
+        files, None, "OTHER", "", "", "crisis_map", "", None, db=db
+    ))
+
+    assert result["successful"] == 2
+    assert "error" in result["results"][1]
+    assert db.rollbacks == 1
+    stored = {str(p.relative_to(tmp_path)) for p in stored_files(tmp_path)}
+    assert len(recorded) == 2 and set(recorded) <= stored
+    assert any("thumbnail" in key or "detail" in key for key in stored)
+    assert not any("green" in key for key in stored)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Query budgets for the listing endpoints
+
+Each endpoint must run a fixed number of SQL statements however many rows it
+returns; a lazy relationship load per row (N+1) pushes it over its budget.
+Counts come from the Server-Timing header.
+"""
+
+import os
+import re
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Statements per request, independent of page size
+BUDGETS = {
+    "/api/images/grouped": 6,
+    "/api/images/{image_id}": 2,
+    "/api/captions": 2,
+}
+
+@pytest.fixture(scope="module")
+def client():
+    from sqlalchemy import text
+    from fastapi.testclient import TestClient
+    from app.database import engine
+    from app.main import app
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        pytest.skip(f"Database not reachable: {e}")
+    return TestClient(app)
+
+def query_count(response):
+    header = response.headers.get("server-timing", "")
+    match = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', header)
+    assert match, f"No db entry in Server-Timing: {header!r}"
+    return int(match.group(1))
+
+def test_grouped_budget(client):
+    """Grouped listing stays within budget for small and large pages"""
+    for limit in (1, 50):
+        response = client.get("/api/images/grouped", params={"limit": limit, "include_count": True})
+        assert response.status_code == 200
+        queries = query_count(response)
+        print(f"/api/images/grouped?limit={limit}: {queries} queries")
+        assert queries <= BUDGETS["/api/images/grouped"]
+
+def test_image_budget(client):
+    """Single image with its countries and captions in one go"""
+    items = client.get("/api/images/grouped", params={"limit": 1}).json()
+    if not items:
+        pytest.skip("No images in the database")
+    response = client.get(f"/api/images/{items[0]['image_id']}")
+    assert response.status_code == 200
+    assert query_count(response) <= BUDGETS["/api/images/{image_id}"]
+
+def test_captions_budget(client):
+    """All captions with their images, no per-caption refresh or lazy load"""
+    response = client.get("/api/captions")
+    assert response.status_code == 200
+    queries = query_count(response)
+    print(f"/api/captions: {queries} queries for {len(response.json())} captions")
+    assert queries <= BUDGETS["/api/captions"]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Shared fake VLM service for unit tests (not a test module itself)"""
+
+import asyncio
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.stub_vlm_service import StubVLMService
+
+class FakeVLMService(StubVLMService):
+    """Stub provider with a set delay and outcome; counts calls and notes cancellation
+
+    fail is a bool or a predicate on the image bytes; a failing call raises
+    error (default: a MODEL_UNAVAILABLE exception). reply(service, image_bytes)
+    builds the result; by default the caption is the model name.
+    """
+
+    def __init__(self, model_name="FAKE_MODEL", delay=0.0, fail=False, error=None, reply=None):
+        super().__init__()
+        self.model_name = model_name
+        self.delay = delay
+        self.fail = fail
+        self.error = error
+        self.reply = reply
+        self.calls = 0
+        self.cancelled = False
+
+    def _fails(self, image_bytes) -> bool:
+        return self.fail(image_bytes) if callable(self.fail) else bool(self.fail)
+
+    async def generate_caption(self, image_bytes, prompt, metadata_instructions=""):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self._fails(image_bytes):
+            raise self.error or Exception(f"MODEL_UNAVAILABLE: {self.model_name} failed")
+        if self.reply:
+            return self.reply(self, image_bytes)
+        return {"caption": self.model_name, "metadata": {}, "raw_response": {}}
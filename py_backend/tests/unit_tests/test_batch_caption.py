@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Unit tests for batch re-caption jobs"""
+
+import unittest
+import asyncio
+import shutil
+import sys
+import os
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.batch_caption import (
+    BatchCaptionRunner, BatchJobStore, BatchJobError, job_summary, COMPLETED, CANCELLED, RUNNING
+)
+
+class FakeCaptioner:
+    """Records calls; fails for selected ids and tracks peak concurrency"""
+
+    def __init__(self, fail_ids=(), delay=0.01):
+        self.fail_ids = set(fail_ids)
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, image_id, job):
+        self.calls.append(image_id)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if image_id in self.fail_ids:
+            raise RuntimeError(f"{image_id} failed")
+        return f"caption-{image_id}"
+
+class TestBatchCaptionRunner(unittest.TestCase):
+    """Test cases for running, checkpointing and resuming jobs"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = BatchJobStore(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _runner(self, captioner, **kwargs):
+        return BatchCaptionRunner(self.store, caption_one=captioner, checkpoint_interval_s=0, **kwargs)
+
+    def test_run_bounded_concurrency(self):
+        """Test all images are captioned with at most `concurrency` in flight"""
+        captioner = FakeCaptioner()
+        runner = self._runner(captioner)
+        job = runner.create_job([f"img{i}" for i in range(10)], model_name="M", concurrency=3)
+
+        result = asyncio.run(runner.run(job["job_id"]))
+        self.assertEqual(result["status"], COMPLETED)
+        self.assertEqual(len(result["done"]), 10)
+        self.assertEqual(captioner.peak, 3)
+        self.assertEqual(self.store.load(job["job_id"])["done"]["img0"], "caption-img0")
+
+    def test_failures_recorded_and_retried_on_resume(self):
+        """Test failed images are recorded, and resuming only redoes unfinished ones"""
+        runner = self._runner(FakeCaptioner(fail_ids={"img1"}))
+        job = runner.create_job(["img0", "img1", "img2"])
+        result = asyncio.run(runner.run(job["job_id"]))
+        self.assertIn("img1", result["failed"])
+        self.assertEqual(job_summary(result)["remaining"], 1)
+
+        retry = FakeCaptioner()
+        result = asyncio.run(self._runner(retry).run(job["job_id"]))
+        self.assertEqual(retry.calls, ["img1"])
+        self.assertEqual(result["failed"], {})
+        self.assertEqual(len(result["done"]), 3)
+
+    def test_interrupted_job_resumes(self):
+        """Test a job interrupted mid-run is left resumable with its checkpoint"""
+        captioner = FakeCaptioner(delay=0.05)
+        runner = self._runner(captioner)
+        job = runner.create_job([f"img{i}" for i in range(6)], concurrency=2)
+
+        async def interrupt():
+            task = asyncio.create_task(runner.run(job["job_id"]))
+            await asyncio.sleep(0.08)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(interrupt())
+        saved = self.store.load(job["job_id"])
+        self.assertEqual(saved["status"], RUNNING)
+        self.assertGreater(len(saved["done"]), 0)
+
+        async def resume():
+            resumed = runner.resume_pending()
+            self.assertEqual(resumed, [job["job_id"]])
+            await runner._tasks[job["job_id"]]
+
+        asyncio.run(resume())
+        saved = self.store.load(job["job_id"])
+        self.assertEqual(saved["status"], COMPLETED)
+        self.assertEqual(len(saved["done"]), 6)
+
+    def test_cancel(self):
+        """Test cancelling stops the job and it is not resumed on restart"""
+        runner = self._runner(FakeCaptioner(delay=0.05))
+        job = runner.create_job([f"img{i}" for i in range(6)], concurrency=1)
+
+        async def run_and_cancel():
+            runner.start(job["job_id"])
+            await asyncio.sleep(0.02)
+            runner.cancel(job["job_id"])
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run_and_cancel())
+        self.assertEqual(self.store.load(job["job_id"])["status"], CANCELLED)
+        self.assertEqual(runner.resume_pending(), [])
+
+    def test_cancel_from_another_worker(self):
+        """Test a cancel handled by a different runner stops the job and is not overwritten by its checkpoints"""
+        running = self._runner(FakeCaptioner(delay=0.02))
+        other = self._runner(FakeCaptioner())
+        job = running.create_job([f"img{i}" for i in range(20)], concurrency=2)
+
+        async def run_and_cancel_elsewhere():
+            task = asyncio.create_task(running.run(job["job_id"]))
+            await asyncio.sleep(0.05)
+            self.assertEqual(other.cancel(job["job_id"])["status"], CANCELLED)
+            return await task
+
+        result = asyncio.run(run_and_cancel_elsewhere())
+        saved = self.store.load(job["job_id"])
+        self.assertEqual(result["status"], CANCELLED)
+        self.assertEqual(saved["status"], CANCELLED)
+        self.assertTrue(saved["cancel_requested"])
+        self.assertLess(len(saved["done"]), 20)
+        self.assertEqual(saved["done"], result["done"])
+
+    def test_invalid_requests(self):
+        """Test empty selections and unknown jobs are rejected"""
+        runner = self._runner(FakeCaptioner())
+        with self.assertRaises(BatchJobError):
+            runner.create_job([])
+        with self.assertRaises(BatchJobError) as ctx:
+            runner.get_job("not-a-job")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Unit tests for streaming caption generation"""
+
+import unittest
+import asyncio
+import json
+import sys
+import os
+
+from aiohttp import web
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+from services.huggingface_service import HuggingFaceService
+
+class StreamingService(StubVLMService):
+    """Stub that streams its caption word by word, optionally failing midway"""
+
+    def __init__(self, model_name="STREAMING_MODEL", fail_after=None):
+        super().__init__()
+        self.model_name = model_name
+        self.fail_after = fail_after
+
+    async def stream_caption(self, image_bytes, prompt, metadata_instructions="", on_delta=None):
+        for i, word in enumerate(["A ", "flooded ", "road"]):
+            if self.fail_after is not None and i == self.fail_after:
+                raise Exception("MODEL_UNAVAILABLE: stream dropped")
+            await asyncio.sleep(0)
+            on_delta(word)
+        return {"caption": "A flooded road", "metadata": {}, "raw_response": {"content": "A flooded road"}}
+
+class TestManagerStreaming(unittest.TestCase):
+    """Test cases for VLMServiceManager.generate_caption_stream"""
+
+    def setUp(self):
+        self.manager = VLMServiceManager()
+        self.deltas = []
+
+    def test_deltas_then_result(self):
+        """Test partial text reaches on_delta before the full result is returned"""
+        self.manager.register_service(StreamingService())
+        result = asyncio.run(self.manager.generate_caption_stream(
+            b"img", "prompt", model_name="STREAMING_MODEL", on_delta=self.deltas.append
+        ))
+        self.assertEqual(self.deltas, ["A ", "flooded ", "road"])
+        self.assertEqual(result["caption"], "A flooded road")
+        self.assertEqual(result["model"], "STREAMING_MODEL")
+
+    def test_non_streaming_provider_is_emulated(self):
+        """Test providers without a streaming API send the whole caption as one delta"""
+        self.manager.register_service(StubVLMService())
+        result = asyncio.run(self.manager.generate_caption_stream(
+            b"img", "prompt", model_name="STUB_MODEL", on_delta=self.deltas.append
+        ))
+        self.assertEqual(self.deltas, [result["caption"]])
+
+    def test_failed_stream_falls_back(self):
+        """Test a stream that breaks midway falls back to STUB_MODEL"""
+        self.manager.register_service(StreamingService(fail_after=1))
+        self.manager.register_service(StubVLMService())
+        result = asyncio.run(self.manager.generate_caption_stream(
+            b"img", "prompt", model_name="STREAMING_MODEL", on_delta=self.deltas.append
+        ))
+        self.assertEqual(self.deltas, ["A "])
+        self.assertTrue(result["fallback_used"])
+        self.assertEqual(result["model"], "STUB_MODEL")
+
+class TestHuggingFaceStreaming(unittest.TestCase):
+    """Test cases for parsing the OpenAI-compatible SSE stream"""
+
+    def test_stream_parsing(self):
+        """Test content deltas are forwarded and the joined JSON is parsed"""
+        body = '{"description": "Flood", "analysis": "Water on road", "recommended_actions": "Divert", "metadata": {"title": "T"}}'
+        pieces = [body[:20], body[20:60], body[60:]]
+
+        async def completions(request):
+            payload = await request.json()
+            self.assertTrue(payload["stream"])
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await resp.prepare(request)
+            await resp.write(b": comment\n\n")
+            for piece in pieces:
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await resp.write(b"data: [DONE]\n\n")
+            return resp
+
+        async def run():
+            app = web.Application()
+            app.router.add_post("/v1/chat/completions", completions)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                service = HuggingFaceService("token", "org/model", f"http://127.0.0.1:{port}/v1/chat/completions")
+                service.prepare_image = self._fake_prepare
+                deltas = []
+                result = await service.stream_caption(b"img", "prompt", on_delta=deltas.append)
+                return deltas, result
+            finally:
+                await runner.cleanup()
+
+        deltas, result = asyncio.run(run())
+        self.assertEqual(deltas, pieces)
+        self.assertEqual(result["description"], "Flood")
+        self.assertEqual(result["metadata"], {"title": "T"})
+        self.assertTrue(result["raw_response"]["streamed"])
+
+    @staticmethod
+    async def _fake_prepare(image_bytes):
+        class Image:
+            data_url = "data:image/jpeg;base64,AA=="
+
+            def describe(self):
+                return {}
+        return Image()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Unit tests for the VLM circuit breaker"""
+
+import unittest
+import asyncio
+import sys
+import os
+from unittest.mock import AsyncMock
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitOpenError, CircuitState
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for breaker state transitions"""
+
+    def test_opens_on_consecutive_failures(self):
+        """Test the circuit opens after consecutive failures and rejects calls"""
+        breaker = CircuitBreaker("M", CircuitBreakerConfig(consecutive_failures=3, open_duration_s=60))
+        for _ in range(3):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_opens_on_error_rate(self):
+        """Test the circuit opens once the windowed error rate crosses the threshold"""
+        breaker = CircuitBreaker("M", CircuitBreakerConfig(min_calls=4, error_rate_threshold=0.5, consecutive_failures=10))
+        breaker.record_success(0.1)
+        breaker.record_failure(0.1)
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+
+    def test_opens_on_slow_calls(self):
+        """Test successful but slow calls also trip the circuit"""
+        breaker = CircuitBreaker("M", CircuitBreakerConfig(min_calls=2, slow_call_s=1.0, slow_rate_threshold=1.0))
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+
+    def test_half_open_trial(self):
+        """Test half-open admits one trial; success closes, failure re-opens"""
+        breaker = CircuitBreaker("M", CircuitBreakerConfig(consecutive_failures=1, open_duration_s=0))
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, CircuitState.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+
+    def test_probe_moves_open_to_half_open(self):
+        """Test a successful re-probe lets the next call through"""
+        breaker = CircuitBreaker("M", CircuitBreakerConfig(consecutive_failures=1, open_duration_s=600))
+        breaker.record_failure(0.1)
+        breaker.probe_succeeded()
+        self.assertEqual(breaker.state, CircuitState.HALF_OPEN)
+
+class TestManagerCircuit(unittest.TestCase):
+    """Test cases for health-aware routing in the manager"""
+
+    def setUp(self):
+        self.manager = VLMServiceManager()
+        self.manager.configure_breakers(CircuitBreakerConfig(consecutive_failures=1, open_duration_s=600))
+        self.stub = StubVLMService()
+        self.manager.register_service(self.stub)
+        self.failing = StubVLMService()
+        self.failing.model_name = "FAILING"
+        self.failing.generate_caption = AsyncMock(side_effect=Exception("HTTP 503"))
+        self.manager.register_service(self.failing)
+
+    def test_open_circuit_skips_provider(self):
+        """Test an open circuit fails fast and falls back without calling the provider"""
+        first = asyncio.run(self.manager.generate_caption(b"img", "prompt", model_name="FAILING"))
+        self.assertTrue(first["fallback_used"])
+        self.assertEqual(self.failing.generate_caption.await_count, 1)
+
+        second = asyncio.run(self.manager.generate_caption(b"img", "prompt", model_name="FAILING"))
+        self.assertEqual(second["model"], "STUB_MODEL")
+        self.assertIn("circuit open", second["fallback_reason"])
+        self.assertEqual(self.failing.generate_caption.await_count, 1)
+
+    def test_call_service_raises_when_open(self):
+        """Test _call_service rejects immediately once open"""
+        with self.assertRaises(Exception):
+            asyncio.run(self.manager._call_service(self.failing, b"img", "prompt"))
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(self.manager._call_service(self.failing, b"img", "prompt"))
+
+    def test_reprobe_admits_trial(self):
+        """Test re-probing an open circuit moves it to half-open"""
+        with self.assertRaises(Exception):
+            asyncio.run(self.manager._call_service(self.failing, b"img", "prompt"))
+        asyncio.run(self.manager.reprobe_open_circuits())
+        self.assertEqual(self.manager.breakers["FAILING"].state, CircuitState.HALF_OPEN)
+
+if __name__ == '__main__':
+    unittest.main()
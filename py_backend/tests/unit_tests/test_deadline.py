@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Unit tests for request deadline propagation"""
+
+import unittest
+import asyncio
+import time
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services.deadline import Deadline, DeadlineExceeded
+from services.vlm_service import VLMServiceManager
+from fake_vlm import FakeVLMService
+
+class TestDeadline(unittest.TestCase):
+    """Test cases for the Deadline helper"""
+
+    def test_run_within_budget(self):
+        """Test a stage that finishes in time returns its result"""
+        async def quick():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        self.assertEqual(asyncio.run(Deadline(1.0).run(quick(), "preprocess")), "ok")
+
+    def test_run_past_budget_names_stage(self):
+        """Test an overrunning stage raises DeadlineExceeded with its stage"""
+        with self.assertRaises(DeadlineExceeded) as ctx:
+            asyncio.run(Deadline(0.05).run(asyncio.sleep(1.0), "storage"))
+        self.assertEqual(ctx.exception.stage, "storage")
+        self.assertEqual(ctx.exception.to_dict()["error"], "deadline_exceeded")
+
+    def test_expired_deadline_skips_stage(self):
+        """Test a stage is not started once the budget is spent"""
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(deadline.run_sync("thumbnails", lambda: "never"))
+
+    def test_stage_timeout_not_relabelled(self):
+        """Test a stage's own TimeoutError is not reported as the request deadline"""
+        async def own_timeout():
+            raise asyncio.TimeoutError()
+
+        with self.assertRaises(asyncio.TimeoutError) as ctx:
+            asyncio.run(Deadline(5.0).run(own_timeout(), "VLM call"))
+        self.assertNotIsInstance(ctx.exception, DeadlineExceeded)
+
+    def test_unbounded_deadline(self):
+        """Test no budget means no timeout"""
+        deadline = Deadline(None)
+        self.assertFalse(deadline.bounded)
+        self.assertIsNone(deadline.timeout())
+        self.assertEqual(deadline.timeout(30), 30)
+
+class TestManagerDeadline(unittest.TestCase):
+    """Test cases for deadlines in VLMServiceManager"""
+
+    def test_deadline_stops_fallback_chain(self):
+        """Test a slow provider consumes the budget and no fallback is tried"""
+        manager = VLMServiceManager()
+        slow = FakeVLMService("SLOW_MODEL", delay=1.0)
+        backup = FakeVLMService("BACKUP_MODEL")
+        manager.register_service(slow)
+        manager.register_service(backup)
+
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(manager.generate_caption(
+                b"img", "prompt", model_name="SLOW_MODEL", deadline=Deadline(0.1)
+            ))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(backup.calls, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Unit tests for cancelling work when the client disconnects"""
+
+import unittest
+import asyncio
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from utils.disconnect import cancel_on_disconnect, ClientDisconnected, abandoned_requests
+
+class FakeRequest:
+    """ASGI receive that reports a disconnect after disconnect_after seconds"""
+
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self):
+        if self.disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+class SlowCall:
+    """Awaitable work that records whether it was cancelled"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = False
+
+    async def __call__(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return "done"
+
+class TestCancelOnDisconnect(unittest.TestCase):
+    """Test cases for the disconnect watcher"""
+
+    def test_connected_client_gets_result(self):
+        """Test the result is returned when the client stays connected"""
+        call = SlowCall(0.02)
+        result = asyncio.run(cancel_on_disconnect(FakeRequest(), call(), policy="cancel", poll_interval_s=0.01))
+        self.assertEqual(result, "done")
+
+    def test_disconnect_cancels_call(self):
+        """Test a disconnect cancels the in-flight call and raises ClientDisconnected"""
+        call = SlowCall(5.0)
+        before = abandoned_requests.get("upload", 0)
+
+        async def run():
+            return await cancel_on_disconnect(
+                FakeRequest(disconnect_after=0.02), call(), label="upload", policy="cancel", poll_interval_s=0.01
+            )
+
+        with self.assertRaises(ClientDisconnected) as ctx:
+            asyncio.run(run())
+        self.assertEqual(ctx.exception.status_code, 499)
+        self.assertTrue(call.cancelled)
+        self.assertEqual(abandoned_requests["upload"], before + 1)
+
+    def test_complete_policy_finishes_call(self):
+        """Test the complete policy ignores the disconnect"""
+        call = SlowCall(0.05)
+        result = asyncio.run(cancel_on_disconnect(
+            FakeRequest(disconnect_after=0), call(), policy="complete", poll_interval_s=0.01
+        ))
+        self.assertEqual(result, "done")
+        self.assertFalse(call.cancelled)
+
+    def test_errors_propagate(self):
+        """Test exceptions from the call are raised unchanged"""
+        async def failing():
+            raise ValueError("provider error")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(cancel_on_disconnect(FakeRequest(), failing(), policy="cancel", poll_interval_s=0.01))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Unit tests for hedged VLM requests"""
+
+import unittest
+import asyncio
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services.hedging import HedgePolicy, HedgeSpendGuard, LatencyTracker, hedge_delay
+from services.vlm_service import VLMServiceManager
+from fake_vlm import FakeVLMService
+
+class TestLatencyTracker(unittest.TestCase):
+    """Test cases for latency percentiles and hedge delay"""
+
+    def test_percentile(self):
+        """Test percentiles over recorded samples"""
+        tracker = LatencyTracker()
+        for i in range(1, 101):
+            tracker.record("M", float(i))
+        self.assertEqual(tracker.percentile("M", 0.95), 95.0)
+        self.assertIsNone(tracker.percentile("M", 0.95, min_samples=200))
+
+    def test_delay_clamped_and_defaulted(self):
+        """Test the hedge delay uses the default until samples exist and is clamped"""
+        policy = HedgePolicy(min_samples=3, default_delay_s=7.0, min_delay_s=1.0, max_delay_s=10.0)
+        tracker = LatencyTracker()
+        self.assertEqual(hedge_delay(policy, tracker, "M"), 7.0)
+        for value in (50.0, 60.0, 70.0):
+            tracker.record("M", value)
+        self.assertEqual(hedge_delay(policy, tracker, "M"), 10.0)
+
+class TestSpendGuard(unittest.TestCase):
+    """Test cases for the hedge budget"""
+
+    def test_budget_per_model(self):
+        """Test hedges are bounded per target model"""
+        guard = HedgeSpendGuard(max_per_minute=2)
+        self.assertTrue(guard.try_spend("A"))
+        self.assertTrue(guard.try_spend("A"))
+        self.assertFalse(guard.try_spend("A"))
+        self.assertTrue(guard.try_spend("B"))
+        self.assertEqual(guard.denied["A"], 1)
+        self.assertFalse(guard.try_spend("C", max_per_minute=0))
+
+class TestHedgedCall(unittest.TestCase):
+    """Test cases for racing the fallback model"""
+
+    def setUp(self):
+        self.manager = VLMServiceManager()
+        self.manager.configure_hedging(HedgePolicy(enabled=True, default_delay_s=0.05, min_delay_s=0.0))
+
+    def _run(self, primary, target):
+        attempted = {primary.model_name}
+        result = asyncio.run(self.manager._hedged_call(primary, target, b"img", "prompt", "", attempted))
+        return result, attempted
+
+    def test_fast_primary_not_hedged(self):
+        """Test no hedge is sent when the primary answers within the delay"""
+        primary, target = FakeVLMService("PRIMARY", 0.0), FakeVLMService("FALLBACK", 0.0)
+        result, attempted = self._run(primary, target)
+        self.assertEqual(result["model"], "PRIMARY")
+        self.assertEqual(attempted, {"PRIMARY"})
+
+    def test_hedge_wins_and_primary_cancelled(self):
+        """Test a slow primary is raced and cancelled when the hedge wins"""
+        primary, target = FakeVLMService("PRIMARY", 5.0), FakeVLMService("FALLBACK", 0.0)
+        result, attempted = self._run(primary, target)
+        self.assertEqual(result["model"], "FALLBACK")
+        self.assertTrue(result["hedged"])
+        self.assertTrue(result["fallback_used"])
+        self.assertTrue(primary.cancelled)
+        self.assertIn("FALLBACK", attempted)
+
+    def test_failed_hedge_waits_for_primary(self):
+        """Test a failing hedge does not discard a primary that later succeeds"""
+        primary, target = FakeVLMService("PRIMARY", 0.2), FakeVLMService("FALLBACK", 0.0, fail=True)
+        result, _ = self._run(primary, target)
+        self.assertEqual(result["model"], "PRIMARY")
+
+    def test_caller_cancelled_during_hedge_delay(self):
+        """Test cancelling the caller while it waits out the hedge delay cancels the primary call"""
+        self.manager.configure_hedging(HedgePolicy(enabled=True, default_delay_s=1.0, min_delay_s=0.0))
+        primary, target = FakeVLMService("PRIMARY", 5.0), FakeVLMService("FALLBACK", 0.0)
+
+        async def cancel_caller():
+            caller = asyncio.create_task(self.manager._hedged_call(primary, target, b"img", "prompt", "", set()))
+            await asyncio.sleep(0.05)
+            caller.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await caller
+            await asyncio.sleep(0)
+            # Checked before asyncio.run cancels leftover tasks at shutdown
+            self.assertTrue(primary.cancelled)
+
+        asyncio.run(cancel_caller())
+
+    def test_spend_guard_blocks_hedge(self):
+        """Test an exhausted budget means waiting for the primary"""
+        self.manager.configure_hedging(HedgePolicy(enabled=True, default_delay_s=0.01, min_delay_s=0.0, max_hedges_per_minute=0))
+        primary, target = FakeVLMService("PRIMARY", 0.1), FakeVLMService("FALLBACK", 0.0)
+        result, attempted = self._run(primary, target)
+        self.assertEqual(result["model"], "PRIMARY")
+        self.assertEqual(attempted, {"PRIMARY"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Unit tests for the event-loop watchdog and blocking-call detector"""
+
+import unittest
+import asyncio
+import logging
+import time
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services import loop_watchdog, metrics
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import Session
+    ASYNC_SQLITE_AVAILABLE = True
+except ImportError:
+    ASYNC_SQLITE_AVAILABLE = False
+
+def blocking_handler(seconds):
+    time.sleep(seconds)
+
+class TestLoopWatchdog(unittest.TestCase):
+    """Test cases for lag sampling and stall reports"""
+
+    def test_stall_logs_blocking_stack(self):
+        """Test a stalled loop is reported with the blocking function on the stack"""
+        watchdog = loop_watchdog.LoopWatchdog(interval_s=0.02, stall_threshold_s=0.1)
+        before = metrics.registry.get_sample_value("event_loop_lag_seconds_count") if metrics.PROMETHEUS_AVAILABLE else 0
+
+        async def run():
+            watchdog.start()
+            await asyncio.sleep(0.1)
+            blocking_handler(0.4)
+            await asyncio.sleep(0.1)
+            watchdog.stop()
+
+        with self.assertLogs(loop_watchdog.logger, logging.WARNING) as logs:
+            asyncio.run(run())
+
+        self.assertEqual(watchdog.stalls, 1)
+        self.assertGreaterEqual(watchdog.max_lag_s, 0.25)
+        stall = next(line for line in logs.output if "stalled" in line)
+        self.assertIn("blocking_handler", stall)
+        self.assertTrue(any("was blocked for" in line for line in logs.output))
+        if metrics.PROMETHEUS_AVAILABLE:
+            self.assertGreater(metrics.registry.get_sample_value("event_loop_lag_seconds_count"), before or 0)
+
+    def test_healthy_loop_is_quiet(self):
+        """Test a loop that keeps yielding produces no warnings"""
+        watchdog = loop_watchdog.LoopWatchdog(interval_s=0.02, stall_threshold_s=0.2)
+
+        async def run():
+            watchdog.start()
+            await asyncio.sleep(0.2)
+            watchdog.stop()
+
+        with self.assertNoLogs(loop_watchdog.logger, logging.WARNING):
+            asyncio.run(run())
+        self.assertEqual(watchdog.stalls, 0)
+
+class TestBlockingCallDetector(unittest.TestCase):
+    """Test cases for the debug-mode blocking-call detector"""
+
+    def setUp(self):
+        self.assertEqual(loop_watchdog.install_blocking_call_detector(calls=(("time", "sleep"),)), 1)
+
+    def tearDown(self):
+        loop_watchdog.uninstall_blocking_call_detector()
+
+    def test_reports_loop_thread_calls_once_per_site(self):
+        """Test calls on the loop thread are reported once per call site, not from worker threads"""
+        async def handler():
+            for _ in range(3):
+                time.sleep(0)
+            await asyncio.to_thread(time.sleep, 0)
+
+        with self.assertLogs(loop_watchdog.logger, logging.WARNING) as logs:
+            asyncio.run(handler())
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("time.sleep", logs.output[0])
+        self.assertIn("test_loop_watchdog.py", logs.output[0])
+
+    def test_outside_loop_not_reported(self):
+        """Test sync code with no running loop is left alone, and uninstall restores the original"""
+        with self.assertNoLogs(loop_watchdog.logger, logging.WARNING):
+            time.sleep(0)
+        loop_watchdog.uninstall_blocking_call_detector()
+        self.assertFalse(getattr(time.sleep, "_blocking_call_wrapped", False))
+
+@unittest.skipUnless(ASYNC_SQLITE_AVAILABLE, "aiosqlite not installed")
+class TestBlockingCallDetectorSessions(unittest.TestCase):
+    """Test cases for SQLAlchemy sessions under the blocking-call detector"""
+
+    def setUp(self):
+        self.assertEqual(loop_watchdog.install_blocking_call_detector(calls=(("sqlalchemy.orm", "Session.execute"),)), 1)
+
+    def tearDown(self):
+        loop_watchdog.uninstall_blocking_call_detector()
+
+    def test_async_session_not_reported(self):
+        """Test AsyncSession queries (sync Session run in SQLAlchemy's greenlet) are not blocking calls"""
+        async def handler():
+            engine = create_async_engine("sqlite+aiosqlite://")
+            try:
+                async with AsyncSession(engine) as session:
+                    for _ in range(3):
+                        await session.execute(text("SELECT 1"))
+            finally:
+                await engine.dispose()
+
+        with self.assertNoLogs(loop_watchdog.logger, logging.WARNING):
+            asyncio.run(handler())
+
+    def test_sync_session_on_loop_reported(self):
+        """Test a sync Session used directly in a coroutine is still reported"""
+        engine = create_engine("sqlite://")
+
+        async def handler():
+            with Session(engine) as session:
+                session.execute(text("SELECT 1"))
+
+        with self.assertLogs(loop_watchdog.logger, logging.WARNING) as logs:
+            asyncio.run(handler())
+        self.assertIn("sqlalchemy.orm.Session.execute", logs.output[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Unit tests for Prometheus metrics"""
+
+import unittest
+import asyncio
+import subprocess
+import tempfile
+import sys
+import os
+
+# Add the app directory to the path
+APP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services import metrics
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+from fake_vlm import FakeVLMService
+
+def sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0.0
+
+class FakePool:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def connect(self):
+        if self.fail:
+            raise TimeoutError("QueuePool limit reached")
+        return "connection"
+
+@unittest.skipUnless(metrics.PROMETHEUS_AVAILABLE, "prometheus_client not installed")
+class TestMetrics(unittest.TestCase):
+    """Test cases for the metrics helpers"""
+
+    def test_stage_timer_records_on_error(self):
+        """Test a stage is timed even when it raises"""
+        before = sample("upload_stage_duration_seconds_count", stage="preprocess")
+        with metrics.stage_timer("preprocess"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.stage_timer("preprocess"):
+                raise ValueError("bad image")
+        self.assertEqual(sample("upload_stage_duration_seconds_count", stage="preprocess") - before, 2)
+
+    def test_vlm_calls_and_fallback(self):
+        """Test provider outcomes and the stub fallback are counted per model"""
+        manager = VLMServiceManager()
+        manager.register_service(StubVLMService())
+        failing = FakeVLMService("METRICS_FAILING", fail=True, error=RuntimeError("provider down"))
+        manager.register_service(failing)
+        before_error = sample("vlm_calls_total", model="METRICS_FAILING", outcome="error")
+        before_ok = sample("vlm_calls_total", model="STUB_MODEL", outcome="success")
+        before_fallback = sample("vlm_fallbacks_total", from_model="METRICS_FAILING", to_model="STUB_MODEL", kind="stub")
+
+        result = asyncio.run(manager.generate_caption(b"image", "prompt", model_name="METRICS_FAILING"))
+
+        self.assertEqual(result["model"], "STUB_MODEL")
+        self.assertEqual(sample("vlm_calls_total", model="METRICS_FAILING", outcome="error") - before_error, 1)
+        self.assertEqual(sample("vlm_calls_total", model="STUB_MODEL", outcome="success") - before_ok, 1)
+        self.assertEqual(
+            sample("vlm_fallbacks_total", from_model="METRICS_FAILING", to_model="STUB_MODEL", kind="stub") - before_fallback, 1
+        )
+        self.assertGreaterEqual(sample("vlm_call_duration_seconds_count", model="STUB_MODEL", outcome="success"), 1)
+
+    def test_pool_checkout(self):
+        """Test pool checkouts are timed and failed checkouts counted"""
+        pool, failing = FakePool(), FakePool(fail=True)
+        metrics.instrument_pool(pool)
+        metrics.instrument_pool(pool)
+        metrics.instrument_pool(failing)
+        before = sample("db_pool_checkout_wait_seconds_count")
+        before_errors = sample("db_pool_checkout_errors_total")
+
+        self.assertEqual(pool.connect(), "connection")
+        with self.assertRaises(TimeoutError):
+            failing.connect()
+
+        self.assertEqual(sample("db_pool_checkout_wait_seconds_count") - before, 2)
+        self.assertEqual(sample("db_pool_checkout_errors_total") - before_errors, 1)
+
+    def test_cache_lookups(self):
+        """Test hits and misses are counted separately per cache"""
+        before_hit = sample("cache_lookups_total", cache="test_cache", result="hit")
+        metrics.record_cache("test_cache", True)
+        metrics.record_cache("test_cache", True)
+        metrics.record_cache("test_cache", False)
+        self.assertEqual(sample("cache_lookups_total", cache="test_cache", result="hit") - before_hit, 2)
+        self.assertEqual(sample("cache_lookups_total", cache="test_cache", result="miss"), 1)
+
+    def test_route_template(self):
+        """Test route labels are full templates, with or without a router prefix in the route path"""
+        from starlette.routing import Route
+        full = Route("/api/images/{image_id}", lambda request: None)
+        relative = Route("/{image_id}", lambda request: None)
+        self.assertEqual(metrics.route_template({"route": full, "path": "/api/images/abc"}), "/api/images/{image_id}")
+        self.assertEqual(metrics.route_template({"route": relative, "path": "/api/images/abc"}), "/api/images/{image_id}")
+        self.assertEqual(metrics.route_template({"path": "/nope"}), "unmatched")
+
+    def test_render(self):
+        """Test the exposition text includes every metric family"""
+        metrics.observe_request("GET", "/api/images/{image_id}", 200, 0.01)
+        body, content_type = metrics.render()
+        text = body.decode()
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn('route="/api/images/{image_id}"', text)
+        for name in ("upload_stage_duration_seconds", "vlm_calls_total", "db_pool_checkout_wait_seconds",
+                     "cache_lookups_total"):
+            self.assertIn(name, text)
+
+    def test_multiprocess_aggregation(self):
+        """Test samples recorded by separate worker processes are summed on render"""
+        record = (
+            "import sys; sys.path.insert(0, sys.argv[1]); from services import metrics; "
+            "metrics.record_cache('shared', True); metrics.observe_stage('storage', 0.2)"
+        )
+        render = (
+            "import sys; sys.path.insert(0, sys.argv[1]); from services import metrics; "
+            "sys.stdout.write(metrics.render()[0].decode())"
+        )
+        with tempfile.TemporaryDirectory() as shared:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": shared}
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", record, APP_DIR], env=env, check=True)
+            text = subprocess.run(
+                [sys.executable, "-c", render, APP_DIR], env=env, check=True, capture_output=True, text=True
+            ).stdout
+        self.assertIn('cache_lookups_total{cache="shared",result="hit"} 2.0', text)
+        self.assertIn('upload_stage_duration_seconds_count{stage="storage"} 2.0', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Unit tests for the model benchmarking harness"""
+
+import unittest
+import asyncio
+import shutil
+import sys
+import os
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+from fake_vlm import FakeVLMService
+from services.model_benchmark import (
+    BenchmarkRunLocks, ModelBenchmark, compare_runs, output_tokens, percentile, summarise, synthetic_image_set
+)
+
+def reported_reply(service, image_bytes):
+    """Reply carrying usage and payload like the real providers"""
+    return {
+        "caption": "A flooded road",
+        "raw_response": {
+            "content": '{"description": "Flood"}',
+            "parse_status": "ok",
+            "usage": {"completion_tokens": 42},
+            "image_payload": {"payload_bytes": len(image_bytes)},
+        },
+    }
+
+def reporting_service(fail_on=()):
+    """Fake provider that reports usage, failing on images of the given sizes"""
+    return FakeVLMService("REPORTING_MODEL", fail=lambda image_bytes: len(image_bytes) in fail_on, reply=reported_reply)
+
+def always_valid(raw, image_type):
+    return True, None
+
+class TestModelBenchmark(unittest.TestCase):
+    """Test cases for ModelBenchmark runs"""
+
+    def setUp(self):
+        self.manager = VLMServiceManager()
+        self.images = synthetic_image_set(count=3, size=256)
+
+    def run_benchmark(self, **kwargs):
+        benchmark = ModelBenchmark(self.manager, validate=always_valid)
+        return asyncio.run(benchmark.run(self.images, **kwargs))
+
+    def test_every_registered_model_is_benchmarked(self):
+        """Test each model gets rounds x images calls and a full summary"""
+        self.manager.register_service(StubVLMService())
+        self.manager.register_service(reporting_service())
+        results = self.run_benchmark(rounds=2, concurrency=2)
+        self.assertEqual(set(results), {"STUB_MODEL", "REPORTING_MODEL"})
+        summary = results["REPORTING_MODEL"]
+        self.assertEqual(summary["calls"], 6)
+        self.assertEqual(summary["succeeded"], 6)
+        self.assertEqual(summary["schema_pass_rate"], 1.0)
+        self.assertEqual(summary["output_tokens"]["mean"], 42)
+        self.assertFalse(summary["output_tokens"]["estimated"])
+        self.assertEqual(summary["payload_bytes"]["max"], max(len(b) for _, b in self.images))
+        self.assertIn("p95", summary["latency_ms"])
+        # The stub reports no usage, so its tokens are estimated from the text
+        self.assertTrue(results["STUB_MODEL"]["output_tokens"]["estimated"])
+
+    def test_failures_are_counted_not_fallen_back(self):
+        """Test a failing call is recorded against the requested model"""
+        self.manager.register_service(StubVLMService())
+        self.manager.register_service(reporting_service(fail_on={len(self.images[0][1])}))
+        results = self.run_benchmark(model_names=["REPORTING_MODEL"])
+        summary = results["REPORTING_MODEL"]
+        self.assertEqual(list(results), ["REPORTING_MODEL"])
+        self.assertEqual(summary["succeeded"], 2)
+        self.assertAlmostEqual(summary["error_rate"], 0.3333)
+        self.assertEqual(list(summary["errors"].values()), [1])
+
+    def test_unknown_model(self):
+        """Test asking for an unregistered model is an error"""
+        self.manager.register_service(StubVLMService())
+        with self.assertRaises(ValueError):
+            self.run_benchmark(model_names=["NOPE"])
+
+class TestBenchmarkSummaries(unittest.TestCase):
+    """Test cases for the summary helpers"""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 50))
+
+    def test_output_tokens(self):
+        """Test reported usage wins over the text estimate"""
+        self.assertEqual(output_tokens({"usage": {"completion_tokens": 7}, "content": "x" * 400}), (7, False))
+        self.assertEqual(output_tokens({"content": "x" * 400}), (100, True))
+        self.assertEqual(output_tokens({}), (None, True))
+
+    def test_unchecked_validation_is_not_a_failure(self):
+        """Test samples without a validation result are left out of the pass rate"""
+        sample = {"ok": True, "latency_ms": 10.0, "payload_bytes": None, "schema_valid": None,
+                  "output_tokens": None, "tokens_estimated": True, "parse_status": None, "error": None}
+        self.assertIsNone(summarise([sample])["schema_pass_rate"])
+
+    def test_compare_runs(self):
+        """Test runs are lined up per model in the order given"""
+        summary = {"calls": 4, "error_rate": 0.0, "latency_ms": {"p50": 100.0, "p95": 200.0},
+                   "schema_pass_rate": 0.75, "output_tokens": {"mean": 40}, "payload_bytes": {"mean": 1000}}
+        comparison = compare_runs([
+            {"run_id": "a", "results": {"M1": summary}},
+            {"run_id": "b", "results": {"M1": summary, "M2": summary}},
+        ])
+        self.assertEqual(comparison["runs"], ["a", "b"])
+        self.assertEqual([row["run_id"] for row in comparison["models"]["M1"]], ["a", "b"])
+        self.assertEqual(comparison["models"]["M2"][0]["p95_ms"], 200.0)
+        self.assertEqual(comparison["models"]["M2"][0]["schema_pass_rate"], 0.75)
+
+class TestBenchmarkRunLocks(unittest.TestCase):
+    """Test cases for telling runs executing in a live worker from orphaned ones"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_held_only_while_running(self):
+        """Test another worker sees a run as held until its owner releases it"""
+        owner, other = BenchmarkRunLocks(self.tmp_dir), BenchmarkRunLocks(self.tmp_dir)
+        self.assertFalse(other.is_held("run-1"))
+
+        lock = owner.hold("run-1")
+        self.assertTrue(other.is_held("run-1"))
+        self.assertFalse(other.is_held("run-2"))
+
+        owner.release("run-1", lock)
+        self.assertFalse(other.is_held("run-1"))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
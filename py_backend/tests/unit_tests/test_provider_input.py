@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Unit tests for provider image renditions"""
+
+import unittest
+import io
+import sys
+import os
+
+from PIL import Image
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.provider_input import ImageInputSpec, PreparedImages, ProviderInputCache, render_image
+from services.stub_vlm_service import StubVLMService
+
+def _image_bytes(size, fmt, mode='RGB') -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, (10, 120, 200)).save(output, format=fmt)
+    return output.getvalue()
+
+class TestImageInputSpec(unittest.TestCase):
+    """Test cases for per-model image input settings"""
+
+    def test_defaults(self):
+        """Test defaults apply when the model has no config"""
+        spec = ImageInputSpec.from_config(None)
+        self.assertEqual(spec, ImageInputSpec())
+        self.assertEqual(spec.mime_type, "image/jpeg")
+
+    def test_from_config(self):
+        """Test values are read from Models.config['image_input']"""
+        spec = ImageInputSpec.from_config({"image_input": {"max_dimension": 768, "format": "webp", "quality": 70}})
+        self.assertEqual(spec.max_dimension, 768)
+        self.assertEqual(spec.format, "WEBP")
+        self.assertEqual(spec.quality, 70)
+        self.assertEqual(spec.mime_type, "image/webp")
+
+    def test_unknown_format_falls_back(self):
+        """Test unsupported formats keep the default format"""
+        spec = ImageInputSpec.from_config({"image_input": {"format": "BMP"}})
+        self.assertEqual(spec.format, "JPEG")
+
+class TestRenderImage(unittest.TestCase):
+    """Test cases for rendition generation"""
+
+    def test_large_png_downscaled_to_jpeg(self):
+        """Test lossless originals are bounded and re-encoded"""
+        source = _image_bytes((4000, 2000), 'PNG', 'RGBA')
+        image = render_image(source, ImageInputSpec(max_dimension=1024))
+
+        self.assertEqual((image.width, image.height), (1024, 512))
+        self.assertEqual(image.mime_type, "image/jpeg")
+        self.assertTrue(image.data.startswith(b'\xff\xd8\xff'))
+        self.assertEqual(image.describe()["source_bytes"], len(source))
+        self.assertTrue(image.data_url.startswith("data:image/jpeg;base64,"))
+
+    def test_small_matching_image_reused(self):
+        """Test images already within spec are not recompressed"""
+        source = _image_bytes((300, 200), 'JPEG')
+        image = render_image(source, ImageInputSpec(max_dimension=1024))
+        self.assertIs(image.data, source)
+
+class TestProviderInputCache(unittest.TestCase):
+    """Test cases for the rendition cache"""
+
+    def test_cache_hit_by_content_and_spec(self):
+        """Test identical content reuses the rendition; a new spec does not"""
+        cache = ProviderInputCache()
+        source = _image_bytes((1600, 1600), 'PNG')
+        first = cache.get_or_render(source, ImageInputSpec(max_dimension=512))
+        second = cache.get_or_render(bytes(source), ImageInputSpec(max_dimension=512))
+        cache.get_or_render(source, ImageInputSpec(max_dimension=256))
+
+        self.assertIs(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_eviction_by_bytes(self):
+        """Test least recently used renditions are evicted past max_bytes"""
+        cache = ProviderInputCache(max_bytes=1)
+        cache.get_or_render(_image_bytes((64, 64), 'PNG'), ImageInputSpec(max_dimension=32))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+class TestPreparedImages(unittest.TestCase):
+    """Test cases for per-request multi-image renditions"""
+
+    def test_rendered_once_per_spec(self):
+        """Test renditions and their base64 are kept per spec, and the list stays the source bytes"""
+        sources = [_image_bytes((800, 600), 'PNG'), _image_bytes((300, 200), 'JPEG')]
+        images = PreparedImages(sources)
+        cache = ProviderInputCache(max_bytes=1)  # nothing cached, so reuse must come from PreparedImages
+        first = images.renditions(ImageInputSpec(max_dimension=256), cache)
+        second = images.renditions(ImageInputSpec(max_dimension=256), cache)
+        other = images.renditions(ImageInputSpec(max_dimension=128), cache)
+
+        self.assertEqual(images, sources)
+        self.assertIs(first, second)
+        self.assertIsNotNone(first[0]._base64)
+        self.assertEqual(cache.stats()["misses"], 4)
+        self.assertEqual(max(other[0].width, other[0].height), 128)
+
+class TestServiceConfigure(unittest.TestCase):
+    """Test cases for applying model config to a service"""
+
+    def test_configure_sets_image_input(self):
+        """Test services pick up image_input from their model config"""
+        service = StubVLMService()
+        service.configure({"provider": "custom", "image_input": {"max_dimension": 640}})
+        self.assertEqual(service.image_input.max_dimension, 640)
+        self.assertEqual(service.get_model_info()["image_input"]["max_dimension"], 640)
+
+if __name__ == '__main__':
+    unittest.main()
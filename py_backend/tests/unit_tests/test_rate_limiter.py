@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Unit tests for VLM rate limiting"""
+
+import unittest
+import asyncio
+import shutil
+import sys
+import os
+import tempfile
+import fcntl
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.rate_limiter import (
+    TokenBucket, RateLimitSpec, ServiceRateLimiter, RateLimitExceeded, FileRateLimitCoordinator, POLL_INTERVAL_S
+)
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the token bucket"""
+
+    def test_burst_then_wait(self):
+        """Test a full bucket allows a burst, then reports the refill wait"""
+        bucket = TokenBucket(rate_per_minute=60)
+        for _ in range(60):
+            self.assertEqual(bucket.try_acquire(1, now=100.0), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(1, now=100.0), 1.0)
+        self.assertEqual(bucket.try_acquire(1, now=101.0), 0.0)
+
+    def test_oversized_request_capped(self):
+        """Test a request larger than the bucket still gets through when full"""
+        bucket = TokenBucket(rate_per_minute=1000)
+        self.assertEqual(bucket.try_acquire(5000, now=0.0), 0.0)
+
+class TestRateLimitSpec(unittest.TestCase):
+    """Test cases for limits read from model config"""
+
+    def test_from_config(self):
+        """Test limits are read from Models.config['limits']"""
+        spec = RateLimitSpec.from_config({"limits": {"max_concurrency": 2, "rpm": 30, "tpm": 50000}})
+        self.assertEqual(spec.max_concurrency, 2)
+        self.assertEqual(spec.rpm, 30.0)
+        self.assertEqual(spec.tpm, 50000.0)
+        self.assertIsNone(spec.queue_timeout_s)
+
+    def test_estimate_tokens(self):
+        """Test token estimate covers prompt, images and completion"""
+        spec = RateLimitSpec(max_output_tokens=100)
+        self.assertEqual(spec.estimate_tokens("x" * 400, image_count=2), 100 + 2000 + 100)
+
+class TestServiceRateLimiter(unittest.TestCase):
+    """Test cases for concurrency and queueing"""
+
+    def test_concurrency_cap(self):
+        """Test no more than max_concurrency calls run at once"""
+        limiter = ServiceRateLimiter("TEST", RateLimitSpec(max_concurrency=2), default_queue_timeout_s=5)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.acquire():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.02)
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_queue_deadline(self):
+        """Test waiters give up once the queue deadline passes"""
+        limiter = ServiceRateLimiter("TEST", RateLimitSpec(rpm=1), default_queue_timeout_s=0.1)
+
+        async def run():
+            async with limiter.acquire():
+                pass
+            async with limiter.acquire():
+                pass
+
+        with self.assertRaises(RateLimitExceeded):
+            asyncio.run(run())
+        self.assertEqual(limiter.rejected, 1)
+
+    def test_slot_timeout_keeps_rate_budget(self):
+        """Test a call that times out waiting for a slot does not spend RPM budget"""
+        limiter = ServiceRateLimiter("TEST", RateLimitSpec(max_concurrency=1, rpm=2), default_queue_timeout_s=0.05)
+
+        async def run():
+            async with limiter.acquire():
+                with self.assertRaises(RateLimitExceeded):
+                    async with limiter.acquire():
+                        pass
+            async with limiter.acquire():
+                pass
+
+        asyncio.run(run())
+        self.assertEqual(limiter.rejected, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_tpm_timeout_refunds_rpm(self):
+        """Test a call rejected on TPM gives back the RPM token it took"""
+        limiter = ServiceRateLimiter("TEST", RateLimitSpec(rpm=2, tpm=1000), default_queue_timeout_s=0.05)
+
+        async def run():
+            async with limiter.acquire(tokens=1000):
+                pass
+            with self.assertRaises(RateLimitExceeded):
+                async with limiter.acquire(tokens=1000):
+                    pass
+
+        asyncio.run(run())
+        self.assertAlmostEqual(limiter._buckets["rpm"]._state["tokens"], 1.0, places=2)
+
+    def test_disabled_without_limits(self):
+        """Test an empty spec does not throttle"""
+        limiter = ServiceRateLimiter("TEST", RateLimitSpec())
+        self.assertFalse(limiter.enabled)
+
+class TestFileCoordinator(unittest.TestCase):
+    """Test cases for cross-worker limit sharing"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_shared_bucket(self):
+        """Test two coordinators on one directory draw from the same bucket"""
+        first = FileRateLimitCoordinator(self.tmp_dir)
+        second = FileRateLimitCoordinator(self.tmp_dir)
+        self.assertEqual(first.try_acquire("M.rpm", 1, 2), 0.0)
+        self.assertEqual(second.try_acquire("M.rpm", 1, 2), 0.0)
+        self.assertGreater(first.try_acquire("M.rpm", 1, 2), 0.0)
+
+    def test_locked_bucket_does_not_block(self):
+        """Test a bucket locked by another worker reports a short wait instead of blocking"""
+        coordinator = FileRateLimitCoordinator(self.tmp_dir)
+        with open(coordinator._path("M.rpm", ".bucket.json"), "a+") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            self.assertEqual(coordinator.try_acquire("M.rpm", 1, 2), POLL_INTERVAL_S)
+        self.assertEqual(coordinator.try_acquire("M.rpm", 1, 2), 0.0)
+
+    def test_shared_refund(self):
+        """Test tokens refunded through one coordinator are available to another"""
+        first = FileRateLimitCoordinator(self.tmp_dir)
+        second = FileRateLimitCoordinator(self.tmp_dir)
+        self.assertEqual(first.try_acquire("M.rpm", 1, 1), 0.0)
+        self.assertGreater(second.try_acquire("M.rpm", 1, 1), 0.0)
+        self.assertTrue(first.refund("M.rpm", 1, 1))
+        self.assertEqual(second.try_acquire("M.rpm", 1, 1), 0.0)
+
+    def test_slots(self):
+        """Test slot locks cap concurrency and are released"""
+        coordinator = FileRateLimitCoordinator(self.tmp_dir)
+        slot = coordinator.try_acquire_slot("M", 1)
+        self.assertIsNotNone(slot)
+        self.assertIsNone(coordinator.try_acquire_slot("M", 1))
+        coordinator.release_slot(slot)
+        other = coordinator.try_acquire_slot("M", 1)
+        self.assertIsNotNone(other)
+        coordinator.release_slot(other)
+
+class TestManagerLimits(unittest.TestCase):
+    """Test cases for limits applied through the manager"""
+
+    def test_call_goes_through_limiter(self):
+        """Test provider calls use the per-service limiter from model config"""
+        manager = VLMServiceManager()
+        service = StubVLMService()
+        service.configure({"limits": {"max_concurrency": 1}})
+        manager.register_service(service)
+
+        result = asyncio.run(manager._call_service(service, b"img", "prompt"))
+        self.assertIn("caption", result)
+        self.assertEqual(manager.limiters[service.model_name].spec.max_concurrency, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Unit tests for read-replica routing"""
+
+import unittest
+import asyncio
+import tempfile
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from sqlalchemy import Column, Integer, String, create_engine, select
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from services.replica_routing import Replica, ReplicaSet, RoutingSession, use_primary
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    ASYNC_SQLITE_AVAILABLE = True
+except ImportError:
+    ASYNC_SQLITE_AVAILABLE = False
+
+Base = declarative_base()
+
+class Item(Base):
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+def make_db(path, name):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Item.__table__.insert(), {"id": 1, "name": name})
+    return engine
+
+class TestReplicaRouting(unittest.TestCase):
+    """Test cases for RoutingSession and ReplicaSet"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.primary = make_db(os.path.join(self.tmp.name, "primary.db"), "primary")
+        self.replica_path = os.path.join(self.tmp.name, "replica.db")
+        self.replica = Replica("replica", make_db(self.replica_path, "replica"))
+        self.replicas = ReplicaSet([self.replica])
+        self.Session = sessionmaker(bind=self.primary, class_=RoutingSession, replicas=self.replicas)
+
+    def tearDown(self):
+        self.primary.dispose()
+        self.replica.engine.dispose()
+        self.tmp.cleanup()
+
+    def read_name(self, session):
+        return session.execute(select(Item.name).where(Item.id == 1)).scalar_one()
+
+    def test_reads_go_to_replica(self):
+        """Test reads use the replica and writes the primary, and a session that wrote stays there"""
+        with self.Session() as session:
+            self.assertEqual(self.read_name(session), "replica")
+            session.add(Item(id=2, name="new"))
+            session.commit()
+            self.assertEqual(self.read_name(session), "primary")
+        with self.primary.connect() as conn:
+            self.assertEqual(conn.execute(select(Item.name).where(Item.id == 2)).scalar_one(), "new")
+
+    def test_pinned_requests_use_primary(self):
+        """Test use_primary() (read-your-writes) routes reads to the primary"""
+        with use_primary():
+            with self.Session() as session:
+                self.assertEqual(self.read_name(session), "primary")
+        with use_primary(False), self.Session() as session:
+            self.assertEqual(self.read_name(session), "replica")
+
+    def test_unhealthy_replica_falls_back(self):
+        """Test reads fall back to the primary while no replica is healthy, and return after a good check"""
+        self.replica.mark_down("maintenance")
+        with self.Session() as session:
+            self.assertEqual(self.read_name(session), "primary")
+        self.replicas.check()
+        self.assertTrue(self.replica.healthy)
+        with self.Session() as session:
+            self.assertEqual(self.read_name(session), "replica")
+
+    def test_health_check_marks_unreachable(self):
+        """Test a replica that cannot be reached is taken out of rotation"""
+        broken = Replica("broken", create_engine(f"sqlite:///{self.tmp.name}/missing/dir.db"))
+        replicas = ReplicaSet([broken, self.replica])
+        replicas.check()
+        self.assertFalse(broken.healthy)
+        self.assertIsNotNone(broken.last_error)
+        self.assertEqual({replicas.pick().name for _ in range(4)}, {"replica"})
+        self.assertEqual(replicas.status()["broken"]["healthy"], False)
+
+    def test_no_replicas_uses_primary(self):
+        """Test routing is a no-op without replicas"""
+        Session = sessionmaker(bind=self.primary, class_=RoutingSession, replicas=ReplicaSet([]))
+        with Session() as session:
+            self.assertEqual(self.read_name(session), "primary")
+
+    @unittest.skipUnless(ASYNC_SQLITE_AVAILABLE, "aiosqlite not installed")
+    def test_async_session_reads_replica(self):
+        """Test the same routing works behind an AsyncSession"""
+        primary = create_async_engine(f"sqlite+aiosqlite:///{self.tmp.name}/primary.db")
+        replica = Replica("replica", self.replica.engine, create_async_engine(f"sqlite+aiosqlite:///{self.replica_path}"))
+        Session = async_sessionmaker(
+            bind=primary, class_=AsyncSession, sync_session_class=RoutingSession,
+            replicas=ReplicaSet([replica]), use_async_engines=True,
+        )
+
+        async def read():
+            async with Session() as session:
+                result = await session.execute(select(Item.name).where(Item.id == 1))
+                name = result.scalar_one()
+            await primary.dispose()
+            await replica.async_engine.dispose()
+            return name
+
+        self.assertEqual(asyncio.run(read()), "replica")
+
+if __name__ == '__main__':
+    unittest.main()
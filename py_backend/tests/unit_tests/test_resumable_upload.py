@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Unit tests for resumable upload store"""
+
+import unittest
+import hashlib
+import shutil
+import sys
+import os
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.resumable_upload import ResumableUploadStore, ResumableUploadError
+
+class TestResumableUploadStore(unittest.TestCase):
+    """Test cases for resumable upload store"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = ResumableUploadStore(self.tmp_dir, max_bytes=1024)
+        self.data = os.urandom(300)
+        self.sha = hashlib.sha256(self.data).hexdigest()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_upload_in_chunks_and_verify(self):
+        """Test appending chunks then verifying the checksum"""
+        state = self.store.create("ortho.tif", len(self.data), self.sha)
+        upload_id = state["upload_id"]
+
+        for start in range(0, len(self.data), 128):
+            state = self.store.append(upload_id, start, self.data[start:start + 128])
+
+        self.assertEqual(state["offset"], len(self.data))
+        verified = self.store.verify(upload_id)
+        self.assertEqual(verified["verified_sha256"], self.sha)
+        with open(self.store.data_path(upload_id), "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_resume_after_offset_mismatch(self):
+        """Test a stale offset is rejected and reports where to resume"""
+        upload_id = self.store.create("ortho.tif", len(self.data), self.sha)["upload_id"]
+        self.store.append(upload_id, 0, self.data[:100])
+
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.append(upload_id, 0, self.data[:100])
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertEqual(ctx.exception.offset, 100)
+
+        self.store.append(upload_id, 100, self.data[100:])
+        self.assertEqual(self.store.get(upload_id)["offset"], len(self.data))
+
+    def test_verify_incomplete_upload(self):
+        """Test verification fails while bytes are missing"""
+        upload_id = self.store.create("ortho.tif", len(self.data))["upload_id"]
+        self.store.append(upload_id, 0, self.data[:10])
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.verify(upload_id)
+        self.assertEqual(ctx.exception.status_code, 409)
+
+    def test_verify_checksum_mismatch(self):
+        """Test verification fails when the declared sha256 does not match"""
+        upload_id = self.store.create("ortho.tif", len(self.data), "0" * 64)["upload_id"]
+        self.store.append(upload_id, 0, self.data)
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.verify(upload_id)
+        self.assertEqual(ctx.exception.status_code, 422)
+
+    def test_chunk_past_declared_size(self):
+        """Test chunks cannot exceed the declared size"""
+        upload_id = self.store.create("ortho.tif", 10)["upload_id"]
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.append(upload_id, 0, b"x" * 11)
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    def test_streamed_chunk_stops_at_declared_size(self):
+        """Test a streamed chunk is refused once it runs past the size, leaving the offset alone"""
+        upload_id = self.store.create("ortho.tif", 100)["upload_id"]
+        self.store.append(upload_id, 0, b"a" * 40)
+
+        writer = self.store.start_append(upload_id, 40)
+        try:
+            writer.write(b"b" * 50)
+            with self.assertRaises(ResumableUploadError) as ctx:
+                writer.write(b"c" * 11)
+        finally:
+            writer.close()
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertEqual(self.store.get(upload_id)["offset"], 40)
+
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.start_append(upload_id, 40, length=61)
+        self.assertEqual(ctx.exception.status_code, 413)
+
+        # The aborted bytes are dropped by the next append
+        self.store.append(upload_id, 40, b"d" * 60)
+        with open(self.store.data_path(upload_id), "rb") as f:
+            self.assertEqual(f.read(), b"a" * 40 + b"d" * 60)
+
+    def test_busy_upload_refused_with_offset(self):
+        """Test a second writer gets a 423 with the stored offset instead of waiting for the lock"""
+        upload_id = self.store.create("ortho.tif", len(self.data))["upload_id"]
+        self.store.append(upload_id, 0, self.data[:100])
+
+        writer = self.store.start_append(upload_id, 100)
+        try:
+            writer.write(self.data[100:150])
+            with self.assertRaises(ResumableUploadError) as ctx:
+                self.store.start_append(upload_id, 100)
+            self.assertEqual(ctx.exception.status_code, 423)
+            self.assertEqual(ctx.exception.offset, 100)
+            # A writer whose client went away keeps what did arrive
+            writer.commit()
+        finally:
+            writer.close()
+        self.assertEqual(self.store.get(upload_id)["offset"], 150)
+
+    def test_completion_claimed_once(self):
+        """Test a second complete is refused while the first runs, and allowed after a release"""
+        upload_id = self.store.create("ortho.tif", len(self.data), self.sha)["upload_id"]
+        self.store.append(upload_id, 0, self.data)
+
+        self.store.claim_completion(upload_id)
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.claim_completion(upload_id)
+        self.assertEqual(ctx.exception.status_code, 409)
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.append(upload_id, len(self.data), b"")
+        self.assertEqual(ctx.exception.status_code, 409)
+
+        self.store.release_completion(upload_id)
+        self.store.claim_completion(upload_id)
+        # A claim whose completer died can be taken over once stale
+        self.store.claim_completion(upload_id, stale_after_s=-1)
+
+    def test_create_too_large(self):
+        """Test size limit is enforced at creation"""
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.create("ortho.tif", 2048)
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    def test_invalid_upload_id(self):
+        """Test ids that are not UUIDs are rejected"""
+        with self.assertRaises(ResumableUploadError) as ctx:
+            self.store.get("../../etc/passwd")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_delete_and_cleanup_expired(self):
+        """Test deletion and TTL-based cleanup"""
+        first = self.store.create("a.tif", 10)["upload_id"]
+        self.store.create("b.tif", 10)
+        self.store.delete(first)
+        with self.assertRaises(ResumableUploadError):
+            self.store.get(first)
+
+        self.assertEqual(self.store.cleanup_expired(-1), 1)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -194,5 +194,79 @@ class TestSchemaValidator(unittest.TestCase):
         self.assertFalse(is_valid)
         self.assertIsNotNone(error)
 
+class TestSchemaValidatorCache(unittest.TestCase):
+    """Test cases for compiled validator and schema lookup caching"""
+
+    def setUp(self):
+        self.schema = {
+            "type": "object",
+            "properties": {"analysis": {"type": "string"}},
+            "required": ["analysis"]
+        }
+        self.schema_obj = Mock(schema_id="crisis_map_v1", version="1.0.0", schema=self.schema)
+        self.schema_validator = SchemaValidator(type_cache_ttl_s=300)
+
+    @patch('services.schema_validator.SessionLocal')
+    @patch('services.schema_validator.crud')
+    def test_image_type_lookup_cached(self, mock_crud, mock_session):
+        """Test repeated validations query the database once"""
+        mock_crud.get_schemas_by_image_type.return_value = [self.schema_obj]
+        for _ in range(3):
+            is_valid, _ = self.schema_validator.validate_by_image_type({"analysis": "ok"}, "crisis_map")
+            self.assertTrue(is_valid)
+        self.assertEqual(mock_crud.get_schemas_by_image_type.call_count, 1)
+        self.assertEqual(self.schema_validator.cache_stats["compiled"], 1)
+
+    @patch('services.schema_validator.SessionLocal')
+    @patch('services.schema_validator.crud')
+    def test_clear_cache_reloads_schema(self, mock_crud, mock_session):
+        """Test clearing a schema picks up its new content"""
+        mock_crud.get_schemas_by_image_type.return_value = [self.schema_obj]
+        self.assertTrue(self.schema_validator.validate_by_image_type({"analysis": "ok"}, "crisis_map")[0])
+
+        stricter = dict(self.schema, required=["analysis", "metadata"])
+        mock_crud.get_schemas_by_image_type.return_value = [
+            Mock(schema_id="crisis_map_v1", version="1.0.0", schema=stricter)
+        ]
+        self.schema_validator.clear_schema_cache("crisis_map_v1")
+        self.assertFalse(self.schema_validator.validate_by_image_type({"analysis": "ok"}, "crisis_map")[0])
+        self.assertEqual(mock_crud.get_schemas_by_image_type.call_count, 2)
+
+    @patch('services.schema_validator.SessionLocal')
+    @patch('services.schema_validator.crud')
+    def test_missing_schema_cached(self, mock_crud, mock_session):
+        """Test an image type without a schema is looked up once, and again after a schema is added"""
+        mock_crud.get_schemas_by_image_type.return_value = []
+        for _ in range(3):
+            self.assertIsNone(self.schema_validator._get_schema_by_image_type("drone_image"))
+        self.assertEqual(mock_crud.get_schemas_by_image_type.call_count, 1)
+
+        mock_crud.get_schemas_by_image_type.return_value = [
+            Mock(schema_id="drone_v1", version="1.0.0", schema=self.schema)
+        ]
+        self.schema_validator.clear_schema_cache("drone_v1")
+        self.assertEqual(self.schema_validator._get_schema_by_image_type("drone_image"), ("drone_v1", self.schema))
+        self.assertEqual(mock_crud.get_schemas_by_image_type.call_count, 2)
+
+    @patch('services.schema_validator.SessionLocal')
+    @patch('services.schema_validator.crud')
+    def test_missing_schema_expires(self, mock_crud, mock_session):
+        """Test a cached miss is re-checked once the TTL has passed"""
+        validator = SchemaValidator(type_cache_ttl_s=0)
+        mock_crud.get_schemas_by_image_type.return_value = []
+        validator._get_schema_by_image_type("drone_image")
+        validator._get_schema_by_image_type("drone_image")
+        self.assertEqual(mock_crud.get_schemas_by_image_type.call_count, 2)
+
+    def test_changed_schema_recompiled(self):
+        """Test a schema passed with new content under the same id is not served stale"""
+        self.assertTrue(self.schema_validator.validate_against_schema({"analysis": "ok"}, self.schema, "s")[0])
+        self.assertTrue(self.schema_validator.validate_against_schema({"analysis": "ok"}, dict(self.schema), "s")[0])
+        self.assertEqual(self.schema_validator.cache_stats["compiled"], 1)
+
+        stricter = dict(self.schema, required=["analysis", "metadata"])
+        self.assertFalse(self.schema_validator.validate_against_schema({"analysis": "ok"}, stricter, "s")[0])
+        self.assertEqual(self.schema_validator.cache_stats["compiled"], 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Unit tests for the Server-Timing middleware and query budgets"""
+
+import unittest
+import logging
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from services import server_timing
+from services.metrics import stage_timer
+
+def make_app(**budgets):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    server_timing.instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(server_timing.ServerTimingMiddleware, **budgets)
+
+    @app.get("/queries/{n}")
+    def run_queries(n: int):
+        # Sync endpoint: runs in the threadpool, still counted for this request
+        with engine.connect() as conn:
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+        return {"ran": n}
+
+    @app.get("/stages")
+    async def stages():
+        with stage_timer("preprocess"):
+            pass
+        server_timing.add_stage("vlm_call", 0.25)
+        return {}
+
+    return app, engine
+
+class TestServerTiming(unittest.TestCase):
+    """Test cases for per-request query counting"""
+
+    def test_queries_counted_per_request(self):
+        """Test each request reports only its own statements"""
+        app, engine = make_app()
+        client = TestClient(app)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))  # outside any request: not counted
+
+        for n in (3, 0, 5):
+            header = client.get(f"/queries/{n}").headers["server-timing"]
+            self.assertIn(f'desc="{n} queries"', header)
+            self.assertIn("total;dur=", header)
+
+    def test_stages_in_header(self):
+        """Test stage timers and added stages appear as Server-Timing entries"""
+        app, _ = make_app()
+        header = TestClient(app).get("/stages").headers["server-timing"]
+        self.assertIn("preprocess;dur=", header)
+        self.assertIn("vlm_call;dur=250.0", header)
+
+    def test_header_can_be_turned_off(self):
+        """Test send_header=False leaves responses untouched"""
+        app, _ = make_app(send_header=False)
+        self.assertNotIn("server-timing", TestClient(app).get("/queries/1").headers)
+
+    def test_slow_request_logged(self):
+        """Test requests over the query budget are logged, others are not"""
+        app, _ = make_app(max_queries=3)
+        client = TestClient(app)
+        with self.assertLogs(server_timing.logger, logging.WARNING) as logs:
+            client.get("/queries/4")
+            server_timing.logger.warning("marker")
+            client.get("/queries/3")
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("/queries/{n}", logs.output[0])
+        self.assertIn("4 queries > 3", logs.output[0])
+
+    def test_add_stage_outside_request(self):
+        """Test adding a stage with no request in progress is a no-op"""
+        self.assertIsNone(server_timing.current())
+        server_timing.add_stage("orphan", 1.0)
+        with server_timing.track() as timing:
+            server_timing.add_stage("thumbnail", 0.5)
+            server_timing.add_stage("thumbnail", 0.5)
+        self.assertEqual(timing.stages, {"thumbnail": 1.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Unit tests for coalescing identical concurrent caption requests"""
+
+import unittest
+import asyncio
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services.single_flight import SingleFlight
+from services.deadline import Deadline, DeadlineExceeded
+from services.vlm_service import VLMServiceManager
+from fake_vlm import FakeVLMService
+
+def counted_reply(service, image_bytes):
+    """Provider reply that says which call produced it"""
+    return {"caption": "shared", "metadata": {}, "raw_response": {"n": service.calls}}
+
+class FakeSession:
+    """Stands in for SessionLocal(); records that it was closed"""
+
+    def __init__(self):
+        self.info = {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for the single-flight primitive"""
+
+    def test_identical_keys_share_one_call(self):
+        """Test concurrent callers with one key run fn once"""
+        flight = SingleFlight()
+        runs = 0
+
+        async def fn():
+            nonlocal runs
+            runs += 1
+            await asyncio.sleep(0.02)
+            return runs
+
+        async def run():
+            return await asyncio.gather(*(flight.do("k", fn, label="M") for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [1] * 5)
+        self.assertEqual(runs, 1)
+        self.assertEqual(flight.stats()["coalesced"], {"M": 4})
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_errors_are_shared(self):
+        """Test every waiter sees the shared call's exception"""
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(flight.do("k", fn), flight.do("k", fn), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_cancel_one_waiter_keeps_call(self):
+        """Test a cancelled caller does not cancel the call others still wait on"""
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def run():
+            first = asyncio.create_task(flight.do("k", fn))
+            second = asyncio.create_task(flight.do("k", fn))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "ok")
+
+class TestManagerCoalescing(unittest.TestCase):
+    """Test cases for coalescing in VLMServiceManager"""
+
+    def setUp(self):
+        self.manager = VLMServiceManager()
+        self.service = FakeVLMService("STUB_MODEL", delay=0.05, reply=counted_reply)
+        self.manager.register_service(self.service)
+
+    def test_duplicate_requests_one_provider_call(self):
+        """Test identical concurrent requests reach the provider once and get separate results"""
+        async def run():
+            return await asyncio.gather(*(
+                self.manager.generate_caption(b"img", "prompt", "instr", model_name="STUB_MODEL")
+                for _ in range(3)
+            ))
+
+        results = asyncio.run(run())
+        self.assertEqual(self.service.calls, 1)
+        self.assertEqual([r["caption"] for r in results], ["shared"] * 3)
+        results[0]["raw_response"]["validation_failed"] = True
+        self.assertNotIn("validation_failed", results[1]["raw_response"])
+        self.assertEqual(self.manager.single_flight.stats()["total_coalesced"], 2)
+
+    def test_different_requests_not_coalesced(self):
+        """Test different images or prompts are separate provider calls"""
+        async def run():
+            await asyncio.gather(
+                self.manager.generate_caption(b"img-a", "prompt", model_name="STUB_MODEL"),
+                self.manager.generate_caption(b"img-b", "prompt", model_name="STUB_MODEL"),
+                self.manager.generate_caption(b"img-a", "other", model_name="STUB_MODEL"),
+            )
+
+        asyncio.run(run())
+        self.assertEqual(self.service.calls, 3)
+
+    def test_short_deadline_does_not_bind_other_callers(self):
+        """Test a coalesced caller with a long deadline gets the result after the first caller's short one expires"""
+        self.service.delay = 0.2
+        sessions = []
+        self.manager.session_factory = lambda: sessions.append(FakeSession()) or sessions[-1]
+        request_session = object()  # the first caller's, closed once its request ends; must not be used
+
+        async def run():
+            short = asyncio.create_task(self.manager.generate_caption(
+                b"img", "prompt", model_name="STUB_MODEL", db_session=request_session, deadline=Deadline(0.05)
+            ))
+            await asyncio.sleep(0.01)
+            long = asyncio.create_task(self.manager.generate_caption(
+                b"img", "prompt", model_name="STUB_MODEL", db_session=request_session, deadline=Deadline(5.0)
+            ))
+            with self.assertRaises(DeadlineExceeded):
+                await short
+            return await long
+
+        result = asyncio.run(run())
+        self.assertEqual(result["caption"], "shared")
+        self.assertEqual(self.service.calls, 1)
+        self.assertFalse(self.service.cancelled)
+        self.assertEqual(len(sessions), 1)
+        self.assertTrue(sessions[0].closed)
+
+    def test_all_callers_gone_cancels_provider_call(self):
+        """Test the provider call is cancelled once no caller is waiting"""
+        self.service.delay = 5.0
+
+        async def run():
+            task = asyncio.create_task(self.manager.generate_caption(b"img", "prompt", model_name="STUB_MODEL"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertTrue(self.service.cancelled)
+
+if __name__ == '__main__':
+    unittest.main()
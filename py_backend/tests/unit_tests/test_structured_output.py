@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Unit tests and fuzz/benchmark suite for the structured-output parser"""
+
+import unittest
+import json
+import random
+import time
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from services.structured_output import parse_structured_output, OK, EXTRACTED, REPAIRED, FAILED
+
+CAPTION = {
+    "description": "Satellite map of flooding along the river delta, \"Zone A\" shaded red.",
+    "analysis": "Roughly 40% of the district is inundated; roads N1 and N7 are cut {north of the bridge}.",
+    "recommended_actions": "Pre-position boats at the N7 junction; prioritise shelters in Zone A.",
+    "metadata": {
+        "title": "Delta Flood Extent",
+        "source": "WFP",
+        "type": "FLOOD",
+        "countries": ["BD", "IN"],
+        "epsg": "4326"
+    }
+}
+BODY = json.dumps(CAPTION, indent=2)
+
+# Reply shapes seen from providers
+RECORDED_RESPONSES = [
+    ("plain", BODY, OK),
+    ("fenced", "```json\n" + BODY + "\n```", OK),
+    ("bare fence", "```\n" + BODY + "\n```", OK),
+    ("glm box tokens", "<|begin_of_box|>" + BODY + "<|end_of_box|>", OK),
+    ("double encoded", json.dumps(BODY), OK),
+    ("chatty prefix", "Sure! Here is the analysis you asked for:\n\n" + BODY, EXTRACTED),
+    ("prefix and suffix fence", "Here you go:\n```json\n" + BODY + "\n```\nLet me know if you need more.", EXTRACTED),
+    ("prefix with stray braces", "Output format {as requested}:\n" + BODY, EXTRACTED),
+]
+
+class TestStructuredOutput(unittest.TestCase):
+    """Test cases for parse_structured_output"""
+
+    def test_recorded_responses(self):
+        """Test every recorded reply shape parses to the full object"""
+        for name, reply, status in RECORDED_RESPONSES:
+            with self.subTest(name):
+                parsed = parse_structured_output(reply)
+                self.assertEqual(parsed.status, status)
+                self.assertEqual(parsed.data, CAPTION)
+                self.assertEqual(parsed.metadata["countries"], ["BD", "IN"])
+
+    def test_content_blocks_and_bytes(self):
+        """Test list-of-blocks and bytes content are flattened first"""
+        self.assertEqual(parse_structured_output([{"type": "text", "text": BODY}]).data, CAPTION)
+        self.assertEqual(parse_structured_output(BODY.encode()).data, CAPTION)
+
+    def test_truncated_keeps_complete_fields(self):
+        """Test a reply cut off at max_tokens keeps the fields that arrived"""
+        cut = BODY[:BODY.index('"metadata"') + 30]
+        parsed = parse_structured_output("```json\n" + cut)
+        self.assertEqual(parsed.status, REPAIRED)
+        self.assertEqual(parsed.description, CAPTION["description"])
+        self.assertEqual(parsed.recommended_actions, CAPTION["recommended_actions"])
+        self.assertIsInstance(parsed.metadata, dict)
+
+    def test_not_json(self):
+        """Test plain prose fails cleanly with the text kept"""
+        parsed = parse_structured_output("The map shows flooding in the north.")
+        self.assertEqual(parsed.status, FAILED)
+        self.assertFalse(parsed.ok)
+        self.assertEqual(parsed.text, "The map shows flooding in the north.")
+        self.assertEqual(parse_structured_output(None).status, FAILED)
+        self.assertEqual(parse_structured_output("[1, 2]").status, FAILED)
+
+class TestStructuredOutputFuzz(unittest.TestCase):
+    """Fuzz and benchmark runs over the recorded replies"""
+
+    def test_every_truncation_point(self):
+        """Test cutting the reply anywhere never raises and never invents values"""
+        for cut in range(len(BODY) + 1):
+            parsed = parse_structured_output(BODY[:cut])
+            if not parsed.ok:
+                continue
+            for key, value in parsed.data.items():
+                self.assertIn(key, CAPTION)
+                if isinstance(value, str) and key != "metadata":
+                    self.assertTrue(CAPTION[key].startswith(value), (cut, key, value))
+
+    def test_random_noise(self):
+        """Test random prefixes, suffixes and byte noise never raise"""
+        rng = random.Random(1234)
+        alphabet = '{}[]",:\\ abc123\n`'
+        for _ in range(500):
+            noise = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+            reply = rng.choice(RECORDED_RESPONSES)[1]
+            mode = rng.randint(0, 2)
+            if mode == 0:
+                reply = noise + reply
+            elif mode == 1:
+                reply = reply + noise
+            else:
+                i = rng.randint(0, len(reply))
+                reply = reply[:i] + noise + reply[i:]
+            parsed = parse_structured_output(reply)
+            self.assertIn(parsed.status, (OK, EXTRACTED, REPAIRED, FAILED))
+
+    def test_benchmark(self):
+        """Test recorded replies parse well within the per-caption budget"""
+        replies = [reply for _, reply, _ in RECORDED_RESPONSES] + [BODY[:len(BODY) // 2]]
+        rounds = 200
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for reply in replies:
+                parse_structured_output(reply)
+        per_parse_ms = (time.perf_counter() - start) * 1000 / (rounds * len(replies))
+        self.assertLess(per_parse_ms, 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
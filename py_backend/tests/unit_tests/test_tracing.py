@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Unit tests for OpenTelemetry tracing"""
+
+import unittest
+import asyncio
+import json
+import logging
+import tempfile
+import sys
+import os
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))  # shared fakes (fake_vlm)
+
+from services import tracing
+from services.vlm_service import VLMServiceManager
+from services.stub_vlm_service import StubVLMService
+from fake_vlm import FakeVLMService
+
+try:
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    SDK_AVAILABLE = True
+except ImportError:
+    SDK_AVAILABLE = False
+
+class TestTracingDisabled(unittest.TestCase):
+    """Test cases for tracing while it is off"""
+
+    def test_noop(self):
+        """Test spans, decorators and the log filter work without tracing"""
+        tracing.shutdown()
+        with tracing.span("anything", key="value") as span:
+            self.assertIsNone(span)
+
+        @tracing.traced("double")
+        def double(x):
+            return x * 2
+
+        self.assertEqual(double(2), 4)
+        self.assertIsNone(tracing.current_trace_id())
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+        tracing.TraceContextFilter().filter(record)
+        self.assertEqual(record.trace_id, "-")
+
+    def test_unknown_exporter(self):
+        """Test an unknown exporter leaves tracing off"""
+        self.assertFalse(tracing.configure(""))
+        self.assertFalse(tracing.configure("zipkin"))
+        self.assertFalse(tracing.enabled())
+
+@unittest.skipUnless(SDK_AVAILABLE, "opentelemetry-sdk not installed")
+class TestTracing(unittest.TestCase):
+    """Test cases for spans recorded while tracing is on"""
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        self.assertTrue(tracing.configure("memory", span_exporter=self.exporter))
+
+    def tearDown(self):
+        tracing.shutdown()
+
+    def spans(self, name=None):
+        return [s for s in self.exporter.get_finished_spans() if name is None or s.name == name]
+
+    def test_nested_spans_and_errors(self):
+        """Test child spans share the trace and exceptions mark the span as an error"""
+        with tracing.span("upload.receive") as parent:
+            with self.assertRaises(ValueError):
+                with tracing.span("upload.preprocess", filename="a.png"):
+                    raise ValueError("bad image")
+        child = self.spans("upload.preprocess")[0]
+        self.assertEqual(child.parent.span_id, parent.get_span_context().span_id)
+        self.assertEqual(child.attributes["filename"], "a.png")
+        self.assertFalse(child.status.is_ok)
+
+    def test_fallback_attempts(self):
+        """Test each provider call and fallback attempt gets its own span"""
+        manager = VLMServiceManager()
+        manager.register_service(StubVLMService())
+        manager.register_service(FakeVLMService("TRACE_FAILING", fail=True, error=RuntimeError("provider down")))
+
+        result = asyncio.run(manager.generate_caption(b"image", "prompt", model_name="TRACE_FAILING"))
+
+        self.assertEqual(result["model"], "STUB_MODEL")
+        caption = self.spans("vlm.caption")[0]
+        calls = {s.attributes["vlm.model"]: s for s in self.spans("vlm.call")}
+        self.assertEqual(set(calls), {"TRACE_FAILING", "STUB_MODEL"})
+        self.assertFalse(calls["TRACE_FAILING"].status.is_ok)
+        fallback = self.spans("vlm.fallback")[0]
+        self.assertEqual(fallback.attributes["vlm.original_model"], "TRACE_FAILING")
+        self.assertEqual(fallback.attributes["vlm.fallback_kind"], "stub")
+        self.assertEqual(calls["STUB_MODEL"].parent.span_id, fallback.context.span_id)
+        self.assertEqual(fallback.parent.span_id, caption.context.span_id)
+
+    def test_sql_spans(self):
+        """Test SQL statements on an instrumented engine become db spans"""
+        from sqlalchemy import create_engine, text
+        engine = create_engine("sqlite://")
+        tracing.instrument_engine(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with self.assertRaises(Exception):
+                conn.execute(text("SELECT * FROM missing_table"))
+        spans = self.spans("db.SELECT")
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0].attributes["db.statement"], "SELECT 1")
+        self.assertTrue(spans[0].status.is_unset)
+        self.assertFalse(spans[1].status.is_ok)
+
+    def test_log_correlation(self):
+        """Test log records carry the active trace and span ids"""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+        with tracing.span("work") as span:
+            tracing.TraceContextFilter().filter(record)
+            self.assertEqual(record.trace_id, tracing.current_trace_id())
+        self.assertEqual(record.span_id, format(span.get_span_context().span_id, "016x"))
+        self.assertIn("%(trace_id)s", tracing.LOG_FORMAT)
+
+    def test_file_exporter(self):
+        """Test the file exporter writes one JSON span per line"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces", "spans.jsonl")
+            self.assertTrue(tracing.configure("file", file_path=path))
+            with tracing.span("storage.upload_fileobj"):
+                pass
+            tracing.shutdown()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+        self.assertEqual([line["name"] for line in lines], ["storage.upload_fileobj"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Unit tests for streaming upload helpers"""
+
+import unittest
+import asyncio
+import hashlib
+import io
+import sys
+import os
+
+from fastapi import FastAPI, UploadFile, File
+from fastapi.testclient import TestClient
+from PIL import Image
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from utils.upload_stream import spool_upload, hash_fileobj, UploadSizeLimitMiddleware
+from services.image_preprocessor import ImagePreprocessor
+
+def _make_upload(data: bytes, filename: str = "map.png") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename)
+
+def _image_bytes(fmt: str) -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (20, 10), (200, 10, 10)).save(output, format=fmt)
+    return output.getvalue()
+
+class TestSpoolUpload(unittest.TestCase):
+    """Test cases for chunked hashing of uploads"""
+
+    def test_hash_and_size(self):
+        """Test sha256 and size are computed and the handle is rewound"""
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        upload = asyncio.run(spool_upload(_make_upload(data), max_bytes=len(data)))
+
+        self.assertEqual(upload.size, len(data))
+        self.assertEqual(upload.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(upload.head, data[:64])
+        self.assertEqual(upload.file.tell(), 0)
+        self.assertEqual(upload.read_bytes(), data)
+
+    def test_size_limit(self):
+        """Test uploads over the limit are rejected with 413"""
+        from fastapi import HTTPException
+        with self.assertRaises(HTTPException) as ctx:
+            asyncio.run(spool_upload(_make_upload(b"x" * 2048), max_bytes=1024))
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    def test_hash_fileobj(self):
+        """Test hashing a file handle leaves it rewound"""
+        f = io.BytesIO(b"promptaid")
+        self.assertEqual(hash_fileobj(f), hashlib.sha256(b"promptaid").hexdigest())
+        self.assertEqual(f.tell(), 0)
+
+class TestPreprocessFileobj(unittest.TestCase):
+    """Test cases for handle-based preprocessing"""
+
+    def test_png_passes_through_same_handle(self):
+        """Test PNG uploads are not read into memory or copied"""
+        f = io.BytesIO(_image_bytes('PNG'))
+        processed, filename, mime_type, original = ImagePreprocessor.preprocess_fileobj(f, "map.png")
+        self.assertIs(processed, f)
+        self.assertEqual(filename, "map.png")
+        self.assertEqual(mime_type, "image/png")
+        self.assertEqual(original, "image/png")
+
+    def test_webp_is_converted(self):
+        """Test formats needing conversion return a new handle"""
+        f = io.BytesIO(_image_bytes('WEBP'))
+        processed, filename, mime_type, original = ImagePreprocessor.preprocess_fileobj(f, "map.webp")
+        self.assertIsNot(processed, f)
+        self.assertEqual(mime_type, "image/png")
+        self.assertEqual(original, "image/webp")
+        self.assertTrue(processed.read().startswith(b'\x89PNG'))
+
+class TestUploadSizeLimitMiddleware(unittest.TestCase):
+    """Test cases for the request body limit"""
+
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(UploadSizeLimitMiddleware, max_bytes=4096)
+
+        @app.post("/upload")
+        async def upload(file: UploadFile = File(...)):
+            return {"size": len(await file.read())}
+
+        self.client = TestClient(app)
+
+    def test_small_upload_allowed(self):
+        """Test bodies under the limit reach the route"""
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 100)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["size"], 100)
+
+    def test_declared_length_rejected(self):
+        """Test bodies over the limit are refused with 413"""
+        response = self.client.post("/upload", files={"file": ("a.png", b"x" * 10000)})
+        self.assertEqual(response.status_code, 413)
+
+    def test_streamed_body_rejected(self):
+        """Test chunked bodies are cut off once they cross the limit"""
+        boundary = "testboundary"
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\n"
+            "Content-Type: image/png\r\n\r\n"
+        ).encode() + b"x" * 10000 + f"\r\n--{boundary}--\r\n".encode()
+
+        def chunks():
+            for i in range(0, len(body), 1000):
+                yield body[i:i + 1000]
+
+        response = self.client.post(
+            "/upload",
+            content=chunks(),
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        self.assertEqual(response.status_code, 413)
+
+if __name__ == '__main__':
+    unittest.main()
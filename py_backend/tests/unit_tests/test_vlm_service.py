@@ -3,14 +3,20 @@
 
 import unittest
 from unittest.mock import Mock, patch, MagicMock, AsyncMock
+import asyncio
+import time
 import sys
 import os
+import io
+
+from PIL import Image
 
 # Add the app directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
 
-from services.vlm_service import VLMServiceManager, ModelType
+from services.vlm_service import VLMService, VLMServiceManager, ModelType, ServiceStatus
 from services.stub_vlm_service import StubVLMService
+from services.manual_vlm_service import ManualVLMService
 
 class TestVLMServiceManager(unittest.TestCase):
     """Test cases for VLM service manager"""
@@ -146,5 +152,198 @@ class TestModelType(unittest.TestCase):
             self.assertIsInstance(model_type, ModelType)
             self.assertIsInstance(model_type.value, str)
 
+class TestServiceProbing(unittest.TestCase):
+    """Test cases for concurrent, periodic provider probing"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.manager = VLMServiceManager()
+        self.manager.probe_timeout_s = 0.2
+        self.services = []
+        for i in range(5):
+            service = StubVLMService()
+            service.model_name = f"SLOW_{i}"
+            service.probe = self._sleepy_probe(0.1, True)
+            self.manager.register_service(service)
+            self.services.append(service)
+
+    @staticmethod
+    def _sleepy_probe(delay, result):
+        async def probe():
+            await asyncio.sleep(delay)
+            return result
+        return probe
+
+    def test_probes_run_concurrently(self):
+        """Test probes overlap instead of running one after another"""
+        # Act
+        start = time.monotonic()
+        asyncio.run(self.manager.probe_all())
+        elapsed = time.monotonic() - start
+
+        # Assert
+        self.assertLess(elapsed, 0.3)
+        for service in self.services:
+            self.assertEqual(service.status, ServiceStatus.READY)
+            self.assertTrue(service.last_probe_ok)
+            self.assertIsNotNone(service.last_probe_latency_s)
+
+    def test_probe_timeout_marks_unhealthy(self):
+        """Test hung probes time out and repeated failures make a service unavailable"""
+        # Arrange
+        hung = self.services[0]
+        hung.probe = self._sleepy_probe(5, True)
+
+        # Act
+        for _ in range(self.manager.unhealthy_after):
+            asyncio.run(self.manager.probe_all())
+
+        # Assert
+        self.assertFalse(hung.last_probe_ok)
+        self.assertEqual(hung.status, ServiceStatus.UNAVAILABLE)
+        self.assertFalse(self.manager.get_health()[hung.model_name]["healthy"])
+
+    def test_selection_prefers_healthy(self):
+        """Test random selection skips services that probes report as down"""
+        # Arrange
+        for service in self.services[1:]:
+            service.status = ServiceStatus.UNAVAILABLE
+        self.services[0].status = ServiceStatus.READY
+
+        # Act
+        picks = {asyncio.run(self.manager._pick_service(None, None)).model_name for _ in range(20)}
+
+        # Assert
+        self.assertEqual(picks, {"SLOW_0"})
+
+class SingleImageService(StubVLMService):
+    """Service that only captions single images"""
+
+    def __init__(self, model_name="SINGLE_ONLY"):
+        super().__init__()
+        self.model_name = model_name
+
+    # Back to the base class's NotImplementedError
+    generate_multi_image_caption = VLMService.generate_multi_image_caption
+
+class MultiImageService(StubVLMService):
+    """Multi-image service with a set delay, outcome and parse status"""
+
+    def __init__(self, model_name, delay=0.0, fail=False, parse_status="ok"):
+        super().__init__()
+        self.model_name = model_name
+        self.delay = delay
+        self.fail = fail
+        self.parse_status = parse_status
+        self.calls = 0
+        self.renditions = None
+        self.cancelled = False
+
+    async def generate_multi_image_caption(self, image_bytes_list, prompt, metadata_instructions=""):
+        self.calls += 1
+        self.renditions = await self.prepare_images(image_bytes_list)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise Exception(f"MODEL_UNAVAILABLE: {self.model_name} failed")
+        return {"caption": f"{self.model_name} caption", "raw_response": {"parse_status": self.parse_status}}
+
+def _jpeg(color) -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(output, format='JPEG')
+    return output.getvalue()
+
+class TestMultiImageFallback(unittest.TestCase):
+    """Test cases for capability-aware and raced multi-image fallback"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.manager = VLMServiceManager()
+        self.images = [_jpeg((200, 0, 0)), _jpeg((0, 200, 0))]
+
+    def caption(self, model_name):
+        return asyncio.run(self.manager.generate_multi_image_caption(self.images, "prompt", model_name=model_name))
+
+    def test_capability(self):
+        """Test services report multi-image support, and config can opt a model out"""
+        capable = MultiImageService("CAPABLE")
+        self.assertTrue(capable.supports_multi_image)
+        self.assertFalse(SingleImageService().supports_multi_image)
+        capable.configure({"multi_image": False})
+        self.assertFalse(capable.supports_multi_image)
+        self.assertFalse(capable.get_model_info()["multi_image"])
+
+    def test_single_image_services_are_skipped(self):
+        """Test a requested single-image model is never called and fallbacks skip manual"""
+        self.manager.register_service(SingleImageService())
+        self.manager.register_service(ManualVLMService())
+        capable = MultiImageService("CAPABLE")
+        self.manager.register_service(capable)
+
+        result = self.caption("SINGLE_ONLY")
+
+        self.assertEqual(result["model"], "CAPABLE")
+        self.assertTrue(result["fallback_used"])
+        self.assertIn("does not support multi-image", result["fallback_reason"])
+
+    def test_stub_is_tried_last(self):
+        """Test failed providers fall through the other capable services to STUB_MODEL"""
+        self.manager.register_service(StubVLMService())
+        primary = MultiImageService("PRIMARY", fail=True)
+        other = MultiImageService("OTHER", fail=True)
+        self.manager.register_service(primary)
+        self.manager.register_service(other)
+
+        result = self.caption("PRIMARY")
+
+        self.assertEqual(result["model"], "STUB_MODEL")
+        self.assertEqual((primary.calls, other.calls), (1, 1))
+        self.assertIn("PRIMARY failed", result["fallback_reason"])
+
+    def test_payload_rendered_once(self):
+        """Test every attempt reuses the same renditions"""
+        primary = MultiImageService("PRIMARY", fail=True)
+        fallback = MultiImageService("FALLBACK")
+        self.manager.register_service(primary)
+        self.manager.register_service(fallback)
+
+        self.caption("PRIMARY")
+
+        self.assertEqual(len(fallback.renditions), 2)
+        for first, second in zip(primary.renditions, fallback.renditions):
+            self.assertIs(first, second)
+
+    def test_race_takes_first_usable_answer(self):
+        """Test racing returns the fastest parsed answer and cancels the rest"""
+        self.manager.configure_multi_image(3)
+        slow = MultiImageService("SLOW", delay=2.0)
+        garbled = MultiImageService("GARBLED", parse_status="failed")
+        fast = MultiImageService("FAST", delay=0.05)
+        for service in (slow, garbled, fast):
+            self.manager.register_service(service)
+
+        start = time.monotonic()
+        result = self.caption("SLOW")
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(result["model"], "FAST")
+        self.assertTrue(result["fallback_used"])
+        self.assertEqual(sorted(result["raced"]), ["FAST", "GARBLED", "SLOW"])
+        self.assertTrue(slow.cancelled)
+
+    def test_race_keeps_unusable_answer_as_last_resort(self):
+        """Test an unparsed raced answer is returned when nothing better arrives"""
+        self.manager.configure_multi_image(2)
+        self.manager.register_service(MultiImageService("FAILING", fail=True))
+        self.manager.register_service(MultiImageService("GARBLED", parse_status="failed"))
+
+        result = self.caption("FAILING")
+
+        self.assertEqual(result["model"], "GARBLED")
+        self.assertIn("FAILING failed", result["fallback_reason"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible VLM simulator for offline load testing.
+
+Serves POST /v1/chat/completions (plain and streamed) by replaying
+recorded provider replies with a configurable latency distribution, error
+and 429 rates, a concurrency limit and slow streams. Point the backend at
+it instead of a real provider:
+
+  HF_API_KEY=sim HF_PROVIDERS_URL=http://localhost:8090/v1/chat/completions
+  OPENAI_API_KEY=sim OPENAI_BASE_URL=http://localhost:8090/v1
+
+Examples:
+  python vlm_simulator.py --latency lognormal:4,0.5
+  python vlm_simulator.py --latency uniform:1,8 --error-rate 0.02 --rate-limit-rate 0.05 --max-concurrency 16
+  python vlm_simulator.py --responses recorded.jsonl --slow-stream-rate 0.1
+
+--responses is a JSONL file; each line is either a reply string or an
+object with "content" (the model's message text), e.g. rows exported from
+captions.raw_json. GET /stats reports what the simulator has served.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+DEFAULT_RESPONSES = [
+    {
+        "description": "Map of flood extent across the river delta with affected districts shaded.",
+        "analysis": "Flooding covers the low-lying southern districts; main roads toward the coast are cut.",
+        "recommended_actions": "Pre-position boats and shelter kits near the northern road junctions.",
+        "metadata": {"title": "Delta Flood Extent", "source": "WFP", "type": "FLOOD", "countries": ["BD"], "epsg": "4326"},
+    },
+    {
+        "description": "Shake map showing intensity contours around the epicentre.",
+        "analysis": "Strongest shaking is concentrated near the coast; inland towns saw moderate intensity.",
+        "recommended_actions": "Prioritise structural assessments in coastal towns within the inner contours.",
+        "metadata": {"title": "Earthquake Intensity", "source": "OTHER", "type": "EARTHQUAKE", "countries": ["PA"], "epsg": "OTHER"},
+    },
+]
+
+
+class LatencyModel:
+    """Seconds to wait before answering, drawn from a distribution spec"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v]
+        if kind == "fixed" and len(values) == 1:
+            self.sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self.sample = lambda: random.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            median, sigma = values
+            self.sample = lambda: random.lognormvariate(math.log(median), sigma)
+        elif kind == "exponential" and len(values) == 1:
+            self.sample = lambda: random.expovariate(1.0 / values[0])
+        else:
+            raise SystemExit(
+                f"Invalid latency spec '{spec}'; use fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exponential:MEAN"
+            )
+
+
+def load_responses(path):
+    if not path:
+        return [json.dumps(r) for r in DEFAULT_RESPONSES]
+    replies = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if isinstance(row, dict):
+                row = row.get("content") or (row.get("raw_json") or {}).get("content") or json.dumps(row)
+            replies.append(row if isinstance(row, str) else json.dumps(row))
+    if not replies:
+        raise SystemExit(f"No responses in {path}")
+    return replies
+
+
+class Simulator:
+    def __init__(self, args):
+        self.args = args
+        self.latency = LatencyModel(args.latency)
+        self.responses = load_responses(args.responses)
+        self.in_flight = 0
+        self.started_at = time.time()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streams": 0, "slow_streams": 0}
+
+    def _completion(self, model, content):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": len(content) // 4, "total_tokens": 1000 + len(content) // 4},
+        }
+
+    def _error(self, status, message, retry_after=None):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        return web.json_response({"error": {"message": message, "type": "simulated"}}, status=status, headers=headers)
+
+    async def chat_completions(self, request):
+        self.stats["requests"] += 1
+        try:
+            payload = await request.json()
+        except ValueError:
+            return self._error(400, "Request body must be JSON")
+        model = payload.get("model", "simulated")
+
+        if self.args.max_concurrency and self.in_flight >= self.args.max_concurrency:
+            self.stats["rate_limited"] += 1
+            return self._error(429, "Too many concurrent requests", retry_after=1)
+        if random.random() < self.args.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return self._error(429, "Rate limit exceeded", retry_after=self.args.retry_after)
+
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency.sample())
+            if random.random() < self.args.error_rate:
+                self.stats["errors"] += 1
+                return self._error(random.choice((500, 502, 503)), "Simulated provider error")
+
+            content = random.choice(self.responses)
+            if payload.get("stream"):
+                return await self._stream(request, model, content)
+            self.stats["ok"] += 1
+            return web.json_response(self._completion(model, content))
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, model, content):
+        self.stats["streams"] += 1
+        delay = self.args.stream_chunk_delay
+        if random.random() < self.args.slow_stream_rate:
+            self.stats["slow_streams"] += 1
+            delay *= self.args.slow_stream_factor
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        size = self.args.stream_chunk_chars
+        for i in range(0, len(content), size):
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}],
+            }
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(delay)
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        self.stats["ok"] += 1
+        return resp
+
+    async def models(self, request):
+        return web.json_response({"object": "list", "data": [{"id": "simulated", "object": "model"}]})
+
+    async def get_stats(self, request):
+        return web.json_response({
+            **self.stats,
+            "in_flight": self.in_flight,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "latency": self.latency.spec,
+            "responses": len(self.responses),
+        })
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        for prefix in ("/v1", ""):
+            app.router.add_post(f"{prefix}/chat/completions", self.chat_completions)
+            app.router.add_get(f"{prefix}/models", self.models)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded VLM replies as an OpenAI-compatible endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--responses", help="JSONL file of recorded replies (default: built-in samples)")
+    parser.add_argument("--latency", default="lognormal:4,0.5", help="fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exponential:MEAN")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=5, help="Retry-After seconds sent with random 429s")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="429 beyond this many calls in flight (0 = unlimited)")
+    parser.add_argument("--stream-chunk-chars", type=int, default=24)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.03, help="seconds between streamed chunks")
+    parser.add_argument("--slow-stream-rate", type=float, default=0.0, help="fraction of streams slowed down")
+    parser.add_argument("--slow-stream-factor", type=float, default=20.0, help="chunk delay multiplier for slow streams")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    sim = Simulator(args)
+    print(f"VLM simulator on http://{args.host}:{args.port}/v1 ({len(sim.responses)} replies, latency {args.latency})")
+    web.run_app(sim.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()